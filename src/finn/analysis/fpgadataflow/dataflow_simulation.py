@@ -0,0 +1,344 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+import warnings
+from qonnx.custom_op.registry import getCustomOp
+
+from finn.util.fpgadataflow import is_hls_node, is_rtl_node
+
+# operators that buffer (k-1) rows of the input feature map before producing
+# their first output, as (kernel attribute, input dimension attribute)
+_row_buffered_ops = {
+    "ConvolutionInputGenerator": ("ConvKernelDim", "IFMDim"),
+    "StreamingMaxPool": ("PoolDim", "ImgDim"),
+}
+# operators that compute each output vector from a complete input vector
+_vector_ops = ("MVAU", "VVAU")
+
+
+def _scan(lower_bound, interval):
+    """Solve t[i] = max(lower_bound[i], t[i-1] + interval) for all i, which
+    is the time at which a node that handles one transaction every interval
+    cycles completes each transaction."""
+    offsets = np.arange(len(lower_bound), dtype=np.float64) * interval
+    return np.maximum.accumulate(lower_bound - offsets) + offsets
+
+
+def _map_tokens(n_from, n_to, n_frames):
+    """For each of the n_to transactions per frame on one side of a stream,
+    return the global index of the n_from-transaction on the other side it
+    corresponds to (1:1 if the counts match, proportional otherwise)."""
+    local = np.arange(n_to, dtype=np.int64)
+    local = ((local + 1) * n_from + n_to - 1) // n_to - 1
+    frames = np.arange(n_frames, dtype=np.int64)[:, None] * n_from
+    return (frames + local[None, :]).reshape(-1)
+
+
+def _n_transactions(folded_shape):
+    return int(np.prod(folded_shape[1:-1]))
+
+
+def _input_lookahead(node, inst, n_in):
+    """Number of input transactions a sliding-window operator needs to buffer
+    before its first output, expressed in input stream transactions."""
+    for op_type, (k_attr, dim_attr) in _row_buffered_ops.items():
+        if node.op_type.startswith(op_type):
+            k_h, k_w = inst.get_nodeattr(k_attr)
+            ifm_h, ifm_w = inst.get_nodeattr(dim_attr)
+            try:
+                dil_h, dil_w = inst.get_nodeattr("Dilation")
+            except AttributeError:
+                dil_h, dil_w = 1, 1
+            per_pixel = n_in // (ifm_h * ifm_w)
+            pixels = (k_h - 1) * dil_h * ifm_w + (k_w - 1) * dil_w
+            return min(n_in - 1, pixels * per_pixel)
+    return 0
+
+
+def _output_requirements(n_in, n_out, in_block, out_block, lookahead, vector_op):
+    """Index of the last input transaction (per frame) that output transaction
+    j of the same frame depends on."""
+    j = np.arange(n_out, dtype=np.int64)
+    if lookahead == 0 and n_in // in_block == n_out // out_block:
+        if vector_op:
+            # each (folded) output vector needs the complete input vector
+            return (j // out_block + 1) * in_block - 1
+        if n_in == n_out:
+            # elementwise streaming
+            return j
+    # proportional consumption after filling the window buffer
+    rest = n_in - lookahead
+    return lookahead + ((j + 1) * rest + n_out - 1) // n_out - 1
+
+
+class _SimNode:
+    """Per-node state of the dataflow simulation."""
+
+    def __init__(self, node, model, n_frames):
+        inst = getCustomOp(node)
+        self.name = node.name
+        self.in_tensors = []
+        self.n_in = []
+        self.req = []
+        self.free = []
+        out_fshape = inst.get_folded_output_shape()
+        self.n_out = _n_transactions(out_fshape)
+        in_fifo_depths = inst.get_nodeattr("inFIFODepths")
+        self.in_depths = []
+        for ind, inp in enumerate(node.input):
+            if model.get_initializer(inp) is not None:
+                # parameters stored inside the node, not streamed
+                continue
+            in_fshape = inst.get_folded_input_shape(ind)
+            n_in = _n_transactions(in_fshape)
+            lookahead = _input_lookahead(node, inst, n_in) if ind == 0 else 0
+            vector_op = node.op_type.startswith(_vector_ops)
+            req = _output_requirements(
+                n_in, self.n_out, in_fshape[-2], out_fshape[-2], lookahead, vector_op
+            )
+            frames = np.arange(n_frames, dtype=np.int64)[:, None]
+            req = (frames * n_in + req[None, :]).reshape(-1)
+            self.in_tensors.append(inp)
+            self.n_in.append(n_in)
+            self.req.append(req)
+            # internal buffering: an input transaction can only be accepted
+            # once the transaction `capacity` positions earlier was consumed
+            # by the first output that depends on it
+            if node.op_type.startswith("StreamingFIFO"):
+                capacity = inst.get_nodeattr("depth")
+            else:
+                per_out = -(-n_in // self.n_out)
+                capacity = lookahead + max(int(in_fshape[-2]), per_out) + 2
+            in_idx = np.arange(n_frames * n_in, dtype=np.int64)
+            free = np.searchsorted(req, in_idx - capacity, side="left")
+            free[in_idx < capacity] = -1
+            # never wait on an output that itself depends on this input
+            free[req[np.minimum(free, len(req) - 1)] >= in_idx] = -1
+            self.free.append(free)
+            self.in_depths.append(in_fifo_depths[ind] if ind < len(in_fifo_depths) else 2)
+        self.out_tensors = list(node.output)
+        self.out_depths = inst.get_nodeattr("outFIFODepths")
+        # a node needs at least one cycle per transaction on each stream
+        self.cycles = float(max([inst.get_exp_cycles(), self.n_out, 1] + self.n_in))
+        self.out_interval = self.cycles / self.n_out
+        if node.op_type.startswith(_vector_ops + tuple(_row_buffered_ops)):
+            # inputs are read at full rate into the vector/row buffers and
+            # held while the outputs are computed from them
+            self.in_intervals = [1.0] * len(self.n_in)
+        else:
+            self.in_intervals = [self.cycles / n for n in self.n_in]
+        # simulation state: time at which each input transaction is read and
+        # each output transaction is written, plus the lower bounds on the
+        # output times imposed by the inputs and by backpressure
+        self.t_in = [np.zeros(n_frames * n, dtype=np.float64) for n in self.n_in]
+        self.t_out = np.zeros(n_frames * self.n_out, dtype=np.float64)
+        self.lb_in = self.t_out.copy()
+        self.lb_bp = self.t_out.copy()
+        # filled in once all nodes are known
+        self.in_sources = []
+        self.out_sinks = []
+
+
+def _connect(sim_nodes, n_frames):
+    by_output = {}
+    for sn in sim_nodes:
+        for ind, out in enumerate(sn.out_tensors):
+            by_output[out] = (sn, ind)
+    for sn in sim_nodes:
+        for q, inp in enumerate(sn.in_tensors):
+            if inp not in by_output:
+                # top-level input stream, assumed to be always valid
+                sn.in_sources.append(None)
+                continue
+            prod, out_ind = by_output[inp]
+            src_idx = _map_tokens(prod.n_out, sn.n_in[q], n_frames)
+            sn.in_sources.append((prod, src_idx))
+            # output transaction k of the producer can only be written once
+            # the consumer has read far enough to make space in the stream
+            depth = sn.in_depths[q]
+            if out_ind < len(prod.out_depths):
+                depth = max(depth, prod.out_depths[out_ind])
+            # mismatched stream widths imply a width converter that holds at
+            # least one complete consumer transaction
+            depth = max(depth, -(-prod.n_out // sn.n_in[q]) + 1)
+            consumed_idx = _map_tokens(sn.n_in[q], prod.n_out, n_frames)
+            sink_idx = np.full_like(consumed_idx, -1)
+            sink_idx[depth:] = consumed_idx[:-depth]
+            prod.out_sinks.append((sn, q, sink_idx))
+
+
+def _update(sn):
+    """Recompute the transaction times of one node from the current times of
+    its neighbours. Returns True if anything changed."""
+    changed = False
+    lb_in = np.zeros_like(sn.t_out)
+    for q in range(len(sn.in_tensors)):
+        src = sn.in_sources[q]
+        if src is None:
+            avail = np.zeros_like(sn.t_in[q])
+        else:
+            prod, src_idx = src
+            avail = prod.t_out[src_idx]
+        free = sn.free[q]
+        blocked = np.where(free >= 0, sn.t_out[np.maximum(free, 0)], 0.0)
+        t_in = _scan(np.maximum(avail, blocked), sn.in_intervals[q])
+        if not changed and not np.array_equal(t_in, sn.t_in[q]):
+            changed = True
+        sn.t_in[q] = t_in
+        lb_in = np.maximum(lb_in, t_in[sn.req[q]] + 1)
+    lb_bp = np.zeros_like(sn.t_out)
+    for cons, q, sink_idx in sn.out_sinks:
+        space = np.where(sink_idx >= 0, cons.t_in[q][np.maximum(sink_idx, 0)] + 1, 0.0)
+        lb_bp = np.maximum(lb_bp, space)
+    t_out = _scan(np.maximum(lb_in, lb_bp), sn.out_interval)
+    if not changed and not np.array_equal(t_out, sn.t_out):
+        changed = True
+    sn.t_out = t_out
+    sn.lb_in = lb_in
+    sn.lb_bp = lb_bp
+    return changed
+
+
+def _wait_cycles(sn):
+    """Split the time a node spends waiting between output transactions into
+    stall (blocked by downstream backpressure) and starve (waiting for input
+    data) cycles."""
+    prev = np.concatenate(([0.0], sn.t_out[:-1]))
+    gaps = np.maximum(sn.t_out - prev - sn.out_interval, 0.0)
+    stalled = sn.lb_bp > sn.lb_in
+    return float(gaps[stalled].sum()), float(gaps[~stalled].sum())
+
+
+def dataflow_simulation(model, n_frames=10, clk_ns=None, max_sweeps=None):
+    """Simulate the pipelined execution of a batch of n_frames frames through
+    the given dataflow model and extract throughput, latency and per-node
+    stall/starve statistics. Unlike dataflow_performance, this accounts for
+    the overlap between nodes and the limited FIFO depths between them.
+
+    Every stream transaction (one word of the folded input or output shape)
+    is an event whose time is bounded by the node's initiation interval
+    (cycles per frame divided by transactions per frame), by the availability
+    of the input transactions it depends on and by space in the downstream
+    FIFO. The resulting max-plus recurrences are solved with vectorized
+    forward/backward sweeps over the graph until the event times settle,
+    which keeps the runtime low for graphs with hundreds of nodes.
+
+    Preconditions:
+    - model consists of HLS/RTL nodes in topological order
+    - nodes have unique names (see GiveUniqueNodeNames)
+    - FIFO depths are either set as StreamingFIFO nodes or given by the
+      inFIFODepths/outFIFODepths node attributes
+
+    Arguments:
+    - n_frames : number of frames to stream through the model
+    - clk_ns : clock period, taken from the clk_ns metadata_prop if None
+    - max_sweeps : limit on the number of sweeps, defaults to 4x #nodes + 10
+
+    Returns a dict with:
+    - cycles, latency_cycles : cycles to finish all frames and the first frame
+    - runtime[ms], latency[s], fclk[mhz]
+    - throughput[images/s] : n_frames over the total runtime
+    - stable_throughput[images/s] : frame rate once the pipeline is filled
+    - stable_cycles_per_frame : cycles between frames in the stable state
+    - bottleneck_node : name of the node with the highest busy ratio
+    - converged : False if the sweep limit was hit (e.g. a deadlock due to
+      insufficient FIFO depths on reconvergent paths)
+    - node_stats : per-node dict with busy_ratio, stall_ratio, starve_ratio,
+      stall[s] and starve[s]
+    """
+    assert n_frames >= 1, "n_frames must be >= 1"
+    if clk_ns is None:
+        clk_ns = model.get_metadata_prop("clk_ns")
+        assert clk_ns is not None, "clk_ns must be given or set as metadata_prop"
+    clk_ns = float(clk_ns)
+    for node in model.graph.node:
+        assert is_hls_node(node) or is_rtl_node(node), (
+            "Node %s is not an HLS or RTL node" % node.name
+        )
+    sim_nodes = [_SimNode(node, model, n_frames) for node in model.graph.node]
+    _connect(sim_nodes, n_frames)
+    if max_sweeps is None:
+        max_sweeps = 4 * len(sim_nodes) + 10
+    converged = False
+    for sweep in range(max_sweeps):
+        # alternate sweep direction: forward sweeps propagate data
+        # availability, backward sweeps propagate backpressure
+        order = sim_nodes if sweep % 2 == 0 else reversed(sim_nodes)
+        changed = False
+        for sn in order:
+            changed = _update(sn) or changed
+        if not changed:
+            converged = True
+            break
+    if not converged:
+        warnings.warn(
+            "Dataflow simulation did not converge after %d sweeps, "
+            "the FIFO depths may be insufficient to avoid a deadlock" % max_sweeps
+        )
+
+    # completion time of each frame at the graph outputs
+    graph_outputs = [x.name for x in model.graph.output]
+    frame_done = np.zeros(n_frames, dtype=np.float64)
+    for sn in sim_nodes:
+        for out in sn.out_tensors:
+            if out in graph_outputs:
+                last = np.arange(1, n_frames + 1) * sn.n_out - 1
+                frame_done = np.maximum(frame_done, sn.t_out[last])
+    total_cycles = float(frame_done[-1])
+    latency_cycles = float(frame_done[0])
+    if n_frames > 1:
+        stable_cycles = (frame_done[-1] - frame_done[0]) / (n_frames - 1)
+    else:
+        stable_cycles = latency_cycles
+    cycle_s = clk_ns * 10**-9
+
+    ret = dict()
+    ret["cycles"] = int(np.ceil(total_cycles))
+    ret["latency_cycles"] = int(np.ceil(latency_cycles))
+    ret["stable_cycles_per_frame"] = float(stable_cycles)
+    ret["runtime[ms]"] = total_cycles * cycle_s * 1000
+    ret["latency[s]"] = latency_cycles * cycle_s
+    ret["throughput[images/s]"] = n_frames / (total_cycles * cycle_s)
+    ret["stable_throughput[images/s]"] = 1 / (stable_cycles * cycle_s)
+    ret["fclk[mhz]"] = 1 / (clk_ns * 0.001)
+    ret["N"] = n_frames
+    ret["converged"] = converged
+    node_stats = dict()
+    for sn in sim_nodes:
+        stall_cycles, starve_cycles = _wait_cycles(sn)
+        node_stats[sn.name] = {
+            "busy_ratio": n_frames * sn.cycles / total_cycles,
+            "stall_ratio": stall_cycles / total_cycles,
+            "starve_ratio": starve_cycles / total_cycles,
+            "stall[s]": stall_cycles * cycle_s,
+            "starve[s]": starve_cycles * cycle_s,
+        }
+    ret["bottleneck_node"] = max(node_stats, key=lambda x: node_stats[x]["busy_ratio"])
+    ret["node_stats"] = node_stats
+    return ret
@@ -61,9 +61,17 @@ def hls_synth_res_estimation(model):
                     "HLSSynthIP" first to generate the report files"""
                 )
             else:
-                xmlfile = "{}/project_{}/sol1/syn/report/{}_csynth.xml".format(
-                    code_gen_dir, node.name, node.name
-                )
+                ipgen_path = inst.get_nodeattr("ipgen_path")
+                vlnv = inst.get_nodeattr("ip_vlnv")
+                if ipgen_path != "" and vlnv != "":
+                    # the IP may be shared with an identical node, see HLSSynthIP
+                    xmlfile = "{}/sol1/syn/report/{}_csynth.xml".format(
+                        ipgen_path, vlnv.split(":")[2]
+                    )
+                else:
+                    xmlfile = "{}/project_{}/sol1/syn/report/{}_csynth.xml".format(
+                        code_gen_dir, node.name, node.name
+                    )
 
                 if os.path.isfile(xmlfile):
                     tree = ET.parse(xmlfile)
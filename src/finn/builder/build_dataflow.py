@@ -27,20 +27,43 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import clize
+import dataclasses
+import hashlib
+import inspect
 import json
 import logging
 import os
 import pdb  # NOQA
+import shutil
 import sys
 import time
 import traceback
+from onnx import AttributeProto
 from qonnx.core.modelwrapper import ModelWrapper
 
 from finn.builder.build_dataflow_config import (
     DataflowBuildConfig,
     default_build_dataflow_steps,
 )
-from finn.builder.build_dataflow_steps import build_dataflow_step_lookup
+from finn.builder.build_dataflow_steps import (
+    build_dataflow_step_cfg_fields,
+    build_dataflow_step_lookup,
+    build_dataflow_steps_using_parent,
+)
+from finn.util.basic import make_build_dir
+from finn.util.cache import BuildCache, hash_file, hash_items
+
+#: DataflowBuildConfig fields that never affect the outcome of a step
+non_fingerprint_cfg_fields = [
+    "output_dir",
+    "steps",
+    "start_step",
+    "stop_step",
+    "verbose",
+    "enable_build_pdb_debug",
+    "incremental_build",
+    "build_cache_max_size_mb",
+]
 
 
 # adapted from https://stackoverflow.com/a/39215961
@@ -102,6 +125,109 @@ def resolve_step_filename(step_name: str, cfg: DataflowBuildConfig, step_delta:
     return filename
 
 
+def get_step_fingerprint(transform_step, model: ModelWrapper, cfg: DataflowBuildConfig):
+    """Return a fingerprint for running the given step on the given model,
+    covering the step code, the serialized input model and the build config
+    fields relevant for this step (including the contents of any config
+    files these fields point to). For steps that read the parent model of the
+    dataflow partition, its contents are covered as well."""
+    step_name = transform_step.__name__
+    if build_dataflow_step_lookup.get(step_name) is transform_step:
+        cfg_fields = build_dataflow_step_cfg_fields[step_name]
+        uses_parent = step_name in build_dataflow_steps_using_parent
+    else:
+        # custom step, any field and the parent model may be relevant
+        cfg_fields = [x.name for x in dataclasses.fields(cfg)]
+        cfg_fields = [x for x in cfg_fields if x not in non_fingerprint_cfg_fields]
+        uses_parent = True
+    try:
+        step_src = inspect.getsource(transform_step)
+    except (OSError, TypeError):
+        step_src = repr(transform_step)
+    items = [step_name, step_src, hashlib.sha256(model.model.SerializeToString()).hexdigest()]
+    for cfg_field in sorted(set(cfg_fields)):
+        value = getattr(cfg, cfg_field)
+        items.append("%s=%s" % (cfg_field, str(value)))
+        if isinstance(value, str) and os.path.isfile(value):
+            items.append(hash_file(value))
+    parent_model_fn = cfg.output_dir + "/intermediate_models/dataflow_parent.onnx"
+    if uses_parent and os.path.isfile(parent_model_fn):
+        items.append("dataflow_parent=" + hash_file(parent_model_fn))
+    return hash_items(items)
+
+
+def snapshot_output_dir(output_dir):
+    """Return a dict mapping each file in output_dir (relative path) to its
+    modification time and size, leaving out the build cache and log."""
+    ret = dict()
+    for root, dirs, files in os.walk(output_dir):
+        if root == output_dir:
+            dirs[:] = [x for x in dirs if x != "build_cache"]
+            files = [x for x in files if x != "build_dataflow.log"]
+        for fname in files:
+            fpath = os.path.join(root, fname)
+            fstat = os.stat(fpath)
+            ret[os.path.relpath(fpath, output_dir)] = (fstat.st_mtime_ns, fstat.st_size)
+    return ret
+
+
+def model_paths_exist(model: ModelWrapper, cfg: DataflowBuildConfig):
+    """Check that all build and output directory paths referenced by the
+    node attributes and metadata_props of the given model (e.g. generated
+    code directories) still exist."""
+    prefixes = [os.path.abspath(cfg.output_dir)]
+    if "FINN_BUILD_DIR" in os.environ:
+        prefixes.append(os.environ["FINN_BUILD_DIR"])
+    values = [x.value for x in model.model.metadata_props]
+    for node in model.graph.node:
+        for attr in node.attribute:
+            if attr.type == AttributeProto.STRING:
+                values.append(attr.s.decode("utf-8", errors="ignore"))
+    for value in values:
+        if any([value.startswith(x) for x in prefixes]) and not os.path.exists(value):
+            return False
+    return True
+
+
+def load_cached_step(cache: BuildCache, fingerprint, cfg: DataflowBuildConfig):
+    """Look up the result of a step with the given fingerprint. On a hit,
+    restore the output files the step produced into the output_dir and
+    return the resulting model, otherwise return None."""
+    entry_dir = make_build_dir("build_cache_entry_")
+    try:
+        if not cache.lookup(fingerprint, entry_dir):
+            return None
+        model = ModelWrapper(entry_dir + "/model.onnx")
+        if not model_paths_exist(model, cfg):
+            print("Cached model refers to generated files that no longer exist, rebuilding")
+            return None
+        if os.path.isdir(entry_dir + "/outputs"):
+            shutil.copytree(entry_dir + "/outputs", cfg.output_dir, dirs_exist_ok=True)
+        return model
+    finally:
+        shutil.rmtree(entry_dir)
+
+
+def save_cached_step(
+    cache: BuildCache, fingerprint, step_name, model: ModelWrapper, cfg, outputs_before
+):
+    """Insert the result of a step into the cache, consisting of the
+    resulting model and all files in the output_dir that the step created or
+    modified (as determined by comparing against outputs_before)."""
+    entry_dir = make_build_dir("build_cache_entry_")
+    try:
+        model.save(entry_dir + "/model.onnx")
+        outputs_after = snapshot_output_dir(cfg.output_dir)
+        for rel_path, fstat in outputs_after.items():
+            if outputs_before.get(rel_path) != fstat:
+                dst_path = entry_dir + "/outputs/" + rel_path
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                shutil.copy2(cfg.output_dir + "/" + rel_path, dst_path)
+        cache.insert(fingerprint, entry_dir, description=step_name)
+    finally:
+        shutil.rmtree(entry_dir)
+
+
 def build_dataflow_cfg(model_filename, cfg: DataflowBuildConfig):
     """Best-effort build a dataflow accelerator using the given configuration.
 
@@ -143,6 +269,16 @@ def build_dataflow_cfg(model_filename, cfg: DataflowBuildConfig):
     stderr_logger = StreamToLogger(log, logging.ERROR)
     stdout_orig = sys.stdout
     stderr_orig = sys.stderr
+    # results of earlier runs of each step, for incremental builds
+    if cfg.incremental_build:
+        step_cache = BuildCache(
+            cfg.output_dir + "/build_cache",
+            max_size_mb=cfg.build_cache_max_size_mb,
+            name="Build step cache",
+        )
+    else:
+        step_cache = None
+    cached_steps = []
     for transform_step in build_dataflow_steps:
         try:
             step_name = transform_step.__name__
@@ -153,13 +289,26 @@ def build_dataflow_cfg(model_filename, cfg: DataflowBuildConfig):
                 sys.stderr = stderr_logger
                 # also log current step name to logfile
                 print("Running step: %s [%d/%d]" % (step_name, step_num, len(build_dataflow_steps)))
-            # run the step
+            # run the step, unless its result can be reused from an earlier build
             step_start = time.time()
-            model = transform_step(model, cfg)
+            cached_model = None
+            if step_cache is not None:
+                fingerprint = get_step_fingerprint(transform_step, model, cfg)
+                cached_model = load_cached_step(step_cache, fingerprint, cfg)
+            if cached_model is not None:
+                model = cached_model
+                cached_steps.append(step_name)
+            else:
+                outputs_before = snapshot_output_dir(cfg.output_dir)
+                model = transform_step(model, cfg)
+                if step_cache is not None:
+                    save_cached_step(step_cache, fingerprint, step_name, model, cfg, outputs_before)
             step_end = time.time()
             # restore stdout/stderr
             sys.stdout = stdout_orig
             sys.stderr = stderr_orig
+            if cached_model is not None:
+                print("Reused cached result for step: %s" % step_name)
             time_per_step[step_name] = step_end - step_start
             chkpt_name = "%s.onnx" % (step_name)
             if cfg.save_intermediate_models:
@@ -185,6 +334,11 @@ def build_dataflow_cfg(model_filename, cfg: DataflowBuildConfig):
 
     with open(cfg.output_dir + "/time_per_step.json", "w") as f:
         json.dump(time_per_step, f, indent=2)
+    if step_cache is not None:
+        print(
+            "Reused cached results for %d out of %d steps"
+            % (len(cached_steps), len(build_dataflow_steps))
+        )
     print("Completed successfully")
     return 0
 
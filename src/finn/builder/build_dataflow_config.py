@@ -94,6 +94,9 @@ class VerificationStepType(str, Enum):
     TIDY_UP_PYTHON = "initial_python"
     #: verify after step_streamline , using Python execution
     STREAMLINED_PYTHON = "streamlined_python"
+    #: verify after step_apply_folding_config, using Python execution of each
+    #: specialized HW node (exec_mode "python"), without compiling
+    FOLDED_PYTHON = "folded_python"
     #: verify after step_apply_folding_config, using C++ for each HLS node
     FOLDED_HLS_CPPSIM = "folded_hls_cppsim"
     #: verify after step_create_stitched_ip, using stitched-ip Verilog
@@ -304,10 +307,37 @@ class DataflowBuildConfig:
     #: Only relevant when `shell_flow_type = ShellFlowType.VITIS_ALVEO`
     vitis_opt_strategy: Optional[VitisOptStrategyCfg] = VitisOptStrategyCfg.DEFAULT
 
+    #: Number of replicas (compute units) of the accelerator to link into the
+    #: .xclbin, the generated driver shards each batch across them.
+    #: Only relevant when `shell_flow_type = ShellFlowType.VITIS_ALVEO`
+    vitis_num_compute_units: Optional[int] = 1
+
+    #: Whether to fuse the host-side pre-processing in front of the dataflow
+    #: partition (e.g. normalization and quantization of uint8 images) into
+    #: the input packing of the generated driver, which then takes the raw
+    #: inputs of the model. The pre-processing must be a chain of elementwise
+    #: Add/Sub/Mul/Div, MultiThreshold and Transpose nodes on an integer input
+    #: of at most 16 bits, and is exported as lookup tables.
+    fuse_host_preproc: Optional[bool] = False
+
     #: Whether intermediate ONNX files will be saved during the build process.
     #: These can be useful for debugging if the build fails.
     save_intermediate_models: Optional[bool] = True
 
+    #: Whether steps will be skipped if they were already run on the same
+    #: input model with the same relevant build configuration fields, reusing
+    #: the resulting model and output files from an earlier build into the
+    #: same output_dir. Cached results are kept under output_dir/build_cache.
+    #: Only the step's source code, input model and configuration fields (and
+    #: the contents of files they name) are fingerprinted, so changes to other
+    #: code or files a step depends on are not detected. Disabled by default.
+    incremental_build: Optional[bool] = False
+
+    #: Upper bound on the size of output_dir/build_cache in MB for incremental
+    #: builds, least recently used results are evicted once it is exceeded.
+    #: None for no bound.
+    build_cache_max_size_mb: Optional[int] = 8192
+
     #: Whether hardware debugging will be enabled (e.g. ILA cores inserted to
     #: debug signals in the generated hardware)
     enable_hw_debug: Optional[bool] = False
@@ -379,7 +379,8 @@ def step_create_dataflow_partition(model: ModelWrapper, cfg: DataflowBuildConfig
     sdp_node = sdp_nodes[0]
     sdp_node = getCustomOp(sdp_node)
     dataflow_model_filename = sdp_node.get_nodeattr("model")
-    if cfg.save_intermediate_models:
+    if cfg.save_intermediate_models or cfg.fuse_host_preproc:
+        # also needed to export the host-side pre-processing to the driver
         parent_model.save(cfg.output_dir + "/intermediate_models/dataflow_parent.onnx")
     model = ModelWrapper(dataflow_model_filename)
 
@@ -450,6 +451,10 @@ def step_apply_folding_config(model: ModelWrapper, cfg: DataflowBuildConfig):
         model = model.transform(GiveUniqueNodeNames())
         model = model.transform(ApplyConfig(cfg.folding_config_file))
 
+    if VerificationStepType.FOLDED_PYTHON in cfg._resolve_verification_steps():
+        model = model.transform(SetExecMode("python"))
+        verify_step(model, cfg, "folded_python", need_parent=True)
+
     if VerificationStepType.FOLDED_HLS_CPPSIM in cfg._resolve_verification_steps():
         # prepare cppsim
         model = model.transform(PrepareCppSim())
@@ -556,7 +561,11 @@ def step_set_fifo_depths(model: ModelWrapper, cfg: DataflowBuildConfig):
             model = model.transform(AnnotateCycles())
             period = model.analysis(dataflow_performance)["max_cycles"] + 10
             model = model.transform(DeriveCharacteristic(period))
-            model = model.transform(DeriveFIFOSizes())
+            report_dir = cfg.output_dir + "/report"
+            os.makedirs(report_dir, exist_ok=True)
+            model = model.transform(
+                DeriveFIFOSizes(report_file=report_dir + "/fifo_sizing_characterize.json")
+            )
             model = model.transform(
                 InsertFIFO(
                     vivado_ram_style=cfg.large_fifo_mem_style,
@@ -753,7 +762,14 @@ def step_make_pynq_driver(model: ModelWrapper, cfg: DataflowBuildConfig):
 
     if DataflowOutputType.PYNQ_DRIVER in cfg.generate_outputs:
         driver_dir = cfg.output_dir + "/driver"
-        model = model.transform(MakePYNQDriver(cfg._resolve_driver_platform()))
+        host_preproc_model = None
+        if cfg.fuse_host_preproc:
+            host_preproc_model = ModelWrapper(
+                cfg.output_dir + "/intermediate_models/dataflow_parent.onnx"
+            )
+        model = model.transform(
+            MakePYNQDriver(cfg._resolve_driver_platform(), host_preproc_model=host_preproc_model)
+        )
         copy_tree(model.get_metadata_prop("pynq_driver_dir"), driver_dir)
         print("PYNQ Python driver written into " + driver_dir)
     return model
@@ -829,6 +845,7 @@ def step_synthesize_bitfile(model: ModelWrapper, cfg: DataflowBuildConfig):
                     enable_debug=cfg.enable_hw_debug,
                     floorplan_file=cfg.vitis_floorplan_file,
                     partition_model_dir=partition_model_dir,
+                    num_compute_units=cfg.vitis_num_compute_units,
                 )
             )
             copy(model.get_metadata_prop("bitfile"), bitfile_dir + "/finn-accel.xclbin")
@@ -882,3 +899,86 @@ build_dataflow_step_lookup = {
     "step_synthesize_bitfile": step_synthesize_bitfile,
     "step_deployment_package": step_deployment_package,
 }
+
+#: map step name strings to the DataflowBuildConfig fields that affect the
+#: outcome of each step, used for fingerprinting steps in incremental builds.
+#: Steps that are not listed here are fingerprinted with all fields.
+_fpga_part_fields = ["board", "fpga_part", "shell_flow_type"]
+_hls_clk_fields = ["synth_clk_period_ns", "hls_clk_period_ns"]
+_verify_fields = [
+    "verify_steps",
+    "verify_input_npy",
+    "verify_expected_output_npy",
+    "verify_save_full_context",
+    "verify_save_rtlsim_waveforms",
+    "rtlsim_use_vivado_comps",
+]
+build_dataflow_step_cfg_fields = {
+    "step_qonnx_to_finn": ["max_multithreshold_bit_width"] + _verify_fields,
+    "step_tidy_up": _verify_fields,
+    "step_streamline": _verify_fields,
+    "step_convert_to_hw": ["standalone_thresholds"],
+    "step_specialize_layers": ["specialize_layers_config_file"] + _fpga_part_fields,
+    "step_create_dataflow_partition": ["save_intermediate_models", "fuse_host_preproc"],
+    "step_target_fps_parallelization": [
+        "target_fps",
+        "synth_clk_period_ns",
+        "folding_two_pass_relaxation",
+        "mvau_wwidth_max",
+    ],
+    "step_apply_folding_config": ["folding_config_file"] + _verify_fields,
+    "step_minimize_bit_width": ["minimize_bit_width"],
+    "step_generate_estimate_reports": ["generate_outputs", "synth_clk_period_ns"]
+    + _fpga_part_fields,
+    "step_hw_codegen": _hls_clk_fields + _fpga_part_fields,
+    "step_hw_ipgen": [],
+    "step_set_fifo_depths": [
+        "auto_fifo_depths",
+        "auto_fifo_strategy",
+        "default_swg_exception",
+        "folding_config_file",
+        "force_python_rtlsim",
+        "large_fifo_mem_style",
+        "split_large_fifos",
+    ]
+    + _hls_clk_fields
+    + _fpga_part_fields,
+    "step_create_stitched_ip": [
+        "generate_outputs",
+        "signature",
+        "stitched_ip_gen_dcp",
+        "synth_clk_period_ns",
+    ]
+    + _fpga_part_fields
+    + _verify_fields,
+    "step_measure_rtlsim_performance": [
+        "generate_outputs",
+        "force_python_rtlsim",
+        "rtlsim_batch_size",
+        "verify_save_rtlsim_waveforms",
+    ],
+    "step_make_pynq_driver": ["generate_outputs", "shell_flow_type", "fuse_host_preproc"],
+    "step_out_of_context_synthesis": ["generate_outputs", "synth_clk_period_ns"]
+    + _fpga_part_fields,
+    "step_synthesize_bitfile": [
+        "generate_outputs",
+        "synth_clk_period_ns",
+        "enable_hw_debug",
+        "vitis_platform",
+        "vitis_floorplan_file",
+        "vitis_opt_strategy",
+        "vitis_num_compute_units",
+    ]
+    + _fpga_part_fields,
+    "step_deployment_package": ["generate_outputs"],
+}
+
+#: standard steps that read the parent model of the dataflow partition, saved
+#: by step_create_dataflow_partition (for verification with need_parent=True or
+#: host-side pre-processing), which is thus part of their fingerprint as well.
+#: Custom steps are always fingerprinted with the parent model.
+build_dataflow_steps_using_parent = [
+    "step_apply_folding_config",
+    "step_create_stitched_ip",
+    "step_make_pynq_driver",
+]
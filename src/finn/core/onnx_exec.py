@@ -27,11 +27,318 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import copy
+import multiprocessing as mp
 import numpy as np
 import qonnx.analysis.topology as ta
+import queue
+from qonnx.core.modelwrapper import ModelWrapper
+from qonnx.core.onnx_exec import execute_node
 from qonnx.core.onnx_exec import execute_onnx as execute_onnx_base
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.util.basic import (
+    get_by_name,
+    get_num_default_workers,
+    get_sanitize_quant_tensors,
+    is_finn_op,
+    sanitize_quant_values,
+)
 
 from finn.core.rtlsim_exec import rtlsim_exec
+from finn.util.cppsim_server import shutdown_cppsim_servers
+
+
+def get_input_batch_size(model, input_dict):
+    """Returns the batch size of the given named inputs if they contain several
+    samples of a model that describes a single sample, i.e. if their shapes
+    only differ from those of the model in the first dimension, which is 1 in
+    the model. Returns None if the input shapes match those of the model."""
+
+    batch_size = None
+    for inp_name, inp in input_dict.items():
+        if model.get_tensor_shape(inp_name) is None:
+            continue
+        model_shape = tuple(model.get_tensor_shape(inp_name))
+        inp_shape = inp.shape
+        if inp_shape == model_shape:
+            continue
+        if (
+            len(model_shape) > 0
+            and len(inp_shape) == len(model_shape)
+            and model_shape[0] == 1
+            and inp_shape[1:] == model_shape[1:]
+            and batch_size in [None, inp_shape[0]]
+        ):
+            batch_size = inp_shape[0]
+        else:
+            raise Exception(
+                "Shape mismatch for provided input %s: found %s expected %s "
+                % (inp_name, str(inp_shape), str(model_shape))
+            )
+    return batch_size
+
+
+def is_batched_tensor(model, tensor_name, value, batch_size):
+    """Returns whether the given value of a tensor of the model, which describes
+    a single sample, holds batch_size samples stacked along its first dimension.
+    This is not the case for initializers and for tensors whose leading
+    dimension is not 1 in the model or not batch_size in the value, e.g. shape
+    tensors or side inputs that are broadcast over the batch."""
+
+    if get_by_name(model.graph.initializer, tensor_name) is not None:
+        return False
+    if np.ndim(value) == 0 or value.shape[0] != batch_size:
+        return False
+    model_shape = model.get_tensor_shape(tensor_name)
+    return model_shape is None or (len(model_shape) > 0 and model_shape[0] == 1)
+
+
+def execute_node_batched(model, node, context, batch_size, opset_version):
+    """Executes a single node of the given model on batch_size samples, which
+    are stacked along the first dimension of the tensors in the context (see
+    is_batched_tensor). Custom ops that implement execute_node_batched, such as
+    HW layers (see HWCustomOp.execute_node_batched), execute the whole batch at
+    once, all other nodes are executed once per sample on the batched inputs
+    sliced per sample and the other inputs unchanged."""
+
+    if is_finn_op(node.domain):
+        inst = getCustomOp(node)
+        if hasattr(inst, "execute_node_batched"):
+            inst.execute_node_batched(context, model.graph, batch_size)
+            return
+    batched = set(
+        [x for x in node.input if x != "" and is_batched_tensor(model, x, context[x], batch_size)]
+    )
+    if len(batched) == 0:
+        # e.g. Constant nodes or shape computations, the same for all samples
+        execute_node(node, context, model.graph, opset_version=opset_version)
+        return
+    outputs = {x: [] for x in node.output}
+    sample_context = {x: context[x] for x in node.output}
+    for i in range(batch_size):
+        for inp in node.input:
+            if inp in batched:
+                sample_context[inp] = context[inp][i : i + 1]
+            elif inp != "":
+                sample_context[inp] = context[inp]
+        execute_node(node, sample_context, model.graph, opset_version=opset_version)
+        for outp in node.output:
+            outputs[outp].append(sample_context[outp])
+    for outp in node.output:
+        context[outp] = np.concatenate(outputs[outp], axis=0)
+
+
+def execute_onnx_batched(
+    model, input_dict, batch_size, return_full_exec_context=False, start_node=None, end_node=None
+):
+    """Executes given ONNX ModelWrapper, which describes a single sample, node
+    by node on batch_size samples stacked along the first dimension of the given
+    named inputs (see get_input_batch_size). In rtlsim mode, the samples are
+    streamed back-to-back through a single simulation of each HW layer. The
+    other arguments are as for execute_onnx."""
+
+    if not model.check_all_tensor_shapes_specified():
+        raise Exception("Found unspecified tensor shapes, try infer_shapes")
+    ret = model.analysis(ta.nodes_topologically_sorted)
+    assert (
+        ret["nodes_topologically_sorted"] is True
+    ), """Nodes must be
+    topologically sorted."""
+
+    graph = model.graph
+    execution_context = model.make_empty_exec_context()
+    for inp_name in input_dict.keys():
+        if inp_name in execution_context:
+            execution_context[inp_name] = input_dict[inp_name]
+    opset_version = model.model.opset_import[0].version
+    if start_node is None:
+        start_node = graph.node[0]
+    if end_node is None:
+        end_node = graph.node[-1]
+    # select the nodes between specified start/end nodes
+    start_ind = model.get_node_index(start_node)
+    end_ind = model.get_node_index(end_node) + 1
+    assert end_ind >= start_ind, "Start/end nodes must define valid subgraph"
+    for node in graph.node[start_ind:end_ind]:
+        if get_sanitize_quant_tensors() != 0:
+            # round input values to match quantization annotation
+            execution_context = sanitize_quant_values(model, node.input, execution_context)
+        execute_node_batched(model, node, execution_context, batch_size, opset_version)
+        if get_sanitize_quant_tensors() != 0:
+            # round output values to quantization annotation
+            execution_context = sanitize_quant_values(model, node.output, execution_context)
+
+    if return_full_exec_context:
+        return execution_context
+    else:
+        # provide outputs as dict
+        output_dict = dict()
+        for out_tensor in graph.output:
+            out_name = out_tensor.name
+            output_dict[out_name] = execution_context[out_name]
+        return output_dict
+
+
+# model and execution context of a worker process of execute_onnx_pipelined
+_pipeline_worker = {}
+
+
+def _pipeline_worker_init(model_bytes):
+    model = ModelWrapper(model_bytes)
+    _pipeline_worker["model"] = model
+    _pipeline_worker["context"] = model.make_empty_exec_context()
+    # terminate the cppsim servers started by this worker when it exits
+    mp.util.Finalize(None, shutdown_cppsim_servers, exitpriority=10)
+
+
+def _pipeline_worker_run(node_ind, chunk_ind, batch_size, inputs):
+    model = _pipeline_worker["model"]
+    node = model.graph.node[node_ind]
+    context = dict(_pipeline_worker["context"])
+    context.update(inputs)
+    if get_sanitize_quant_tensors() != 0:
+        context = sanitize_quant_values(model, node.input, context)
+    execute_node_batched(model, node, context, batch_size, model.model.opset_import[0].version)
+    if get_sanitize_quant_tensors() != 0:
+        context = sanitize_quant_values(model, node.output, context)
+    return (node_ind, chunk_ind, {x: context[x] for x in node.output})
+
+
+def execute_onnx_pipelined(
+    model, input_dict, chunk_size=1, num_workers=None, return_full_exec_context=False
+):
+    """Executes given ONNX ModelWrapper, which describes a single sample, on a
+    batch of samples (see get_input_batch_size) like execute_onnx_batched, but
+    pipelined across a pool of worker processes. The batch is split into chunks
+    of chunk_size samples, and each node starts on a chunk as soon as all its
+    inputs for that chunk are available, so that the chunks flow through the
+    graph concurrently like through the dataflow hardware. This pays off if
+    execution is dominated by node-level cppsim or rtlsim.
+
+    Each node is assigned to one of num_workers workers (defaulting to
+    NUM_DEFAULT_WORKERS, 0 for one per CPU core) and processes the chunks in
+    order, since node-level simulations exchange data through files in the
+    node's code generation directory. Node attributes set during execution
+    (such as cycles_rtlsim) are not propagated back to the given model. The
+    other arguments are as for execute_onnx."""
+
+    batch_size = get_input_batch_size(model, input_dict)
+    if batch_size is None:
+        # a single sample, nothing to pipeline
+        return execute_onnx(model, input_dict, return_full_exec_context)
+    if not model.check_all_tensor_shapes_specified():
+        raise Exception("Found unspecified tensor shapes, try infer_shapes")
+    ret = model.analysis(ta.nodes_topologically_sorted)
+    assert (
+        ret["nodes_topologically_sorted"] is True
+    ), """Nodes must be
+    topologically sorted."""
+    if num_workers is None:
+        num_workers = get_num_default_workers()
+    assert num_workers >= 0, "Number of workers must be nonnegative."
+    if num_workers == 0:
+        num_workers = mp.cpu_count()
+
+    graph = model.graph
+    nodes = list(graph.node)
+    producers = {x: k for (k, node) in enumerate(nodes) for x in node.output}
+    # tensors exchanged between the nodes (or provided as inputs) per chunk
+    node_inputs = []
+    consumers = {}
+    for k, node in enumerate(nodes):
+        inps = set([x for x in node.input if x in producers or x in input_dict])
+        node_inputs.append(inps)
+        for x in inps:
+            consumers.setdefault(x, []).append(k)
+    graph_outputs = [x.name for x in graph.output]
+    # tensors holding a chunk of samples, the others are the same for all chunks
+    batched = set(
+        [x for x, value in input_dict.items() if is_batched_tensor(model, x, value, batch_size)]
+    )
+    for node in nodes:
+        if any([x in batched for x in node.input]):
+            batched.update(node.output)
+    chunks = [(i, min(i + chunk_size, batch_size)) for i in range(0, batch_size, chunk_size)]
+    available = {}
+    n_missing = {}
+    n_unconsumed = {}
+    # chunks ready to be executed by each node, in order
+    ready = [[] for node in nodes]
+
+    def make_available(name, chunk_ind, value):
+        available[(name, chunk_ind)] = value
+        n_unconsumed[(name, chunk_ind)] = len(consumers.get(name, []))
+        for k in consumers.get(name, []):
+            n_missing[(k, chunk_ind)] = n_missing.get((k, chunk_ind), len(node_inputs[k])) - 1
+            if n_missing[(k, chunk_ind)] == 0:
+                ready[k].append(chunk_ind)
+
+    for k in range(len(nodes)):
+        if len(node_inputs[k]) == 0:
+            ready[k] = list(range(len(chunks)))
+    for name, value in input_dict.items():
+        for j, (start, end) in enumerate(chunks):
+            make_available(name, j, value[start:end] if name in batched else value)
+
+    busy = [False for node in nodes]
+    n_done = 0
+    done_queue = queue.Queue()
+    pools = []
+    try:
+        for w in range(min(num_workers, len(nodes))):
+            pools.append(mp.Pool(1, _pipeline_worker_init, (model.model.SerializeToString(),)))
+        while n_done < len(nodes) * len(chunks):
+            for k in range(len(nodes)):
+                if busy[k] or len(ready[k]) == 0:
+                    continue
+                j = min(ready[k])
+                ready[k].remove(j)
+                inputs = {x: available[(x, j)] for x in node_inputs[k]}
+                if not return_full_exec_context:
+                    # free tensors once all their consumers were started
+                    for x in node_inputs[k]:
+                        n_unconsumed[(x, j)] -= 1
+                        if n_unconsumed[(x, j)] == 0 and x not in graph_outputs:
+                            del available[(x, j)]
+                chunk_len = chunks[j][1] - chunks[j][0]
+                pools[k % len(pools)].apply_async(
+                    _pipeline_worker_run,
+                    (k, j, chunk_len, inputs),
+                    callback=done_queue.put,
+                    error_callback=done_queue.put,
+                )
+                busy[k] = True
+            if not any(busy):
+                raise Exception("Found node inputs that are neither provided nor produced")
+            result = done_queue.get()
+            if isinstance(result, BaseException):
+                raise result
+            k, j, outputs = result
+            busy[k] = False
+            n_done += 1
+            for name, value in outputs.items():
+                make_available(name, j, value)
+        for pool in pools:
+            pool.close()
+            pool.join()
+    finally:
+        for pool in pools:
+            pool.terminate()
+            pool.join()
+
+    if return_full_exec_context:
+        execution_context = model.make_empty_exec_context()
+        names = set([x[0] for x in available.keys()])
+    else:
+        execution_context = dict()
+        names = graph_outputs
+    for name in names:
+        if name in batched:
+            execution_context[name] = np.concatenate(
+                [available[(name, j)] for j in range(len(chunks))], axis=0
+            )
+        else:
+            execution_context[name] = available[(name, 0)]
+    return execution_context
 
 
 def execute_onnx(model, input_dict, return_full_exec_context=False, start_node=None, end_node=None):
@@ -44,13 +351,21 @@ def execute_onnx(model, input_dict, return_full_exec_context=False, start_node=N
     When start_node and end_node are set to None, the whole graph is executed.
     If they are set to particular ONNX nodes, only the subgraph between (and
     including) those nodes is executed.
+    The inputs may contain a batch of several samples for a model that describes
+    a single sample (see get_input_batch_size), which are then executed as a
+    batch (see execute_onnx_batched) or by stitched IP rtlsim.
     """
 
+    batch_size = get_input_batch_size(model, input_dict)
     # check if model has an execution mode set
     # if None, execute model node using the QONNX-provided execute_onnx impl
     # if set to "rtlsim" execute model using pyverilator
     model_exec_mode = model.get_metadata_prop("exec_mode")
     if (model_exec_mode is None) or (model_exec_mode == ""):
+        if batch_size is not None:
+            return execute_onnx_batched(
+                model, input_dict, batch_size, return_full_exec_context, start_node, end_node
+            )
         return execute_onnx_base(model, input_dict, return_full_exec_context, start_node, end_node)
 
     if not model.check_all_tensor_shapes_specified():
@@ -69,19 +384,10 @@ def execute_onnx(model, input_dict, return_full_exec_context=False, start_node=N
     # this is provided by the execution_context, which is a dict of np.ndarray
     execution_context = model.make_empty_exec_context()
     # fill in any inputs provided to this function
+    # (shapes were checked by get_input_batch_size)
     for inp_name in input_dict.keys():
         if inp_name in execution_context:
-            if execution_context[inp_name].shape == input_dict[inp_name].shape:
-                execution_context[inp_name] = input_dict[inp_name]
-            else:
-                raise Exception(
-                    "Shape mismatch for provided input %s: found %s expected %s "
-                    % (
-                        inp_name,
-                        str(execution_context[inp_name].shape),
-                        str(input_dict[inp_name].shape),
-                    )
-                )
+            execution_context[inp_name] = input_dict[inp_name]
 
     # check if model has an execution mode set
     # if None, execute model node by node using execute_node()
@@ -27,6 +27,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import time
 from pyverilator.util.axi_utils import reset_rtlsim, rtlsim_multi_io
 from qonnx.custom_op.registry import getCustomOp
 
@@ -71,6 +72,10 @@ def rtlsim_exec(model, execution_context, pre_hook=None, post_hook=None):
     # extract i/o info to prepare io_dict
     io_dict = {"inputs": {}, "outputs": {}}
     if_dict = eval(model.get_metadata_prop("vivado_stitch_ifnames"))
+    # keep track of where the wall-clock time goes (host-side packing and
+    # unpacking vs. simulation), reported via the rtlsim_profile metadata_prop
+    profile = dict()
+    start = time.time()
     # go over and prepare inputs
     for i, i_vi in enumerate(model.graph.input):
         i_name = i_vi.name
@@ -123,6 +128,7 @@ def rtlsim_exec(model, execution_context, pre_hook=None, post_hook=None):
         o_stream_w = last_node.get_outstream_width()
         o_tensor_info.append((o_stream_w, o_dt, o_folded_shape, o_shape))
         num_out_values += batchsize * last_node.get_number_output_values()
+    profile["pack_input[ms]"] = (time.time() - start) * 1000
 
     # prepare pyverilator model
     rtlsim_so = model.get_metadata_prop("rtlsim_so")
@@ -136,6 +142,7 @@ def rtlsim_exec(model, execution_context, pre_hook=None, post_hook=None):
     reset_rtlsim(sim)
     if pre_hook is not None:
         pre_hook(sim)
+    start = time.time()
     n_cycles = rtlsim_multi_io(
         sim,
         io_dict,
@@ -144,10 +151,12 @@ def rtlsim_exec(model, execution_context, pre_hook=None, post_hook=None):
         sname="_",
         liveness_threshold=pyverilate_get_liveness_threshold_cycles(),
     )
+    profile["rtlsim[ms]"] = (time.time() - start) * 1000
     if post_hook is not None:
         post_hook(sim)
 
     # unpack outputs and put back into execution context
+    start = time.time()
     for o, o_vi in enumerate(model.graph.output):
         o_name = o_vi.name
         if_name = if_dict["m_axis"][o][0]
@@ -157,5 +166,7 @@ def rtlsim_exec(model, execution_context, pre_hook=None, post_hook=None):
             packed_output, None, o_dt, o_folded_shape, o_stream_w, o_dt.bitwidth()
         )
         execution_context[o_name] = o_folded_tensor.reshape(o_shape)
+    profile["unpack_output[ms]"] = (time.time() - start) * 1000
 
     model.set_metadata_prop("cycles_rtlsim", str(n_cycles))
+    model.set_metadata_prop("rtlsim_profile", str(profile))
@@ -82,5 +82,10 @@ def throughput_test_rtlsim(model, batchsize=100):
     res["DRAM_out_bandwidth[MB/s]"] = o_bytes * 0.000001 / runtime_s
     res["fclk[mhz]"] = fclk_mhz
     res["N"] = batchsize
+    # host-side time breakdown of the rtlsim_exec call
+    rtlsim_profile = eval(model.get_metadata_prop("rtlsim_profile"))
+    res.update(rtlsim_profile)
+    total_ms = sum(rtlsim_profile.values())
+    res["rtlsim_time_fraction"] = rtlsim_profile["rtlsim[ms]"] / total_ms if total_ms > 0 else 1.0
 
     return res
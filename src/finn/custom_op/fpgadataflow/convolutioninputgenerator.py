@@ -27,14 +27,11 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import numpy as np
-from onnx import TensorProto, helper
 from qonnx.core.datatype import DataType
-from qonnx.core.modelwrapper import ModelWrapper
 from qonnx.custom_op.general.im2col import compute_conv_output_dim
-from qonnx.custom_op.registry import getCustomOp
-from qonnx.util.basic import qonnx_make_model
 
 from finn.custom_op.fpgadataflow.hwcustomop import HWCustomOp
+from finn.util.python_exec import im2col_nhwc
 
 # ONNX i/o tensor shape assumptions for ConvolutionInputGenerator:
 # input 0 is the input tensor, shape NHWC = (1, IFMDim, IFMDim, IFMChannels)
@@ -217,41 +214,14 @@ class ConvolutionInputGenerator(HWCustomOp):
         return 0
 
     def execute_node(self, context, graph):
-        # using Im2Col node to calculate output
+        # sliding window view equivalent of the Im2Col node, which also handles a
+        # batch of samples stacked along the first dimension
         node = self.onnx_node
-        ifm_dim = self.get_nodeattr("IFMDim")
         k = self.get_nodeattr("ConvKernelDim")
         s = self.get_nodeattr("Stride")
         d = self.get_nodeattr("Dilation")
-        ifm_ch = self.get_nodeattr("IFMChannels")
         inp_values = context[node.input[0]]
-        oshape = context[node.output[0]].shape
-        ishape = inp_values.shape
-        inp = helper.make_tensor_value_info(node.input[0], TensorProto.FLOAT, ishape)
-        outp = helper.make_tensor_value_info(node.output[0], TensorProto.FLOAT, oshape)
-        im2col_node = helper.make_node(
-            "Im2Col",
-            [node.input[0]],
-            [node.output[0]],
-            domain="qonnx.custom_op.general",
-            stride=[s[0], s[1]],
-            kernel_size=[k[0], k[1]],
-            dilations=[d[0], d[1]],
-            input_shape="(1,{},{},{})".format(ifm_dim[0], ifm_dim[1], ifm_ch),
-        )
-        graph_im2col = helper.make_graph(
-            nodes=[im2col_node],
-            name="single-im2col-exec",
-            inputs=[inp],
-            outputs=[outp],
-        )
+        context[node.output[0]] = im2col_nhwc(inp_values, k, s, d)
 
-        opset_version = self.onnx_opset_version
-        opset_imports = [helper.make_opsetid("", opset_version)]
-        onnx_kwargs = {"opset_imports": opset_imports}
-        model_im2col = ModelWrapper(qonnx_make_model(graph_im2col, **onnx_kwargs))
-        model_im2col.set_tensor_datatype(node.input[0], self.get_input_datatype())
-        # use execution function from Im2Col node
-        # this automatically updates the execution context
-        inst = getCustomOp(im2col_node)
-        inst.execute_node(context, model_im2col.graph)
+    def python_exec_supports_batch(self):
+        return True
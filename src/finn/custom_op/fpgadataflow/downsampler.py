@@ -28,13 +28,10 @@
 
 import numpy as np
 import warnings
-from onnx import TensorProto, helper
 from qonnx.core.datatype import DataType
-from qonnx.core.modelwrapper import ModelWrapper
-from qonnx.custom_op.registry import getCustomOp
-from qonnx.util.basic import qonnx_make_model
 
 from finn.custom_op.fpgadataflow.hwcustomop import HWCustomOp
+from finn.util.python_exec import im2col_nhwc
 
 
 class DownSampler(HWCustomOp):
@@ -177,53 +174,21 @@ class DownSampler(HWCustomOp):
         return np.prod(folded_oshape[:-1])
 
     def execute_node(self, context, graph):
-        # using Im2Col node to calculate output
+        # equivalent to an Im2Col node with a 1x1 kernel
         node = self.onnx_node
-        ifm_dim = self.get_nodeattr("ImgDim")
         stride = self.get_nodeattr("Stride")
-        ifm_ch = self.get_nodeattr("NumChannels")
         # check if 1D or 2D case
         if self.get_nodeattr("is1D"):
             if self.get_nodeattr("is1D_unitx"):
-                ifm_dim_w = 1
-                sw = 1
-                ifm_dim_h = ifm_dim
                 sh = stride
+                sw = 1
             else:
-                ifm_dim_h = 1
                 sh = 1
-                ifm_dim_w = ifm_dim
                 sw = stride
         else:
-            ifm_dim_h = ifm_dim_w = ifm_dim
             sh = sw = stride
         inp_values = context[node.input[0]]
-        oshape = context[node.output[0]].shape
-        ishape = inp_values.shape
-        inp = helper.make_tensor_value_info(node.input[0], TensorProto.FLOAT, ishape)
-        outp = helper.make_tensor_value_info(node.output[0], TensorProto.FLOAT, oshape)
-        im2col_node = helper.make_node(
-            "Im2Col",
-            [node.input[0]],
-            [node.output[0]],
-            domain="qonnx.custom_op.general",
-            stride=[sh, sw],
-            kernel_size=[1, 1],
-            input_shape="(1,{},{},{})".format(ifm_dim_h, ifm_dim_w, ifm_ch),
-        )
-        graph_im2col = helper.make_graph(
-            nodes=[im2col_node],
-            name="single-im2col-exec",
-            inputs=[inp],
-            outputs=[outp],
-        )
-
-        opset_version = self.onnx_opset_version
-        opset_imports = [helper.make_opsetid("", opset_version)]
-        onnx_kwargs = {"opset_imports": opset_imports}
-        model_im2col = ModelWrapper(qonnx_make_model(graph_im2col, **onnx_kwargs))
-        model_im2col.set_tensor_datatype(node.input[0], self.get_input_datatype())
-        # use execution function from Im2Col node
-        # this automatically updates the execution context
-        inst = getCustomOp(im2col_node)
-        inst.execute_node(context, model_im2col.graph)
+        context[node.output[0]] = im2col_nhwc(inp_values, (1, 1), (sh, sw), (1, 1))
+
+    def python_exec_supports_batch(self):
+        return True
@@ -227,6 +227,9 @@ class ChannelwiseOp_hls(ChannelwiseOp, HLSBackend):
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            ChannelwiseOp.execute_node(self, context, graph)
+            return
         node = self.onnx_node
 
         # TODO ensure codegen dir exists
@@ -237,7 +240,7 @@ class ChannelwiseOp_hls(ChannelwiseOp, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
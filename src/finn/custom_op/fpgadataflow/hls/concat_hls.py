@@ -91,6 +91,9 @@ class StreamingConcat_hls(StreamingConcat, HLSBackend):
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            StreamingConcat.execute_node(self, context, graph)
+            return
         node = self.onnx_node
         n_inps = len(self.onnx_node.input)
         ishapes = [self.get_normal_input_shape(x) for x in range(n_inps)]
@@ -106,7 +109,7 @@ class StreamingConcat_hls(StreamingConcat, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
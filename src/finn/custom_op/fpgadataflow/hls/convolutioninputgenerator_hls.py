@@ -335,6 +335,23 @@ class ConvolutionInputGenerator_hls(ConvolutionInputGenerator, HLSBackend):
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            ConvolutionInputGenerator.execute_node(self, context, graph)
+            if self.get_nodeattr("depthwise"):
+                # interleave channels to match the output order of the depthwise
+                # SWG, which subsequent VVAU layers expect (see the folded
+                # output shapes above)
+                node = self.onnx_node
+                im2col_out = context[node.output[0]]
+                simd = self.get_nodeattr("SIMD")
+                ofm_h, ofm_w = self.get_nodeattr("OFMDim")
+                k_h, k_w = self.get_nodeattr("ConvKernelDim")
+                ifm_ch = self.get_nodeattr("IFMChannels")
+                im2col_out = im2col_out.reshape(-1, ofm_h, ofm_w, k_h * k_w, ifm_ch // simd, simd)
+                im2col_out = im2col_out.transpose(0, 1, 2, 4, 3, 5)
+                im2col_out = im2col_out.reshape(-1, ofm_h, ofm_w, ifm_ch * k_h * k_w)
+                context[node.output[0]] = im2col_out
+            return
         node = self.onnx_node
         exp_ishape = self.get_normal_input_shape()
         exp_oshape = self.get_normal_output_shape()
@@ -348,7 +365,7 @@ class ConvolutionInputGenerator_hls(ConvolutionInputGenerator, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
@@ -95,6 +95,9 @@ class DownSampler_hls(DownSampler, HLSBackend):
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            DownSampler.execute_node(self, context, graph)
+            return
         node = self.onnx_node
         exp_ishape = self.get_normal_input_shape()
         exp_oshape = self.get_normal_output_shape()
@@ -107,7 +110,7 @@ class DownSampler_hls(DownSampler, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
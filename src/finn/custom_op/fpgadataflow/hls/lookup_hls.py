@@ -36,7 +36,7 @@ from finn.custom_op.fpgadataflow.lookup import Lookup
 from finn.util.data_packing import (
     npy_to_rtlsim_input,
     numpy_to_hls_code,
-    pack_innermost_dim_as_hex_string,
+    pack_innermost_dim_to_hex_file,
     rtlsim_output_to_npy,
 )
 
@@ -239,17 +239,17 @@ class Lookup_hls(Lookup, HLSBackend):
             # reshape for packing the innermost dim
             embeddings_padded = embeddings_padded.reshape(-1, emb_elems_per_ext_mem_width)
             weight_filename = "%s/%s.dat" % (path, self.onnx_node.name)
-            ret = pack_innermost_dim_as_hex_string(
-                embeddings_padded, edt, ext_mem_width, True, prefix=""
+            pack_innermost_dim_to_hex_file(
+                embeddings_padded, edt, ext_mem_width, weight_filename, reverse_inner=True
             )
-            with open(weight_filename, "w") as f:
-                for current_line in ret:
-                    f.write(current_line + "\n")
         else:
             raise Exception("Unrecognized mem_mode: " + mem_mode)
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            Lookup.execute_node(self, context, graph)
+            return
         node = self.onnx_node
         exp_ishape = tuple(self.get_normal_input_shape())
         exp_oshape = tuple(self.get_normal_output_shape())
@@ -267,7 +267,7 @@ class Lookup_hls(Lookup, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
@@ -479,6 +479,9 @@ class MVAU_hls(MVAU, HLSBackend):
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            MVAU.execute_node(self, context, graph)
+            return
         mem_mode = self.get_nodeattr("mem_mode")
         node = self.onnx_node
 
@@ -490,7 +493,7 @@ class MVAU_hls(MVAU, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
@@ -28,7 +28,6 @@
 
 import numpy as np
 import os
-import textwrap
 from math import ceil, log2
 from qonnx.core.datatype import DataType
 from qonnx.util.basic import roundup_to_integer_multiple
@@ -38,7 +37,8 @@ from finn.custom_op.fpgadataflow.thresholding import Thresholding
 from finn.util.data_packing import (
     npy_to_rtlsim_input,
     numpy_to_hls_code,
-    pack_innermost_dim_as_hex_string,
+    pack_innermost_dim_as_words,
+    pack_innermost_dim_to_hex_file,
     rtlsim_output_to_npy,
 )
 
@@ -160,7 +160,7 @@ class Thresholding_hls(Thresholding, HLSBackend):
 
         * weights : numpy array with weights to be put into the file
         * weight_file_mode : one of {hls_header, decoupled_verilog_dat,
-          decoupled_runtime}
+          decoupled_runtime, decoupled_runtime_npy}
         * weight_file_name : filename for the weight file to be generated
 
         """
@@ -220,15 +220,10 @@ class Thresholding_hls(Thresholding, HLSBackend):
                 weight_width = self.get_weightstream_width()
                 # pad to nearest 4 bits to get hex strings
                 weight_width_padded = roundup_to_integer_multiple(weight_width, 4)
-                weight_tensor_pe_flipped = pack_innermost_dim_as_hex_string(
-                    decoupled_thres_pe_flipped, tdt, weight_width_padded, prefix=""
+                pack_innermost_dim_to_hex_file(
+                    decoupled_thres_pe_flipped, tdt, weight_width_padded, weight_file_name
                 )
-                weight_stream = weight_tensor_pe_flipped.flatten()
-                weight_stream = weight_stream.copy()
-                with open(weight_file_name, "w") as f:
-                    for val in weight_stream:
-                        f.write(val + "\n")
-            elif weight_file_mode == "decoupled_runtime":
+            elif weight_file_mode in ["decoupled_runtime", "decoupled_runtime_npy"]:
                 # memstream axi-lite interface will map each mem line to
                 # one or multiple 32-bit words
                 weight_width = self.get_weightstream_width()
@@ -236,19 +231,21 @@ class Thresholding_hls(Thresholding, HLSBackend):
                 if words_per_memwidth < 1:
                     words_per_memwidth = 1
                 weight_width_padded = words_per_memwidth * 32
-                # first, pack and ensure padding to 32 bits
-                weight_tensor_pe_flipped = pack_innermost_dim_as_hex_string(
-                    decoupled_thres_pe_flipped, tdt, weight_width_padded, prefix=""
-                )
-                weight_stream = weight_tensor_pe_flipped.flatten()
-                weight_stream = weight_stream.copy()
-                with open(weight_file_name, "w") as f:
-                    for val in weight_stream:
-                        # split into groups of 8 hex digits (= 32 bits)
-                        words_32b = textwrap.wrap(val, 8)
-                        words_32b.reverse()
-                        for word_32b in words_32b:
-                            f.write(word_32b + "\n")
+                # pack with padding to 32 bits, then split into 32-bit words
+                if weight_file_mode == "decoupled_runtime":
+                    pack_innermost_dim_to_hex_file(
+                        decoupled_thres_pe_flipped,
+                        tdt,
+                        weight_width_padded,
+                        weight_file_name,
+                        split_words_nbits=32,
+                    )
+                else:
+                    # same words in binary form, as a .npy file of uint32
+                    words = pack_innermost_dim_as_words(
+                        decoupled_thres_pe_flipped, tdt, weight_width_padded
+                    )
+                    np.save(weight_file_name, words)
             else:
                 raise Exception("Decoupled weight export not yet implemented")
         else:
@@ -275,6 +272,9 @@ class Thresholding_hls(Thresholding, HLSBackend):
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            Thresholding.execute_node(self, context, graph)
+            return
         node = self.onnx_node
 
         # TODO ensure codegen dir exists
@@ -285,7 +285,7 @@ class Thresholding_hls(Thresholding, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
@@ -128,6 +128,9 @@ class VVAU_hls(VVAU, HLSBackend):
 
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
+        if mode == "python":
+            VVAU.execute_node(self, context, graph)
+            return
         mem_mode = self.get_nodeattr("mem_mode")
         node = self.onnx_node
 
@@ -139,7 +142,7 @@ class VVAU_hls(VVAU, HLSBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
@@ -28,13 +28,22 @@
 
 import numpy as np
 import os
+import shutil
 import subprocess
 from abc import ABC, abstractmethod
 from qonnx.core.datatype import DataType
 
 from finn.custom_op.fpgadataflow import templates
-from finn.util.basic import CppBuilder, get_rtlsim_trace_depth, make_build_dir
-from finn.util.hls import CallHLS
+from finn.util.basic import (
+    CppBuilder,
+    get_cppsim_server_enabled,
+    get_rtlsim_trace_depth,
+    make_build_dir,
+)
+from finn.util.cache import hash_items
+from finn.util.cppsim_server import get_cppsim_server, shutdown_cppsim_servers
+from finn.util.fpgadataflow import hash_generated_code
+from finn.util.hls import CallHLS, get_hls_env_digest, get_ip_cache
 from finn.util.pyverilator import make_single_source_file
 
 try:
@@ -64,7 +73,14 @@ class HLSBackend(ABC):
             code_gen_dir != ""
         ), """Node attribute "code_gen_dir_ipgen" is
         not set. Please run HLSSynthIP first."""
-        verilog_path = "{}/project_{}/sol1/impl/verilog/".format(code_gen_dir, self.onnx_node.name)
+        ipgen_path = self.get_nodeattr("ipgen_path")
+        if ipgen_path != "":
+            # may point to the IP of an identical node, see HLSSynthIP
+            verilog_path = "{}/sol1/impl/verilog/".format(ipgen_path)
+        else:
+            verilog_path = "{}/project_{}/sol1/impl/verilog/".format(
+                code_gen_dir, self.onnx_node.name
+            )
         # default impl only returns the HLS verilog codegen dir
         return [verilog_path]
 
@@ -93,16 +109,23 @@ class HLSBackend(ABC):
         verilog_files = self.get_all_verilog_filenames(abspath=True)
         single_src_dir = make_build_dir("rtlsim_" + self.onnx_node.name + "_")
         tmp_build_dir = make_build_dir("pyverilator_" + self.onnx_node.name + "_")
-        target_file = single_src_dir + "/" + self.get_verilog_top_module_name() + ".v"
+        vlnv = self.get_nodeattr("ip_vlnv")
+        if vlnv != "":
+            # the IP may have been generated for an identical node, in which
+            # case its top module is named after that node
+            top_module_name = vlnv.split(":")[2]
+        else:
+            top_module_name = self.get_verilog_top_module_name()
+        target_file = single_src_dir + "/" + top_module_name + ".v"
         make_single_source_file(verilog_files, target_file)
 
         # build the Verilator emu library
         sim = PyVerilator.build(
-            self.get_verilog_top_module_name() + ".v",
+            top_module_name + ".v",
             build_dir=tmp_build_dir,
             verilog_path=[single_src_dir],
             trace_depth=get_rtlsim_trace_depth(),
-            top_module_name=self.get_verilog_top_module_name(),
+            top_module_name=top_module_name,
         )
         # save generated lib filename in attribute
         self.set_nodeattr("rtlsim_so", sim.lib._name)
@@ -171,14 +194,56 @@ class HLSBackend(ABC):
         "Return a list of extra tcl directives for HLS synthesis."
         return []
 
+    # files in code_gen_dir_ipgen that are not inputs to HLS synthesis: memory
+    # init files for the RTL memstream, weights in numpy format, build scripts
+    # and logs
+    ipgen_nonsource_exts = (".dat", ".npy", ".sh", ".log")
+
+    def ipgen_cache_key(self):
+        """Return a content-addressed key for the IP that HLS synthesis
+        generates for this node. The key covers the node name (which ends up
+        in the generated module names), the code generated by
+        code_generation_ipgen and the HLS tool and library versions. Since
+        the generated code reflects the op type, attributes, folding, weights,
+        FPGA part and clock, identical layers map to the same key."""
+        code_gen_dir = self.get_nodeattr("code_gen_dir_ipgen")
+        code_digest = hash_generated_code(code_gen_dir, exclude_exts=self.ipgen_nonsource_exts)
+        return hash_items([self.onnx_node.name, get_hls_env_digest(), code_digest])
+
+    def ipgen_dedup_key(self):
+        """Return a key that is identical for nodes within the same model
+        whose HLS IP would only differ in the node name, and can hence be
+        shared between them. Nodes that differ only in the contents of their
+        memstream init file (weights in internal_decoupled mode) share the
+        same key."""
+        code_gen_dir = self.get_nodeattr("code_gen_dir_ipgen")
+        code_digest = hash_generated_code(
+            code_gen_dir, self.onnx_node.name, exclude_exts=self.ipgen_nonsource_exts
+        )
+        return hash_items([self.onnx_node.op_type, code_digest])
+
     def ipgen_singlenode_code(self):
-        """Builds the bash script for IP generation using the CallHLS utility."""
+        """Builds the bash script for IP generation using the CallHLS utility.
+        The synthesized HLS project is reused from the HLS IP cache (see
+        get_ip_cache()) if an identical node was synthesized before."""
         node = self.onnx_node
         code_gen_dir = self.get_nodeattr("code_gen_dir_ipgen")
         builder = CallHLS()
         builder.append_tcl(code_gen_dir + "/hls_syn_{}.tcl".format(node.name))
         builder.set_ipgen_path(code_gen_dir + "/project_{}".format(node.name))
-        builder.build(code_gen_dir)
+        cache = get_ip_cache()
+        if cache is not None:
+            cache_key = self.ipgen_cache_key()
+        if cache is None or not cache.lookup(cache_key, builder.ipgen_path):
+            builder.build(code_gen_dir)
+            if cache is not None and os.path.isdir(builder.ipgen_path + "/sol1/impl/ip"):
+                # intermediate HLS databases are large and not needed downstream
+                cache.insert(
+                    cache_key,
+                    builder.ipgen_path,
+                    description="%s (%s)" % (node.name, node.op_type),
+                    ignore=shutil.ignore_patterns(".autopilot", "*.log"),
+                )
         ipgen_path = builder.ipgen_path
         assert os.path.isdir(ipgen_path), "IPGen failed: %s not found" % (ipgen_path)
         self.set_nodeattr("ipgen_path", ipgen_path)
@@ -242,6 +307,8 @@ class HLSBackend(ABC):
         builder.append_sources("$FINN_ROOT/deps/cnpy/cnpy.cpp")
         builder.append_includes("-lz")
         builder.set_executable_path(code_gen_dir + "/node_model")
+        # a server of a previous build of this node must not outlive it
+        shutdown_cppsim_servers(builder.executable_path)
         builder.build(code_gen_dir)
         self.set_nodeattr("executable_path", builder.executable_path)
 
@@ -306,7 +373,9 @@ class HLSBackend(ABC):
             context[node.output[i]] = output.reshape(exp_shape)
 
     def exec_precompiled_singlenode_model(self):
-        """Executes precompiled executable."""
+        """Executes precompiled executable. Unless disabled via the
+        FINN_CPPSIM_SERVER env.var., the executable is kept running as a
+        persistent server process across executions of this node."""
         executable_path = self.get_nodeattr("executable_path")
         if executable_path == "":
             raise Exception(
@@ -315,6 +384,11 @@ Found no executable for this node, did you run the codegen and
 compilation transformations?
             """
             )
+        if get_cppsim_server_enabled():
+            server = get_cppsim_server(executable_path)
+            if server is not None:
+                server.run()
+                return
         process_execute = subprocess.Popen(executable_path, stdout=subprocess.PIPE)
         process_execute.communicate()
 
@@ -28,13 +28,20 @@
 
 import numpy as np
 import os
+import re
 import warnings
 from abc import abstractmethod
-from pyverilator.util.axi_utils import _read_signal, reset_rtlsim, rtlsim_multi_io
+from pyverilator.util.axi_utils import rtlsim_multi_io
 from qonnx.custom_op.base import CustomOp
 from qonnx.util.basic import roundup_to_integer_multiple
 
 from finn.util.basic import pyverilate_get_liveness_threshold_cycles
+from finn.util.pyverilator import (
+    ints_to_words,
+    rtlsim_characterize,
+    rtlsim_stream,
+    words_to_ints,
+)
 
 try:
     from pyverilator import PyVerilator
@@ -42,6 +49,13 @@ except ModuleNotFoundError:
     PyVerilator = None
 
 
+def accumulate_char_fxn(chrc):
+    """Accumulate the per-cycle transactions in chrc (last axis is time, one
+    period long) over two periods, as used for the io_chrc_* node attributes."""
+    chrc = np.asarray(chrc, dtype=np.int32)
+    return np.cumsum(np.concatenate([chrc, chrc], axis=-1), axis=-1, dtype=np.int32)
+
+
 class HWCustomOp(CustomOp):
     """HWCustomOp class all custom ops that can be implemented with either
     HLS or RTL backend are based on. Contains different functions every fpgadataflow
@@ -51,6 +65,8 @@ class HWCustomOp(CustomOp):
     def __init__(self, onnx_node, **kwargs):
         super().__init__(onnx_node, **kwargs)
         self.code_gen_dict = {}
+        # state of a batched rtlsim, see execute_node_batched
+        self.rtlsim_batch = None
 
     def get_nodeattr_types(self):
         return {
@@ -60,7 +76,7 @@ class HWCustomOp(CustomOp):
             "ipgen_path": ("s", False, ""),
             "ip_path": ("s", False, ""),
             "ip_vlnv": ("s", False, ""),
-            "exec_mode": ("s", False, "", {"", "rtlsim", "cppsim"}),
+            "exec_mode": ("s", False, "", {"", "rtlsim", "cppsim", "python"}),
             "cycles_rtlsim": ("i", False, 0),
             "cycles_estimate": ("i", False, 0),
             "rtlsim_trace": ("s", False, ""),
@@ -130,6 +146,9 @@ class HWCustomOp(CustomOp):
         """Return a PyVerilator wrapper for the Verilator emulation library
         for this node."""
 
+        if self.rtlsim_batch is not None:
+            # reuse a single simulation for all samples of a batch
+            return self.rtlsim_batch["sim"]
         rtlsim_so = self.get_nodeattr("rtlsim_so")
         assert os.path.isfile(rtlsim_so), "Cannot find rtlsim library."
         # create PyVerilator wrapper
@@ -204,106 +223,175 @@ class HWCustomOp(CustomOp):
         sim.io.ap_clk = 1
         sim.io.ap_clk = 0
 
-    def rtlsim(self, sim, inp, inp2=None):
-        """Runs the pyverilator simulation by passing the input values to the simulation,
-        toggle the clock and observing the execution time. Function contains also an
-        observation loop that can abort the simulation if no output value is produced
-        after 100 cycles."""
-
-        trace_file = self.get_nodeattr("rtlsim_trace")
-        if trace_file != "":
-            if trace_file == "default":
-                trace_file = self.onnx_node.name + ".vcd"
-            sim.start_vcd_trace(trace_file)
-        inputs = inp
-        outputs = []
-        sname = self.hls_sname()
-        o_ready = "out_" + sname + "_TREADY"
-        o_valid = "out_" + sname + "_TVALID"
-        o_data = "out_" + sname + "_TDATA"
-        in0_ready = "in0_" + sname + "_TREADY"
-        in0_valid = "in0_" + sname + "_TVALID"
-        in0_data = "in0_" + sname + "_TDATA"
-        in1_ready = "in1_" + sname + "_TREADY"
-        in1_valid = "in1_" + sname + "_TVALID"
-        in1_data = "in1_" + sname + "_TDATA"
-
-        sim.io[o_ready] = 1
-
-        # observe if output is completely calculated
-        # observation_count will contain the number of cycles the calculation ran
-        num_out_values = self.get_number_output_values()
-        output_observed = False
-        observation_count = 0
-
-        # avoid infinite looping of simulation by aborting when there is no change in
-        # output values after 100 cycles
-        no_change_count = 0
-        old_outputs = outputs
-        liveness_threshold = pyverilate_get_liveness_threshold_cycles()
-
-        while not (output_observed):
-            sim.io[in0_valid] = 1 if len(inputs) > 0 else 0
-            sim.io[in0_data] = inputs[0] if len(inputs) > 0 else 0
-            if sim.io[in0_ready] == 1 and sim.io[in0_valid] == 1:
-                inputs = inputs[1:]
-
-            if inp2 is not None:
-                sim.io[in1_valid] = 1 if len(inp2) > 0 else 0
-                sim.io[in1_data] = inp2[0] if len(inp2) > 0 else 0
-                if sim.io[in1_ready] == 1 and sim.io[in1_valid] == 1:
-                    inp2 = inp2[1:]
-
-            if sim.io[o_valid] == 1 and sim.io[o_ready] == 1:
-                outputs = outputs + [sim.io[o_data]]
-            sim.io.ap_clk = 1
-            sim.io.ap_clk = 0
-
-            observation_count = observation_count + 1
-            no_change_count = no_change_count + 1
-
-            if len(outputs) == num_out_values:
-                self.set_nodeattr("cycles_rtlsim", observation_count)
-                output_observed = True
-
-            if no_change_count == liveness_threshold:
-                if old_outputs == outputs:
-                    if trace_file != "":
-                        sim.flush_vcd_trace()
-                        sim.stop_vcd_trace()
-                    raise Exception(
-                        "Error in simulation! Takes too long to produce output. "
-                        "Consider setting the LIVENESS_THRESHOLD env.var. to a "
-                        "larger value."
-                    )
-                else:
-                    no_change_count = 0
-                    old_outputs = outputs
-        if trace_file != "":
-            sim.flush_vcd_trace()
-            sim.stop_vcd_trace()
-        return outputs
-
-    def rtlsim_multi_io(self, sim, io_dict):
-        "Run rtlsim for this node, supports multiple i/o streams."
+    def get_rtlsim_stream_width(self, name):
+        """Returns the TDATA width of the AXI stream with the given name (e.g.
+        "in0", "in1", "weights", "out" or "out1") of this node's Verilog top
+        module. The width comes from the node's padded stream width functions,
+        since get_verilog_top_module_intf_names only lists the streams exposed
+        to the block design (e.g. no weight stream in internal_decoupled mode)."""
+        if name == "weights":
+            return self.get_weightstream_width_padded()
+        m = re.fullmatch(r"(in|out)(\d*)", name)
+        assert m is not None, "Unknown stream name %s" % name
+        ind = int(m.group(2)) if m.group(2) != "" else 0
+        if m.group(1) == "in":
+            return self.get_instream_width_padded(ind)
+        else:
+            return self.get_outstream_width_padded(ind)
 
+    def rtlsim(self, sim, inp, inp2=None):
+        """Runs the pyverilator simulation by passing the input values (lists of
+        integers, one per stream transaction) to the simulation and returns the
+        list of output values. The stream handshakes are driven natively (see
+        rtlsim_stream) and the number of cycles is stored in cycles_rtlsim.
+        The simulation is aborted if no output value is produced for
+        LIVENESS_THRESHOLD cycles."""
+        io_dict = {"inputs": {"in0": inp}, "outputs": {"out": []}}
+        if inp2 is not None:
+            io_dict["inputs"]["in1"] = inp2
+        self.rtlsim_multi_io(sim, io_dict)
+        return io_dict["outputs"]["out"]
+
+    def rtlsim_multi_io(self, sim, io_dict, num_out_values=None):
+        """Run rtlsim for this node, supports multiple i/o streams. The output
+        values are appended to the lists in io_dict["outputs"]. The simulation
+        ends after num_out_values output values over all output streams, which
+        defaults to the number of output values of a single sample."""
+
+        if self.rtlsim_batch is not None:
+            # the sample is part of a batch simulated by execute_node_batched
+            self.rtlsim_batch_sample(io_dict)
+            return
         # signal name
         sname = "_" + self.hls_sname() + "_"
 
         trace_file = self.get_nodeattr("rtlsim_trace")
         if trace_file == "default":
             trace_file = self.onnx_node.name + ".vcd"
-        num_out_values = self.get_number_output_values()
-        total_cycle_count = rtlsim_multi_io(
+        if num_out_values is None:
+            num_out_values = self.get_number_output_values()
+        if trace_file != "":
+            # waveforms are traced by PyVerilator on each eval from Python
+            total_cycle_count = rtlsim_multi_io(
+                sim,
+                io_dict,
+                num_out_values,
+                trace_file=trace_file,
+                sname=sname,
+                liveness_threshold=pyverilate_get_liveness_threshold_cycles(),
+            )
+            self.set_nodeattr("cycles_rtlsim", total_cycle_count)
+            return
+        in_streams = {}
+        for name, values in io_dict["inputs"].items():
+            width = self.get_rtlsim_stream_width(name)
+            in_streams[name] = (width, ints_to_words(values, width))
+        out_streams = {x: self.get_rtlsim_stream_width(x) for x in io_dict["outputs"].keys()}
+        total_cycle_count, outputs = rtlsim_stream(
             sim,
-            io_dict,
+            in_streams,
+            out_streams,
             num_out_values,
-            trace_file=trace_file,
+            pyverilate_get_liveness_threshold_cycles(),
             sname=sname,
-            liveness_threshold=pyverilate_get_liveness_threshold_cycles(),
         )
+        for name, words in outputs.items():
+            io_dict["outputs"][name] = io_dict["outputs"][name] + words_to_ints(words)
         self.set_nodeattr("cycles_rtlsim", total_cycle_count)
 
+    def rtlsim_batch_sample(self, io_dict):
+        """Called instead of the simulation for each sample of a batch in
+        execute_node_batched. While recording, the input streams of the sample
+        are collected and placeholder outputs returned, while replaying, the
+        sample's part of the simulated output streams is returned."""
+        if self.rtlsim_batch["outputs"] is None:
+            sample_io = {"inputs": io_dict["inputs"], "outputs": list(io_dict["outputs"].keys())}
+            self.rtlsim_batch["inputs"].append(sample_io)
+            n_out = self.get_number_output_values() // len(io_dict["outputs"])
+            for name in io_dict["outputs"].keys():
+                io_dict["outputs"][name] = io_dict["outputs"][name] + [0] * n_out
+        else:
+            outputs = self.rtlsim_batch["outputs"].pop(0)
+            for name in io_dict["outputs"].keys():
+                io_dict["outputs"][name] = io_dict["outputs"][name] + outputs[name]
+
+    def python_exec_supports_batch(self):
+        """Returns True if the Python execution of this node (the execute_node of
+        the HW abstraction layer, also used in exec_mode "python") processes a
+        batch of samples stacked along the first dimension in a single call."""
+        return False
+
+    def execute_node_batched(self, context, graph, batch_size):
+        """Executes this node on batch_size samples, which are stacked along the
+        first dimension of its outputs and of all its inputs except initializers
+        and inputs whose leading dimension is not batch_size.
+
+        In rtlsim mode, the input streams of all samples are streamed
+        back-to-back through a single simulation and the output streams are
+        split up per sample again, so that cycles_rtlsim reflects the
+        multi-frame steady state. To do so, execute_node is called twice per
+        sample: first to record the sample's input streams, then to post-process
+        its part of the simulated output streams. Nodes whose Python execution
+        supports batches (see python_exec_supports_batch) execute the whole batch
+        in one call in Python execution, otherwise execute_node is called once
+        per sample."""
+        node = self.onnx_node
+        mode = self.get_nodeattr("exec_mode")
+        if mode in ["", "python"] and self.python_exec_supports_batch():
+            self.execute_node(context, graph)
+            return
+        init_names = set([x.name for x in graph.initializer])
+        sample_contexts = []
+        for i in range(batch_size):
+            sample_context = {}
+            for inp in node.input:
+                if inp == "" or inp in init_names:
+                    sample_context[inp] = context.get(inp)
+                elif np.ndim(context[inp]) > 0 and context[inp].shape[0] == batch_size:
+                    sample_context[inp] = context[inp][i : i + 1]
+                else:
+                    # e.g. side inputs broadcast over the batch
+                    sample_context[inp] = context[inp]
+            sample_contexts.append(sample_context)
+
+        if mode == "rtlsim" and batch_size > 1:
+            sim = self.get_rtlsim()
+            self.rtlsim_batch = {"sim": sim, "inputs": [], "outputs": None}
+            try:
+                # record the streams of each sample
+                for sample_context in sample_contexts:
+                    self.execute_node(sample_context, graph)
+                sample_io = self.rtlsim_batch["inputs"]
+                # simulate all samples back-to-back, starting from the state
+                # after the setup (reset etc.) done by execute_node
+                self.rtlsim_batch = None
+                io_dict = {"inputs": {}, "outputs": {}}
+                for name in sample_io[0]["inputs"].keys():
+                    io_dict["inputs"][name] = [x for io in sample_io for x in io["inputs"][name]]
+                for name in sample_io[0]["outputs"]:
+                    io_dict["outputs"][name] = []
+                num_out_values = batch_size * self.get_number_output_values()
+                self.rtlsim_multi_io(sim, io_dict, num_out_values=num_out_values)
+                # replay the output streams of each sample
+                outputs = []
+                for i in range(batch_size):
+                    sample_outputs = {}
+                    for name, values in io_dict["outputs"].items():
+                        n_values = len(values) // batch_size
+                        sample_outputs[name] = values[i * n_values : (i + 1) * n_values]
+                    outputs.append(sample_outputs)
+                self.rtlsim_batch = {"sim": sim, "inputs": None, "outputs": outputs}
+                for sample_context in sample_contexts:
+                    self.execute_node(sample_context, graph)
+            finally:
+                self.rtlsim_batch = None
+        else:
+            for sample_context in sample_contexts:
+                self.execute_node(sample_context, graph)
+
+        for outp in node.output:
+            context[outp] = np.concatenate([x[outp] for x in sample_contexts], axis=0)
+
     def generate_params(self, model, path):
         """Function to generate parameters (i.e. weights and thresholds),
         is member function of HWCustomOp class but has to be filled
@@ -381,7 +469,6 @@ class HWCustomOp(CustomOp):
             self.onnx_node.name,
             exp_cycles,
         )
-        sim = self.get_rtlsim()
         # signal name
         sname = "_" + self.hls_sname() + "_"
         if override_rtlsim_dict is not None:
@@ -393,79 +480,25 @@ class HWCustomOp(CustomOp):
                 },
                 "outputs": {"out": []},
             }
-
-        # extra dicts to keep track of cycle-by-cycle transaction behavior
-        # note that we restrict key names to filter out weight streams etc
-        txns_in = {key: [] for (key, value) in io_dict["inputs"].items() if "in" in key}
-        txns_out = {key: [] for (key, value) in io_dict["outputs"].items() if "out" in key}
-
-        def monitor_txns(sim_obj):
-            for inp in txns_in:
-                in_ready = _read_signal(sim, inp + sname + "TREADY") == 1
-                in_valid = _read_signal(sim, inp + sname + "TVALID") == 1
-                if in_ready and in_valid:
-                    txns_in[inp].append(1)
-                else:
-                    txns_in[inp].append(0)
-            for outp in txns_out:
-                if (
-                    _read_signal(sim, outp + sname + "TREADY") == 1
-                    and _read_signal(sim, outp + sname + "TVALID") == 1
-                ):
-                    txns_out[outp].append(1)
-                else:
-                    txns_out[outp].append(0)
-
-        reset_rtlsim(sim)
-        total_cycle_count = rtlsim_multi_io(
-            sim,
-            io_dict,
-            n_outs,
-            sname=sname,
-            liveness_threshold=period,
-            hook_preclk=monitor_txns,
-        )
-        assert (
-            total_cycle_count <= period
-        ), """Total cycle count from rtl simulation is higher than
-            specified period, please set the period higher than {}""".format(
-            total_cycle_count
+        # only the number of transactions on each stream matters here, the
+        # stream contents are always zero
+        in_txns = {key: len(value) for (key, value) in io_dict["inputs"].items()}
+        out_streams = list(io_dict["outputs"].keys())
+        # transactions are counted on all streams by the C++ driver, but we
+        # restrict the characteristic to key names that filter out weight streams etc
+        in_idx = [i for (i, key) in enumerate(in_txns.keys()) if "in" in key]
+        out_idx = [i for (i, key) in enumerate(out_streams) if "out" in key]
+        # raises an exception if the outputs are not complete within the period
+        total_cycle_count, counts_in, counts_out = rtlsim_characterize(
+            self.get_nodeattr("rtlsim_so"), in_txns, out_streams, n_outs, period, sname=sname
         )
         self.set_nodeattr("io_chrc_period", period)
 
-        def accumulate_char_fxn(chrc):
-            p = len(chrc)
-            ret = []
-            for t in range(2 * p):
-                if t == 0:
-                    ret.append(chrc[0])
-                else:
-                    ret.append(ret[-1] + chrc[t % p])
-            return np.asarray(ret, dtype=np.int32)
-
-        all_txns_in = np.empty((len(txns_in.keys()), 2 * period), dtype=np.int32)
-        all_txns_out = np.empty((len(txns_out.keys()), 2 * period), dtype=np.int32)
-        all_pad_in = []
-        all_pad_out = []
-        for in_idx, in_strm_nm in enumerate(txns_in.keys()):
-            txn_in = txns_in[in_strm_nm]
-            if len(txn_in) < period:
-                pad_in = period - len(txn_in)
-                txn_in += [0 for x in range(pad_in)]
-            txn_in = accumulate_char_fxn(txn_in)
-            all_txns_in[in_idx, :] = txn_in
-            all_pad_in.append(pad_in)
-
-        for out_idx, out_strm_nm in enumerate(txns_out.keys()):
-            txn_out = txns_out[out_strm_nm]
-            if len(txn_out) < period:
-                pad_out = period - len(txn_out)
-                txn_out += [0 for x in range(pad_out)]
-            txn_out = accumulate_char_fxn(txn_out)
-            all_txns_out[out_idx, :] = txn_out
-            all_pad_out.append(pad_out)
-
-        self.set_nodeattr("io_chrc_in", all_txns_in)
-        self.set_nodeattr("io_chrc_out", all_txns_out)
-        self.set_nodeattr("io_chrc_pads_in", all_pad_in)
-        self.set_nodeattr("io_chrc_pads_out", all_pad_out)
+        # convert the cumulative counts back into per-cycle transactions
+        txns_in = np.diff(counts_in[in_idx].astype(np.int32), axis=-1, prepend=0)
+        txns_out = np.diff(counts_out[out_idx].astype(np.int32), axis=-1, prepend=0)
+        pad = period - total_cycle_count
+        self.set_nodeattr("io_chrc_in", accumulate_char_fxn(txns_in))
+        self.set_nodeattr("io_chrc_out", accumulate_char_fxn(txns_out))
+        self.set_nodeattr("io_chrc_pads_in", [pad for i in in_idx])
+        self.set_nodeattr("io_chrc_pads_out", [pad for i in out_idx])
@@ -28,12 +28,9 @@
 
 import math
 import numpy as np
-import onnx.numpy_helper as np_helper
 import qonnx.custom_op.general.xnorpopcount as xp
-import textwrap
 import warnings
 from qonnx.core.datatype import DataType
-from qonnx.custom_op.general.multithreshold import multithreshold
 from qonnx.util.basic import (
     calculate_matvec_accumulator_range,
     interleave_matrix_outer_dim_from_partitions,
@@ -41,7 +38,12 @@ from qonnx.util.basic import (
 )
 
 from finn.custom_op.fpgadataflow.hwcustomop import HWCustomOp
-from finn.util.data_packing import numpy_to_hls_code, pack_innermost_dim_as_hex_string
+from finn.util.data_packing import (
+    numpy_to_hls_code,
+    pack_innermost_dim_as_words,
+    pack_innermost_dim_to_hex_file,
+)
+from finn.util.python_exec import get_derived, multithreshold
 
 # ONNX i/o tensor shape assumptions for MatrixVectorActivation:
 # input 0 is the input tensor, shape (.., i_size) = (..., MW)
@@ -130,8 +132,9 @@ class MVAU(HWCustomOp):
     def execute_node(self, context, graph):
         node = self.onnx_node
         in_act = context[node.input[0]]
-        mvau_w_init = [x for x in graph.initializer if x.name == node.input[1]][0]
-        mvau_w = np_helper.to_array(mvau_w_init)
+        # weights and thresholds are taken from the execution context, which
+        # also holds them when they are not initializers (e.g. external weights)
+        mvau_w = context[node.input[1]]
         # Matrix multiplication
         if self.get_nodeattr("binaryXnorMode"):
             # Note: activation/weights are expected to be binary
@@ -142,13 +145,13 @@ class MVAU(HWCustomOp):
             and self.get_nodeattr("weightDataType") == "BIPOLAR"
         ):
             # Convert to binary and use xnorpopcountmatmul function
-            result = xp.xnorpopcountmatmul((in_act + 1) / 2, (mvau_w + 1) / 2)
+            mvau_w_bin = get_derived(mvau_w, "bipolar_to_binary", lambda x: (x + 1) / 2)
+            result = xp.xnorpopcountmatmul((in_act + 1) / 2, mvau_w_bin)
         else:
             # Regular matrix multiplication
             result = np.matmul(in_act, mvau_w)
         if self.get_nodeattr("noActivation") == 0:
-            mvau_thr_init = [x for x in graph.initializer if x.name == node.input[2]][0]
-            mvau_thr = np_helper.to_array(mvau_thr_init)
+            mvau_thr = context[node.input[2]]
             odt_is_bipolar = self.get_nodeattr("outputDataType") == "BIPOLAR"
             out_scale = 2 if odt_is_bipolar else 1
             out_bias = -1 if odt_is_bipolar else self.get_nodeattr("ActVal")
@@ -159,9 +162,13 @@ class MVAU(HWCustomOp):
             if result.ndim == 4:
                 # NCHW to NHWC
                 result = result.transpose((0, 2, 3, 1))
-        oshape = context[node.output[0]].shape
+        # keep the batch size of the input
+        oshape = (in_act.shape[0],) + context[node.output[0]].shape[1:]
         context[node.output[0]] = result.reshape(oshape)
 
+    def python_exec_supports_batch(self):
+        return True
+
     def verify_node(self):
         info_messages = []
         # verify that "backend" is set to "fpgadataflow"
@@ -646,7 +653,7 @@ class MVAU(HWCustomOp):
 
         * weights : numpy array with weights to be put into the file
         * weight_file_mode : one of {hls_header, decoupled_verilog_dat,
-          decoupled_runtime}
+          decoupled_runtime, decoupled_runtime_npy}
         * weight_file_name : filename for the weight file to be generated
 
         """
@@ -705,16 +712,10 @@ class MVAU(HWCustomOp):
                 weight_width = self.get_weightstream_width()
                 # pad to nearest 4 bits to get hex strings
                 weight_width_padded = roundup_to_integer_multiple(weight_width, 4)
-                weight_tensor_pe_flipped = pack_innermost_dim_as_hex_string(
-                    weight_tensor_pe_flipped, export_wdt, weight_width_padded, prefix=""
+                pack_innermost_dim_to_hex_file(
+                    weight_tensor_pe_flipped, export_wdt, weight_width_padded, weight_file_name
                 )
-                # add zeroes to pad out file to 1024 entries
-                weight_stream = weight_tensor_pe_flipped.flatten()
-                weight_stream = weight_stream.copy()
-                with open(weight_file_name, "w") as f:
-                    for val in weight_stream:
-                        f.write(val + "\n")
-            elif weight_file_mode == "decoupled_runtime":
+            elif weight_file_mode in ["decoupled_runtime", "decoupled_runtime_npy"]:
                 # memstream axi-lite interface will map each mem line to
                 # one or multiple 32-bit words
                 weight_width = self.get_weightstream_width()
@@ -722,19 +723,21 @@ class MVAU(HWCustomOp):
                 if words_per_memwidth < 1:
                     words_per_memwidth = 1
                 weight_width_padded = words_per_memwidth * 32
-                # first, pack and ensure padding to 32 bits
-                weight_tensor_pe_flipped = pack_innermost_dim_as_hex_string(
-                    weight_tensor_pe_flipped, export_wdt, weight_width_padded, prefix=""
-                )
-                weight_stream = weight_tensor_pe_flipped.flatten()
-                weight_stream = weight_stream.copy()
-                with open(weight_file_name, "w") as f:
-                    for val in weight_stream:
-                        # split into groups of 8 hex digits (= 32 bits)
-                        words_32b = textwrap.wrap(val, 8)
-                        words_32b.reverse()
-                        for word_32b in words_32b:
-                            f.write(word_32b + "\n")
+                # pack with padding to 32 bits, then split into 32-bit words
+                if weight_file_mode == "decoupled_runtime":
+                    pack_innermost_dim_to_hex_file(
+                        weight_tensor_pe_flipped,
+                        export_wdt,
+                        weight_width_padded,
+                        weight_file_name,
+                        split_words_nbits=32,
+                    )
+                else:
+                    # same words in binary form, as a .npy file of uint32
+                    words = pack_innermost_dim_as_words(
+                        weight_tensor_pe_flipped, export_wdt, weight_width_padded
+                    )
+                    np.save(weight_file_name, words)
             else:
                 raise Exception("Unknown weight_file_mode")
 
@@ -289,7 +289,7 @@ class ConvolutionInputGenerator_rtl(ConvolutionInputGenerator, RTLBackend):
         mode = self.get_nodeattr("exec_mode")
         code_gen_dir = self.get_nodeattr("code_gen_dir_ipgen")
 
-        if mode == "cppsim":
+        if mode in ["cppsim", "python"]:
             ConvolutionInputGenerator.execute_node(self, context, graph)
             # if depthwise = 1
             # interleave channels such that cppsim of ConvolutionInputGenerator_rtl
@@ -302,9 +302,9 @@ class ConvolutionInputGenerator_rtl(ConvolutionInputGenerator, RTLBackend):
                 ofm_h, ofm_w = getCustomOp(node).get_nodeattr("OFMDim")
                 k_h, k_w = getCustomOp(node).get_nodeattr("ConvKernelDim")
                 ifm_ch = getCustomOp(node).get_nodeattr("IFMChannels")
-                im2col_out = im2col_out.reshape(1, ofm_h, ofm_w, k_h * k_w, ifm_ch // simd, simd)
+                im2col_out = im2col_out.reshape(-1, ofm_h, ofm_w, k_h * k_w, ifm_ch // simd, simd)
                 im2col_out = im2col_out.transpose(0, 1, 2, 4, 3, 5)
-                im2col_out = im2col_out.reshape(1, ofm_h, ofm_w, ifm_ch * k_h * k_w)
+                im2col_out = im2col_out.reshape(-1, ofm_h, ofm_w, ifm_ch * k_h * k_w)
                 context[node.output[0]] = im2col_out
         elif mode == "rtlsim":
             node = self.onnx_node
@@ -363,7 +363,7 @@ class ConvolutionInputGenerator_rtl(ConvolutionInputGenerator, RTLBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
@@ -72,7 +72,7 @@ class FMPadding_rtl(FMPadding, RTLBackend):
         mode = self.get_nodeattr("exec_mode")
         code_gen_dir = self.get_nodeattr("code_gen_dir_ipgen")
 
-        if mode == "cppsim":
+        if mode in ["cppsim", "python"]:
             FMPadding.execute_node(self, context, graph)
         elif mode == "rtlsim":
             node = self.onnx_node
@@ -119,7 +119,7 @@ class FMPadding_rtl(FMPadding, RTLBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
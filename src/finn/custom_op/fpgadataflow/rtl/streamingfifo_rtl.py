@@ -126,7 +126,7 @@ class StreamingFIFO_rtl(StreamingFIFO, RTLBackend):
         inp = context[node.input[0]]
         exp_shape = self.get_normal_input_shape()
 
-        if mode == "cppsim":
+        if mode in ["cppsim", "python"]:
             output = inp
             output = np.asarray([output], dtype=np.float32).reshape(*exp_shape)
             context[node.output[0]] = output
@@ -169,7 +169,7 @@ class StreamingFIFO_rtl(StreamingFIFO, RTLBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
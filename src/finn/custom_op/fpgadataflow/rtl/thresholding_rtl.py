@@ -30,7 +30,7 @@ import math
 import numpy as np
 import os
 import shutil
-from pyverilator.util.axi_utils import reset_rtlsim, rtlsim_multi_io
+from pyverilator.util.axi_utils import reset_rtlsim
 from qonnx.core.datatype import DataType
 from qonnx.util.basic import roundup_to_integer_multiple
 
@@ -41,11 +41,11 @@ from finn.util.basic import (
     get_rtlsim_trace_depth,
     make_build_dir,
     mem_primitives_versal,
-    pyverilate_get_liveness_threshold_cycles,
 )
 from finn.util.data_packing import (
     npy_to_rtlsim_input,
-    pack_innermost_dim_as_hex_string,
+    pack_innermost_dim_as_words,
+    pack_innermost_dim_to_hex_file,
     rtlsim_output_to_npy,
 )
 
@@ -191,43 +191,33 @@ class Thresholding_rtl(Thresholding, RTLBackend):
             bias = bias - 1
             n_thres_steps += 1
 
-        # add dummy dimension as final dimension (that's what gets packed with next call)
-        t_expand = np.expand_dims(thresholds, axis=-1)
         bw_hexdigit = roundup_to_integer_multiple(wdt.bitwidth(), 4)
-        t_packed = pack_innermost_dim_as_hex_string(
-            t_expand,
-            wdt,
-            bw_hexdigit,
-            prefix="",
-        )
 
         pe = self.get_nodeattr("PE")
         num_channels = self.get_nodeattr("NumChannels")  # number of channels
 
         # If a single threshold value is found, broadcast the value
-        if t_packed.shape[0] == 1:
-            t_packed = np.broadcast_to(t_packed, (pe, expected_thresholds))
+        if thresholds.shape[0] == 1:
+            thresholds = np.broadcast_to(thresholds, (pe, expected_thresholds))
             num_channels = pe
 
         channel_fold = int(num_channels / pe)
 
         for stage in range(o_bitwidth):
             sn = o_bitwidth - stage - 1
+            # indices of the thresholds used in this stage of the binary search
+            stage_idx = (np.arange(2**stage) << (o_bitwidth - stage)) + 2**sn - 1
             for pe_value in range(pe):
                 thresh_file = t_path + "/%s_threshs_%s_%s.dat" % (
                     self.onnx_node.name,
                     pe_value,
                     stage,
                 )
-                threshs = np.zeros([channel_fold * (2**stage)], dtype="object")
-                for ch in range(channel_fold):
-                    for i in range(2**stage):
-                        threshs[(ch << stage) + i] = t_packed[ch * pe + pe_value][
-                            (i << (o_bitwidth - stage)) + 2**sn - 1
-                        ]
-                with open(thresh_file, "w") as f:
-                    for val in threshs:
-                        f.write(val + "\n")
+                # (channel_fold, 2**stage) thresholds for this PE, one per line
+                threshs = thresholds[pe_value::pe][:channel_fold, stage_idx]
+                pack_innermost_dim_to_hex_file(
+                    threshs.reshape(-1, 1), wdt, bw_hexdigit, thresh_file
+                )
         code_gen_dict["$THRESHOLDS_PATH$"] = ['"./%s_"' % self.onnx_node.name]
 
         # Identify the module name
@@ -380,7 +370,7 @@ class Thresholding_rtl(Thresholding, RTLBackend):
     def execute_node(self, context, graph):
         mode = self.get_nodeattr("exec_mode")
         code_gen_dir = self.get_nodeattr("code_gen_dir_ipgen")
-        if mode == "cppsim":
+        if mode in ["cppsim", "python"]:
             Thresholding.execute_node(self, context, graph)
         elif mode == "rtlsim":
             node = self.onnx_node
@@ -418,37 +408,20 @@ class Thresholding_rtl(Thresholding, RTLBackend):
             sim = self.get_rtlsim()
             nbits = self.get_instream_width()
             inp = npy_to_rtlsim_input("{}/input_0.npy".format(code_gen_dir), export_idt, nbits)
-            io_names = self.get_verilog_top_module_intf_names()
-            istream_name = io_names["s_axis"][0][0]
-            ostream_name = io_names["m_axis"][0][0]
             io_dict = {
-                "inputs": {istream_name: inp},
-                "outputs": {ostream_name: []},
+                "inputs": {"in0": inp},
+                "outputs": {"out": []},
             }
 
-            trace_file = self.get_nodeattr("rtlsim_trace")
-            if trace_file == "default":
-                trace_file = self.onnx_node.name + ".vcd"
-            sname = "_"
-
             # Change into so directory to ensure threshold files can be found
             rtlsim_so = self.get_nodeattr("rtlsim_so")
             so_dir = os.path.dirname(os.path.realpath(rtlsim_so))
             olcwd = os.getcwd()
             os.chdir(so_dir)
-            num_out_values = self.get_number_output_values()
             reset_rtlsim(sim)
-            total_cycle_count = rtlsim_multi_io(
-                sim,
-                io_dict,
-                num_out_values,
-                trace_file=trace_file,
-                sname=sname,
-                liveness_threshold=pyverilate_get_liveness_threshold_cycles(),
-            )
-            self.set_nodeattr("cycles_rtlsim", total_cycle_count)
+            self.rtlsim_multi_io(sim, io_dict)
             os.chdir(olcwd)
-            output = io_dict["outputs"][ostream_name]
+            output = io_dict["outputs"]["out"]
 
             # Manage output data
             odt = self.get_output_datatype()
@@ -467,7 +440,7 @@ class Thresholding_rtl(Thresholding, RTLBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
@@ -512,6 +485,8 @@ class Thresholding_rtl(Thresholding, RTLBackend):
         Arguments:
 
         * weights : numpy array with weights to be put into the file
+        * weight_file_mode : decoupled_runtime_npy for a binary .npy file of
+          32-bit words, any other mode produces a hex text file
         * weight_file_name : filename for the weight file to be generated
 
         """
@@ -540,28 +515,20 @@ class Thresholding_rtl(Thresholding, RTLBackend):
         width_padded = roundup_to_integer_multiple(thresholds.shape[1], 2**o_bitwidth)
         thresh_padded = np.zeros((thresholds.shape[0], width_padded))
         thresh_padded[: thresholds.shape[0], :n_thres_steps] = thresholds
-        thresh_stream = []
         wdt = self.get_weight_datatype()
         bw_hexdigit = roundup_to_integer_multiple(wdt.bitwidth(), 32)
-        padding = np.zeros(width_padded, dtype=np.int32)
 
-        chan_ind = 0
+        # each channel fold holds PE channels of thresholds, followed by
+        # zero padding up to the next power of two number of channels
         cf = ch // pe
-        for fold in range(cf):
-            for c in range(2 ** (pe - 1).bit_length()):
-                if (c == 0 or c % pe != 0) and c < pe:
-                    for t in thresh_padded[chan_ind]:
-                        t_packed = pack_innermost_dim_as_hex_string(
-                            [t], wdt, bw_hexdigit, prefix=""
-                        ).item()
-                        thresh_stream.append(t_packed)
-                    chan_ind += 1
-                else:
-                    for z in padding:
-                        t_packed = pack_innermost_dim_as_hex_string(
-                            [z], wdt, bw_hexdigit, prefix=""
-                        ).item()
-                        thresh_stream.append(t_packed)
-        with open(weight_file_name, "w") as f:
-            for val in thresh_stream:
-                f.write(val + "\n")
+        pe_padded = 2 ** (pe - 1).bit_length()
+        thresh_stream = np.zeros((cf, pe_padded, width_padded))
+        thresh_stream[:, :pe, :] = thresh_padded[: cf * pe].reshape(cf, pe, width_padded)
+        if weight_file_mode == "decoupled_runtime_npy":
+            # binary form of the same words, as a .npy file of uint32
+            words = pack_innermost_dim_as_words(thresh_stream.reshape(-1, 1), wdt, bw_hexdigit)
+            np.save(weight_file_name, words)
+        else:
+            pack_innermost_dim_to_hex_file(
+                thresh_stream.reshape(-1, 1), wdt, bw_hexdigit, weight_file_name
+            )
@@ -59,7 +59,7 @@ class VVAU_rtl(VVAU, RTLBackend):
         mem_mode = self.get_nodeattr("mem_mode")
         node = self.onnx_node
 
-        if mode == "cppsim":
+        if mode in ["cppsim", "python"]:
             VVAU.execute_node(self, context, graph)
         elif mode == "rtlsim":
             code_gen_dir = self.get_nodeattr("code_gen_dir_ipgen")
@@ -134,7 +134,7 @@ class VVAU_rtl(VVAU, RTLBackend):
         else:
             raise Exception(
                 """Invalid value for attribute exec_mode! Is currently set to: {}
-            has to be set to one of the following value ("cppsim", "rtlsim")""".format(
+            has to be set to one of the following value ("cppsim", "rtlsim", "python")""".format(
                     mode
                 )
             )
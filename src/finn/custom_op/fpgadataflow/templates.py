@@ -32,6 +32,7 @@ docompute_template = """
 #define AP_INT_MAX_W $AP_INT_MAX_W$
 #include "cnpy.h"
 #include "npy2apintstream.hpp"
+#include "cppsim_server.hpp"
 #include <vector>
 #include "bnn-library.h"
 
@@ -41,7 +42,7 @@ $GLOBALS$
 // defines for network parameters
 $DEFINES$
 
-int main(){
+void execute_node(){
 $PRAGMAS$
 
 $STREAMDECLARATIONS$
@@ -56,6 +57,10 @@ $SAVEASCNPY$
 
 }
 
+int main(int argc, char **argv){
+  return cppsim_main(argc, argv, execute_node);
+}
+
 """
 
 # templates for single node ip generation
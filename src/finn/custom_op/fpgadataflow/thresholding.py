@@ -29,10 +29,10 @@
 import numpy as np
 import warnings
 from qonnx.core.datatype import DataType
-from qonnx.custom_op.general.multithreshold import multithreshold
 from qonnx.util.basic import interleave_matrix_outer_dim_from_partitions
 
 from finn.custom_op.fpgadataflow.hwcustomop import HWCustomOp
+from finn.util.python_exec import multithreshold
 
 
 class Thresholding(HWCustomOp):
@@ -259,6 +259,9 @@ class Thresholding(HWCustomOp):
             y = 2 * y - 1
         context[node.output[0]] = y
 
+    def python_exec_supports_batch(self):
+        return True
+
     def calc_tmem(self):
         """Calculates and returns TMEM."""
         num_channels = self.get_nodeattr("NumChannels")
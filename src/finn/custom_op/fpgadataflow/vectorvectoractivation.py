@@ -28,11 +28,8 @@
 
 import math
 import numpy as np
-import onnx.numpy_helper as np_helper
-import textwrap
 import warnings
 from qonnx.core.datatype import DataType
-from qonnx.custom_op.general.multithreshold import multithreshold
 from qonnx.util.basic import (
     calculate_matvec_accumulator_range,
     interleave_matrix_outer_dim_from_partitions,
@@ -40,7 +37,12 @@ from qonnx.util.basic import (
 )
 
 from finn.custom_op.fpgadataflow.hwcustomop import HWCustomOp
-from finn.util.data_packing import numpy_to_hls_code, pack_innermost_dim_as_hex_string
+from finn.util.data_packing import (
+    numpy_to_hls_code,
+    pack_innermost_dim_as_words,
+    pack_innermost_dim_to_hex_file,
+)
+from finn.util.python_exec import get_derived, multithreshold
 
 
 class VVAU(HWCustomOp):
@@ -118,7 +120,7 @@ class VVAU(HWCustomOp):
     def execute_node(self, context, graph):
         node = self.onnx_node
         in_act = context[node.input[0]]
-        (_, dim_h, dim_w, _) = in_act.shape
+        (n, dim_h, dim_w, _) = in_act.shape
         (k_h, k_w) = self.get_nodeattr("Kernel")
         channels = self.get_nodeattr("Channels")
         producer = [x for x in graph.node if x.output[0] == node.input[0]]
@@ -132,13 +134,17 @@ class VVAU(HWCustomOp):
         # Reorder the input activations. Note that PE gets interleaved by the SWG,
         # so we have to untangle and for simplicity of computation assume pe=1.
         # Note that PE has no effect on the QONNX node
-        in_act = in_act.reshape(1, dim_h, dim_w, channels // pe, k_h * k_w, pe)
+        in_act = in_act.reshape(n, dim_h, dim_w, channels // pe, k_h * k_w, pe)
         in_act = in_act.transpose(0, 1, 2, 4, 3, 5)
-        in_act = in_act.reshape(1, dim_h, dim_w, channels * k_h * k_w)
-        # Reshape weights in appropriate format
-        vvau_w_init = [x for x in graph.initializer if x.name == node.input[1]][0]
-        vvau_w = np_helper.to_array(vvau_w_init)
-        vvau_w_onnx = self._infer_sparse_weight_tensor(vvau_w, k_h, k_w, channels)
+        in_act = in_act.reshape(n, dim_h, dim_w, channels * k_h * k_w)
+        # Reshape weights in appropriate format, weights and thresholds are
+        # taken from the execution context (see MVAU.execute_node)
+        vvau_w = context[node.input[1]]
+        vvau_w_onnx = get_derived(
+            vvau_w,
+            ("sparse", k_h, k_w, channels),
+            lambda x: self._infer_sparse_weight_tensor(x, k_h, k_w, channels),
+        )
 
         if (
             self.get_nodeattr("inputDataType") == "BIPOLAR"
@@ -150,8 +156,7 @@ class VVAU(HWCustomOp):
             result = np.matmul(in_act, vvau_w_onnx)  # result is in [N, H, W, C] format
 
         if self.get_nodeattr("noActivation") == 0:
-            vvau_thr_init = [x for x in graph.initializer if x.name == node.input[2]][0]
-            vvau_thr = np_helper.to_array(vvau_thr_init)
+            vvau_thr = context[node.input[2]]
             odt_is_bipolar = self.get_nodeattr("outputDataType") == "BIPOLAR"
             out_scale = 2 if odt_is_bipolar else 1
             out_bias = -1 if odt_is_bipolar else self.get_nodeattr("ActVal")
@@ -163,6 +168,9 @@ class VVAU(HWCustomOp):
 
         context[node.output[0]] = result
 
+    def python_exec_supports_batch(self):
+        return True
+
     def verify_node(self):
         pass
 
@@ -582,7 +590,7 @@ class VVAU(HWCustomOp):
 
         * weights : numpy array with weights to be put into the file
         * weight_file_mode : one of {hls_header, decoupled_verilog_dat,
-          decoupled_runtime}
+          decoupled_runtime, decoupled_runtime_npy}
         * weight_file_name : filename for the weight file to be generated
 
         """
@@ -652,20 +660,13 @@ class VVAU(HWCustomOp):
                 # pad to nearest 4 bits to get hex strings
                 weight_width_padded = roundup_to_integer_multiple(weight_width, 4)
                 if self.onnx_node.op_type == "VVAU_rtl":
-                    weight_arr = pack_innermost_dim_as_hex_string(
-                        weight_tensor_pe_simd_flipped, export_wdt, weight_width_padded, prefix=""
-                    )
+                    weight_arr = weight_tensor_pe_simd_flipped
                 else:
-                    weight_arr = pack_innermost_dim_as_hex_string(
-                        weight_tensor_pe_flipped, export_wdt, weight_width_padded, prefix=""
-                    )
-                # add zeroes to pad out file to 1024 entries
-                weight_stream = weight_arr.flatten()
-                weight_stream = weight_stream.copy()
-                with open(weight_file_name, "w") as f:
-                    for val in weight_stream:
-                        f.write(val + "\n")
-            elif weight_file_mode == "decoupled_runtime":
+                    weight_arr = weight_tensor_pe_flipped
+                pack_innermost_dim_to_hex_file(
+                    weight_arr, export_wdt, weight_width_padded, weight_file_name
+                )
+            elif weight_file_mode in ["decoupled_runtime", "decoupled_runtime_npy"]:
                 # memstream axi-lite interface will map each mem line to
                 # one or multiple 32-bit words
                 weight_width = self.get_weightstream_width()
@@ -673,19 +674,21 @@ class VVAU(HWCustomOp):
                 if words_per_memwidth < 1:
                     words_per_memwidth = 1
                 weight_width_padded = words_per_memwidth * 32
-                # first, pack and ensure padding to 32 bits
-                weight_tensor_pe_flipped = pack_innermost_dim_as_hex_string(
-                    weight_tensor_pe_flipped, export_wdt, weight_width_padded, prefix=""
-                )
-                weight_stream = weight_tensor_pe_flipped.flatten()
-                weight_stream = weight_stream.copy()
-                with open(weight_file_name, "w") as f:
-                    for val in weight_stream:
-                        # split into groups of 8 hex digits (= 32 bits)
-                        words_32b = textwrap.wrap(val, 8)
-                        words_32b.reverse()
-                        for word_32b in words_32b:
-                            f.write(word_32b + "\n")
+                # pack with padding to 32 bits, then split into 32-bit words
+                if weight_file_mode == "decoupled_runtime":
+                    pack_innermost_dim_to_hex_file(
+                        weight_tensor_pe_flipped,
+                        export_wdt,
+                        weight_width_padded,
+                        weight_file_name,
+                        split_words_nbits=32,
+                    )
+                else:
+                    # same words in binary form, as a .npy file of uint32
+                    words = pack_innermost_dim_as_words(
+                        weight_tensor_pe_flipped, export_wdt, weight_width_padded
+                    )
+                    np.save(weight_file_name, words)
             else:
                 raise Exception("Unknown weight_file_mode")
 
@@ -0,0 +1,67 @@
+/* Copyright (C) 2024, Advanced Micro Devices, Inc.
+All rights reserved.
+#
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+#
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+#
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+#
+* Neither the name of FINN nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+#
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
+
+/* Entry point of the cppsim executables (node_model) of FINN nodes. Without
+arguments, the node is executed once, reading its inputs from and writing its
+outputs to .npy files. With --server, the process stays alive and executes
+the node once for every "run" line read from stdin, so that the process
+startup (and the initialization of the node parameters) is paid only once
+per node rather than once per execution. Each execution is acknowledged with
+a CPPSIM_DONE line on stdout, any other output of the node is passed through.
+The control lines are preceded by a newline, so that they are recognized even
+if the node's output does not end with one. The server exits on "exit" or
+when stdin is closed. */
+
+#ifndef CPPSIM_SERVER_HPP
+#define CPPSIM_SERVER_HPP
+
+#include <iostream>
+#include <string>
+
+#define CPPSIM_READY "@cppsim_ready"
+#define CPPSIM_DONE "@cppsim_done"
+
+inline int cppsim_main(int argc, char **argv, void (*execute)()) {
+  if((argc < 2) || (std::string(argv[1]) != "--server")) {
+    execute();
+    return 0;
+  }
+  std::cout << '\n' << CPPSIM_READY << std::endl;
+  std::string cmd;
+  while(std::getline(std::cin, cmd)) {
+    if(cmd == "run") {
+      execute();
+      std::cout << '\n' << CPPSIM_DONE << std::endl;
+    } else if(cmd == "exit") {
+      break;
+    }
+  }
+  return 0;
+}
+
+#endif
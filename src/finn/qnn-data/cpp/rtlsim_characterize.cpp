@@ -0,0 +1,121 @@
+/* Copyright (C) 2024, Advanced Micro Devices, Inc.
+All rights reserved.
+#
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+#
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+#
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+#
+* Neither the name of FINN nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+#
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
+
+/* Driver for deriving the i/o characteristic functions of a single FINN
+node from its PyVerilator emulation library. All Verilator accesses go
+through the get_/set_/eval functions exported by the PyVerilator wrapper,
+which are passed in as function pointers from Python. The transactions on
+each stream are counted here instead of in per-cycle Python callbacks, and
+the cumulative counts for each cycle are written to caller-provided buffers
+of shape (n_streams, max_cycles). */
+
+#include <cstdint>
+#include <vector>
+
+typedef int (*eval_fxn_t)(void *);
+typedef int (*set_fxn_t)(void *, uint32_t);
+typedef uint32_t (*get_fxn_t)(void *);
+
+static inline void toggle_clk(void *top, eval_fxn_t eval, set_fxn_t set_clk) {
+    set_clk(top, 1);
+    eval(top);
+    set_clk(top, 0);
+    eval(top);
+}
+
+/* Returns the number of simulated cycles until n_out_txns output
+transactions were observed, or -1 if this did not happen within max_cycles.
+Input streams are kept valid as long as there are transactions left in
+in_txns, output streams are always ready. */
+extern "C" int64_t characterize(
+    void *top, eval_fxn_t eval, set_fxn_t set_clk, set_fxn_t set_rst_n,
+    uint32_t n_in, set_fxn_t *in_set_valid, get_fxn_t *in_get_ready,
+    const uint64_t *in_txns, uint32_t n_out, set_fxn_t *out_set_ready,
+    get_fxn_t *out_get_valid, uint64_t n_out_txns, uint64_t max_cycles,
+    uint32_t reset_cycles, uint32_t *counts_in, uint32_t *counts_out
+) {
+    std::vector<uint64_t> remaining(in_txns, in_txns + n_in);
+    std::vector<uint32_t> cnt_in(n_in, 0);
+    std::vector<uint32_t> cnt_out(n_out, 0);
+    uint64_t total_out = 0;
+    uint64_t cycle = 0;
+
+    // reset with all streams idle
+    for (uint32_t i = 0; i < n_in; i++) {
+        in_set_valid[i](top, 0);
+    }
+    for (uint32_t o = 0; o < n_out; o++) {
+        out_set_ready[o](top, 1);
+    }
+    set_rst_n(top, 0);
+    for (uint32_t c = 0; c < reset_cycles; c++) {
+        toggle_clk(top, eval, set_clk);
+    }
+    set_rst_n(top, 1);
+    eval(top);
+
+    while (cycle < max_cycles) {
+        for (uint32_t i = 0; i < n_in; i++) {
+            in_set_valid[i](top, remaining[i] > 0 ? 1 : 0);
+        }
+        eval(top);
+        // sample handshakes before the rising clock edge
+        for (uint32_t i = 0; i < n_in; i++) {
+            if (remaining[i] > 0 && in_get_ready[i](top) == 1) {
+                remaining[i]--;
+                cnt_in[i]++;
+            }
+            counts_in[i * max_cycles + cycle] = cnt_in[i];
+        }
+        for (uint32_t o = 0; o < n_out; o++) {
+            if (out_get_valid[o](top) == 1) {
+                cnt_out[o]++;
+                total_out++;
+            }
+            counts_out[o * max_cycles + cycle] = cnt_out[o];
+        }
+        toggle_clk(top, eval, set_clk);
+        cycle++;
+        if (total_out >= n_out_txns) {
+            break;
+        }
+    }
+    if (total_out < n_out_txns) {
+        return -1;
+    }
+    // transaction counts stay constant for the remainder of the period
+    for (uint64_t c = cycle; c < max_cycles; c++) {
+        for (uint32_t i = 0; i < n_in; i++) {
+            counts_in[i * max_cycles + c] = cnt_in[i];
+        }
+        for (uint32_t o = 0; o < n_out; o++) {
+            counts_out[o * max_cycles + c] = cnt_out[o];
+        }
+    }
+    return (int64_t)cycle;
+}
@@ -0,0 +1,159 @@
+/* Copyright (C) 2024, Advanced Micro Devices, Inc.
+All rights reserved.
+#
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+#
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+#
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+#
+* Neither the name of FINN nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+#
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
+
+/* Stream driver for the rtlsim of a single FINN node from its PyVerilator
+emulation library. All Verilator accesses go through the get_/set_/eval
+functions exported by the PyVerilator wrapper, which are passed in as
+function pointers from Python, so the AXI stream handshakes of every cycle
+are driven here rather than through ctypes calls for each signal access.
+
+Stream data is exchanged as buffers of 32-bit words, n_words per transaction
+with the least significant word first. Following PyVerilator, the TDATA
+accessors of signals of up to 32 bits take/return uint32_t, those of up to 64
+bits uint64_t, and those of wider signals one 32-bit word at a time. */
+
+#include <cstdint>
+#include <vector>
+
+typedef int (*eval_fxn_t)(void *);
+typedef int (*set_fxn_t)(void *, uint32_t);
+typedef uint32_t (*get_fxn_t)(void *);
+typedef int (*set64_fxn_t)(void *, uint64_t);
+typedef uint64_t (*get64_fxn_t)(void *);
+typedef int (*set_word_fxn_t)(void *, int, uint32_t);
+typedef uint32_t (*get_word_fxn_t)(void *, int);
+
+/* One AXI stream of the node. For input streams, set_valid, get_ready and
+set_data are used and buf holds n_txns transactions. For output streams,
+set_ready, get_valid and get_data are used and buf has space for n_txns
+transactions. */
+struct stream_t {
+    void *handshake_set;
+    void *handshake_get;
+    void *data;
+    uint32_t width;
+    uint32_t n_words;
+    uint64_t n_txns;
+    uint32_t *buf;
+};
+
+static inline void toggle_clk(void *top, eval_fxn_t eval, set_fxn_t set_clk) {
+    set_clk(top, 1);
+    eval(top);
+    set_clk(top, 0);
+    eval(top);
+}
+
+static void set_data(void *top, const stream_t &s, const uint32_t *words) {
+    if (s.width > 64) {
+        for (uint32_t k = 0; k < s.n_words; k++) {
+            ((set_word_fxn_t)s.data)(top, (int)k, words[k]);
+        }
+    } else if (s.width > 32) {
+        ((set64_fxn_t)s.data)(top, uint64_t(words[0]) | (uint64_t(words[1]) << 32));
+    } else {
+        ((set_fxn_t)s.data)(top, words[0]);
+    }
+}
+
+static void get_data(void *top, const stream_t &s, uint32_t *words) {
+    if (s.width > 64) {
+        for (uint32_t k = 0; k < s.n_words; k++) {
+            words[k] = ((get_word_fxn_t)s.data)(top, (int)k);
+        }
+    } else if (s.width > 32) {
+        uint64_t val = ((get64_fxn_t)s.data)(top);
+        words[0] = uint32_t(val);
+        words[1] = uint32_t(val >> 32);
+    } else {
+        words[0] = ((get_fxn_t)s.data)(top);
+    }
+}
+
+/* Simulate until n_out_txns output transactions were observed over all output
+streams, the same way as pyverilator's rtlsim_multi_io: in every cycle, the
+input streams are valid while they have transactions left, the output
+streams are always ready, and handshakes are sampled before the rising clock
+edge. Output transactions are written to the output buffers (and counted, but
+dropped, beyond their capacity), the number of output transactions of each
+stream is written to out_counts.
+
+Returns the number of simulated cycles, or -1 if no output transaction was
+observed for liveness_threshold consecutive cycles. */
+extern "C" int64_t rtlsim_stream(
+    void *top, eval_fxn_t eval, set_fxn_t set_clk, uint32_t n_in, const stream_t *in,
+    uint32_t n_out, const stream_t *out, uint64_t n_out_txns, uint64_t liveness_threshold,
+    uint64_t *out_counts
+) {
+    std::vector<uint64_t> pos(n_in, 0);
+    uint32_t max_words = 1;
+    for (uint32_t i = 0; i < n_in; i++) {
+        max_words = in[i].n_words > max_words ? in[i].n_words : max_words;
+    }
+    const std::vector<uint32_t> zeros(max_words, 0);
+    uint64_t total_out = 0;
+    uint64_t no_change_count = 0;
+    int64_t cycle = 0;
+
+    for (uint32_t o = 0; o < n_out; o++) {
+        out_counts[o] = 0;
+        ((set_fxn_t)out[o].handshake_set)(top, 1);
+    }
+    while (total_out < n_out_txns) {
+        for (uint32_t i = 0; i < n_in; i++) {
+            const bool valid = pos[i] < in[i].n_txns;
+            ((set_fxn_t)in[i].handshake_set)(top, valid ? 1 : 0);
+            set_data(top, in[i], valid ? in[i].buf + pos[i] * in[i].n_words : zeros.data());
+        }
+        eval(top);
+        // sample handshakes before the rising clock edge
+        for (uint32_t i = 0; i < n_in; i++) {
+            if (pos[i] < in[i].n_txns && ((get_fxn_t)in[i].handshake_get)(top) == 1) {
+                pos[i]++;
+            }
+        }
+        bool changed = false;
+        for (uint32_t o = 0; o < n_out; o++) {
+            if (((get_fxn_t)out[o].handshake_get)(top) == 1) {
+                if (out_counts[o] < out[o].n_txns) {
+                    get_data(top, out[o], out[o].buf + out_counts[o] * out[o].n_words);
+                }
+                out_counts[o]++;
+                total_out++;
+                changed = true;
+            }
+        }
+        toggle_clk(top, eval, set_clk);
+        cycle++;
+        no_change_count = changed ? 0 : no_change_count + 1;
+        if (total_out < n_out_txns && no_change_count >= liveness_threshold) {
+            return -1;
+        }
+    }
+    return cycle;
+}
@@ -26,9 +26,17 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import csv
+import itertools
+import json
 import numpy as np
 import os
+import queue
+import re
+import threading
 import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from pynq import Overlay, allocate
 from pynq.ps import Clocks
 from qonnx.core.datatype import DataType
@@ -44,6 +52,187 @@ from finn.util.data_packing import (
 # io_shape_dict (generated by the MakePYNQDriver transformation).
 
 
+# marks the end of the input stream between the stages of execute_stream
+_end_of_stream = object()
+
+
+def compute_unit_name(instance_name, cu):
+    """Returns the name of the given kernel instance in compute unit cu, following
+    the naming of replicated compute units in VitisLink."""
+    return instance_name if cu == 0 else "%s_cu%d" % (instance_name, cu)
+
+
+# stages of execute() timed separately by FINNExampleOverlay.benchmark
+benchmark_stages = ["pack", "copy_input", "execute", "copy_output", "unpack", "total"]
+# latency percentiles reported by FINNExampleOverlay.benchmark
+benchmark_percentiles = [50, 90, 99, 100]
+
+
+def write_benchmark_results(results, json_filename=None, csv_filename=None):
+    """Write the results of FINNExampleOverlay.benchmark as JSON and/or CSV,
+    with one row per batch size in the CSV file."""
+    if json_filename is not None:
+        with open(json_filename, "w") as f:
+            json.dump(results, f, indent=2)
+    if csv_filename is not None:
+        with open(csv_filename, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+# runtime-writable weight files are named <sdp_ind>_<layer_ind>_<node name>
+_runtime_weight_filename = re.compile(r"^(\d+)_(\d+)_.*\.(dat|npy)$")
+
+
+def read_runtime_weights(weight_dir):
+    """Read the runtime-writable weights in weight_dir, given as one file per
+    layer named <sdp_ind>_<layer_ind>_<node name>, either as binary .npy file
+    of 32-bit words (as generated by MakePYNQDriver), or as .dat text file with
+    one 32-bit hex word per line. The .npy files are memory-mapped and take
+    precedence over .dat files for the same layer. Returns a dictionary from
+    (sdp_ind, layer_ind) to a uint32 ndarray with the words to write."""
+    rt_weight_dict = {}
+    if not os.path.isdir(weight_dir):
+        return rt_weight_dict
+    w_filenames = []
+    for dirpath, dirnames, filenames in os.walk(weight_dir):
+        w_filenames.extend(filenames)
+    # read .dat files first, to be overridden by .npy files
+    for w_filename in sorted(w_filenames, key=lambda x: x.endswith(".npy")):
+        match = _runtime_weight_filename.match(w_filename)
+        if match is None:
+            continue
+        sdp_ind, layer_ind, ext = int(match.group(1)), int(match.group(2)), match.group(3)
+        if ext == "npy":
+            layer_w = np.load(weight_dir + "/" + w_filename, mmap_mode="r")
+            assert layer_w.dtype == np.uint32, "Runtime weights must be 32-bit words"
+        else:
+            with open(weight_dir + "/" + w_filename, "r") as f:
+                dat = f.read().split()
+            if all([len(x) == 8 for x in dat]):
+                # convert all 8-digit hex words at once
+                layer_w = np.frombuffer(bytes.fromhex("".join(dat)), dtype=">u4")
+                layer_w = layer_w.astype(np.uint32)
+            else:
+                layer_w = np.fromiter([int(x, 16) for x in dat], dtype=np.uint32)
+        rt_weight_dict[(sdp_ind, layer_ind)] = layer_w
+    return rt_weight_dict
+
+
+# chunk size in bytes for copying memory-mapped external weights to the device
+_external_weight_chunk_size = 1 << 20
+# device buffers holding external weights, shared between overlay instances as
+# long as any of them holds a reference to the buffer
+_external_weight_buffers = weakref.WeakValueDictionary()
+
+
+def get_external_weight_buffer(filename, device=None):
+    """Returns a device buffer on the given PYNQ device with the contents of
+    the given external weight .npy file (a flat uint8 array as generated by
+    MakePYNQDriver). The file is memory-mapped and copied chunk-wise, so that
+    it never has to be fully loaded into host memory. Buffers are cached per
+    device and file (including its modification time), so overlays loading the
+    same weights in one process share a single device buffer."""
+    file_stat = os.stat(filename)
+    key = (id(device), os.path.realpath(filename), file_stat.st_mtime_ns, file_stat.st_size)
+    weight_buf = _external_weight_buffers.get(key)
+    if weight_buf is None:
+        weight_tensor = np.load(filename, mmap_mode="r")
+        weight_buf = allocate(weight_tensor.shape, dtype=np.uint8, target=device)
+        weight_flat = weight_tensor.reshape(-1)
+        weight_buf_flat = weight_buf.reshape(-1)
+        for start in range(0, weight_flat.size, _external_weight_chunk_size):
+            end = start + _external_weight_chunk_size
+            weight_buf_flat[start:end] = weight_flat[start:end]
+        del weight_tensor, weight_flat
+        weight_buf.flush()
+        _external_weight_buffers[key] = weight_buf
+    return weight_buf
+
+
+class HostPreproc:
+    """Host-side pre-processing of one accelerator input, as exported by
+    MakePYNQDriver from the nodes in front of the dataflow partition. Raw
+    integer inputs in [raw_min, raw_min + n_values) are first transposed by
+    perm, then each element is looked up in its table in lut, whose leading
+    dimensions broadcast against the normal input shape of the accelerator and
+    whose last dimension holds the n_values pre-processed values."""
+
+    def __init__(self, filename, ishape_normal):
+        preproc = np.load(filename)
+        self.lut = preproc["lut"]
+        self.raw_min = int(preproc["raw_min"])
+        self.perm = tuple(int(x) for x in preproc["perm"])
+        self.n_values = self.lut.shape[-1]
+        self.sample_shape = tuple(ishape_normal[1:])
+        # index of the table of each element in the flattened lut
+        lut_shape = self.lut.shape[:-1]
+        lut_base = np.arange(int(np.prod(lut_shape)), dtype=np.intp).reshape(lut_shape)
+        self.lut_base = np.broadcast_to(lut_base * self.n_values, self.sample_shape)
+        self.lut_flat = self.lut.reshape(-1)
+        raw_max = self.raw_min + self.n_values - 1
+        self.raw_dtype = np.result_type(
+            np.min_scalar_type(self.raw_min), np.min_scalar_type(raw_max)
+        )
+        # tables for the native runtime, created on first use
+        self.native_lut = None
+
+    def ishape_raw(self, ishape_normal):
+        "Returns the shape of raw inputs for the given normal input shape."
+        return tuple(ishape_normal[x] for x in np.argsort(self.perm))
+
+    def check_range(self, ibuf_raw):
+        "Asserts that all raw input values are in range."
+        raw_max = self.raw_min + self.n_values - 1
+        if np.issubdtype(ibuf_raw.dtype, np.integer):
+            info = np.iinfo(ibuf_raw.dtype)
+            if info.min >= self.raw_min and info.max <= raw_max:
+                return
+        if ibuf_raw.size > 0:
+            assert (
+                ibuf_raw.min() >= self.raw_min and ibuf_raw.max() <= raw_max
+            ), "Raw input out of range [%d, %d]" % (self.raw_min, raw_max)
+
+    def __call__(self, ibuf_raw, out=None):
+        """Pre-process the given raw input, returning the pre-processed values
+        in normal shape (or writing them into out, if given)."""
+        self.check_range(ibuf_raw)
+        ibuf_raw = ibuf_raw.transpose(self.perm)
+        ind = np.add(self.lut_base, ibuf_raw, dtype=np.intp, casting="unsafe")
+        ind -= self.raw_min
+        return np.take(self.lut_flat, ind, out=out)
+
+    def pack(self, ibuf_raw, finn_runtime, dtype, folded_shape, packed_shape, out=None):
+        """Pre-process and pack the given raw input in a single pass with the
+        native runtime (see finn_runtime.pack_lut), returning the packed input
+        or out if given."""
+        if self.native_lut is None:
+            codes = finn_runtime.lut_codes(self.lut_flat, dtype)
+            lut_base = np.ascontiguousarray(self.lut_base, dtype=np.uint64)
+            if self.perm == tuple(range(len(self.perm))):
+                src_index = None
+            else:
+                raw_sample_shape = self.ishape_raw((1,) + self.sample_shape)[1:]
+                raw_index = np.arange(int(np.prod(raw_sample_shape)), dtype=np.uint64)
+                raw_index = raw_index.reshape((1,) + raw_sample_shape)
+                src_index = np.ascontiguousarray(raw_index.transpose(self.perm))
+            self.native_lut = (codes, lut_base, src_index)
+        codes, lut_base, src_index = self.native_lut
+        return finn_runtime.pack_lut(
+            ibuf_raw,
+            self.raw_min,
+            self.n_values,
+            codes,
+            lut_base,
+            dtype,
+            folded_shape,
+            packed_shape,
+            src_index=src_index,
+            out=out,
+        )
+
+
 class FINNExampleOverlay(Overlay):
     def __init__(
         self,
@@ -55,6 +244,8 @@ class FINNExampleOverlay(Overlay):
         device=None,
         download=True,
         runtime_weight_dir="runtime_weights/",
+        native_runtime=False,
+        host_preproc_dir="host_preproc/",
     ):
         """Initialize the FINN accelerator.
 
@@ -76,32 +267,59 @@ class FINNExampleOverlay(Overlay):
             Whether to flash the bitstream.
         runtime_weight_dir: str
             Path to runtime weights folder.
+        native_runtime: bool
+            Whether to pack and unpack data with the native (C++) runtime
+            in finn_runtime.py, compiled on first use, where supported. If
+            all inputs and outputs are supported, execute() runs through a
+            native accelerator handle (finn_runtime.NativeAccelerator) on
+            the device buffers.
+        host_preproc_dir: str
+            Path to the host-side pre-processing exported by MakePYNQDriver,
+            which is then fused into the input packing, so that execute()
+            takes raw inputs. None to disable.
         """
         super().__init__(bitfile_name, download=download, device=device)
+        if native_runtime:
+            import finn_runtime
+
+            self.native_runtime = finn_runtime
+            finn_runtime.get_library()
+        else:
+            self.native_runtime = None
         self.runtime_weight_dir = runtime_weight_dir
         self._io_shape_dict = io_shape_dict
+        # host-side pre-processing of each input, if any
+        preproc_files = io_shape_dict.get("host_preproc", [None] * self.num_inputs)
+        self.host_preproc = [
+            None
+            if x is None or host_preproc_dir is None
+            else HostPreproc(host_preproc_dir + "/" + x, io_shape_dict["ishape_normal"][i])
+            for i, x in enumerate(preproc_files)
+        ]
         self.ibuf_packed_device = None
         self.obuf_packed_device = None
+        self.native_accel = None
         self.platform = platform
         self.batch_size = batch_size
         self.fclk_mhz = fclk_mhz
-        self.idma = []
-        self.odma = []
-        self.odma_handle = []
-        if "input_dma_name" in io_shape_dict.keys():
-            for idma_name in io_shape_dict["input_dma_name"]:
-                self.idma.append(getattr(self, idma_name))
-        else:
-            self.idma = [self.idma0]
-        if "output_dma_name" in io_shape_dict.keys():
-            for odma_name in io_shape_dict["output_dma_name"]:
-                self.odma.append(getattr(self, odma_name))
-                if self.platform == "alveo":
-                    self.odma_handle.append(None)
-        else:
-            self.odma = [self.odma0]
-            if self.platform == "alveo":
-                self.odma_handle.append(None)
+        # the accelerator may consist of several replicated compute units (CUs),
+        # each with its own set of DMAs, that process a shard of each batch
+        self.num_compute_units = io_shape_dict.get("num_compute_units", 1)
+        idma_names = io_shape_dict.get("input_dma_name", ["idma0"])
+        odma_names = io_shape_dict.get("output_dma_name", ["odma0"])
+        self.cu_idma = []
+        self.cu_odma = []
+        self.cu_odma_handle = []
+        for cu in range(self.num_compute_units):
+            self.cu_idma.append([getattr(self, compute_unit_name(x, cu)) for x in idma_names])
+            self.cu_odma.append([getattr(self, compute_unit_name(x, cu)) for x in odma_names])
+            self.cu_odma_handle.append([None for x in odma_names])
+        # DMAs of the first CU
+        self.idma = self.cu_idma[0]
+        self.odma = self.cu_odma[0]
+        self.odma_handle = self.cu_odma_handle[0]
+        self.cu_finish_time = [None] * self.num_compute_units
+        self.active_cus = []
         if self.platform == "zynq-iodma":
             # set the clock frequency as specified by user during transformations
             if self.fclk_mhz > 0:
@@ -115,37 +333,35 @@ class FINNExampleOverlay(Overlay):
         appropriate layer of the accelerator. Note that this must be enabled
         during the accelerator build process. The weights directory
         is specified as the class member ``runtime_weight_dir``. External (DRAM)
-        weights are one .npy file per layer.
+        weights are one .npy file per layer, which is memory-mapped and copied
+        to the device buffer chunk-wise. Device buffers for the same weight file
+        are shared between all overlays on the same device, see
+        get_external_weight_buffer.
         """
 
         self.external_weights = []
+        self.cu_external_weights = [[] for cu in range(self.num_compute_units)]
         w_filenames = []
         if not os.path.isdir(self.runtime_weight_dir):
             return
         for dirpath, dirnames, filenames in os.walk(self.runtime_weight_dir):
             w_filenames.extend(filenames)
 
-        tmp_weight_dict = {}
-
         for w_filename in w_filenames:
-            if w_filename.endswith(".npy"):
-                weight_tensor = np.load(self.runtime_weight_dir + "/" + w_filename)
-            else:
+            # skip runtime-writable weights, see read_runtime_weights
+            if not w_filename.endswith(".npy") or _runtime_weight_filename.match(w_filename):
                 continue
-
             idma_name = w_filename.split(".")[0]
-            tmp_weight_dict[idma_name] = weight_tensor
-
-        for idma_name in tmp_weight_dict.keys():
-            if idma_name in self.ip_dict.keys():
-                iwdma = getattr(self, idma_name)
-                weight_tensor = tmp_weight_dict[idma_name]
-                weight_buf = allocate(weight_tensor.shape, dtype=np.uint8)
-                weight_buf[:] = weight_tensor
-                # weight_buf.sync_to_device()
-                weight_buf.flush()
-
-                self.external_weights += [(iwdma, weight_buf, idma_name)]
+            if idma_name not in self.ip_dict.keys():
+                continue
+            weight_buf = get_external_weight_buffer(
+                self.runtime_weight_dir + "/" + w_filename, self.device
+            )
+            # weights DMAs of each compute unit, the weight buffers are shared
+            for cu in range(self.num_compute_units):
+                iwdma = getattr(self, compute_unit_name(idma_name, cu))
+                self.cu_external_weights[cu] += [(iwdma, weight_buf, idma_name)]
+        self.external_weights = self.cu_external_weights[0]
 
         if "number_of_external_weights" in self._io_shape_dict:
             hw_ext_weights = self._io_shape_dict["number_of_external_weights"]
@@ -155,12 +371,13 @@ class FINNExampleOverlay(Overlay):
                 + "Is runtime_weight_dir pointing to the correct folder?"
             )
 
-    def load_runtime_weights(self, flush_accel=True, verify=True):
+    def load_runtime_weights(self, flush_accel=True, verify=True, weight_dir=None):
         """Load any existing runtime-writable weights from the specified dir into the
         appropriate layer of the accelerator. Note that this must be enabled
         during the accelerator build process. The runtime weights directory
         is specified as the class member ``runtime_weight_dir``. Runtime-writable
-        weights are provided as one .dat file per layer.
+        weights are provided as one .npy (binary, memory-mapped) or .dat (text)
+        file per layer, see read_runtime_weights.
 
         Parameters
         ----------
@@ -168,29 +385,25 @@ class FINNExampleOverlay(Overlay):
             Run the accelerator with dummy input after weights are written to
             flush any stale weight data in the weight streamer FIFOs.
         verify: bool
-            Whether the written weights will be re-read and verified.
+            Whether the written weights will be re-read and verified. This is
+            slow on Alveo, disable it to quickly switch between weight sets.
+        weight_dir: str
+            Load the weights from this dir instead of ``runtime_weight_dir``,
+            e.g. to switch between weight sets at runtime.
         """
-        w_filenames = []
-        if not os.path.isdir(self.runtime_weight_dir):
+        if weight_dir is None:
+            weight_dir = self.runtime_weight_dir
+        if not os.path.isdir(weight_dir):
             return
-        for dirpath, dirnames, filenames in os.walk(self.runtime_weight_dir):
-            w_filenames.extend(filenames)
-        rt_weight_dict = {}
-        for w_filename in w_filenames:
-            if w_filename.endswith(".dat"):
-                with open(self.runtime_weight_dir + "/" + w_filename, "r") as f:
-                    dat = f.read()
-            else:
-                continue
-            layer_w = np.fromiter([int(x, 16) for x in dat.strip().split()], dtype=np.uint32)
-            sdp_ind = int(w_filename.split("_")[0])
-            layer_ind = int(w_filename.split("_")[1])
-            rt_weight_dict[(sdp_ind, layer_ind)] = layer_w
-        for sdp_ind, layer_ind in rt_weight_dict.keys():
-            cand_if_name = "StreamingDataflowPartition_%d" % sdp_ind
+        rt_weight_dict = read_runtime_weights(weight_dir)
+        for (sdp_ind, layer_ind), cu in itertools.product(
+            rt_weight_dict.keys(), range(self.num_compute_units)
+        ):
+            cand_if_name = compute_unit_name("StreamingDataflowPartition_%d" % sdp_ind, cu)
             if cand_if_name in self.ip_dict.keys():
-                layer_mmio = getattr(self, "StreamingDataflowPartition_%d" % sdp_ind).mmio
+                layer_mmio = getattr(self, cand_if_name).mmio
                 layer_w = rt_weight_dict[(sdp_ind, layer_ind)]
+                # single bulk write of all words
                 layer_mmio.write_mm(0, layer_w.tobytes())
                 if verify:
                     if self.platform == "alveo":
@@ -226,6 +439,13 @@ class FINNExampleOverlay(Overlay):
         ret[0] = self.batch_size
         return tuple(ret)
 
+    def ishape_raw(self, ind=0):
+        """Shape of the inputs to execute(): the raw input shape if host-side
+        pre-processing is fused into the input packing, else the normal shape."""
+        if self.host_preproc[ind] is None:
+            return self.ishape_normal(ind)
+        return self.host_preproc[ind].ishape_raw(self.ishape_normal(ind))
+
     def ishape_folded(self, ind=0):
         ret = list(self._io_shape_dict["ishape_folded"][ind])
         ret[0] = self.batch_size
@@ -267,26 +487,81 @@ class FINNExampleOverlay(Overlay):
             self.ibuf_packed_device = None
         if self.obuf_packed_device is not None:
             self.obuf_packed_device = None
+        # extra buffer sets for execute_stream are allocated on demand
+        self.stream_buffers = []
+        (
+            self.ibuf_packed_device,
+            self.obuf_packed_device,
+            self.obuf_packed,
+        ) = self.allocate_buffers()
+        self.native_accel = self.make_native_accel()
+
+    def make_native_accel(self):
+        """Create a native accelerator handle on the device buffers, which
+        packs the inputs, executes the accelerator and unpacks the outputs in a
+        single native call. Returns None unless the native runtime is enabled
+        and supports all inputs and outputs without host-side pre-processing."""
+        if self.native_runtime is None:
+            return None
+        if any([x is not None for x in self.host_preproc]):
+            return None
+        dtypes = [self.idt(i) for i in range(self.num_inputs)]
+        dtypes += [self.odt(o) for o in range(self.num_outputs)]
+        if not all([self.use_native_packing(x) for x in dtypes]):
+            return None
+
+        def execute(batch_size):
+            for i in range(self.num_inputs):
+                self.ibuf_packed_device[i].flush()
+            self.execute_on_buffers(batch_size=batch_size)
+            for o in range(self.num_outputs):
+                self.obuf_packed_device[o].invalidate()
+
+        native_accel = self.native_runtime.NativeAccelerator(
+            self._io_shape_dict, self.batch_size, execute=execute
+        )
+        for i in range(self.num_inputs):
+            native_accel.set_buffer(False, i, self.ibuf_packed_device[i])
+        for o in range(self.num_outputs):
+            native_accel.set_buffer(True, o, self.obuf_packed_device[o])
+        return native_accel
+
+    def allocate_buffers(self):
+        """Allocate a set of packed input and output buffers for the current
+        batch size. Returns a tuple of lists (ibuf_packed_device,
+        obuf_packed_device, obuf_packed), with one entry per input/output.
+        obuf_packed are ordinary host buffers to copy the outputs to."""
         cacheable = {"alveo": False, "zynq-iodma": True}[self.platform]
-        self.ibuf_packed_device = []
-        self.obuf_packed_device = []
-        self.obuf_packed = []
+        ibuf_packed_device = []
+        obuf_packed_device = []
+        obuf_packed = []
         for i in range(self.num_inputs):
             new_packed_ibuf = allocate(
                 shape=self.ishape_packed(i), dtype=np.uint8, cacheable=cacheable, target=self.device
             )
-            self.ibuf_packed_device.append(new_packed_ibuf)
+            ibuf_packed_device.append(new_packed_ibuf)
         for o in range(self.num_outputs):
             new_packed_obuf = allocate(
                 shape=self.oshape_packed(o), dtype=np.uint8, cacheable=cacheable, target=self.device
             )
-            self.obuf_packed_device.append(new_packed_obuf)
-            self.obuf_packed.append(np.empty_like(new_packed_obuf))
+            obuf_packed_device.append(new_packed_obuf)
+            obuf_packed.append(np.empty_like(new_packed_obuf))
+        return (ibuf_packed_device, obuf_packed_device, obuf_packed)
+
+    def use_native_packing(self, dtype):
+        "Whether data of the given FINN DataType is packed by the native runtime."
+        return self.native_runtime is not None and self.native_runtime.is_native_packing_supported(
+            dtype
+        )
 
     def fold_input(self, ibuf_normal, ind=0):
         """Reshapes input in desired shape.
         Gets input data (ibuf_normal), checks if data is in expected normal shape.
-        Returns folded input."""
+        Returns folded input. Raw inputs are pre-processed first if host-side
+        pre-processing is fused into the input packing."""
+        if self.host_preproc[ind] is not None:
+            assert ibuf_normal.shape == self.ishape_raw(ind)
+            ibuf_normal = self.host_preproc[ind](ibuf_normal)
         # ensure that shape is as expected
         assert ibuf_normal.shape == self.ishape_normal(ind)
         # convert to folded form
@@ -296,6 +571,8 @@ class FINNExampleOverlay(Overlay):
     def pack_input(self, ibuf_folded, ind=0):
         """Packs folded input and reverses both SIMD dim and endianness.
         Gets input data in folded shape and returns packed input data."""
+        if self.use_native_packing(self.idt(ind)):
+            return self.native_runtime.pack(ibuf_folded, self.idt(ind), self.ishape_packed(ind))
         ibuf_packed = finnpy_to_packed_bytearray(
             ibuf_folded,
             self.idt(ind),
@@ -308,6 +585,8 @@ class FINNExampleOverlay(Overlay):
     def unpack_output(self, obuf_packed, ind=0):
         """Unpacks the packed output buffer from accelerator.
         Gets packed output and returns output data in folded shape."""
+        if self.use_native_packing(self.odt(ind)):
+            return self.native_runtime.unpack(obuf_packed, self.odt(ind), self.oshape_folded(ind))
         obuf_folded = packed_bytearray_to_finnpy(
             obuf_packed,
             self.odt(ind),
@@ -334,7 +613,93 @@ class FINNExampleOverlay(Overlay):
         self.obuf_packed_device[ind].invalidate()
         np.copyto(data, self.obuf_packed_device[ind])
 
-    def execute_on_buffers(self, asynch=False, batch_size=None):
+    def pack_input_to_device(self, ibuf_normal, ind=0, ibuf_packed_device=None):
+        """Folds and packs the given input in normal shape directly into the
+        PYNQ input buffer (or the given buffer ibuf_packed_device) and flushes
+        it, without allocating any intermediate buffers. Equivalent to
+        fold_input, pack_input and copy_input_data_to_device. With host-side
+        pre-processing and the native runtime, raw inputs are pre-processed
+        and packed in a single pass."""
+        if ibuf_packed_device is None:
+            ibuf_packed_device = self.ibuf_packed_device[ind]
+        if self.host_preproc[ind] is not None and self.use_native_packing(self.idt(ind)):
+            assert ibuf_normal.shape == self.ishape_raw(ind)
+            self.host_preproc[ind].pack(
+                ibuf_normal,
+                self.native_runtime,
+                self.idt(ind),
+                self.ishape_folded(ind),
+                self.ishape_packed(ind),
+                out=ibuf_packed_device,
+            )
+            ibuf_packed_device.flush()
+            return
+        ibuf_folded = self.fold_input(ibuf_normal, ind=ind)
+        if self.use_native_packing(self.idt(ind)):
+            self.native_runtime.pack(
+                ibuf_folded,
+                self.idt(ind),
+                self.ishape_packed(ind),
+                out=ibuf_packed_device,
+            )
+            ibuf_packed_device.flush()
+            return
+        finnpy_to_packed_bytearray(
+            ibuf_folded,
+            self.idt(ind),
+            reverse_endian=True,
+            reverse_inner=True,
+            fast_mode=True,
+            out=ibuf_packed_device,
+        )
+        ibuf_packed_device.flush()
+
+    def unpack_output_from_device(self, obuf_normal, ind=0):
+        """Unpacks the PYNQ output buffer directly into the given output array
+        in normal shape (of any numeric dtype), without allocating any
+        intermediate buffers. Equivalent to copy_output_data_from_device,
+        unpack_output and unfold_output. Returns obuf_normal."""
+        assert obuf_normal.shape == self.oshape_normal(ind)
+        obuf_folded = obuf_normal.reshape(self.oshape_folded(ind))
+        assert np.may_share_memory(obuf_folded, obuf_normal), "Output must be contiguous"
+        self.obuf_packed_device[ind].invalidate()
+        if (
+            self.use_native_packing(self.odt(ind))
+            and obuf_folded.flags.c_contiguous
+            and obuf_folded.dtype in self.native_runtime.elem_types
+        ):
+            self.native_runtime.unpack(
+                self.obuf_packed_device[ind],
+                self.odt(ind),
+                self.oshape_folded(ind),
+                out=obuf_folded,
+            )
+            return obuf_normal
+        packed_bytearray_to_finnpy(
+            self.obuf_packed_device[ind],
+            self.odt(ind),
+            self.oshape_folded(ind),
+            reverse_endian=True,
+            reverse_inner=True,
+            fast_mode=True,
+            out=obuf_folded,
+        )
+        return obuf_normal
+
+    def compute_unit_shards(self, batch_size=None):
+        """Returns the (start, end) sample indices of the shard of a batch that
+        is processed by each compute unit. Shards differ in size by at most one
+        sample, and may be empty for batches smaller than num_compute_units."""
+        if batch_size is None:
+            batch_size = self.batch_size
+        shard_sizes = [
+            batch_size // self.num_compute_units + (cu < batch_size % self.num_compute_units)
+            for cu in range(self.num_compute_units)
+        ]
+        shard_ends = np.cumsum(shard_sizes).tolist()
+        return list(zip([0] + shard_ends[:-1], shard_ends))
+
+    def execute_on_buffers(self, asynch=False, batch_size=None, ibufs=None, obufs=None):
         """Executes accelerator by setting up the DMA(s) on pre-allocated buffers.
         Blocking behavior depends on the asynch parameter:
         * ``asynch=True`` will block until all transfers are complete.
@@ -343,66 +708,130 @@ class FINNExampleOverlay(Overlay):
 
         The optional batch_size parameter can be used to execute on a smaller
         batch than the initialized ``self.batch_size``.
+
+        The optional ibufs and obufs parameters can be used to execute on
+        other buffers (see ``allocate_buffers()``) than the default
+        ``self.ibuf_packed_device`` and ``self.obuf_packed_device``.
+
+        With several compute units, the batch is sharded across them (see
+        ``compute_unit_shards()``) and all compute units are started before
+        waiting on any of them.
         """
         if batch_size is None:
             batch_size = self.batch_size
+        if ibufs is None:
+            ibufs = self.ibuf_packed_device
+        if obufs is None:
+            obufs = self.obuf_packed_device
         assert batch_size <= self.batch_size, "Specified batch_size is too large."
+        self.cu_finish_time = [None] * self.num_compute_units
+        for cu, (start, end) in enumerate(self.compute_unit_shards(batch_size)):
+            if start == end:
+                continue
+            self.active_cus.append(cu)
+            # slices of PYNQ buffers along the batch dimension are PYNQ buffers
+            # with the device address of the shard
+            self.execute_compute_unit(
+                cu, end - start, [x[start:end] for x in ibufs], [x[start:end] for x in obufs]
+            )
+        # blocking behavior depends on asynch parameter
+        if asynch is False:
+            self.wait_until_finished()
+
+    def execute_compute_unit(self, cu, batch_size, ibufs, obufs):
+        "Starts the DMAs of compute unit cu on the given buffers without blocking."
+        idma = self.cu_idma[cu]
+        odma = self.cu_odma[cu]
+        odma_handle = self.cu_odma_handle[cu]
         if self.platform == "zynq-iodma":
             for o in range(self.num_outputs):
-                assert self.odma[o].read(0x00) & 0x4 != 0, "Output DMA %d is not idle" % (o)
+                assert odma[o].read(0x00) & 0x4 != 0, "Output DMA %d is not idle" % (o)
             # manually launch IODMAs since signatures are missing
-            for iwdma, iwbuf, iwdma_name in self.external_weights:
+            for iwdma, iwbuf, iwdma_name in self.cu_external_weights[cu]:
                 iwdma.write(0x10, iwbuf.device_address)
                 iwdma.write(0x1C, batch_size)
                 iwdma.write(0x00, 1)
             for o in range(self.num_outputs):
-                self.odma[o].write(0x10, self.obuf_packed_device[o].device_address)
-                self.odma[o].write(0x1C, batch_size)
-                self.odma[o].write(0x00, 1)
+                odma[o].write(0x10, obufs[o].device_address)
+                odma[o].write(0x1C, batch_size)
+                odma[o].write(0x00, 1)
             for i in range(self.num_inputs):
-                self.idma[i].write(0x10, self.ibuf_packed_device[i].device_address)
-                self.idma[i].write(0x1C, batch_size)
-                self.idma[i].write(0x00, 1)
+                idma[i].write(0x10, ibufs[i].device_address)
+                idma[i].write(0x1C, batch_size)
+                idma[i].write(0x00, 1)
         elif self.platform == "alveo":
             for o in range(self.num_outputs):
-                assert self.odma_handle[o] is None, "Output DMA %d is already running" % o
+                assert odma_handle[o] is None, "Output DMA %d is already running" % o
             for i in range(self.num_inputs):
-                self.idma[i].start(self.ibuf_packed_device[i], batch_size)
-            for iwdma, iwbuf, iwdma_name in self.external_weights:
+                idma[i].start(ibufs[i], batch_size)
+            for iwdma, iwbuf, iwdma_name in self.cu_external_weights[cu]:
                 iwdma.start(iwbuf, batch_size)
             for o in range(self.num_outputs):
-                self.odma_handle[o] = self.odma[o].start(self.obuf_packed_device[o], batch_size)
+                odma_handle[o] = odma[o].start(obufs[o], batch_size)
         else:
             raise Exception("Unrecognized platform: %s" % self.platform)
-        # blocking behavior depends on asynch parameter
-        if asynch is False:
-            self.wait_until_finished()
 
-    def wait_until_finished(self):
-        "Block until all output DMAs have finished writing."
+    def wait_compute_unit(self, cu):
+        "Block until all output DMAs of compute unit cu have finished writing."
         if self.platform == "zynq-iodma":
             # check if output IODMA is finished via register reads
             for o in range(self.num_outputs):
-                status = self.odma[o].read(0x00)
+                status = self.cu_odma[cu][o].read(0x00)
                 while status & 0x2 == 0:
-                    status = self.odma[o].read(0x00)
+                    status = self.cu_odma[cu][o].read(0x00)
         elif self.platform == "alveo":
-            assert all([x is not None for x in self.odma_handle]), "No odma_handle to wait on"
+            odma_handle = self.cu_odma_handle[cu]
+            assert all([x is not None for x in odma_handle]), "No odma_handle to wait on"
             for o in range(self.num_outputs):
-                self.odma_handle[o].wait()
-                self.odma_handle[o] = None
+                odma_handle[o].wait()
+                odma_handle[o] = None
         else:
             raise Exception("Unrecognized platform: %s" % self.platform)
+        self.cu_finish_time[cu] = time.time()
+
+    def wait_until_finished(self):
+        """Block until all output DMAs have finished writing. Compute units are
+        awaited concurrently, recording when each of them finished in
+        ``self.cu_finish_time``."""
+        assert len(self.active_cus) > 0, "No compute unit to wait on"
+        if len(self.active_cus) == 1:
+            self.wait_compute_unit(self.active_cus[0])
+        else:
+            with ThreadPoolExecutor(max_workers=len(self.active_cus)) as executor:
+                # re-raises any exception from waiting on a compute unit
+                list(executor.map(self.wait_compute_unit, self.active_cus))
+        self.active_cus = []
 
-    def execute(self, input_npy):
+    def execute(self, input_npy, out=None):
         """Given a single or a list of input numpy array, first perform necessary
         packing and copying to device buffers, execute on accelerator, then unpack
-        output and return output numpy array from accelerator."""
+        output and return output numpy array from accelerator.
+
+        If out is given (a single or a list of output arrays in normal shape),
+        the inputs are packed directly into the device buffers and the outputs
+        are unpacked directly into out, which is returned. This avoids any
+        allocations in steady state, see pack_input_to_device and
+        unpack_output_from_device."""
         # if single input, convert to list to normalize how we process the input
         if not type(input_npy) is list:
             input_npy = [input_npy]
         assert self.num_inputs == len(input_npy), "Not all accelerator inputs are specified."
+        if self.native_accel is not None:
+            return self.execute_native(input_npy, out)
+        if out is not None:
+            outputs = out if type(out) is list else [out]
+            assert self.num_outputs == len(outputs), "Not all accelerator outputs are specified."
+            for i in range(self.num_inputs):
+                self.pack_input_to_device(input_npy[i], ind=i)
+            self.execute_on_buffers()
+            for o in range(self.num_outputs):
+                self.unpack_output_from_device(outputs[o], ind=o)
+            return out
         for i in range(self.num_inputs):
+            if self.host_preproc[i] is not None:
+                # pre-process raw inputs straight into the device buffer
+                self.pack_input_to_device(input_npy[i], ind=i)
+                continue
             ibuf_folded = self.fold_input(input_npy[i], ind=i)
             ibuf_packed = self.pack_input(ibuf_folded, ind=i)
             self.copy_input_data_to_device(ibuf_packed, ind=i)
@@ -418,6 +847,152 @@ class FINNExampleOverlay(Overlay):
         else:
             return outputs
 
+    def execute_native(self, input_npy, out=None):
+        """execute() through the native accelerator handle: packs the list of
+        inputs into the device buffers, executes the accelerator and unpacks
+        the outputs in a single native call. Outputs are unpacked into out if
+        given (C-contiguous arrays of a native element type), otherwise into
+        new float32 arrays."""
+        for i in range(self.num_inputs):
+            assert input_npy[i].shape == self.ishape_normal(i)
+        if out is None:
+            outputs = [
+                np.empty(self.oshape_normal(o), dtype=np.float32) for o in range(self.num_outputs)
+            ]
+        else:
+            outputs = out if type(out) is list else [out]
+            assert self.num_outputs == len(outputs), "Not all accelerator outputs are specified."
+            for o in range(self.num_outputs):
+                assert outputs[o].shape == self.oshape_normal(o)
+        self.native_accel.execute(input_npy, outputs)
+        if out is not None:
+            return out
+        return outputs[0] if self.num_outputs == 1 else outputs
+
+    def execute_stream(self, inputs, num_buffers=2):
+        """Pipelined version of execute() for a stream of inputs. Given an
+        iterable of inputs (each a numpy array or a list of numpy arrays, as
+        for execute(), with the full batch size), yields the outputs in the
+        same order.
+
+        Up to num_buffers sets of device buffers are in flight at any time.
+        Folding, packing and copying the next inputs to the device, as well as
+        copying, unpacking and unfolding the previous outputs run on worker
+        threads, overlapping with the DMA transfers and accelerator compute.
+        """
+        assert num_buffers >= 1, "Need at least one set of buffers."
+        while len(self.stream_buffers) < num_buffers - 1:
+            self.stream_buffers.append(self.allocate_buffers())
+        buffers = [(self.ibuf_packed_device, self.obuf_packed_device, self.obuf_packed)]
+        buffers += self.stream_buffers[: num_buffers - 1]
+        # buffer sets are passed between the stages by index
+        free_q = queue.Queue()
+        for b in range(num_buffers):
+            free_q.put(b)
+        exec_q = queue.Queue()
+        unpack_q = queue.Queue()
+        out_q = queue.Queue()
+        stop = threading.Event()
+
+        def pack(input_npy):
+            if not type(input_npy) is list:
+                input_npy = [input_npy]
+            assert self.num_inputs == len(input_npy), "Not all accelerator inputs are specified."
+            b = free_q.get()
+            if stop.is_set():
+                return _end_of_stream
+            ibufs = buffers[b][0]
+            for i in range(self.num_inputs):
+                if self.host_preproc[i] is not None:
+                    self.pack_input_to_device(input_npy[i], ind=i, ibuf_packed_device=ibufs[i])
+                    continue
+                ibuf_folded = self.fold_input(input_npy[i], ind=i)
+                ibuf_packed = self.pack_input(ibuf_folded, ind=i)
+                np.copyto(ibufs[i], ibuf_packed)
+                ibufs[i].flush()
+            return b
+
+        def execute(b):
+            self.execute_on_buffers(ibufs=buffers[b][0], obufs=buffers[b][1])
+            return b
+
+        def unpack(b):
+            obufs, obuf_packed = buffers[b][1:]
+            for o in range(self.num_outputs):
+                obufs[o].invalidate()
+                np.copyto(obuf_packed[o], obufs[o])
+            outputs = []
+            for o in range(self.num_outputs):
+                obuf_folded = self.unpack_output(obuf_packed[o], ind=o)
+                outputs.append(self.unfold_output(obuf_folded, ind=o))
+            # the host copies are only reused after this stage is done with them
+            free_q.put(b)
+            return outputs[0] if self.num_outputs == 1 else outputs
+
+        def run_stage(fxn, in_items, out_q):
+            # forward results, the end of the stream or any exception raised
+            # in this stage to the next stage
+            try:
+                for item in in_items:
+                    if stop.is_set() or item is _end_of_stream:
+                        break
+                    if isinstance(item, BaseException):
+                        out_q.put(item)
+                        return
+                    ret = fxn(item)
+                    if ret is _end_of_stream:
+                        break
+                    out_q.put(ret)
+            except BaseException as e:
+                out_q.put(e)
+                return
+            out_q.put(_end_of_stream)
+
+        def iter_queue(q):
+            while True:
+                yield q.get()
+
+        stages = [
+            (pack, inputs, exec_q),
+            (execute, iter_queue(exec_q), unpack_q),
+            (unpack, iter_queue(unpack_q), out_q),
+        ]
+        workers = [threading.Thread(target=run_stage, args=x, daemon=True) for x in stages]
+        for worker in workers:
+            worker.start()
+        try:
+            while True:
+                ret = out_q.get()
+                if ret is _end_of_stream:
+                    break
+                if isinstance(ret, BaseException):
+                    raise ret
+                yield ret
+        finally:
+            # unblock and shut down all stages, e.g. if the consumer stopped early
+            stop.set()
+            free_q.put(0)
+            exec_q.put(_end_of_stream)
+            unpack_q.put(_end_of_stream)
+            for worker in workers:
+                worker.join()
+
+    def random_input(self, ind=0):
+        """Returns a random input for execute() with the current batch size, as
+        raw input if host-side pre-processing is fused into the input packing."""
+        preproc = self.host_preproc[ind]
+        if preproc is not None:
+            return np.random.randint(
+                preproc.raw_min, preproc.raw_min + preproc.n_values, size=self.ishape_raw(ind)
+            ).astype(preproc.raw_dtype)
+        inp = gen_finn_dt_tensor(self.idt(ind), self.ishape_normal(ind))
+        # provide as int8/uint8 to support fast packing path where possible
+        if self.idt(ind) == DataType["UINT8"]:
+            inp = inp.astype(np.uint8)
+        elif self.idt(ind) == DataType["INT8"]:
+            inp = inp.astype(np.int8)
+        return inp
+
     def throughput_test(self):
         """Run accelerator with empty inputs to measure throughput and other metrics.
         Returns dictionary with various metrics."""
@@ -429,6 +1004,15 @@ class FINNExampleOverlay(Overlay):
         runtime = end - start
         res["runtime[ms]"] = runtime * 1000
         res["throughput[images/s]"] = self.batch_size / runtime
+        if self.num_compute_units > 1:
+            # throughput of each compute unit on its shard of the batch
+            res["num_compute_units"] = self.num_compute_units
+            for cu, (shard_start, shard_end) in enumerate(self.compute_unit_shards()):
+                if shard_start == shard_end:
+                    continue
+                cu_runtime = self.cu_finish_time[cu] - start
+                res["runtime_cu%d[ms]" % cu] = cu_runtime * 1000
+                res["throughput_cu%d[images/s]" % cu] = (shard_end - shard_start) / cu_runtime
         total_in = 0
         for i in range(self.num_inputs):
             total_in += np.prod(self.ishape_packed(i))
@@ -447,12 +1031,7 @@ class FINNExampleOverlay(Overlay):
             res["fclk[mhz]"] = self.clock_dict["clock0"]["frequency"]
         res["batch_size"] = self.batch_size
         # also benchmark driver-related overheads
-        input_npy = gen_finn_dt_tensor(self.idt(), self.ishape_normal())
-        # provide as int8/uint8 to support fast packing path where possible
-        if self.idt() == DataType["UINT8"]:
-            input_npy = input_npy.astype(np.uint8)
-        elif self.idt() == DataType["INT8"]:
-            input_npy = input_npy.astype(np.int8)
+        input_npy = self.random_input()
         start = time.time()
         ibuf_folded = self.fold_input(input_npy)
         end = time.time()
@@ -489,3 +1068,61 @@ class FINNExampleOverlay(Overlay):
         runtime = end - start
         res["unfold_output[ms]"] = runtime * 1000
         return res
+
+    def benchmark(self, batch_sizes=None, num_iterations=100, num_warmup=2):
+        """Run the accelerator with random inputs for num_iterations (after
+        num_warmup untimed iterations) at each of the given batch sizes
+        (default: the current batch size), timing each stage of execute()
+        (see ``benchmark_stages``) separately.
+
+        Returns a list with one dictionary of metrics per batch size: mean and
+        p50/p90/p99/max latency per stage, and throughput based on the mean
+        end-to-end and execution latencies. See write_benchmark_results to save
+        the results as JSON/CSV. The batch size is restored afterwards."""
+        orig_batch_size = self.batch_size
+        if batch_sizes is None:
+            batch_sizes = [orig_batch_size]
+        results = []
+        for batch_size in batch_sizes:
+            self.batch_size = batch_size
+            input_npy = [self.random_input(i) for i in range(self.num_inputs)]
+            times = np.zeros((num_iterations, len(benchmark_stages)))
+            for it in range(-num_warmup, num_iterations):
+                t = [time.perf_counter()]
+                ibuf_packed = []
+                for i in range(self.num_inputs):
+                    ibuf_folded = self.fold_input(input_npy[i], ind=i)
+                    ibuf_packed.append(self.pack_input(ibuf_folded, ind=i))
+                t.append(time.perf_counter())
+                for i in range(self.num_inputs):
+                    self.copy_input_data_to_device(ibuf_packed[i], ind=i)
+                t.append(time.perf_counter())
+                self.execute_on_buffers()
+                t.append(time.perf_counter())
+                for o in range(self.num_outputs):
+                    self.copy_output_data_from_device(self.obuf_packed[o], ind=o)
+                t.append(time.perf_counter())
+                for o in range(self.num_outputs):
+                    obuf_folded = self.unpack_output(self.obuf_packed[o], ind=o)
+                    self.unfold_output(obuf_folded, ind=o)
+                t.append(time.perf_counter())
+                if it >= 0:
+                    times[it, :-1] = np.diff(t)
+                    times[it, -1] = t[-1] - t[0]
+            # latencies in ms
+            times *= 1000
+            res = {"batch_size": int(batch_size), "num_iterations": int(num_iterations)}
+            total_mean = times[:, -1].mean()
+            execute_mean = times[:, benchmark_stages.index("execute")].mean()
+            res["throughput[images/s]"] = batch_size / total_mean * 1000
+            res["execute_throughput[images/s]"] = batch_size / execute_mean * 1000
+            for stage_ind, stage in enumerate(benchmark_stages):
+                res["%s_mean[ms]" % stage] = times[:, stage_ind].mean()
+                stage_percentiles = np.percentile(times[:, stage_ind], benchmark_percentiles)
+                for p, val in zip(benchmark_percentiles, stage_percentiles):
+                    p_name = "max" if p == 100 else "p%d" % p
+                    res["%s_%s[ms]" % (stage, p_name)] = val
+            # convert from numpy scalars to be JSON-serializable
+            results.append({k: v if type(v) is int else float(v) for k, v in res.items()})
+        self.batch_size = orig_batch_size
+        return results
@@ -0,0 +1,538 @@
+/* Copyright (C) 2024, Advanced Micro Devices, Inc.
+All rights reserved.
+#
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+#
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+#
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+#
+* Neither the name of FINN nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+#
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
+
+/* Native FINN host runtime, see finn_runtime.h for the C ABI. Build with
+  g++ -O3 -std=c++11 -shared -fPIC finn_runtime.cpp -o libfinn_runtime.so
+(finn_runtime.py does this on first use). */
+
+#include "finn_runtime.h"
+
+#include <algorithm>
+#include <cmath>
+#include <cstring>
+#include <vector>
+
+namespace {
+
+/* how element values map to their packed bit patterns */
+enum Kind { KIND_INT, KIND_FIXED, KIND_BIPOLAR, KIND_FLOAT32 };
+
+Kind get_kind(const finn_packing_t &p) {
+  if (p.is_float32) {
+    return KIND_FLOAT32;
+  } else if (p.is_bipolar) {
+    return KIND_BIPOLAR;
+  } else if (p.scale != 1.0) {
+    return KIND_FIXED;
+  }
+  return KIND_INT;
+}
+
+uint64_t get_mask(uint32_t bitwidth) {
+  return bitwidth >= 64 ? ~uint64_t(0) : (uint64_t(1) << bitwidth) - 1;
+}
+
+template <Kind K, typename T> inline uint64_t to_code(T v, double scale, uint64_t mask) {
+  if (K == KIND_FLOAT32) {
+    float f = float(v);
+    uint32_t bits;
+    std::memcpy(&bits, &f, sizeof(bits));
+    return bits;
+  } else if (K == KIND_BIPOLAR) {
+    return v > 0 ? 1 : 0;
+  } else if (K == KIND_FIXED) {
+    return uint64_t(int64_t(std::llround(double(v) / scale))) & mask;
+  }
+  return uint64_t(int64_t(v)) & mask;
+}
+
+template <Kind K, typename T>
+inline T from_code(uint64_t code, uint32_t bitwidth, bool is_signed, double scale) {
+  if (K == KIND_FLOAT32) {
+    uint32_t bits = uint32_t(code);
+    float f;
+    std::memcpy(&f, &bits, sizeof(f));
+    return T(f);
+  } else if (K == KIND_BIPOLAR) {
+    return T(2 * int64_t(code) - 1);
+  }
+  int64_t v = int64_t(code);
+  if (is_signed && bitwidth < 64) {
+    // sign-extend two's complement values
+    v = int64_t(code << (64 - bitwidth)) >> (64 - bitwidth);
+  }
+  if (K == KIND_FIXED) {
+    return T(double(v) * scale);
+  }
+  return T(v);
+}
+
+/* Pack n_rows rows into out, where get_code(j) returns the bit pattern of
+element j (counted from the first element of the first row). */
+template <typename F>
+void pack_codes(const finn_packing_t &p, uint64_t n_rows, uint8_t *out, F get_code) {
+  const uint32_t bw = p.bitwidth;
+  const uint64_t epr = p.elems_per_row;
+  const uint64_t bpr = p.bytes_per_row;
+  for (uint64_t r = 0; r < n_rows; r++) {
+    const uint64_t j = r * epr;
+    uint8_t *o = out + r * bpr;
+    uint64_t pos = 0;
+    if (bw % 8 == 0) {
+      // byte-aligned elements
+      const uint32_t nb = bw / 8;
+      for (uint64_t i = 0; i < epr; i++) {
+        uint64_t code = get_code(j + i);
+        for (uint32_t k = 0; k < nb; k++) {
+          o[pos++] = uint8_t(code >> (8 * k));
+        }
+      }
+    } else if (bw <= 56) {
+      // less than 8 bits are left in the accumulator before adding an element
+      uint64_t acc = 0;
+      uint32_t n_bits = 0;
+      for (uint64_t i = 0; i < epr; i++) {
+        acc |= get_code(j + i) << n_bits;
+        n_bits += bw;
+        while (n_bits >= 8) {
+          o[pos++] = uint8_t(acc);
+          acc >>= 8;
+          n_bits -= 8;
+        }
+      }
+      if (n_bits > 0) {
+        o[pos++] = uint8_t(acc);
+      }
+    } else {
+      uint8_t cur = 0;
+      uint32_t bit_pos = 0;
+      for (uint64_t i = 0; i < epr; i++) {
+        uint64_t code = get_code(j + i);
+        uint32_t remaining = bw;
+        while (remaining > 0) {
+          uint32_t take = std::min(remaining, 8 - bit_pos);
+          cur |= uint8_t((code & ((uint64_t(1) << take) - 1)) << bit_pos);
+          code >>= take;
+          remaining -= take;
+          bit_pos += take;
+          if (bit_pos == 8) {
+            o[pos++] = cur;
+            cur = 0;
+            bit_pos = 0;
+          }
+        }
+      }
+      if (bit_pos > 0) {
+        o[pos++] = cur;
+      }
+    }
+    // zero padding up to the packed row size
+    std::memset(o + pos, 0, bpr - pos);
+  }
+}
+
+template <Kind K, typename T>
+void pack_rows(const finn_packing_t &p, const T *in, uint64_t n_rows, uint8_t *out) {
+  const double scale = p.scale;
+  const uint64_t mask = get_mask(p.bitwidth);
+  pack_codes(p, n_rows, out, [&](uint64_t j) { return to_code<K>(in[j], scale, mask); });
+}
+
+/* Pack n_samples samples of sample_size raw elements each, looking up the
+code of each element in the table lut (see finn_pack_lut). Returns false if
+any raw value is out of range. */
+template <typename T>
+bool pack_lut_typed(const finn_packing_t &p, const T *raw, int64_t raw_min, uint64_t n_values,
+                    const uint64_t *lut, const uint64_t *lut_base, const uint64_t *src_index,
+                    uint64_t sample_size, uint64_t n_samples, uint8_t *out) {
+  bool in_range = true;
+  const uint64_t rows_per_sample = sample_size / p.elems_per_row;
+  for (uint64_t s = 0; s < n_samples; s++) {
+    const T *x = raw + s * sample_size;
+    uint8_t *o = out + s * rows_per_sample * p.bytes_per_row;
+    auto lookup = [&](uint64_t j, T v) {
+      const uint64_t ind = uint64_t(int64_t(v) - raw_min);
+      if (ind >= n_values) {
+        in_range = false;
+        return uint64_t(0);
+      }
+      return lut[lut_base[j] + ind];
+    };
+    if (src_index == nullptr) {
+      pack_codes(p, rows_per_sample, o, [&](uint64_t j) { return lookup(j, x[j]); });
+    } else {
+      pack_codes(p, rows_per_sample, o, [&](uint64_t j) { return lookup(j, x[src_index[j]]); });
+    }
+  }
+  return in_range;
+}
+
+template <Kind K, typename T>
+void unpack_rows(const finn_packing_t &p, const uint8_t *in, uint64_t n_rows, T *out) {
+  const uint32_t bw = p.bitwidth;
+  const bool is_signed = p.is_signed != 0;
+  const uint64_t mask = get_mask(bw);
+  const uint64_t epr = p.elems_per_row;
+  const uint64_t bpr = p.bytes_per_row;
+  for (uint64_t r = 0; r < n_rows; r++) {
+    const uint8_t *x = in + r * bpr;
+    T *o = out + r * epr;
+    uint64_t pos = 0;
+    if (bw % 8 == 0) {
+      const uint32_t nb = bw / 8;
+      for (uint64_t i = 0; i < epr; i++) {
+        uint64_t code = 0;
+        for (uint32_t k = 0; k < nb; k++) {
+          code |= uint64_t(x[pos++]) << (8 * k);
+        }
+        o[i] = from_code<K, T>(code, bw, is_signed, p.scale);
+      }
+    } else if (bw <= 56) {
+      uint64_t acc = 0;
+      uint32_t n_bits = 0;
+      for (uint64_t i = 0; i < epr; i++) {
+        while (n_bits < bw) {
+          acc |= uint64_t(x[pos++]) << n_bits;
+          n_bits += 8;
+        }
+        o[i] = from_code<K, T>(acc & mask, bw, is_signed, p.scale);
+        acc >>= bw;
+        n_bits -= bw;
+      }
+    } else {
+      uint32_t bit_pos = 0;
+      for (uint64_t i = 0; i < epr; i++) {
+        uint64_t code = 0;
+        uint32_t n_bits = 0;
+        while (n_bits < bw) {
+          uint32_t take = std::min(bw - n_bits, 8 - bit_pos);
+          code |= uint64_t((x[pos] >> bit_pos) & ((1u << take) - 1)) << n_bits;
+          n_bits += take;
+          bit_pos += take;
+          if (bit_pos == 8) {
+            pos++;
+            bit_pos = 0;
+          }
+        }
+        o[i] = from_code<K, T>(code, bw, is_signed, p.scale);
+      }
+    }
+  }
+}
+
+template <typename T>
+void pack_typed(const finn_packing_t &p, const void *in, uint64_t n_rows, uint8_t *out) {
+  const T *x = static_cast<const T *>(in);
+  switch (get_kind(p)) {
+  case KIND_FLOAT32:
+    pack_rows<KIND_FLOAT32>(p, x, n_rows, out);
+    break;
+  case KIND_BIPOLAR:
+    pack_rows<KIND_BIPOLAR>(p, x, n_rows, out);
+    break;
+  case KIND_FIXED:
+    pack_rows<KIND_FIXED>(p, x, n_rows, out);
+    break;
+  default:
+    pack_rows<KIND_INT>(p, x, n_rows, out);
+  }
+}
+
+template <typename T>
+void unpack_typed(const finn_packing_t &p, const uint8_t *in, uint64_t n_rows, void *out) {
+  T *o = static_cast<T *>(out);
+  switch (get_kind(p)) {
+  case KIND_FLOAT32:
+    unpack_rows<KIND_FLOAT32>(p, in, n_rows, o);
+    break;
+  case KIND_BIPOLAR:
+    unpack_rows<KIND_BIPOLAR>(p, in, n_rows, o);
+    break;
+  case KIND_FIXED:
+    unpack_rows<KIND_FIXED>(p, in, n_rows, o);
+    break;
+  default:
+    unpack_rows<KIND_INT>(p, in, n_rows, o);
+  }
+}
+
+bool is_valid_packing(const finn_packing_t *p) {
+  return p != nullptr && p->bitwidth >= 1 && p->bitwidth <= 64 &&
+         p->bytes_per_row * 8 >= p->elems_per_row * p->bitwidth;
+}
+
+} // namespace
+
+struct finn_accel {
+  std::vector<finn_packing_t> packing[2];
+  std::vector<uint64_t> rows_per_sample[2];
+  // buffers owned by the handle, and the buffers in use
+  std::vector<std::vector<uint8_t>> own_bufs[2];
+  std::vector<uint8_t *> bufs[2];
+  uint64_t batch_size;
+  finn_execute_fxn_t execute;
+  void *ctx;
+};
+
+extern "C" {
+
+int32_t finn_pack(const finn_packing_t *packing, const void *in, int32_t in_type, uint64_t n_rows,
+                  uint8_t *out) {
+  if (!is_valid_packing(packing)) {
+    return FINN_ERR_PACKING;
+  }
+  switch (in_type) {
+  case FINN_INT8:
+    pack_typed<int8_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_UINT8:
+    pack_typed<uint8_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_INT16:
+    pack_typed<int16_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_UINT16:
+    pack_typed<uint16_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_INT32:
+    pack_typed<int32_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_UINT32:
+    pack_typed<uint32_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_INT64:
+    pack_typed<int64_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_FLOAT32:
+    pack_typed<float>(*packing, in, n_rows, out);
+    break;
+  case FINN_FLOAT64:
+    pack_typed<double>(*packing, in, n_rows, out);
+    break;
+  default:
+    return FINN_ERR_TYPE;
+  }
+  return FINN_OK;
+}
+
+int32_t finn_pack_lut(const finn_packing_t *packing, const void *raw, int32_t raw_type,
+                      int64_t raw_min, uint64_t n_values, const uint64_t *lut,
+                      const uint64_t *lut_base, const uint64_t *src_index, uint64_t sample_size,
+                      uint64_t n_samples, uint8_t *out) {
+  if (!is_valid_packing(packing) || sample_size % packing->elems_per_row != 0) {
+    return FINN_ERR_PACKING;
+  }
+  bool in_range;
+  switch (raw_type) {
+  case FINN_INT8:
+    in_range = pack_lut_typed(*packing, static_cast<const int8_t *>(raw), raw_min, n_values, lut,
+                              lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_UINT8:
+    in_range = pack_lut_typed(*packing, static_cast<const uint8_t *>(raw), raw_min, n_values, lut,
+                              lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_INT16:
+    in_range = pack_lut_typed(*packing, static_cast<const int16_t *>(raw), raw_min, n_values, lut,
+                              lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_UINT16:
+    in_range = pack_lut_typed(*packing, static_cast<const uint16_t *>(raw), raw_min, n_values,
+                              lut, lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_INT32:
+    in_range = pack_lut_typed(*packing, static_cast<const int32_t *>(raw), raw_min, n_values, lut,
+                              lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_UINT32:
+    in_range = pack_lut_typed(*packing, static_cast<const uint32_t *>(raw), raw_min, n_values,
+                              lut, lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_INT64:
+    in_range = pack_lut_typed(*packing, static_cast<const int64_t *>(raw), raw_min, n_values, lut,
+                              lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_FLOAT32:
+    in_range = pack_lut_typed(*packing, static_cast<const float *>(raw), raw_min, n_values, lut,
+                              lut_base, src_index, sample_size, n_samples, out);
+    break;
+  case FINN_FLOAT64:
+    in_range = pack_lut_typed(*packing, static_cast<const double *>(raw), raw_min, n_values, lut,
+                              lut_base, src_index, sample_size, n_samples, out);
+    break;
+  default:
+    return FINN_ERR_TYPE;
+  }
+  return in_range ? FINN_OK : FINN_ERR_RANGE;
+}
+
+int32_t finn_unpack(const finn_packing_t *packing, const uint8_t *in, uint64_t n_rows, void *out,
+                    int32_t out_type) {
+  if (!is_valid_packing(packing)) {
+    return FINN_ERR_PACKING;
+  }
+  switch (out_type) {
+  case FINN_INT8:
+    unpack_typed<int8_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_UINT8:
+    unpack_typed<uint8_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_INT16:
+    unpack_typed<int16_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_UINT16:
+    unpack_typed<uint16_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_INT32:
+    unpack_typed<int32_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_UINT32:
+    unpack_typed<uint32_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_INT64:
+    unpack_typed<int64_t>(*packing, in, n_rows, out);
+    break;
+  case FINN_FLOAT32:
+    unpack_typed<float>(*packing, in, n_rows, out);
+    break;
+  case FINN_FLOAT64:
+    unpack_typed<double>(*packing, in, n_rows, out);
+    break;
+  default:
+    return FINN_ERR_TYPE;
+  }
+  return FINN_OK;
+}
+
+finn_accel_t *finn_accel_create(uint32_t n_inputs, const finn_packing_t *in_packing,
+                                const uint64_t *in_rows_per_sample, uint32_t n_outputs,
+                                const finn_packing_t *out_packing,
+                                const uint64_t *out_rows_per_sample, uint64_t batch_size,
+                                finn_execute_fxn_t execute, void *ctx) {
+  for (uint32_t i = 0; i < n_inputs; i++) {
+    if (!is_valid_packing(&in_packing[i])) {
+      return nullptr;
+    }
+  }
+  for (uint32_t o = 0; o < n_outputs; o++) {
+    if (!is_valid_packing(&out_packing[o])) {
+      return nullptr;
+    }
+  }
+  finn_accel_t *accel = new finn_accel_t;
+  accel->packing[0].assign(in_packing, in_packing + n_inputs);
+  accel->packing[1].assign(out_packing, out_packing + n_outputs);
+  accel->rows_per_sample[0].assign(in_rows_per_sample, in_rows_per_sample + n_inputs);
+  accel->rows_per_sample[1].assign(out_rows_per_sample, out_rows_per_sample + n_outputs);
+  for (int d = 0; d < 2; d++) {
+    for (size_t i = 0; i < accel->packing[d].size(); i++) {
+      uint64_t n_bytes =
+          batch_size * accel->rows_per_sample[d][i] * accel->packing[d][i].bytes_per_row;
+      accel->own_bufs[d].emplace_back(n_bytes);
+      accel->bufs[d].push_back(accel->own_bufs[d].back().data());
+    }
+  }
+  accel->batch_size = batch_size;
+  if (execute == nullptr) {
+    accel->execute = finn_sim_execute;
+    accel->ctx = accel;
+  } else {
+    accel->execute = execute;
+    accel->ctx = ctx;
+  }
+  return accel;
+}
+
+void finn_accel_destroy(finn_accel_t *accel) { delete accel; }
+
+uint8_t *finn_accel_buffer(finn_accel_t *accel, int32_t is_output, uint32_t ind) {
+  const int d = is_output ? 1 : 0;
+  if (ind >= accel->bufs[d].size()) {
+    return nullptr;
+  }
+  return accel->bufs[d][ind];
+}
+
+int32_t finn_accel_set_buffer(finn_accel_t *accel, int32_t is_output, uint32_t ind, uint8_t *buf) {
+  const int d = is_output ? 1 : 0;
+  if (ind >= accel->bufs[d].size()) {
+    return FINN_ERR_INDEX;
+  }
+  accel->bufs[d][ind] = buf == nullptr ? accel->own_bufs[d][ind].data() : buf;
+  return FINN_OK;
+}
+
+int32_t finn_accel_execute(finn_accel_t *accel, const void *const *inputs, const int32_t *in_types,
+                           void *const *outputs, const int32_t *out_types, uint64_t batch_size) {
+  if (batch_size > accel->batch_size) {
+    return FINN_ERR_BATCH_SIZE;
+  }
+  int32_t ret;
+  for (size_t i = 0; i < accel->packing[0].size(); i++) {
+    ret = finn_pack(&accel->packing[0][i], inputs[i], in_types[i],
+                    batch_size * accel->rows_per_sample[0][i], accel->bufs[0][i]);
+    if (ret != FINN_OK) {
+      return ret;
+    }
+  }
+  ret = accel->execute(accel->ctx, accel->bufs[0].data(), accel->bufs[1].data(), batch_size);
+  if (ret != FINN_OK) {
+    return ret;
+  }
+  for (size_t o = 0; o < accel->packing[1].size(); o++) {
+    ret = finn_unpack(&accel->packing[1][o], accel->bufs[1][o],
+                      batch_size * accel->rows_per_sample[1][o], outputs[o], out_types[o]);
+    if (ret != FINN_OK) {
+      return ret;
+    }
+  }
+  return FINN_OK;
+}
+
+int32_t finn_sim_execute(void *ctx, uint8_t *const *ibufs, uint8_t *const *obufs,
+                         uint64_t batch_size) {
+  finn_accel_t *accel = static_cast<finn_accel_t *>(ctx);
+  const size_t n_inputs = accel->packing[0].size();
+  for (size_t o = 0; o < accel->packing[1].size(); o++) {
+    const size_t i = n_inputs > 0 ? o % n_inputs : 0;
+    const uint64_t n_in =
+        n_inputs > 0
+            ? batch_size * accel->rows_per_sample[0][i] * accel->packing[0][i].bytes_per_row
+            : 0;
+    const uint64_t n_out =
+        batch_size * accel->rows_per_sample[1][o] * accel->packing[1][o].bytes_per_row;
+    const uint64_t n_copy = std::min(n_in, n_out);
+    if (n_copy > 0) {
+      std::memcpy(obufs[o], ibufs[i], n_copy);
+    }
+    std::memset(obufs[o] + n_copy, 0, n_out - n_copy);
+  }
+  return FINN_OK;
+}
+}
@@ -0,0 +1,142 @@
+/* Copyright (C) 2024, Advanced Micro Devices, Inc.
+All rights reserved.
+#
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+#
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+#
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+#
+* Neither the name of FINN nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+#
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. */
+
+/* C ABI of the native FINN host runtime, a C++ alternative to the data
+packing and buffer handling of the Python driver (driver_base.py).
+
+Packed buffers use the layout of the Python driver, i.e. finnpy_to_packed_bytearray
+with reverse_inner=True and reverse_endian=True: each row of the innermost
+folded dimension is packed into bytes_per_row bytes, element i occupying bits
+[i * bitwidth, (i + 1) * bitwidth) of the little-endian row. */
+
+#ifndef FINN_RUNTIME_H
+#define FINN_RUNTIME_H
+
+#include <stdint.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/* element types of unpacked host arrays */
+enum finn_elem_type {
+  FINN_INT8 = 0,
+  FINN_UINT8 = 1,
+  FINN_INT16 = 2,
+  FINN_UINT16 = 3,
+  FINN_INT32 = 4,
+  FINN_UINT32 = 5,
+  FINN_INT64 = 6,
+  FINN_FLOAT32 = 7,
+  FINN_FLOAT64 = 8
+};
+
+/* error codes returned by the runtime functions */
+enum finn_status {
+  FINN_OK = 0,
+  FINN_ERR_TYPE = -1,
+  FINN_ERR_PACKING = -2,
+  FINN_ERR_BATCH_SIZE = -3,
+  FINN_ERR_INDEX = -4,
+  FINN_ERR_RANGE = -5
+};
+
+/* packing parameters of one accelerator input or output, derived from the
+FINN DataType and the folded and packed shapes in io_shape_dict */
+typedef struct {
+  uint32_t bitwidth;      /* bits per element, at most 64 */
+  int32_t is_signed;      /* sign-extend two's complement values on unpacking */
+  int32_t is_bipolar;     /* BIPOLAR: -1 and +1 are packed as 0 and 1 */
+  int32_t is_float32;     /* FLOAT32: raw IEEE 754 bits */
+  double scale;           /* fixed point scale factor, 1 for integers */
+  uint64_t elems_per_row; /* innermost dimension of the folded shape */
+  uint64_t bytes_per_row; /* innermost dimension of the packed shape */
+} finn_packing_t;
+
+/* Pack n_rows rows of elems_per_row elements of type in_type into out. */
+int32_t finn_pack(const finn_packing_t *packing, const void *in, int32_t in_type, uint64_t n_rows,
+                  uint8_t *out);
+
+/* Host-side pre-processing fused into packing: pack n_samples samples of
+sample_size raw integer elements each (of type raw_type, in [raw_min, raw_min +
+n_values)) by table lookup. Element j of each sample is packed as the code
+lut[lut_base[j] + raw[src_index[j]] - raw_min], with codes given as bit patterns
+of the packed type. src_index (the raw element of each packed element, e.g.
+for a transpose) may be NULL for the identity. Returns FINN_ERR_RANGE if any
+raw value is out of range. */
+int32_t finn_pack_lut(const finn_packing_t *packing, const void *raw, int32_t raw_type,
+                      int64_t raw_min, uint64_t n_values, const uint64_t *lut,
+                      const uint64_t *lut_base, const uint64_t *src_index, uint64_t sample_size,
+                      uint64_t n_samples, uint8_t *out);
+
+/* Unpack n_rows packed rows into elems_per_row elements each of type out_type. */
+int32_t finn_unpack(const finn_packing_t *packing, const uint8_t *in, uint64_t n_rows, void *out,
+                    int32_t out_type);
+
+/* Device backend, starts the accelerator on the packed input buffers and
+blocks until the packed output buffers are written. Returns FINN_OK on
+success. */
+typedef int32_t (*finn_execute_fxn_t)(void *ctx, uint8_t *const *ibufs, uint8_t *const *obufs,
+                                      uint64_t batch_size);
+
+typedef struct finn_accel finn_accel_t;
+
+/* Create an accelerator handle with packed buffers for up to batch_size
+samples. rows_per_sample are the number of packed rows (the product of the
+folded shape without the batch and innermost dimensions) of each input and
+output. If execute is NULL, the simulated device backend finn_sim_execute is
+used, with the accelerator handle as its context. */
+finn_accel_t *finn_accel_create(uint32_t n_inputs, const finn_packing_t *in_packing,
+                                const uint64_t *in_rows_per_sample, uint32_t n_outputs,
+                                const finn_packing_t *out_packing,
+                                const uint64_t *out_rows_per_sample, uint64_t batch_size,
+                                finn_execute_fxn_t execute, void *ctx);
+
+void finn_accel_destroy(finn_accel_t *accel);
+
+/* Packed buffers of the given input/output, owned by the handle unless
+replaced with finn_accel_set_buffer, e.g. by device buffers. */
+uint8_t *finn_accel_buffer(finn_accel_t *accel, int32_t is_output, uint32_t ind);
+int32_t finn_accel_set_buffer(finn_accel_t *accel, int32_t is_output, uint32_t ind, uint8_t *buf);
+
+/* Pack the inputs into the input buffers, execute batch_size samples on the
+device backend and unpack the outputs. */
+int32_t finn_accel_execute(finn_accel_t *accel, const void *const *inputs, const int32_t *in_types,
+                           void *const *outputs, const int32_t *out_types, uint64_t batch_size);
+
+/* Simulated device backend for testing on the host: copies the packed bytes
+of input (o % n_inputs) to each output o, truncated or zero-padded to the
+output size. ctx is the accelerator handle. */
+int32_t finn_sim_execute(void *ctx, uint8_t *const *ibufs, uint8_t *const *obufs,
+                         uint64_t batch_size);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
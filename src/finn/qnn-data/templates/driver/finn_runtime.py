@@ -0,0 +1,427 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import ctypes
+import numpy as np
+import os
+import subprocess
+import threading
+from qonnx.core.datatype import DataType
+
+# Python bindings for the native FINN host runtime (finn_runtime.h/.cpp), which
+# implements the data packing and buffer handling of driver_base.py in C++.
+# The library is compiled with g++ on first use, see get_library.
+
+_runtime_dir = os.path.dirname(os.path.abspath(__file__))
+_library = None
+_library_lock = threading.Lock()
+
+# numpy dtypes of unpacked arrays and their finn_elem_type codes
+elem_types = {
+    np.dtype(np.int8): 0,
+    np.dtype(np.uint8): 1,
+    np.dtype(np.int16): 2,
+    np.dtype(np.uint16): 3,
+    np.dtype(np.int32): 4,
+    np.dtype(np.uint32): 5,
+    np.dtype(np.int64): 6,
+    np.dtype(np.float32): 7,
+    np.dtype(np.float64): 8,
+}
+
+
+class Packing(ctypes.Structure):
+    "finn_packing_t, packing parameters of one accelerator input or output."
+    _fields_ = [
+        ("bitwidth", ctypes.c_uint32),
+        ("is_signed", ctypes.c_int32),
+        ("is_bipolar", ctypes.c_int32),
+        ("is_float32", ctypes.c_int32),
+        ("scale", ctypes.c_double),
+        ("elems_per_row", ctypes.c_uint64),
+        ("bytes_per_row", ctypes.c_uint64),
+    ]
+
+
+# finn_execute_fxn_t, device backend called by finn_accel_execute
+execute_fxn_t = ctypes.CFUNCTYPE(
+    ctypes.c_int32, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint64
+)
+
+
+def get_library(build_dir=None):
+    """Compile the native runtime (unless an up-to-date build exists) in
+    build_dir (default: the directory of this file) and return it as a ctypes
+    library. The library is only loaded once per process."""
+    global _library
+    with _library_lock:
+        if _library is not None:
+            return _library
+        if build_dir is None:
+            build_dir = _runtime_dir
+        src_fname = _runtime_dir + "/finn_runtime.cpp"
+        so_fname = build_dir + "/libfinn_runtime.so"
+        # rebuild if the library is older than any of the runtime sources
+        src_mtime = max(
+            os.path.getmtime(_runtime_dir + "/" + x) for x in ["finn_runtime.cpp", "finn_runtime.h"]
+        )
+        if not os.path.isfile(so_fname) or os.path.getmtime(so_fname) < src_mtime:
+            compile_args = ["g++", "-O3", "-std=c++11", "-shared", "-fPIC"]
+            compile_args += ["-I" + _runtime_dir, src_fname, "-o", so_fname]
+            subprocess.run(compile_args, check=True)
+        lib = ctypes.CDLL(so_fname)
+        ptr = ctypes.c_void_p
+        packing_ptr = ctypes.POINTER(Packing)
+        lib.finn_pack.restype = ctypes.c_int32
+        lib.finn_pack.argtypes = [packing_ptr, ptr, ctypes.c_int32, ctypes.c_uint64, ptr]
+        lib.finn_pack_lut.restype = ctypes.c_int32
+        lib.finn_pack_lut.argtypes = [packing_ptr, ptr, ctypes.c_int32, ctypes.c_int64]
+        lib.finn_pack_lut.argtypes += [ctypes.c_uint64, ptr, ptr, ptr, ctypes.c_uint64]
+        lib.finn_pack_lut.argtypes += [ctypes.c_uint64, ptr]
+        lib.finn_unpack.restype = ctypes.c_int32
+        lib.finn_unpack.argtypes = [packing_ptr, ptr, ctypes.c_uint64, ptr, ctypes.c_int32]
+        lib.finn_accel_create.restype = ptr
+        lib.finn_accel_create.argtypes = [
+            ctypes.c_uint32,
+            packing_ptr,
+            ptr,
+            ctypes.c_uint32,
+            packing_ptr,
+            ptr,
+            ctypes.c_uint64,
+            execute_fxn_t,
+            ptr,
+        ]
+        lib.finn_accel_destroy.restype = None
+        lib.finn_accel_destroy.argtypes = [ptr]
+        lib.finn_accel_buffer.restype = ctypes.POINTER(ctypes.c_uint8)
+        lib.finn_accel_buffer.argtypes = [ptr, ctypes.c_int32, ctypes.c_uint32]
+        lib.finn_accel_set_buffer.restype = ctypes.c_int32
+        lib.finn_accel_set_buffer.argtypes = [ptr, ctypes.c_int32, ctypes.c_uint32, ptr]
+        lib.finn_accel_execute.restype = ctypes.c_int32
+        lib.finn_accel_execute.argtypes = [ptr, ptr, ptr, ptr, ptr, ctypes.c_uint64]
+        _library = lib
+        return lib
+
+
+def is_native_packing_supported(dtype):
+    """Returns True if values of the given FINN DataType can be packed by the
+    native runtime: integer and fixed point types of up to 64 bits and FLOAT32."""
+    if dtype == DataType["FLOAT32"]:
+        return True
+    return (dtype.is_integer() or dtype.is_fixed_point()) and dtype.bitwidth() <= 64
+
+
+def make_packing(dtype, folded_shape, packed_shape):
+    """Returns the Packing for tensors of FINN DataType dtype with the given
+    folded and packed shapes (as in io_shape_dict)."""
+    assert is_native_packing_supported(dtype), "%s is not supported natively" % dtype.name
+    return Packing(
+        bitwidth=dtype.bitwidth(),
+        is_signed=int(dtype.signed() and dtype != DataType["BIPOLAR"]),
+        is_bipolar=int(dtype == DataType["BIPOLAR"]),
+        is_float32=int(dtype == DataType["FLOAT32"]),
+        scale=dtype.scale_factor() if dtype.is_fixed_point() else 1.0,
+        elems_per_row=folded_shape[-1],
+        bytes_per_row=packed_shape[-1],
+    )
+
+
+def _check(ret):
+    if ret != 0:
+        raise Exception("Native FINN runtime returned error %d" % ret)
+
+
+def pack(ndarray, dtype, packed_shape, out=None):
+    """Pack the given folded ndarray (of any numeric dtype) of FINN DataType
+    dtype into a uint8 ndarray of packed_shape (the first dimension is taken
+    from ndarray), with the same layout as finnpy_to_packed_bytearray with
+    reverse_endian and reverse_inner. If out is given (a C-contiguous uint8
+    array such as a PYNQ buffer), the result is written into it instead."""
+    lib = get_library()
+    ndarray = np.ascontiguousarray(ndarray)
+    if ndarray.dtype not in elem_types:
+        ndarray = ndarray.astype(np.float32)
+    packed_shape = (ndarray.shape[0],) + tuple(packed_shape[1:])
+    if out is None:
+        out = np.empty(packed_shape, dtype=np.uint8)
+    assert out.dtype == np.uint8 and out.flags.c_contiguous, "out must be contiguous uint8"
+    assert out.size == np.prod(packed_shape), "out has wrong size"
+    packing = make_packing(dtype, ndarray.shape, packed_shape)
+    n_rows = ndarray.size // ndarray.shape[-1] if ndarray.size > 0 else 0
+    _check(
+        lib.finn_pack(
+            ctypes.byref(packing),
+            ndarray.ctypes.data,
+            elem_types[ndarray.dtype],
+            n_rows,
+            out.ctypes.data,
+        )
+    )
+    return out
+
+
+def lut_codes(values, dtype):
+    """Returns the bit patterns (as uint64 ndarray) of the given values of FINN
+    DataType dtype in packed buffers, as used by pack_lut."""
+    values = np.asarray(values).reshape(-1, 1)
+    return pack(values, dtype, (values.shape[0], 8)).view("<u8").reshape(-1)
+
+
+def pack_lut(
+    raw,
+    raw_min,
+    n_values,
+    codes,
+    lut_base,
+    dtype,
+    folded_shape,
+    packed_shape,
+    src_index=None,
+    out=None,
+):
+    """Pack the raw inputs (a C-contiguous ndarray with the batch size as first
+    dimension) with host-side pre-processing by table lookup, in a single pass:
+    element j of each sample is packed as codes[lut_base[j] + raw[src_index[j]]
+    - raw_min], where codes are the bit patterns from lut_codes and the table of
+    each element holds the values for raw inputs in [raw_min, raw_min +
+    n_values). lut_base and src_index are uint64 ndarrays with one entry per
+    element of a sample in folded shape, src_index=None is the identity.
+    Returns the packed uint8 ndarray, or out if given."""
+    lib = get_library()
+    raw = np.ascontiguousarray(raw)
+    if raw.dtype not in elem_types:
+        raw = raw.astype(np.float32)
+    n_samples = raw.shape[0]
+    sample_size = int(np.prod(folded_shape[1:]))
+    assert raw.size == n_samples * sample_size, "raw input has wrong size"
+    assert codes.dtype == np.uint64 and codes.flags.c_contiguous, "codes must be uint64"
+    assert lut_base.dtype == np.uint64 and lut_base.flags.c_contiguous
+    assert lut_base.size == sample_size
+    assert int(lut_base.max()) + n_values <= codes.size, "lut_base exceeds the table"
+    assert src_index is None or (src_index.dtype == np.uint64 and src_index.size == sample_size)
+    packed_shape = (n_samples,) + tuple(packed_shape[1:])
+    if out is None:
+        out = np.empty(packed_shape, dtype=np.uint8)
+    assert out.dtype == np.uint8 and out.flags.c_contiguous, "out must be contiguous uint8"
+    assert out.size == np.prod(packed_shape), "out has wrong size"
+    packing = make_packing(dtype, folded_shape, packed_shape)
+    ret = lib.finn_pack_lut(
+        ctypes.byref(packing),
+        raw.ctypes.data,
+        elem_types[raw.dtype],
+        raw_min,
+        n_values,
+        codes.ctypes.data,
+        lut_base.ctypes.data,
+        None if src_index is None else src_index.ctypes.data,
+        sample_size,
+        n_samples,
+        out.ctypes.data,
+    )
+    if ret == -5:
+        raise ValueError("Raw input out of range [%d, %d)" % (raw_min, raw_min + n_values))
+    _check(ret)
+    return out
+
+
+def unpack(packed, dtype, folded_shape, out=None):
+    """Unpack the given packed uint8 ndarray (as produced by pack) into a
+    float32 ndarray of folded_shape, or into out (a C-contiguous array of any
+    numeric dtype with the size of folded_shape) if given."""
+    lib = get_library()
+    packed = np.ascontiguousarray(packed)
+    if out is None:
+        out = np.empty(folded_shape, dtype=np.float32)
+    assert out.flags.c_contiguous and out.dtype in elem_types, "Unsupported out array"
+    assert out.size == np.prod(folded_shape), "out has wrong size"
+    packing = make_packing(dtype, folded_shape, packed.shape)
+    n_rows = out.size // folded_shape[-1] if out.size > 0 else 0
+    assert packed.size >= n_rows * packed.shape[-1], "Packed array is too small"
+    _check(
+        lib.finn_unpack(
+            ctypes.byref(packing),
+            packed.ctypes.data,
+            n_rows,
+            out.ctypes.data,
+            elem_types[out.dtype],
+        )
+    )
+    return out
+
+
+class NativeAccelerator:
+    """Accelerator handle of the native runtime, with packed buffers for up to
+    batch_size samples, for the accelerator described by io_shape_dict.
+
+    execute is the device backend, a Python callable taking the batch size that
+    runs the accelerator on the packed buffers (see input_buffer,
+    output_buffer and set_buffer) and returns once the outputs are written.
+    If None, the simulated device backend is used, which copies the packed
+    bytes of each input to the corresponding output (finn_sim_execute)."""
+
+    def __init__(self, io_shape_dict, batch_size=1, execute=None):
+        self.lib = get_library()
+        self._io_shape_dict = io_shape_dict
+        self.batch_size = batch_size
+        self.num_inputs = io_shape_dict["num_inputs"]
+        self.num_outputs = io_shape_dict["num_outputs"]
+        in_packing = [
+            make_packing(
+                io_shape_dict["idt"][i],
+                self.shape("ishape_folded", i),
+                self.shape("ishape_packed", i),
+            )
+            for i in range(self.num_inputs)
+        ]
+        out_packing = [
+            make_packing(
+                io_shape_dict["odt"][o],
+                self.shape("oshape_folded", o),
+                self.shape("oshape_packed", o),
+            )
+            for o in range(self.num_outputs)
+        ]
+        in_rows = [
+            int(np.prod(self.shape("ishape_folded", i)[1:-1])) for i in range(self.num_inputs)
+        ]
+        out_rows = [
+            int(np.prod(self.shape("oshape_folded", o)[1:-1])) for o in range(self.num_outputs)
+        ]
+        self._in_packing = (Packing * max(1, self.num_inputs))(*in_packing)
+        self._out_packing = (Packing * max(1, self.num_outputs))(*out_packing)
+        self._in_rows = np.asarray(in_rows + [0], dtype=np.uint64)
+        self._out_rows = np.asarray(out_rows + [0], dtype=np.uint64)
+        if execute is None:
+            # NULL selects the simulated device backend
+            self._execute = ctypes.cast(None, execute_fxn_t)
+        else:
+
+            def execute_wrapper(ctx, ibufs, obufs, batch_size):
+                try:
+                    execute(batch_size)
+                except Exception as e:
+                    # re-raised by execute once the native call returns
+                    self._backend_error = e
+                    return -100
+                return 0
+
+            # keep a reference for as long as the native handle may call it
+            self._execute = execute_fxn_t(execute_wrapper)
+        self.handle = self.lib.finn_accel_create(
+            self.num_inputs,
+            self._in_packing,
+            self._in_rows.ctypes.data,
+            self.num_outputs,
+            self._out_packing,
+            self._out_rows.ctypes.data,
+            batch_size,
+            self._execute,
+            None,
+        )
+        assert self.handle is not None, "Failed to create native accelerator handle"
+        self._buffers = {}
+        self._backend_error = None
+
+    def __del__(self):
+        if getattr(self, "handle", None) is not None:
+            self.lib.finn_accel_destroy(self.handle)
+            self.handle = None
+
+    def shape(self, name, ind=0):
+        "Returns the shape io_shape_dict[name][ind] for batch_size samples."
+        return (self.batch_size,) + tuple(self._io_shape_dict[name][ind][1:])
+
+    def buffer(self, is_output, ind):
+        """Returns the packed buffer of the given input/output as uint8 ndarray
+        (without copying)."""
+        if (is_output, ind) in self._buffers:
+            return self._buffers[(is_output, ind)]
+        shape = self.shape("oshape_packed" if is_output else "ishape_packed", ind)
+        buf_ptr = self.lib.finn_accel_buffer(self.handle, int(is_output), ind)
+        return np.ctypeslib.as_array(buf_ptr, shape=shape)
+
+    def input_buffer(self, ind=0):
+        return self.buffer(False, ind)
+
+    def output_buffer(self, ind=0):
+        return self.buffer(True, ind)
+
+    def set_buffer(self, is_output, ind, buf):
+        """Use the given C-contiguous uint8 array (e.g. a PYNQ device buffer)
+        as packed buffer for the given input/output, or the buffer owned by the
+        handle if buf is None."""
+        if buf is None:
+            self._buffers.pop((is_output, ind), None)
+            _check(self.lib.finn_accel_set_buffer(self.handle, int(is_output), ind, None))
+            return
+        shape = self.shape("oshape_packed" if is_output else "ishape_packed", ind)
+        assert buf.dtype == np.uint8 and buf.flags.c_contiguous, "buf must be contiguous uint8"
+        assert buf.size >= np.prod(shape), "buf is too small"
+        _check(self.lib.finn_accel_set_buffer(self.handle, int(is_output), ind, buf.ctypes.data))
+        self._buffers[(is_output, ind)] = buf
+
+    def execute(self, inputs, outputs=None, batch_size=None):
+        """Packs the given inputs (a list of ndarrays in normal or folded shape)
+        into the packed input buffers, runs the device backend and unpacks the
+        outputs into the given list of output arrays (float32 in normal shape
+        if None), all within a single native call. Returns the outputs."""
+        if batch_size is None:
+            batch_size = self.batch_size
+        inputs = [np.ascontiguousarray(x) for x in inputs]
+        inputs = [x if x.dtype in elem_types else x.astype(np.float32) for x in inputs]
+        if outputs is None:
+            outputs = [
+                np.empty(
+                    (batch_size,) + tuple(self._io_shape_dict["oshape_normal"][o][1:]),
+                    dtype=np.float32,
+                )
+                for o in range(self.num_outputs)
+            ]
+        for i, x in enumerate(inputs):
+            assert x.size == batch_size * np.prod(self.shape("ishape_folded", i)[1:])
+        for o, x in enumerate(outputs):
+            assert x.flags.c_contiguous and x.dtype in elem_types, "Unsupported output array"
+            assert x.size == batch_size * np.prod(self.shape("oshape_folded", o)[1:])
+        in_ptrs = (ctypes.c_void_p * max(1, self.num_inputs))(*[x.ctypes.data for x in inputs])
+        out_ptrs = (ctypes.c_void_p * max(1, self.num_outputs))(*[x.ctypes.data for x in outputs])
+        in_types = np.asarray([elem_types[x.dtype] for x in inputs] + [0], dtype=np.int32)
+        out_types = np.asarray([elem_types[x.dtype] for x in outputs] + [0], dtype=np.int32)
+        self._backend_error = None
+        ret = self.lib.finn_accel_execute(
+            self.handle,
+            in_ptrs,
+            in_types.ctypes.data,
+            out_ptrs,
+            out_types.ctypes.data,
+            batch_size,
+        )
+        if self._backend_error is not None:
+            raise self._backend_error
+        _check(ret)
+        return outputs
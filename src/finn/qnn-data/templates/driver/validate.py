@@ -27,10 +27,101 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
+import collections
+import importlib
 import numpy as np
-from driver import io_shape_dict
+import time
 from driver_base import FINNExampleOverlay
 
+
+def load_dataset(dataset, dataset_root, images=None, labels=None):
+    """Returns the (images, labels) of the test set of the given dataset as
+    array-likes that can be sliced along the first dimension. dataset is one of:
+    * mnist or cifar10 (downloaded to dataset_root if needed)
+    * npy: images and labels given as .npy files, which are memory-mapped so
+      that only the batches being processed are read from disk
+    * module:function : a custom loader function, imported from the given
+      module and called with dataset_root, returning (images, labels)
+    """
+    if dataset == "mnist":
+        from dataset_loading import mnist
+
+        trainx, trainy, testx, testy, valx, valy = mnist.load_mnist_data(
+            dataset_root, download=True, one_hot=False
+        )
+        return (testx, testy)
+    elif dataset == "cifar10":
+        from dataset_loading import cifar
+
+        trainx, trainy, testx, testy, valx, valy = cifar.load_cifar_data(
+            dataset_root, download=True, one_hot=False
+        )
+        return (testx, testy)
+    elif dataset == "npy":
+        assert images is not None and labels is not None, "Specify images and labels .npy"
+        return (np.load(images, mmap_mode="r"), np.load(labels, mmap_mode="r"))
+    elif ":" in dataset:
+        module_name, fxn_name = dataset.split(":")
+        loader = getattr(importlib.import_module(module_name), fxn_name)
+        return loader(dataset_root)
+    else:
+        raise Exception("Unrecognized dataset")
+
+
+def iter_batches(driver, images, labels, label_queue):
+    """Lazily reads batches of images and prepares them as accelerator inputs
+    in the input shape of execute(), appending the labels of each batch to label_queue. The
+    last batch is padded with zeros if needed, its labels are not padded.
+    This is consumed by the input stage of FINNExampleOverlay.execute_stream,
+    so reading and preprocessing overlap with accelerator execution."""
+    bsize = driver.batch_size
+    for start in range(0, len(labels), bsize):
+        batch_labels = np.asarray(labels[start : start + bsize]).flatten()
+        batch_imgs = np.asarray(images[start : start + bsize])
+        batch_imgs = batch_imgs.reshape((len(batch_labels),) + driver.ishape_raw()[1:])
+        if len(batch_labels) < bsize:
+            padded_imgs = np.zeros(driver.ishape_raw(), dtype=batch_imgs.dtype)
+            padded_imgs[: len(batch_labels)] = batch_imgs
+            batch_imgs = padded_imgs
+        label_queue.append(batch_labels)
+        yield batch_imgs
+
+
+def validate(driver, images, labels, num_buffers=2, verbose=True):
+    """Runs the accelerator on all images and compares the top-1 predictions
+    against the labels, using pipelined execution with num_buffers sets of
+    buffers in flight. The accelerator output is either the predicted label
+    or one score per class. Returns a dictionary with the number of correct
+    and incorrect predictions, the accuracy in % and the achieved images/s."""
+    label_queue = collections.deque()
+    ok = 0
+    nok = 0
+    n_batches = -(-len(labels) // driver.batch_size)
+    start = time.time()
+    outputs = driver.execute_stream(
+        iter_batches(driver, images, labels, label_queue), num_buffers=num_buffers
+    )
+    for i, obuf_normal in enumerate(outputs):
+        exp = label_queue.popleft()
+        pred = obuf_normal.reshape(driver.batch_size, -1)[: len(exp)]
+        if pred.shape[1] == 1:
+            pred = pred[:, 0]
+        else:
+            pred = np.argmax(pred, axis=1)
+        n_ok = int(np.sum(pred == exp))
+        ok += n_ok
+        nok += len(exp) - n_ok
+        if verbose:
+            print("batch %d / %d : total OK %d NOK %d" % (i + 1, n_batches, ok, nok))
+    runtime = time.time() - start
+    return {
+        "ok": ok,
+        "nok": nok,
+        "accuracy[%]": 100.0 * ok / (ok + nok),
+        "throughput[images/s]": (ok + nok) / runtime,
+    }
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Validate top-1 accuracy for FINN-generated accelerator"
@@ -38,7 +129,11 @@ if __name__ == "__main__":
     parser.add_argument(
         "--batchsize", help="number of samples for inference", type=int, default=100
     )
-    parser.add_argument("--dataset", help="dataset to use (mnist of cifar10)", required=True)
+    parser.add_argument(
+        "--dataset",
+        help="dataset to use (mnist, cifar10, npy or module:function of a custom loader)",
+        required=True,
+    )
     parser.add_argument(
         "--platform", help="Target platform: zynq-iodma alveo", default="zynq-iodma"
     )
@@ -48,60 +143,26 @@ if __name__ == "__main__":
     parser.add_argument(
         "--dataset_root", help="dataset root dir for download/reuse", default="/tmp"
     )
+    parser.add_argument("--images", help="images .npy file for the npy dataset", default=None)
+    parser.add_argument("--labels", help="labels .npy file for the npy dataset", default=None)
+    parser.add_argument(
+        "--num_buffers", help="number of sets of buffers in flight", type=int, default=2
+    )
     # parse arguments
     args = parser.parse_args()
-    bsize = args.batchsize
-    dataset = args.dataset
-    bitfile = args.bitfile
-    platform = args.platform
-    dataset_root = args.dataset_root
-
-    if dataset == "mnist":
-        from dataset_loading import mnist
-
-        trainx, trainy, testx, testy, valx, valy = mnist.load_mnist_data(
-            dataset_root, download=True, one_hot=False
-        )
-    elif dataset == "cifar10":
-        from dataset_loading import cifar
-
-        trainx, trainy, testx, testy, valx, valy = cifar.load_cifar_data(
-            dataset_root, download=True, one_hot=False
-        )
-    else:
-        raise Exception("Unrecognized dataset")
 
-    test_imgs = testx
-    test_labels = testy
+    from driver import io_shape_dict
 
-    ok = 0
-    nok = 0
-    total = test_imgs.shape[0]
+    images, labels = load_dataset(args.dataset, args.dataset_root, args.images, args.labels)
 
     driver = FINNExampleOverlay(
-        bitfile_name=bitfile,
-        platform=platform,
+        bitfile_name=args.bitfile,
+        platform=args.platform,
         io_shape_dict=io_shape_dict,
-        batch_size=bsize,
+        batch_size=args.batchsize,
         runtime_weight_dir="runtime_weights/",
     )
 
-    n_batches = int(total / bsize)
-
-    test_imgs = test_imgs.reshape(n_batches, bsize, -1)
-    test_labels = test_labels.reshape(n_batches, bsize)
-
-    for i in range(n_batches):
-        ibuf_normal = test_imgs[i].reshape(driver.ibuf_packed_device[0].shape)
-        exp = test_labels[i]
-        driver.copy_input_data_to_device(ibuf_normal)
-        driver.execute_on_buffers()
-        obuf_normal = np.empty_like(driver.obuf_packed_device[0])
-        driver.copy_output_data_from_device(obuf_normal)
-        ret = np.bincount(obuf_normal.flatten() == exp.flatten())
-        nok += ret[0]
-        ok += ret[1]
-        print("batch %d / %d : total OK %d NOK %d" % (i + 1, n_batches, ok, nok))
-
-    acc = 100.0 * ok / (total)
-    print("Final accuracy: %f" % acc)
+    res = validate(driver, images, labels, num_buffers=args.num_buffers)
+    print("Final accuracy: %f" % res["accuracy[%]"])
+    print("Throughput: %f images/s" % res["throughput[images/s]"])
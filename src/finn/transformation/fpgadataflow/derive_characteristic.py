@@ -28,12 +28,25 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import json
+import numpy as np
 import qonnx.custom_op.registry as registry
+import time
 import warnings
 from qonnx.core.modelwrapper import ModelWrapper
-from qonnx.transformation.base import NodeLocalTransformation
+from qonnx.transformation.base import NodeLocalTransformation, Transformation
 
 from finn.util.fpgadataflow import is_hls_node, is_rtl_node
+from finn.util.pyverilator import get_rtlsim_characterize_lib
+
+# node attributes set by HWCustomOp.derive_characteristic_fxns
+_chrc_attrs = [
+    "io_chrc_period",
+    "io_chrc_in",
+    "io_chrc_out",
+    "io_chrc_pads_in",
+    "io_chrc_pads_out",
+]
 
 
 class DeriveCharacteristic(NodeLocalTransformation):
@@ -43,7 +56,10 @@ class DeriveCharacteristic(NodeLocalTransformation):
     called on the graph.
 
     This transformation performs rtlsim for each node, so it will run for
-    some time (minutes to hours depending on configuration).
+    some time (minutes to hours depending on configuration). The transactions
+    are counted by a compiled C++ driver (see rtlsim_characterize), and nodes
+    that share the same emulation library (see PrepareRTLSim) are only
+    simulated once.
 
     * period (int) desired period over which the characteristic function
       will be derived.
@@ -56,9 +72,15 @@ class DeriveCharacteristic(NodeLocalTransformation):
         super().__init__(num_workers=num_workers)
         self.period = period
         self.manual_bypass = manual_bypass
+        # maps node names to the name of the identical node they take the
+        # characteristic from
+        self.shared_chrc = dict()
 
     def applyNodeLocal(self, node):
         op_type = node.op_type
+        if node.name in self.shared_chrc:
+            # characteristic will be copied from an identical node
+            return (node, False)
         if is_hls_node(node) or is_rtl_node(node):
             try:
                 # lookup op_type in registry of CustomOps
@@ -70,7 +92,29 @@ class DeriveCharacteristic(NodeLocalTransformation):
         return (node, False)
 
     def apply(self, model: ModelWrapper):
+        # group nodes that share an emulation library, the first node in each
+        # group gets simulated
+        groups = dict()
+        for node in model.graph.node:
+            if is_hls_node(node) or is_rtl_node(node):
+                inst = registry.getCustomOp(node)
+                if inst.get_nodeattr("io_chrc_period") > 0:
+                    continue
+                key = (node.op_type, inst.get_nodeattr("rtlsim_so"))
+                groups.setdefault(key, []).append(node.name)
+        self.shared_chrc = dict()
+        for node_names in groups.values():
+            for node_name in node_names[1:]:
+                self.shared_chrc[node_name] = node_names[0]
+        # compile the C++ driver before any worker processes are forked
+        if len(groups) > 0:
+            get_rtlsim_characterize_lib()
         (model, run_again) = super().apply(model)
+        for node_name, shared_node_name in self.shared_chrc.items():
+            inst = registry.getCustomOp(model.get_node_from_name(node_name))
+            shared_inst = registry.getCustomOp(model.get_node_from_name(shared_node_name))
+            for attr in _chrc_attrs:
+                inst.set_nodeattr(attr, shared_inst.get_nodeattr(attr))
         if not self.manual_bypass:
             return (model, run_again)
         # apply manual fix for DuplicateStreams and AddStreams for
@@ -115,72 +159,115 @@ class DeriveCharacteristic(NodeLocalTransformation):
         return (model, run_again)
 
 
-class DeriveFIFOSizes(NodeLocalTransformation):
+def solve_fifo_depth(prod_chrc, cons_chrc, period):
+    """Find the minimum FIFO depth between a producer and a consumer, given
+    the producer's accumulated output characteristic prod_chrc and the
+    consumer's accumulated input characteristic cons_chrc (both at least
+    2 * period long, see HWCustomOp.derive_characteristic_fxns).
+
+    The consumer is delayed by the smallest phase shift s for which it never
+    reads more than the producer has written, i.e.
+    prod_chrc[s + t] >= cons_chrc[t] for all t < period - s. The FIFO depth
+    is the largest difference between the shifted characteristics.
+
+    Since the accumulated characteristics are non-decreasing, the earliest
+    index at which the producer catches up with each consumer read can be
+    found with a binary search, and the phase shift constraint reduces to a
+    running maximum. This takes O(period log period) instead of the
+    O(period^2) candidate-by-candidate search.
+
+    Returns (fifo_depth, phase_shift)."""
+    prod_chrc = np.asarray(prod_chrc, dtype=np.int64)
+    cons_chrc = np.asarray(cons_chrc, dtype=np.int64)
+    # earliest producer index that has written at least as much as the
+    # consumer reads at time t (period if never within the first period)
+    t = np.arange(period)
+    catch_up = np.searchsorted(prod_chrc[:period], cons_chrc[:period], side="left")
+    # phase shift s is feasible if s >= catch_up[t] - t for all t < period - s
+    min_shift = np.maximum.accumulate(catch_up - t)
+    shifts = np.arange(period)
+    feasible = np.nonzero(shifts >= min_shift[period - 1 - shifts])[0]
+    pshift = int(feasible[0]) if len(feasible) > 0 else period - 1
+    depth = int((prod_chrc[pshift : pshift + period] - cons_chrc[:period]).max())
+    return (depth, pshift)
+
+
+class DeriveFIFOSizes(Transformation):
     """Prerequisite: DeriveCharacteristic already called on graph.
-    For each node in the graph, use the accumulated I/O characteristic function
-    to perform FIFO sizing, setting the in/outFIFODepths attributes of HLSCustomOp
-    nodes.
+    For each edge between two nodes in the graph, use the accumulated I/O
+    characteristic functions to perform FIFO sizing (see solve_fifo_depth),
+    setting the in/outFIFODepths attributes of HLSCustomOp nodes.
 
-    * num_workers (int or None) number of parallel workers, see documentation in
-      NodeLocalTransformation for more details.
+    * num_workers is accepted for compatibility and ignored, sizing all edges
+      takes a fraction of the time needed for DeriveCharacteristic.
+
+    * io_fifo_depth (int) minimum depth for FIFOs at top-level inputs and outputs.
+
+    * report_file (str or None) if given, write the per-edge results (tensor,
+      producer, consumer, depth, phase shift and solve time) to this JSON file.
+      The results are also available as the fifo_sizing_report member after
+      the transformation was applied.
     """
 
-    def __init__(self, num_workers=None, io_fifo_depth=32):
-        super().__init__(num_workers=num_workers)
+    def __init__(self, num_workers=None, io_fifo_depth=32, report_file=None):
+        super().__init__()
         self.io_fifo_depth = io_fifo_depth
+        self.report_file = report_file
+        self.fifo_sizing_report = []
 
-    def applyNodeLocal(self, node):
-        op_type = node.op_type
-        if is_hls_node(node) or is_rtl_node(node):
-            try:
-                # lookup op_type in registry of CustomOps
-                prod = registry.getCustomOp(node)
-                assert not (op_type.startswith("StreamingFIFO")), "Found existing FIFOs"
-                period = prod.get_nodeattr("io_chrc_period")
-                prod_chrc = prod.get_nodeattr("io_chrc_out")[0]
-                assert len(prod_chrc) == 2 * period, "Found unexpected characterization attribute"
-                if any([x > 2 for x in prod.get_nodeattr("outFIFODepths")]):
-                    # FIFO depth already set, can skip this node
-                    return (node, False)
-
-                # find consumers
-                model = self.ref_input_model
-                out_fifo_depths = []
-                for output_name in node.output:
-                    cons_node = model.find_consumer(output_name)
-                    if cons_node is None:
-                        # could be final node, will be overridden if so
-                        # need an entry in the list anyway
-                        out_fifo_depths.append(self.io_fifo_depth)
-                        continue
-                    cons = registry.getCustomOp(cons_node)
-                    cons_chrc = cons.get_nodeattr("io_chrc_in")[0]
-                    # find minimum phase shift satisfying the constraint
-                    pshift_min = period - 1
-                    for pshift_cand in range(period):
-                        prod_chrc_part = prod_chrc[pshift_cand:period]
-                        cons_chrc_part = cons_chrc[: period - pshift_cand]
-                        if (prod_chrc_part >= cons_chrc_part).all():
-                            pshift_min = pshift_cand
-                            break
-                    prod_chrc_part = prod_chrc[pshift_min : (pshift_min + period)]
-                    cons_chrc_part = cons_chrc[:period]
-                    fifo_depth = int((prod_chrc_part - cons_chrc_part).max())
-                    out_fifo_depths.append(fifo_depth)
-                # set output FIFO depth for this (producing) node
-                # InsertFIFO looks at the max of (outFIFODepths, inFIFODepths)
-                # for each tensor
-                prod.set_nodeattr("outFIFODepths", out_fifo_depths)
-
-                # finally, check node inputs to ensure FIFOs are added to
-                # any top-level inputs (at least self.io_fifo_depth deep)
-                in_fifo_depths = prod.get_nodeattr("inFIFODepths")
-                for i, input_name in enumerate(node.input):
-                    if input_name in [x.name for x in model.graph.input]:
-                        in_fifo_depths[i] = max(self.io_fifo_depth, in_fifo_depths[i])
-                prod.set_nodeattr("inFIFODepths", in_fifo_depths)
+    def apply(self, model):
+        self.fifo_sizing_report = []
+        graph_inputs = [x.name for x in model.graph.input]
+        for node in model.graph.node:
+            if not (is_hls_node(node) or is_rtl_node(node)):
+                continue
+            op_type = node.op_type
+            prod = registry.getCustomOp(node)
+            assert not (op_type.startswith("StreamingFIFO")), "Found existing FIFOs"
+            period = prod.get_nodeattr("io_chrc_period")
+            prod_chrc = prod.get_nodeattr("io_chrc_out")[0]
+            assert len(prod_chrc) == 2 * period, "Found unexpected characterization attribute"
+            if any([x > 2 for x in prod.get_nodeattr("outFIFODepths")]):
+                # FIFO depth already set, can skip this node
+                continue
+            out_fifo_depths = []
+            for output_name in node.output:
+                cons_node = model.find_consumer(output_name)
+                if cons_node is None:
+                    # could be final node, will be overridden if so
+                    # need an entry in the list anyway
+                    out_fifo_depths.append(self.io_fifo_depth)
+                    continue
+                cons = registry.getCustomOp(cons_node)
+                cons_chrc = cons.get_nodeattr("io_chrc_in")[0]
+                start = time.time()
+                fifo_depth, pshift = solve_fifo_depth(prod_chrc, cons_chrc, period)
+                solve_time = time.time() - start
+                out_fifo_depths.append(fifo_depth)
+                self.fifo_sizing_report.append(
+                    {
+                        "tensor": output_name,
+                        "producer": node.name,
+                        "consumer": cons_node.name,
+                        "depth": fifo_depth,
+                        "phase_shift": pshift,
+                        "solve_time[s]": solve_time,
+                    }
+                )
+            # set output FIFO depth for this (producing) node
+            # InsertFIFO looks at the max of (outFIFODepths, inFIFODepths)
+            # for each tensor
+            prod.set_nodeattr("outFIFODepths", out_fifo_depths)
 
-            except KeyError:
-                # exception if op_type is not supported
-                raise Exception("Custom op_type %s is currently not supported." % op_type)
-        return (node, False)
+            # finally, check node inputs to ensure FIFOs are added to
+            # any top-level inputs (at least self.io_fifo_depth deep)
+            in_fifo_depths = prod.get_nodeattr("inFIFODepths")
+            for i, input_name in enumerate(node.input):
+                if input_name in graph_inputs:
+                    in_fifo_depths[i] = max(self.io_fifo_depth, in_fifo_depths[i])
+            prod.set_nodeattr("inFIFODepths", in_fifo_depths)
+
+        if self.report_file is not None:
+            with open(self.report_file, "w") as f:
+                json.dump(self.fifo_sizing_report, f, indent=2)
+        return (model, False)
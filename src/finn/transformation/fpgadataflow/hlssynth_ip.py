@@ -44,7 +44,15 @@ class HLSSynthIP(NodeLocalTransformation):
     will be skipped.
 
     This transformation calls Vitis HLS for synthesis, so it will run for
-    some time (minutes to hours depending on configuration).
+    some time (minutes to hours depending on configuration). Nodes that were
+    synthesized before with identical generated code (in this or an earlier
+    build) reuse the IP from the HLS IP cache instead, see
+    finn.util.hls.get_ip_cache().
+
+    Structurally identical nodes within the model, whose generated code only
+    differs in the node name (and for internal_decoupled mode, the memstream
+    init file), are only synthesized once. The other nodes get their
+    ipgen_path, ip_path and ip_vlnv attributes pointed to the shared IP.
 
     * num_workers (int or None) number of parallel workers, see documentation in
       NodeLocalTransformation for more details.
@@ -52,9 +60,36 @@ class HLSSynthIP(NodeLocalTransformation):
 
     def __init__(self, num_workers=None):
         super().__init__(num_workers=num_workers)
+        # maps node names to the name of the identical node they share IP with
+        self.shared_ip = dict()
+
+    def apply(self, model):
+        # group identical nodes, the first node in each group gets synthesized
+        groups = dict()
+        for node in model.graph.node:
+            if is_hls_node(node):
+                inst = registry.getCustomOp(node)
+                if os.path.isdir(inst.get_nodeattr("code_gen_dir_ipgen")):
+                    groups.setdefault(inst.ipgen_dedup_key(), []).append(node.name)
+        self.shared_ip = dict()
+        for node_names in groups.values():
+            for node_name in node_names[1:]:
+                self.shared_ip[node_name] = node_names[0]
+        n_nodes = sum([len(x) for x in groups.values()])
+        print("HLSSynthIP: %d unique out of %d HLS node configurations" % (len(groups), n_nodes))
+        model, run_again = super().apply(model)
+        for node_name, shared_node_name in self.shared_ip.items():
+            inst = registry.getCustomOp(model.get_node_from_name(node_name))
+            shared_inst = registry.getCustomOp(model.get_node_from_name(shared_node_name))
+            for attr in ["ipgen_path", "ip_path", "ip_vlnv"]:
+                inst.set_nodeattr(attr, shared_inst.get_nodeattr(attr))
+        return (model, run_again)
 
     def applyNodeLocal(self, node):
         op_type = node.op_type
+        if node.name in self.shared_ip:
+            # IP will be shared with an identical node
+            return (node, False)
         if is_hls_node(node):
             try:
                 # lookup op_type in registry of CustomOps
@@ -34,34 +34,105 @@ import warnings
 from qonnx.core.modelwrapper import ModelWrapper
 from qonnx.custom_op.registry import getCustomOp
 from qonnx.transformation.base import Transformation
-from qonnx.util.basic import gen_finn_dt_tensor, roundup_to_integer_multiple
+from qonnx.util.basic import (
+    gen_finn_dt_tensor,
+    get_by_name,
+    roundup_to_integer_multiple,
+)
 
 import finn.util
 import finn.util.data_packing as dpk
 from finn.util.basic import make_build_dir
-from finn.util.data_packing import (
-    hexstring2npbytearray,
-    pack_innermost_dim_as_hex_string,
-)
 
 from . import template_driver
 
 
 def to_external_tensor(init, w_dtype):
     """Return an appropriately formatted and packed numpy byte array for given
-    external parameter tensor."""
+    external parameter tensor. This is a flat, contiguous uint8 array in the
+    order expected by the weight DMA, so that the driver can memory-map the
+    saved .npy file and copy it to the device buffer chunk-wise."""
 
     weight_width = init.shape[1] * w_dtype.bitwidth()
     weight_width_padded = roundup_to_integer_multiple(weight_width, 4)
-    hex_init = pack_innermost_dim_as_hex_string(init, w_dtype, weight_width_padded, prefix="0x")
-    ext_weight = np.array([], dtype=np.uint8)
-    for line in hex_init:
-        array_line = [x for x in reversed(hexstring2npbytearray(line, remove_prefix="0x"))]
-        ext_weight = np.append(ext_weight, array_line)
+    packed_init = dpk.pack_innermost_dim_as_bytes(init, w_dtype, weight_width_padded)
+    # reverse the byte order of each packed line
+    ext_weight = np.flip(packed_init, axis=-1).flatten().astype(np.uint8, copy=False)
 
     return ext_weight
 
 
+# elementwise nodes that can be fused into the host-side pre-processing
+host_preproc_elementwise_ops = {
+    "Add": np.add,
+    "Sub": np.subtract,
+    "Mul": np.multiply,
+    "Div": np.divide,
+}
+
+
+def host_preproc_lut(model, tensor_name):
+    """Returns the host-side pre-processing in front of the given tensor (e.g.
+    an input of the StreamingDataflowPartition in dataflow_parent.onnx) as a
+    lookup table, or None if the tensor is a graph input. The pre-processing
+    must be a chain of elementwise Add/Sub/Mul/Div with constant operands,
+    MultiThreshold and Transpose nodes on a graph input of an integer FINN
+    DataType of at most 16 bits, such as a uint8 image.
+
+    Returns a tuple (lut, raw_min, perm): raw inputs are transposed by perm,
+    then each element is looked up in its table in lut, with the leading
+    dimensions of lut broadcasting against the pre-processed tensor and the
+    last dimension holding the values for all raw inputs from raw_min."""
+    nodes = []
+    producer = model.find_producer(tensor_name)
+    while producer is not None:
+        dyn_inputs = [x for x in producer.input if model.get_initializer(x) is None]
+        assert len(dyn_inputs) == 1, "Host pre-processing must be a chain of nodes"
+        nodes.insert(0, producer)
+        producer = model.find_producer(dyn_inputs[0])
+    if len(nodes) == 0:
+        return None
+    raw_name = [x for x in nodes[0].input if model.get_initializer(x) is None][0]
+    raw_dt = model.get_tensor_datatype(raw_name)
+    assert raw_dt.is_integer() and raw_dt.bitwidth() <= 16, (
+        "Host pre-processing needs an integer input of at most 16 bits, not %s" % raw_dt.name
+    )
+    raw_min = int(raw_dt.min())
+    n_dims = len(model.get_tensor_shape(raw_name))
+    # evaluate the pre-processing for all raw values along the batch dimension
+    values = np.arange(raw_min, int(raw_dt.max()) + 1, dtype=np.float32)
+    x = values.reshape((-1,) + (1,) * (n_dims - 1))
+    perm = tuple(range(n_dims))
+    for node in nodes:
+        if node.op_type in host_preproc_elementwise_ops:
+            param = [model.get_initializer(y) for y in node.input]
+            param = [y for y in param if y is not None][0].astype(np.float32)
+            if model.get_initializer(node.input[0]) is None:
+                x = host_preproc_elementwise_ops[node.op_type](x, param)
+            else:
+                x = host_preproc_elementwise_ops[node.op_type](param, x)
+        elif node.op_type == "MultiThreshold":
+            inst = getCustomOp(node)
+            thresholds = model.get_initializer(node.input[1])
+            ch_axis = 1 if inst.get_nodeattr("data_layout") in ["NCHW", "NC"] else n_dims - 1
+            thr_shape = [1] * n_dims
+            thr_shape[ch_axis] = thresholds.shape[0]
+            # count the thresholds each value is greater than or equal to
+            y = np.zeros(np.broadcast_shapes(x.shape, tuple(thr_shape)), dtype=np.float32)
+            for t in range(thresholds.shape[1]):
+                y += x >= thresholds[:, t].reshape(thr_shape)
+            x = inst.get_nodeattr("out_scale") * y + inst.get_nodeattr("out_bias")
+        elif node.op_type == "Transpose":
+            node_perm = get_by_name(node.attribute, "perm").ints
+            assert node_perm[0] == 0, "Host pre-processing must not transpose the batch dimension"
+            x = x.transpose(node_perm)
+            perm = tuple(perm[i] for i in node_perm)
+        else:
+            raise Exception("Unsupported node %s in host pre-processing" % node.op_type)
+    lut = np.ascontiguousarray(np.moveaxis(x, 0, -1), dtype=np.float32)
+    return (lut, raw_min, perm)
+
+
 class MakePYNQDriver(Transformation):
     """Create PYNQ Python code to correctly interface the generated
     accelerator, including data packing/unpacking. Should be called
@@ -73,12 +144,20 @@ class MakePYNQDriver(Transformation):
     Outcome if successful: sets the pynq_driver_dir attribute in the ONNX
     ModelProto's metadata_props field, with the created driver dir as the
     value. If any layers use runtime-writable parameters, those will be gathered
-    under the runtime_weights/ subfolder of the pynq_driver_dir.
+    under the runtime_weights/ subfolder of the pynq_driver_dir, as .npy files
+    of 32-bit words.
+
+    If host_preproc_model (the parent model of the dataflow partition, as in
+    dataflow_parent.onnx) is given, the host-side pre-processing in front of
+    the dataflow partition is exported under the host_preproc/ subfolder as
+    lookup tables (see host_preproc_lut), which the driver fuses into the input
+    packing. The driver then takes the raw inputs of the parent model.
     """
 
-    def __init__(self, platform):
+    def __init__(self, platform, host_preproc_model=None):
         super().__init__()
         self.platform = platform
+        self.host_preproc_model = host_preproc_model
 
     def apply(self, model):
         # create a temporary folder for the generated driver
@@ -91,6 +170,12 @@ class MakePYNQDriver(Transformation):
         )
         driver_base_py = pynq_driver_dir + "/driver_base.py"
         shutil.copy(driver_base_template, driver_base_py)
+        # native (C++) host runtime and its Python bindings, compiled on first use
+        for runtime_file in ["finn_runtime.h", "finn_runtime.cpp", "finn_runtime.py"]:
+            shutil.copy(
+                os.environ["FINN_ROOT"] + "/src/finn/qnn-data/templates/driver/" + runtime_file,
+                pynq_driver_dir + "/" + runtime_file,
+            )
         # driver depends on qonnx and finn packages
         # extract individual source files and copy to driver folder
         qonnx_target_path = pynq_driver_dir + "/qonnx"
@@ -243,6 +328,28 @@ class MakePYNQDriver(Transformation):
                     np.save(weights_dir + "/" + idma_name + ".npy", init_external_tensor)
                 idma_idx += 1
 
+        # export the host-side pre-processing in front of the dataflow partition
+        host_preproc = [None] * len(idma_names)
+        if self.host_preproc_model is not None:
+            preproc_dir = pynq_driver_dir + "/host_preproc"
+            os.makedirs(preproc_dir)
+            parent_sdp = self.host_preproc_model.get_nodes_by_op_type("StreamingDataflowPartition")
+            assert len(parent_sdp) == 1, "Only a single StreamingDataflowPartition supported."
+            for i, sdp_input in enumerate(parent_sdp[0].input[: len(idma_names)]):
+                preproc = host_preproc_lut(self.host_preproc_model, sdp_input)
+                if preproc is None:
+                    continue
+                lut, raw_min, perm = preproc
+                i_tensor_dt = model.get_tensor_datatype(model.graph.input[i].name)
+                assert all([i_tensor_dt.allowed(x) for x in np.unique(lut)]), (
+                    "Host pre-processing does not produce %s values" % i_tensor_dt.name
+                )
+                assert np.broadcast_shapes(lut.shape[:-1], ishape_normal[i][1:]) == tuple(
+                    ishape_normal[i][1:]
+                ), "Host pre-processing does not match the accelerator input shape"
+                host_preproc[i] = "input%d.npz" % i
+                np.savez(preproc_dir + "/" + host_preproc[i], lut=lut, raw_min=raw_min, perm=perm)
+
         # fill in the driver template
         driver_py = pynq_driver_dir + "/driver.py"
         driver = template_driver.pynq_driver_template
@@ -261,6 +368,12 @@ class MakePYNQDriver(Transformation):
         driver = driver.replace("$NUM_INPUTS$", str(len(idma_names)))
         driver = driver.replace("$NUM_OUTPUTS$", str(len(odma_names)))
         driver = driver.replace("$EXT_WEIGHT_NUM$", str(ext_weight_dma_cnt))
+        # number of accelerator replicas linked by VitisLink, if any
+        num_compute_units = model.get_metadata_prop("vitis_num_compute_units")
+        if num_compute_units is None:
+            num_compute_units = 1
+        driver = driver.replace("$NUM_COMPUTE_UNITS$", str(num_compute_units))
+        driver = driver.replace("$HOST_PREPROC$", str(host_preproc))
 
         with open(driver_py, "w") as f:
             f.write(driver)
@@ -287,12 +400,14 @@ class MakePYNQDriver(Transformation):
                     is_rt_weights = node_inst.get_nodeattr("runtime_writeable_weights")
                     if is_rt_weights == 1:
                         fcl_w = dataflow_model.get_initializer(node.input[1])
-                        w_filename = weights_dir + "/%d_%d_%s.dat" % (
+                        # binary weight files can be memory-mapped and written
+                        # in bulk by the driver
+                        w_filename = weights_dir + "/%d_%d_%s.npy" % (
                             sdp_ind,
                             rt_layer_ind,
                             node.name,
                         )
-                        node_inst.make_weight_file(fcl_w, "decoupled_runtime", w_filename)
+                        node_inst.make_weight_file(fcl_w, "decoupled_runtime_npy", w_filename)
                         rt_layer_ind += 1
                 elif node.op_type == "StreamingDataflowPartition":
                     warnings.warn(
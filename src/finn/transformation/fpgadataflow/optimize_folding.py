@@ -0,0 +1,377 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import copy
+import numpy as np
+import warnings
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.base import Transformation
+from qonnx.transformation.general import GiveUniqueNodeNames
+from qonnx.util.config import extract_model_config_to_json
+
+from finn.custom_op.fpgadataflow.hlsbackend import HLSBackend
+from finn.custom_op.fpgadataflow.hwcustomop import HWCustomOp
+from finn.custom_op.fpgadataflow.rtlbackend import RTLBackend
+from finn.transformation.fpgadataflow.annotate_cycles import AnnotateCycles
+from finn.transformation.fpgadataflow.set_folding import divisors
+from finn.util.fpgadataflow import is_hls_node, is_rtl_node
+from finn.util.platforms import platforms
+
+# resource types considered by the optimizer
+opt_res_types = ["LUT", "BRAM_18K", "URAM", "DSP"]
+# default weights to combine resources into a single cost when no platform is
+# given, in LUT equivalents (roughly the LUT:resource ratio of common devices)
+default_res_weights = {"LUT": 1.0, "BRAM_18K": 180.0, "URAM": 1300.0, "DSP": 200.0}
+# node attributes that the optimizer decides on
+folding_attrs = ["PE", "SIMD", "parallel_window", "mem_mode"]
+# attributes written to the folding config, same as step_target_fps_parallelization
+folding_config_attrs = [
+    "PE",
+    "SIMD",
+    "parallel_window",
+    "ram_style",
+    "resType",
+    "mem_mode",
+    "runtime_writeable_weights",
+    "depth_trigger_uram",
+    "depth_trigger_bram",
+]
+
+
+class OptimizeFolding(Transformation):
+    """Choose the parallelism attributes (PE, SIMD, parallel_window) and the
+    mem_mode of all nodes based on the analytical cycle and resource
+    estimates of each node. Two modes are supported:
+
+    * if target_cycles_per_frame is given, the total estimated resource cost
+      is minimized subject to every node meeting the target
+    * otherwise, the number of cycles per frame is minimized subject to
+      the estimated resources fitting into the given resource_budget or into
+      the (guideline-limited) resources of the given platform, which must be
+      one of the keys of finn.util.platforms.platforms
+
+    The resources are combined into one cost value by weighting LUT, BRAM_18K,
+    URAM and DSP usage with the inverse of the available amount (if a budget
+    or platform is known) or with res_weights.
+
+    For each node, all legal configurations are enumerated and their cycles
+    and resources are tabulated. Tables are memoized by the node's attributes,
+    so identical layers are only evaluated once, and reduced to the
+    Pareto-optimal configurations. Since the throughput of the pipeline is
+    determined by its slowest node, the cheapest configuration per node can be
+    chosen independently for a given cycle target. In budget mode, the lowest
+    cycle target whose configuration fits the budget is found by trying all
+    achievable cycle counts in increasing order.
+
+    A depthwise ConvolutionInputGenerator is folded together with the VVAU or
+    Pool node it feeds, following the same rules as SetFolding. mem_mode is
+    only explored for HLS nodes without runtime-writeable weights, among the
+    modes given in mem_modes. Ops not handled are left unchanged.
+
+    If folding_config_file is specified, the chosen configuration is written
+    to it in the format expected by ApplyConfig (and thus the
+    folding_config_file option of the build_dataflow flow).
+    """
+
+    def __init__(
+        self,
+        fpgapart,
+        target_cycles_per_frame=None,
+        platform=None,
+        resource_budget=None,
+        res_weights=None,
+        mvau_wwidth_max=None,
+        mem_modes=("internal_embedded", "internal_decoupled"),
+        folding_config_file=None,
+    ):
+        super().__init__()
+        self.fpgapart = fpgapart
+        self.target_cycles_per_frame = target_cycles_per_frame
+        if resource_budget is None and platform is not None:
+            plat = platforms[platform]()
+            avail = np.sum(np.asarray(plat.guide_resources) * plat.res_limits, axis=0)
+            # order of resources in finn.util.platforms: LUT, FF, BRAM_18K, URAM, DSP
+            resource_budget = {
+                "LUT": avail[0],
+                "BRAM_18K": avail[2],
+                "URAM": avail[3],
+                "DSP": avail[4],
+            }
+        assert (
+            target_cycles_per_frame is not None or resource_budget is not None
+        ), "OptimizeFolding needs either target_cycles_per_frame or a resource budget/platform"
+        self.resource_budget = resource_budget
+        if res_weights is None:
+            if resource_budget is not None:
+                res_weights = {
+                    x: 1.0 / resource_budget[x] if resource_budget.get(x, 0) > 0 else 0.0
+                    for x in opt_res_types
+                }
+            else:
+                res_weights = default_res_weights
+        self.res_weights = res_weights
+        self.mvau_wwidth_max = mvau_wwidth_max
+        self.mem_modes = list(mem_modes)
+        self.folding_config_file = folding_config_file
+        # memoized cost tables, keyed by the non-folding attributes of the
+        # node(s) in a folding group
+        self.cost_tables = dict()
+
+    def mem_mode_options(self, node, inst):
+        if "mem_mode" not in inst.get_nodeattr_types():
+            return []
+        mem_mode = inst.get_nodeattr("mem_mode")
+        try:
+            runtime_writeable = inst.get_nodeattr("runtime_writeable_weights")
+        except AttributeError:
+            runtime_writeable = 0
+        if is_hls_node(node) and mem_mode != "external" and runtime_writeable == 0:
+            allowed = inst.get_nodeattr_allowed_values("mem_mode")
+            return [x for x in self.mem_modes if x in allowed]
+        return [mem_mode]
+
+    def node_options(self, node, inst, model):
+        """Return a list of candidate configurations for the given node, each
+        being a list of (node, {attribute: value}) pairs, or None if the node
+        is not handled by the optimizer."""
+        op_type = node.op_type
+        mem_modes = self.mem_mode_options(node, inst)
+        options = []
+        if op_type.startswith("MVAU"):
+            wbits = inst.get_weight_datatype().bitwidth()
+            for simd in divisors(inst.get_nodeattr("MW")):
+                if self.mvau_wwidth_max is not None and simd > 1:
+                    if simd * wbits > self.mvau_wwidth_max:
+                        continue
+                for pe in divisors(inst.get_nodeattr("MH")):
+                    for mem_mode in mem_modes:
+                        cfg = {"PE": pe, "SIMD": simd, "mem_mode": mem_mode}
+                        options.append([(node, cfg)])
+        elif op_type.startswith(("VVAU", "Pool")):
+            swu_node = model.find_producer(node.input[0])
+            if swu_node is not None and not swu_node.op_type.startswith(
+                "ConvolutionInputGenerator"
+            ):
+                swu_node = None
+            max_pe = inst.get_nodeattr("Channels")
+            simd_vals = [1]
+            if op_type.startswith("VVAU"):
+                # SIMD > 1 needs a fully unfolded PE and an RTL SWG in
+                # parallel_window mode
+                if swu_node is None or swu_node.op_type == "ConvolutionInputGenerator_rtl":
+                    simd_vals = list(divisors(int(np.prod(inst.get_nodeattr("Kernel")))))
+            mem_modes = mem_modes if len(mem_modes) > 0 else [None]
+            for pe in divisors(max_pe):
+                for simd in simd_vals:
+                    if simd > 1 and pe != max_pe:
+                        continue
+                    for mem_mode in mem_modes:
+                        cfg = {"PE": pe}
+                        if op_type.startswith("VVAU"):
+                            cfg["SIMD"] = simd
+                        if mem_mode is not None:
+                            cfg["mem_mode"] = mem_mode
+                        option = [(node, cfg)]
+                        if swu_node is not None:
+                            swu_cfg = {"SIMD": pe}
+                            if swu_node.op_type == "ConvolutionInputGenerator_rtl":
+                                swu_cfg["parallel_window"] = int(simd > 1)
+                            option.append((swu_node, swu_cfg))
+                        options.append(option)
+        elif op_type.startswith("ConvolutionInputGenerator"):
+            if inst.get_nodeattr("depthwise") == 1:
+                # folded together with its consumer
+                return None
+            max_simd = inst.get_nodeattr("IFMChannels")
+            for simd in divisors(max_simd):
+                options.append([(node, {"SIMD": simd})])
+            if op_type == "ConvolutionInputGenerator_rtl":
+                for option in options:
+                    option[0][1]["parallel_window"] = 0
+                options.append([(node, {"SIMD": max_simd, "parallel_window": 1})])
+        elif op_type.startswith(("DownSampler", "FMPadding")):
+            for simd in divisors(inst.get_nodeattr("NumChannels")):
+                options.append([(node, {"SIMD": simd})])
+        elif op_type.startswith(
+            ("AddStreams", "ChannelwiseOp", "DuplicateStreams", "GlobalAccPool", "Thresholding")
+        ):
+            for pe in divisors(inst.get_nodeattr("NumChannels")):
+                if len(mem_modes) > 0:
+                    for mem_mode in mem_modes:
+                        options.append([(node, {"PE": pe, "mem_mode": mem_mode})])
+                else:
+                    options.append([(node, {"PE": pe})])
+        elif op_type.startswith("LabelSelect"):
+            for pe in divisors(inst.get_nodeattr("Labels")):
+                options.append([(node, {"PE": pe})])
+        else:
+            return None
+        return options
+
+    def table_key(self, options):
+        """Key for memoizing cost tables: all attributes of the nodes in a
+        folding group except their names and the attributes being decided,
+        plus the candidate configurations."""
+        key = []
+        for node, cfg in options[0]:
+            inst = getCustomOp(node)
+            # generic attributes (paths, annotations, ...) don't affect the
+            # estimates and differ between otherwise identical nodes
+            skip = set(folding_attrs) | set(HWCustomOp.get_nodeattr_types(inst))
+            for backend in [HLSBackend, RTLBackend]:
+                if isinstance(inst, backend):
+                    skip |= set(backend.get_nodeattr_types(inst))
+            attrs = []
+            for attr in node.attribute:
+                if attr.name not in skip:
+                    attrs.append(attr.SerializeToString())
+            key.append((node.op_type, tuple(sorted(attrs))))
+        for option in options:
+            key.append(tuple(tuple(sorted(cfg.items())) for _, cfg in option))
+        return tuple(key)
+
+    def evaluate(self, option):
+        """Return (cycles, resources) of the given configuration, with the
+        cycles of a folding group given by its slowest node. The configuration
+        is applied to copies of the nodes, the model is left unchanged."""
+        cycles = 0
+        res = {x: 0 for x in opt_res_types}
+        for node, cfg in option:
+            inst = getCustomOp(copy.deepcopy(node))
+            for attr, val in cfg.items():
+                inst.set_nodeattr(attr, val)
+            cycles = max(cycles, inst.get_exp_cycles())
+            node_res = inst.node_res_estimation(self.fpgapart)
+            for x in opt_res_types:
+                res[x] += node_res.get(x, 0)
+        return cycles, res
+
+    def cost(self, res):
+        return sum(self.res_weights.get(x, 0) * res[x] for x in opt_res_types)
+
+    def cost_table(self, options):
+        """Tabulate the Pareto-optimal configurations (by cycles and by each
+        resource type) of a folding group, sorted by cycles."""
+        key = self.table_key(options)
+        if key in self.cost_tables:
+            return self.cost_tables[key]
+        # store configurations as indices into options, so that the table
+        # can be reused for other nodes with the same attributes
+        entries = []
+        for ind, option in enumerate(options):
+            cycles, res = self.evaluate(option)
+            entries.append((cycles, [res[x] for x in opt_res_types], self.cost(res), ind))
+        entries.sort(key=lambda x: (x[0], x[2]))
+        table = []
+        for entry in entries:
+            dominated = any(
+                t[0] <= entry[0] and all(a <= b for a, b in zip(t[1], entry[1])) for t in table
+            )
+            if not dominated:
+                table.append(entry)
+        self.cost_tables[key] = table
+        return table
+
+    def within_budget(self, res):
+        if self.resource_budget is None:
+            return True
+        for ind, res_type in enumerate(opt_res_types):
+            if res_type in self.resource_budget and res[ind] > self.resource_budget[res_type]:
+                return False
+        return True
+
+    def select(self, tables, target):
+        """Pick the cheapest entry meeting the target from each table, or the
+        fastest one if the target cannot be met. Among equally expensive
+        entries, the least parallel one is preferred. Entries that exceed the
+        resource budget on their own are not considered."""
+        selected = []
+        for table in tables:
+            meets = [x for x in table if x[0] <= target and self.within_budget(x[1])]
+            if len(meets) > 0:
+                selected.append(min(meets, key=lambda x: (x[2], -x[0])))
+            else:
+                selected.append(table[0])
+        return selected
+
+    def fits_budget(self, selected):
+        return self.within_budget(np.sum([x[1] for x in selected], axis=0))
+
+    def budget_target(self, tables):
+        """Return the lowest achievable cycle target whose selected
+        configuration fits into the resource budget, or the highest one (with
+        a warning) if none fits. Fitting is not monotone in the target, since a
+        looser target may select cheaper entries that use more of a single
+        resource type, so all targets are tried in increasing order."""
+        min_cycles = max(table[0][0] for table in tables)
+        targets = sorted(set(x[0] for table in tables for x in table))
+        targets = [x for x in targets if x >= min_cycles]
+        for target in targets:
+            if self.fits_budget(self.select(tables, target)):
+                return target
+        warnings.warn("OptimizeFolding could not fit the design into the budget")
+        return targets[-1]
+
+    def apply(self, model):
+        groups = []
+        tables = []
+        for node in model.graph.node:
+            if not (is_hls_node(node) or is_rtl_node(node)):
+                continue
+            inst = getCustomOp(node)
+            options = self.node_options(node, inst, model)
+            if options is None:
+                if not node.op_type.startswith("ConvolutionInputGenerator"):
+                    warnings.warn("OptimizeFolding doesn't know how to handle " + node.op_type)
+                continue
+            groups.append(options)
+            tables.append(self.cost_table(options))
+
+        if len(groups) > 0:
+            min_cycles = max(table[0][0] for table in tables)
+            if self.target_cycles_per_frame is not None:
+                target = self.target_cycles_per_frame
+            else:
+                target = self.budget_target(tables)
+            if target < min_cycles:
+                warnings.warn(
+                    "Folding target of %d cycles cannot be met, slowest node needs %d cycles"
+                    % (target, min_cycles)
+                )
+            selected = self.select(tables, target)
+            for options, entry in zip(groups, selected):
+                for node, cfg in options[entry[3]]:
+                    inst = getCustomOp(node)
+                    for attr, val in cfg.items():
+                        inst.set_nodeattr(attr, val)
+
+        model = model.transform(GiveUniqueNodeNames())
+        model = model.transform(AnnotateCycles())
+        if self.folding_config_file is not None:
+            extract_model_config_to_json(model, self.folding_config_file, folding_config_attrs)
+        return (model, False)
@@ -27,13 +27,59 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
 import qonnx.custom_op.registry as registry
+from onnx import helper
 from qonnx.transformation.base import NodeLocalTransformation
 
 from finn.transformation.fpgadataflow.replace_verilog_relpaths import (
     ReplaceVerilogRelPaths,
 )
-from finn.util.fpgadataflow import is_hls_node, is_rtl_node
+from finn.util.cache import hash_items
+from finn.util.fpgadataflow import hash_generated_code, is_hls_node, is_rtl_node
+
+# node attributes that record generated files or results of earlier
+# transformations, which do not affect the emulation library
+_rtlsim_irrelevant_attrs = [
+    "code_gen_dir_cppsim",
+    "code_gen_dir_ipgen",
+    "executable_path",
+    "ipgen_path",
+    "ip_path",
+    "ip_vlnv",
+    "rtlsim_so",
+    "rtlsim_trace",
+    "gen_top_module",
+    "exec_mode",
+    "res_estimate",
+    "res_hls",
+    "res_synth",
+    "cycles_rtlsim",
+    "cycles_estimate",
+]
+
+
+def _rtlsim_dedup_key(node):
+    """Return a key that is identical for nodes that can share the same
+    Verilator emulation library, or None if the node cannot be deduplicated.
+    HLS nodes need to share the same IP (see HLSSynthIP), RTL nodes need
+    identical attributes and generated code up to the node name."""
+    inst = registry.getCustomOp(node)
+    code_gen_dir = inst.get_nodeattr("code_gen_dir_ipgen")
+    if not os.path.isdir(code_gen_dir):
+        return None
+    items = [node.op_type]
+    for attr in sorted(node.attribute, key=lambda x: x.name):
+        if attr.name not in _rtlsim_irrelevant_attrs:
+            items.append("%s=%s" % (attr.name, str(helper.get_attribute_value(attr))))
+    if is_hls_node(node):
+        if inst.get_nodeattr("ipgen_path") == "":
+            return None
+        items += [inst.get_nodeattr("ipgen_path"), inst.get_nodeattr("ip_vlnv")]
+    else:
+        items.append(hash_generated_code(code_gen_dir, node.name))
+    return hash_items(items)
+
 
 try:
     from pyverilator import PyVerilator
@@ -51,19 +97,45 @@ class PrepareRTLSim(NodeLocalTransformation):
     SetExecMode) and the model has to be executed using execute_onnx() from
     finn.core.onnx_exec
 
+    Nodes that are identical up to their names (e.g. HLS nodes that share
+    the same IP after HLSSynthIP) share a single emulation library.
+
     * num_workers (int or None) number of parallel workers, see documentation in
       NodeLocalTransformation for more details.
     """
 
     def __init__(self, num_workers=None):
         super().__init__(num_workers=num_workers)
+        # maps node names to the name of the identical node they share rtlsim with
+        self.shared_rtlsim = dict()
 
     def apply(self, model):
         model = model.transform(ReplaceVerilogRelPaths())
-        return super().apply(model)
+        # group identical nodes, the first node in each group gets compiled
+        groups = dict()
+        n_nodes = 0
+        for node in model.graph.node:
+            if is_hls_node(node) or is_rtl_node(node):
+                n_nodes += 1
+                key = _rtlsim_dedup_key(node)
+                groups.setdefault(node.name if key is None else key, []).append(node.name)
+        self.shared_rtlsim = dict()
+        for node_names in groups.values():
+            for node_name in node_names[1:]:
+                self.shared_rtlsim[node_name] = node_names[0]
+        print("PrepareRTLSim: %d unique out of %d node configurations" % (len(groups), n_nodes))
+        model, run_again = super().apply(model)
+        for node_name, shared_node_name in self.shared_rtlsim.items():
+            inst = registry.getCustomOp(model.get_node_from_name(node_name))
+            shared_inst = registry.getCustomOp(model.get_node_from_name(shared_node_name))
+            inst.set_nodeattr("rtlsim_so", shared_inst.get_nodeattr("rtlsim_so"))
+        return (model, run_again)
 
     def applyNodeLocal(self, node):
         op_type = node.op_type
+        if node.name in self.shared_rtlsim:
+            # emulation library will be shared with an identical node
+            return (node, False)
         if is_hls_node(node) or is_rtl_node(node):
             try:
                 # lookup op_type in registry of CustomOps
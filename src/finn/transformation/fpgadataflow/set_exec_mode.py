@@ -35,10 +35,11 @@ from finn.util.fpgadataflow import is_hls_node, is_rtl_node
 
 class SetExecMode(Transformation):
     """Set attribute exec_mode in all fpgadataflow nodes to specify which
-    kind of execution should be used ("cppsim" or "rtlsim").
+    kind of execution should be used ("cppsim", "rtlsim" or "python").
     Note that RTL components do not support cppsim. When cppsim is selected
     for RTL components, by default the execution of the HW op parent is
-    executed."""
+    executed. "python" selects the execution of the HW op parent for all
+    components, which needs no code generation or compilation."""
 
     def __init__(self, mode):
         super().__init__()
@@ -61,7 +61,7 @@ import argparse
 import numpy as np
 import os
 from qonnx.core.datatype import DataType
-from driver_base import FINNExampleOverlay
+from driver_base import FINNExampleOverlay, write_benchmark_results
 from pynq.pl_server.device import Device
 
 # dictionary describing the I/O of the FINN-generated accelerator
@@ -84,18 +84,26 @@ io_shape_dict = {
     "number_of_external_weights": $EXT_WEIGHT_NUM$,
     "num_inputs" : $NUM_INPUTS$,
     "num_outputs" : $NUM_OUTPUTS$,
+    "num_compute_units" : $NUM_COMPUTE_UNITS$,
+    # host-side pre-processing of each input (under host_preproc_dir) fused
+    # into the input packing, with raw inputs to execute(), or None
+    "host_preproc" : $HOST_PREPROC$,
 }
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Execute FINN-generated accelerator on numpy inputs, or run throughput test')
-    parser.add_argument('--exec_mode', help='Please select functional verification ("execute") or throughput test ("throughput_test")', default="execute")
+    parser.add_argument('--exec_mode', help='Please select functional verification ("execute"), throughput test ("throughput_test") or latency benchmark ("benchmark")', default="execute")
     parser.add_argument('--platform', help='Target platform: zynq-iodma alveo', default="$PLATFORM$")
     parser.add_argument('--batchsize', help='number of samples for inference', type=int, default=1)
     parser.add_argument('--device', help='FPGA device to be used', type=int, default=0)
     parser.add_argument('--bitfile', help='name of bitfile (i.e. "resizer.bit")', default="resizer.bit")
     parser.add_argument('--inputfile', help='name(s) of input npy file(s) (i.e. "input.npy")', nargs="*", type=str, default=["input.npy"])
     parser.add_argument('--outputfile', help='name(s) of output npy file(s) (i.e. "output.npy")', nargs="*", type=str, default=["output.npy"])
-    parser.add_argument('--runtime_weight_dir', help='path to folder containing runtime-writable .dat weights', default="runtime_weights/")
+    parser.add_argument('--runtime_weight_dir', help='path to folder containing runtime-writable .npy/.dat weights', default="runtime_weights/")
+    parser.add_argument('--host_preproc_dir', help='path to folder containing the host-side pre-processing fused into input packing', default="host_preproc/")
+    parser.add_argument('--native_runtime', help='pack and unpack data with the native C++ runtime', action='store_true')
+    parser.add_argument('--benchmark_batchsizes', help='batch sizes to sweep for benchmark (default: batchsize)', nargs="*", type=int, default=None)
+    parser.add_argument('--benchmark_iterations', help='number of timed iterations per batch size for benchmark', type=int, default=100)
     # parse arguments
     args = parser.parse_args()
     exec_mode = args.exec_mode
@@ -112,7 +120,8 @@ if __name__ == "__main__":
     accel = FINNExampleOverlay(
         bitfile_name = bitfile, platform = platform,
         io_shape_dict = io_shape_dict, batch_size = batch_size,
-        runtime_weight_dir = runtime_weight_dir, device=device
+        runtime_weight_dir = runtime_weight_dir, device=device,
+        native_runtime = args.native_runtime, host_preproc_dir = args.host_preproc_dir
     )
 
     # for the remote execution the data from the input npy file has to be loaded,
@@ -138,6 +147,12 @@ if __name__ == "__main__":
         file.write(str(res))
         file.close()
         print("Results written to nw_metrics.txt")
+    elif exec_mode == "benchmark":
+        res = accel.benchmark(
+            batch_sizes=args.benchmark_batchsizes, num_iterations=args.benchmark_iterations
+        )
+        write_benchmark_results(res, "nw_benchmark.json", "nw_benchmark.csv")
+        print("Results written to nw_benchmark.json and nw_benchmark.csv")
     else:
-        raise Exception("Exec mode has to be set to execute or throughput_test")
+        raise Exception("Exec mode has to be set to execute, throughput_test or benchmark")
 """
@@ -64,6 +64,12 @@ def _check_vitis_envvars():
     ), "XILINX_XRT must be set for Vitis, ensure the XRT env is sourced"
 
 
+def compute_unit_name(instance_name, cu):
+    """Returns the name of the given kernel instance in the replica (compute
+    unit) cu of the accelerator. Must match the naming in the PYNQ driver."""
+    return instance_name if cu == 0 else "%s_cu%d" % (instance_name, cu)
+
+
 class VitisOptStrategy(Enum):
     "Values applicable to VitisBuild optimization strategy."
 
@@ -165,8 +171,13 @@ class CreateVitisXO(Transformation):
 class VitisLink(Transformation):
     """Create an XCLBIN with Vitis.
 
+    num_compute_units: number of replicas (compute units) of the whole dataflow
+    accelerator to link. Kernel instances of replica cu > 0 are suffixed with
+    _cu<cu>, as expected by the PYNQ driver.
+
     Outcome if successful: sets the bitfile attribute in the ONNX
-    ModelProto's metadata_props field with the XCLBIN full path as value.
+    ModelProto's metadata_props field with the XCLBIN full path as value,
+    and the vitis_num_compute_units attribute with the number of replicas.
     """
 
     def __init__(
@@ -175,12 +186,14 @@ class VitisLink(Transformation):
         f_mhz=200,
         strategy=VitisOptStrategy.PERFORMANCE,
         enable_debug=False,
+        num_compute_units=1,
     ):
         super().__init__()
         self.platform = platform
         self.f_mhz = f_mhz
         self.strategy = strategy
         self.enable_debug = enable_debug
+        self.num_compute_units = num_compute_units
 
     def apply(self, model):
         _check_vitis_envvars()
@@ -213,61 +226,75 @@ class VitisLink(Transformation):
             # TODO not a good way of checking for external in/out
             # check top-level in/out list instead
             if producer is None:
-                instance_names[node.name] = "idma" + str(idma_idx)
-                config.append("nk=%s:1:%s" % (node.name, instance_names[node.name]))
+                base_name = "idma" + str(idma_idx)
                 idma_idx += 1
             elif consumer == []:
-                instance_names[node.name] = "odma" + str(odma_idx)
-                config.append("nk=%s:1:%s" % (node.name, instance_names[node.name]))
+                base_name = "odma" + str(odma_idx)
                 odma_idx += 1
             else:
-                instance_names[node.name] = node.name
-                config.append("nk=%s:1:%s" % (node.name, instance_names[node.name]))
-            sdp_node.set_nodeattr("instance_name", instance_names[node.name])
+                base_name = node.name
+            instance_names[node.name] = [
+                compute_unit_name(base_name, cu) for cu in range(self.num_compute_units)
+            ]
+            config.append(
+                "nk=%s:%d:%s"
+                % (node.name, self.num_compute_units, ".".join(instance_names[node.name]))
+            )
+            sdp_node.set_nodeattr("instance_name", instance_names[node.name][0])
             # explicitly assign SLRs if the slr attribute is not -1
             node_slr = sdp_node.get_nodeattr("slr")
             if node_slr != -1:
-                config.append("slr=%s:SLR%d" % (instance_names[node.name], node_slr))
+                for inst in instance_names[node.name]:
+                    config.append("slr=%s:SLR%d" % (inst, node_slr))
             # assign memory banks
             if producer is None or consumer is None:
                 node_mem_port = sdp_node.get_nodeattr("mem_port")
-                if node_mem_port == "":
-                    # configure good defaults based on board
-                    if "u50" in self.platform or "u280" in self.platform or "u55c" in self.platform:
-                        # Use HBM where available (also U50 does not have DDR)
-                        mem_type = "HBM"
-                        mem_idx = 0
-                    elif "u200" in self.platform:
-                        # Use DDR controller in static region of U200
-                        mem_type = "DDR"
-                        mem_idx = 1
-                    elif "u250" in self.platform:
-                        # Use DDR controller on the node's SLR if set, otherwise 0
-                        mem_type = "DDR"
-                        if node_slr == -1:
-                            mem_idx = 0
+                for cu, inst in enumerate(instance_names[node.name]):
+                    cu_mem_port = node_mem_port
+                    if cu_mem_port == "":
+                        # configure good defaults based on board
+                        if (
+                            "u50" in self.platform
+                            or "u280" in self.platform
+                            or "u55c" in self.platform
+                        ):
+                            # Use HBM where available (also U50 does not have DDR),
+                            # one of the 32 pseudo-channels per compute unit
+                            mem_type = "HBM"
+                            mem_idx = cu % 32
+                        elif "u200" in self.platform:
+                            # Use DDR controller in static region of U200
+                            mem_type = "DDR"
+                            mem_idx = 1
+                        elif "u250" in self.platform:
+                            # Use DDR controller on the node's SLR if set, otherwise 0
+                            mem_type = "DDR"
+                            if node_slr == -1:
+                                mem_idx = 0
+                            else:
+                                mem_idx = node_slr
                         else:
-                            mem_idx = node_slr
-                    else:
-                        mem_type = "DDR"
-                        mem_idx = 1
-                    node_mem_port = "%s[%d]" % (mem_type, mem_idx)
-                config.append("sp=%s.m_axi_gmem0:%s" % (instance_names[node.name], node_mem_port))
-            # connect streams
+                            mem_type = "DDR"
+                            mem_idx = 1
+                        cu_mem_port = "%s[%d]" % (mem_type, mem_idx)
+                    config.append("sp=%s.m_axi_gmem0:%s" % (inst, cu_mem_port))
+            # connect streams, within each compute unit
             if producer is not None:
                 for i in range(len(node.input)):
                     producer = model.find_producer(node.input[i])
                     if producer is not None:
                         j = list(producer.output).index(node.input[i])
-                        config.append(
-                            "stream_connect=%s.m_axis_%d:%s.s_axis_%d"
-                            % (
-                                instance_names[producer.name],
-                                j,
-                                instance_names[node.name],
-                                i,
+                        for cu in range(self.num_compute_units):
+                            config.append(
+                                "stream_connect=%s.m_axis_%d:%s.s_axis_%d"
+                                % (
+                                    instance_names[producer.name][cu],
+                                    j,
+                                    instance_names[node.name][cu],
+                                    i,
+                                )
                             )
-                        )
+        model.set_metadata_prop("vitis_num_compute_units", str(self.num_compute_units))
 
         # create a temporary folder for the project
         link_dir = make_build_dir(prefix="vitis_link_proj_")
@@ -294,7 +321,7 @@ class VitisLink(Transformation):
 
         debug_commands = []
         if self.enable_debug:
-            for inst in list(instance_names.values()):
+            for inst in sum(instance_names.values(), []):
                 debug_commands.append("--dk chipscope:%s" % inst)
 
         # create a shell script and call Vitis
@@ -357,6 +384,8 @@ class VitisBuild(Transformation):
         Must be parse-able by the ApplyConfig transform.
     :parameter enable_link: enable linking kernels (.xo files),
         otherwise just synthesize them independently.
+    :parameter num_compute_units: number of replicas of the accelerator to link,
+        which the PYNQ driver shards each batch across.
     """
 
     def __init__(
@@ -369,6 +398,7 @@ class VitisBuild(Transformation):
         floorplan_file=None,
         enable_link=True,
         partition_model_dir=None,
+        num_compute_units=1,
     ):
         super().__init__()
         self.fpga_part = fpga_part
@@ -379,6 +409,7 @@ class VitisBuild(Transformation):
         self.floorplan_file = floorplan_file
         self.enable_link = enable_link
         self.partition_model_dir = partition_model_dir
+        self.num_compute_units = num_compute_units
 
     def apply(self, model):
         _check_vitis_envvars()
@@ -425,6 +456,7 @@ class VitisBuild(Transformation):
                     round(1000 / self.period_ns),
                     strategy=self.strategy,
                     enable_debug=self.enable_debug,
+                    num_compute_units=self.num_compute_units,
                 )
             )
         # set platform attribute for correct remote execution
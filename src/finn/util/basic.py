@@ -132,6 +132,65 @@ def pyverilate_get_liveness_threshold_cycles():
     return int(os.getenv("LIVENESS_THRESHOLD", 10000))
 
 
+def get_verilator_cache_dir():
+    """Return the directory for the persistent cache of compiled Verilator
+    models, as set by the FINN_VERILATOR_CACHE_DIR environment variable.
+    Defaults to $FINN_BUILD_DIR/verilator_cache if the env.var. is undefined.
+    If it is set to an empty string, caching is disabled and None is returned."""
+
+    cache_dir = os.getenv("FINN_VERILATOR_CACHE_DIR")
+    if cache_dir is None:
+        build_dir = os.getenv("FINN_BUILD_DIR")
+        if build_dir is None:
+            return None
+        cache_dir = build_dir + "/verilator_cache"
+    elif cache_dir == "":
+        return None
+    return cache_dir
+
+
+def get_verilator_cache_max_size_mb():
+    """Return the maximum size in MB of the Verilator model cache, as set by
+    the FINN_VERILATOR_CACHE_MAX_MB environment variable. Least recently used
+    models are evicted once this size is exceeded. Defaults to 4096."""
+
+    return int(os.getenv("FINN_VERILATOR_CACHE_MAX_MB", 4096))
+
+
+def get_ip_cache_dir():
+    """Return the directory for the persistent cache of synthesized HLS IP,
+    as set by the FINN_IP_CACHE_DIR environment variable. Defaults to
+    $FINN_BUILD_DIR/ip_cache if the env.var. is undefined. If it is set to
+    an empty string, caching is disabled and None is returned."""
+
+    cache_dir = os.getenv("FINN_IP_CACHE_DIR")
+    if cache_dir is None:
+        build_dir = os.getenv("FINN_BUILD_DIR")
+        if build_dir is None:
+            return None
+        cache_dir = build_dir + "/ip_cache"
+    elif cache_dir == "":
+        return None
+    return cache_dir
+
+
+def get_ip_cache_max_size_mb():
+    """Return the maximum size in MB of the HLS IP cache, as set by the
+    FINN_IP_CACHE_MAX_MB environment variable. Least recently used IPs are
+    evicted once this size is exceeded. Defaults to 16384."""
+
+    return int(os.getenv("FINN_IP_CACHE_MAX_MB", 16384))
+
+
+def get_cppsim_server_enabled():
+    """Return whether cppsim executables are kept running as persistent server
+    processes (see finn.util.cppsim_server) instead of being launched once
+    per node execution. Controllable via the FINN_CPPSIM_SERVER environment
+    variable, set it to 0 to disable. Defaults to enabled."""
+
+    return os.getenv("FINN_CPPSIM_SERVER", "1") != "0"
+
+
 def make_build_dir(prefix=""):
     """Creates a folder with given prefix to be used as a build dir.
     Use this function instead of tempfile.mkdtemp to ensure any generated files
@@ -0,0 +1,385 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import clize
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from finn.util.basic import get_ip_cache_dir, get_verilator_cache_dir
+
+
+def hash_file(filename, hasher=None):
+    """Return the SHA-256 hex digest of the contents of the given file. If
+    hasher is given, the file contents are fed into it instead and the
+    updated hasher is returned."""
+    ret_digest = hasher is None
+    if hasher is None:
+        hasher = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest() if ret_digest else hasher
+
+
+def hash_items(items):
+    """Return the SHA-256 hex digest of the given sequence of strings and/or
+    bytes, which are length-prefixed so that the boundaries between items
+    are part of the hash."""
+    hasher = hashlib.sha256()
+    for item in items:
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        hasher.update(b"%d:" % len(item))
+        hasher.update(item)
+    return hasher.hexdigest()
+
+
+def get_dir_size(path):
+    "Return the total size in bytes of all files under the given directory."
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            fpath = os.path.join(root, fname)
+            if not os.path.islink(fpath):
+                total += os.path.getsize(fpath)
+    return total
+
+
+class BuildCache:
+    """Persistent on-disk cache for build artifacts, addressed by a key that
+    is computed from the inputs of the build (e.g. a hash of the sources and
+    tool versions). Each entry is a directory under cache_dir, named after
+    its key, whose contents are copied in on insert and copied out on
+    lookup. Entries are evicted in least-recently-used order once the total
+    cache size exceeds max_size_mb. Hit/miss/eviction counts are accumulated
+    in a stats.json file in the cache_dir, and every lookup is reported with
+    print() so that it ends up in the build log.
+
+    :param cache_dir Directory to store the cache entries in
+    :param max_size_mb Upper bound on the total size of all entries in MB,
+        None for no bound
+    :param name Name of the cache, used in log messages
+    """
+
+    stats_filename = "stats.json"
+    lock_filename = ".lock"
+    entry_info_filename = ".entry_info.json"
+
+    def __init__(self, cache_dir, max_size_mb=None, name="build cache"):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size_mb = max_size_mb
+        self.name = name
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        # serialize updates between processes sharing the same cache
+        with open(os.path.join(self.cache_dir, self.lock_filename), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_stats(self):
+        stats_file = os.path.join(self.cache_dir, self.stats_filename)
+        stats = {"hits": 0, "misses": 0, "inserts": 0, "evictions": 0}
+        if os.path.isfile(stats_file):
+            try:
+                with open(stats_file, "r") as f:
+                    stats.update(json.load(f))
+            except ValueError:
+                # corrupted stats file, start counting from scratch
+                pass
+        return stats
+
+    def _update_stats(self, **increments):
+        stats = self._read_stats()
+        for stat_name, increment in increments.items():
+            stats[stat_name] += increment
+        with open(os.path.join(self.cache_dir, self.stats_filename), "w") as f:
+            json.dump(stats, f, indent=2)
+        return stats
+
+    def _touch(self, key):
+        # record the access time explicitly instead of relying on the
+        # filesystem atime, which is often disabled (noatime/relatime)
+        info_file = os.path.join(self._entry_dir(key), self.entry_info_filename)
+        with open(info_file, "r") as f:
+            info = json.load(f)
+        info["last_access"] = time.time()
+        info["n_hits"] = info.get("n_hits", 0) + 1
+        with open(info_file, "w") as f:
+            json.dump(info, f, indent=2)
+
+    def contains(self, key):
+        "Return True if an entry for the given key exists in the cache."
+        return os.path.isfile(os.path.join(self._entry_dir(key), self.entry_info_filename))
+
+    def lookup(self, key, target_dir):
+        """Look up the entry for the given key. On a hit, copy the contents of
+        the entry into target_dir (which will be created if needed) and return
+        True, otherwise return False."""
+        with self._locked():
+            hit = self.contains(key)
+            if hit:
+                self._touch(key)
+                shutil.copytree(
+                    self._entry_dir(key),
+                    target_dir,
+                    dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns(self.entry_info_filename),
+                )
+            stats = self._update_stats(**{"hits" if hit else "misses": 1})
+        print(
+            "%s %s for key %s (hits: %d, misses: %d)"
+            % (self.name, "hit" if hit else "miss", key, stats["hits"], stats["misses"])
+        )
+        return hit
+
+    def insert(self, key, src_files, description="", ignore=None):
+        """Insert a new entry for the given key into the cache, containing
+        copies of the files in the src_files list (as basenames) or, if
+        src_files is a directory, a copy of its contents (leaving out anything
+        matched by the optional ignore callable, see shutil.copytree).
+        Afterwards, least recently used entries are evicted if the cache
+        exceeds its size bound."""
+        # prepare entry in a temporary directory, then move it in place so
+        # that concurrent readers never see partially written entries
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir)
+        try:
+            if isinstance(src_files, str) and os.path.isdir(src_files):
+                shutil.copytree(
+                    src_files, tmp_dir, dirs_exist_ok=True, symlinks=True, ignore=ignore
+                )
+            else:
+                for src_file in src_files:
+                    shutil.copy2(src_file, tmp_dir)
+            now = time.time()
+            info = {
+                "key": key,
+                "description": description,
+                "created": now,
+                "last_access": now,
+                "n_hits": 0,
+                "size": get_dir_size(tmp_dir),
+            }
+            with open(os.path.join(tmp_dir, self.entry_info_filename), "w") as f:
+                json.dump(info, f, indent=2)
+            with self._locked():
+                if self.contains(key):
+                    # another process inserted the same entry in the meantime
+                    return
+                os.rename(tmp_dir, self._entry_dir(key))
+                self._update_stats(inserts=1)
+                if self.max_size_mb is not None:
+                    self._evict_unlocked(max_size_mb=self.max_size_mb, keep=[key])
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+
+    def entries(self):
+        """Return a list of dicts describing all entries in the cache, with
+        the keys: key, description, created, last_access, n_hits and size
+        (in bytes). The list is sorted from least to most recently used."""
+        ret = []
+        for key in os.listdir(self.cache_dir):
+            info_file = os.path.join(self._entry_dir(key), self.entry_info_filename)
+            if not os.path.isfile(info_file):
+                continue
+            try:
+                with open(info_file, "r") as f:
+                    ret.append(json.load(f))
+            except ValueError:
+                continue
+        return sorted(ret, key=lambda x: x["last_access"])
+
+    def _remove_entry(self, key):
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _evict_unlocked(self, max_size_mb=None, max_age_s=None, keep=[]):
+        entries = self.entries()
+        evicted = []
+        now = time.time()
+        if max_age_s is not None:
+            for entry in entries:
+                if now - entry["last_access"] > max_age_s and entry["key"] not in keep:
+                    evicted.append(entry)
+        remaining = [x for x in entries if x not in evicted]
+        if max_size_mb is not None:
+            total_size = sum([x["size"] for x in remaining])
+            # evict least recently used entries first
+            for entry in remaining:
+                if total_size <= max_size_mb * 1024 * 1024:
+                    break
+                if entry["key"] in keep:
+                    continue
+                evicted.append(entry)
+                total_size -= entry["size"]
+        for entry in evicted:
+            self._remove_entry(entry["key"])
+        if len(evicted) > 0:
+            self._update_stats(evictions=len(evicted))
+            print("%s evicted %d entries" % (self.name, len(evicted)))
+        return evicted
+
+    def prune(self, max_size_mb=None, max_age_s=None):
+        """Remove entries that have not been used for longer than max_age_s
+        seconds, then remove least recently used entries until the total size
+        is below max_size_mb. Returns a list of the removed entries."""
+        with self._locked():
+            return self._evict_unlocked(max_size_mb=max_size_mb, max_age_s=max_age_s)
+
+    def clear(self):
+        "Remove all entries from the cache and reset the statistics."
+        with self._locked():
+            for entry in self.entries():
+                self._remove_entry(entry["key"])
+            stats_file = os.path.join(self.cache_dir, self.stats_filename)
+            if os.path.isfile(stats_file):
+                os.remove(stats_file)
+
+    def get_stats(self):
+        """Return a dict with the accumulated hit/miss/insert/eviction counts
+        as well as the current number of entries and total size in bytes."""
+        stats = self._read_stats()
+        entries = self.entries()
+        stats["entries"] = len(entries)
+        stats["size"] = sum([x["size"] for x in entries])
+        return stats
+
+
+def resolve_cache_dir(cache):
+    """Resolve the cache name used on the command line to a directory: ip or
+    verilator for the HLS IP and Verilator model caches, otherwise cache is
+    interpreted as the path to a cache directory (e.g. the build_cache in the
+    output_dir of a dataflow build)."""
+    if cache == "ip":
+        cache_dir = get_ip_cache_dir()
+    elif cache == "verilator":
+        cache_dir = get_verilator_cache_dir()
+    else:
+        cache_dir = cache
+    if cache_dir is None or not os.path.isdir(cache_dir):
+        raise Exception("Could not find cache directory for %s" % cache)
+    return cache_dir
+
+
+def format_size(n_bytes):
+    return "%.1f MB" % (n_bytes / (1024 * 1024))
+
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def cache_list(cache: str):
+    """List the entries of a cache, from least to most recently used.
+
+    :param cache: ip, verilator or path to a cache directory
+    """
+    entries = BuildCache(resolve_cache_dir(cache)).entries()
+    for entry in entries:
+        print(
+            "%s  %10s  last used %s  %4d hits  %s"
+            % (
+                entry["key"][:16],
+                format_size(entry["size"]),
+                format_time(entry["last_access"]),
+                entry["n_hits"],
+                entry["description"],
+            )
+        )
+    print("%d entries" % len(entries))
+
+
+def cache_prune(cache: str, *, max_age_days: float = None, max_size_mb: float = None):
+    """Remove cache entries that were not used for more than max_age_days,
+    then remove least recently used entries until the cache is smaller than
+    max_size_mb.
+
+    :param cache: ip, verilator or path to a cache directory
+    :param max_age_days: Maximum age since last use for entries to keep
+    :param max_size_mb: Maximum total size of the remaining entries
+    """
+    max_age_s = None if max_age_days is None else max_age_days * 24 * 3600
+    build_cache = BuildCache(resolve_cache_dir(cache))
+    removed = build_cache.prune(max_size_mb=max_size_mb, max_age_s=max_age_s)
+    print(
+        "Removed %d entries (%s)" % (len(removed), format_size(sum([x["size"] for x in removed])))
+    )
+
+
+def cache_stats(cache: str):
+    """Print hit/miss statistics and the current size of a cache.
+
+    :param cache: ip, verilator or path to a cache directory
+    """
+    cache_dir = resolve_cache_dir(cache)
+    stats = BuildCache(cache_dir).get_stats()
+    n_lookups = stats["hits"] + stats["misses"]
+    hit_rate = 100.0 * stats["hits"] / n_lookups if n_lookups > 0 else 0.0
+    print("Cache directory: %s" % cache_dir)
+    print("Entries: %d (%s)" % (stats["entries"], format_size(stats["size"])))
+    print("Hits: %d, misses: %d (hit rate %.1f%%)" % (stats["hits"], stats["misses"], hit_rate))
+    print("Inserts: %d, evictions: %d" % (stats["inserts"], stats["evictions"]))
+
+
+def cache_clear(cache: str):
+    """Remove all entries from a cache.
+
+    :param cache: ip, verilator or path to a cache directory
+    """
+    BuildCache(resolve_cache_dir(cache)).clear()
+
+
+def main():
+    """Entry point for managing the FINN build caches from the command line"""
+    clize.run(
+        {
+            "list": cache_list,
+            "prune": cache_prune,
+            "stats": cache_stats,
+            "clear": cache_clear,
+        },
+        description="Manage the FINN HLS IP, Verilator and build step caches",
+    )
+
+
+if __name__ == "__main__":
+    main()
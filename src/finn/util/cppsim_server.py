@@ -0,0 +1,148 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import atexit
+import os
+import subprocess
+
+# lines printed by cppsim_main (see qnn-data/cpp/cppsim_server.hpp)
+CPPSIM_READY = "@cppsim_ready"
+CPPSIM_DONE = "@cppsim_done"
+
+
+class CppsimServer:
+    """A cppsim executable (node_model) of a node, running as a persistent
+    process in --server mode. Each call to run executes the node once on the
+    .npy inputs in its code generation directory, exactly like a launch of
+    the executable would, but without the process startup."""
+
+    def __init__(self, executable_path):
+        self.executable_path = executable_path
+        self.mtime = os.stat(executable_path).st_mtime_ns
+        self.pid = os.getpid()
+        self.proc = subprocess.Popen(
+            [executable_path, "--server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        # executables generated before the server mode was introduced ignore
+        # --server, execute once and exit
+        self.supported = self._wait_for(CPPSIM_READY)
+
+    def _wait_for(self, token):
+        for line in self.proc.stdout:
+            if line.rstrip("\n") == token:
+                return True
+        return False
+
+    def is_current(self):
+        "Returns whether this server can serve its executable in this process."
+        return (
+            self.pid == os.getpid()
+            and self.proc.poll() is None
+            and os.path.isfile(self.executable_path)
+            and os.stat(self.executable_path).st_mtime_ns == self.mtime
+        )
+
+    def run(self):
+        "Execute the node once and wait until it is done."
+        try:
+            self.proc.stdin.write("run\n")
+            self.proc.stdin.flush()
+            done = self._wait_for(CPPSIM_DONE)
+        except BrokenPipeError:
+            done = False
+        if not done:
+            raise Exception(
+                "cppsim process %s terminated with exit code %s"
+                % (self.executable_path, self.proc.wait())
+            )
+
+    def close(self):
+        "Terminate the server process."
+        if self.pid != os.getpid():
+            # inherited through fork, the process belongs to the parent
+            return
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write("exit\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=10)
+            except (BrokenPipeError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+        for pipe in [self.proc.stdin, self.proc.stdout]:
+            try:
+                pipe.close()
+            except BrokenPipeError:
+                pass
+
+
+# running servers by executable path
+_cppsim_servers = dict()
+# mtimes of executables found to have no server mode, by executable path
+_unsupported_executables = dict()
+
+
+def get_cppsim_server(executable_path):
+    """Return the running CppsimServer for the given cppsim executable, which
+    is started on first use and restarted if the executable was rebuilt.
+    Returns None if the executable has no server mode, which is only probed
+    once per build of the executable."""
+    mtime = os.stat(executable_path).st_mtime_ns
+    if _unsupported_executables.get(executable_path) == mtime:
+        return None
+    server = _cppsim_servers.get(executable_path)
+    if server is not None and not server.is_current():
+        server.close()
+        server = None
+    if server is None:
+        server = CppsimServer(executable_path)
+        if not server.supported:
+            server.close()
+            _unsupported_executables[executable_path] = server.mtime
+            return None
+        _cppsim_servers[executable_path] = server
+    return server
+
+
+def shutdown_cppsim_servers(executable_path=None):
+    """Terminate the server of the given cppsim executable, or all servers if
+    no executable path is given."""
+    if executable_path is None:
+        paths = list(_cppsim_servers.keys())
+    else:
+        paths = [executable_path]
+    for path in paths:
+        server = _cppsim_servers.pop(path, None)
+        if server is not None:
+            server.close()
+
+
+atexit.register(shutdown_cppsim_servers)
@@ -29,11 +29,14 @@
 import binascii
 import numpy as np
 import os
-import sys
 from bitstring import BitArray
 from qonnx.core.datatype import DataType
 from qonnx.util.basic import roundup_to_integer_multiple
 
+# upper bound on the number of bits that vectorized packing expands at once,
+# which limits the size of temporary buffers when packing large tensors
+PACKING_CHUNK_BITS = 1 << 24
+
 
 def array2hexstring(array, dtype, pad_to_nbits, prefix="0x", reverse=False):
     """
@@ -127,7 +130,9 @@ def pack_innermost_dim_as_hex_string(
     ndarray, dtype, pad_to_nbits, reverse_inner=False, prefix="0x"
 ):
     """Pack the innermost dimension of the given numpy ndarray into hex
-    strings using array2hexstring.
+    strings with the same format as array2hexstring. DataTypes supported by
+    the vectorized packing routines are packed without per-element
+    conversions, others fall back to array2hexstring.
 
     Examples:
 
@@ -148,12 +153,232 @@ def pack_innermost_dim_as_hex_string(
         # try to convert to a float numpy array (container dtype is float)
         ndarray = np.asarray(ndarray, dtype=np.float32)
 
+    if is_vectorized_packing_supported(dtype):
+        # vectorized path: pack into bytes, then convert to hex strings
+        pad_to_nbits = max(pad_to_nbits, 4)
+        packed = pack_innermost_dim_as_bytes(ndarray, dtype, pad_to_nbits, reverse_inner)
+        n_digits = roundup_to_integer_multiple(pad_to_nbits, 4) // 4
+        hex_chars = packed_bytes_to_hex_chars(packed.reshape(-1, packed.shape[-1]), n_digits)
+        ret = np.ascontiguousarray(hex_chars).view("S%d" % n_digits).astype(str)
+        if prefix != "":
+            ret = np.char.add(prefix, ret)
+        return ret.reshape(ndarray.shape[:-1])
+
     def fun(x):
         return array2hexstring(x, dtype, pad_to_nbits, reverse=reverse_inner, prefix=prefix)
 
     return np.apply_along_axis(fun, ndarray.ndim - 1, ndarray)
 
 
+def is_vectorized_packing_supported(dtype):
+    """Return True if values of the given FINN DataType can be packed by the
+    vectorized NumPy routines (pack_innermost_dim_as_bytes and friends), which
+    is the case for integer and fixed-point types of up to 64 bits and for
+    FLOAT32. Other types fall back to per-element packing with bitstring."""
+    if dtype == DataType["FLOAT32"]:
+        return True
+    return (dtype.is_integer() or dtype.is_fixed_point()) and dtype.bitwidth() <= 64
+
+
+def finnpy_to_uint_codes(ndarray, dtype):
+    """Return the raw bit patterns of the values in the given numpy ndarray
+    with FINN DataType dtype as an ndarray of uint64 with the same shape.
+    BIPOLAR values are mapped to a single bit with 0 representing -1, signed
+    integers are given in two's complement and fixed point values are rescaled
+    to their signed integer equivalent, the same way array2hexstring does it.
+    """
+    if type(ndarray) != np.ndarray or ndarray.dtype != np.float32:
+        ndarray = np.asarray(ndarray, dtype=np.float32)
+    if dtype == DataType["FLOAT32"]:
+        return ndarray.view(np.uint32).astype(np.uint64)
+    if dtype == DataType["BIPOLAR"]:
+        # convert bipolar values to binary
+        ndarray = (ndarray + 1) / 2
+        dtype = DataType["BINARY"]
+    bw = dtype.bitwidth()
+    if dtype.is_fixed_point():
+        # rescale, then pack as integers
+        ndarray = ndarray / dtype.scale_factor()
+        dtype = DataType["INT" + str(bw)]
+    assert (
+        (ndarray >= dtype.min()) & (ndarray <= dtype.max()) & (np.round(ndarray) == ndarray)
+    ).all(), "This value is not permitted by chosen dtype."
+    mask = np.uint64((1 << bw) - 1)
+    return ndarray.astype(np.int64).astype(np.uint64) & mask
+
+
+def rows_view(out, n_rows, n_cols):
+    """Return a 2D view with n_rows rows of n_cols elements on the given
+    ndarray, for the routines that write their results into caller-provided
+    arrays. Raises an Exception if this is not possible without a copy."""
+    if out.size != n_rows * n_cols:
+        raise Exception("Output array has %d elements, expected %d" % (out.size, n_rows * n_cols))
+    rows = out.reshape(n_rows, n_cols)
+    if rows.size > 0 and not np.may_share_memory(rows, out):
+        raise Exception("Output array cannot be written as %d rows in place" % n_rows)
+    return rows
+
+
+def pack_innermost_dim_as_bytes(ndarray, dtype, pad_to_nbits, reverse_inner=False, out=None):
+    """Pack the innermost dimension of the given numpy ndarray with FINN
+    DataType dtype into a big-endian uint8 ndarray with pad_to_nbits rounded up
+    to the nearest multiple of 8 bits per packed line. The first element of
+    the innermost dimension ends up in the most significant bits, exactly as
+    with array2hexstring, and reverse_inner can be used to reverse the
+    innermost dimension prior to packing. Returns an ndarray of shape
+    ndarray.shape[:-1] + (ceil(pad_to_nbits / 8),).
+
+    If out is given, the packed bytes are written into it instead (which
+    must have a compatible size and may be a strided view) and out is
+    returned. Apart from bounded temporaries, no full-size intermediate
+    arrays are allocated.
+
+    Example:
+
+    pack_innermost_dim_as_bytes([[1, 1, 1, 0]], DataType["BINARY"], 8) =
+    array([[14]], dtype=uint8)
+    """
+    if not isinstance(ndarray, np.ndarray):
+        ndarray = np.asarray(ndarray, dtype=np.float32)
+    n_bytes = roundup_to_integer_multiple(pad_to_nbits, 8) // 8
+    outer_shape = ndarray.shape[:-1]
+    if not is_vectorized_packing_supported(dtype):
+        # fall back to per-element packing via hex strings
+        hex_pad = roundup_to_integer_multiple(pad_to_nbits, 8)
+        packed_hex = pack_innermost_dim_as_hex_string(ndarray, dtype, hex_pad, reverse_inner)
+        ret = [hexstring2npbytearray(x) for x in packed_hex.flatten()]
+        ret = np.asarray(ret, dtype=np.uint8).reshape(outer_shape + (n_bytes,))
+        if out is None:
+            return ret
+        np.copyto(out, ret.reshape(out.shape))
+        return out
+    bw = 32 if dtype == DataType["FLOAT32"] else dtype.bitwidth()
+    n_elems = ndarray.shape[-1]
+    if n_elems * bw > pad_to_nbits:
+        raise Exception("Number of bits is greater than pad_to_nbits")
+    if reverse_inner:
+        ndarray = np.flip(ndarray, -1)
+    inp_rows = ndarray.reshape(-1, n_elems)
+    n_rows = inp_rows.shape[0]
+    if out is None:
+        ret = np.empty((n_rows, n_bytes), dtype=np.uint8)
+    else:
+        ret = rows_view(out, n_rows, n_bytes)
+    n_pad_bits = n_bytes * 8 - n_elems * bw
+    rows_per_chunk = max(1, PACKING_CHUNK_BITS // (n_bytes * 8))
+    if 8 % bw == 0:
+        # several whole elements per byte: combine them with shifts, after
+        # prepending zero elements for the padding
+        per_byte = 8 // bw
+        shifts = np.arange(8 - bw, -1, -bw, dtype=np.uint8)
+    elif bw in [16, 32, 64]:
+        # each element occupies whole bytes: reinterpret as big-endian
+        be_dtype = np.dtype(">u%d" % (bw // 8))
+    else:
+        # expand into one byte per bit (MSB first) and let np.packbits compress
+        shifts = np.arange(bw - 1, -1, -1, dtype=np.uint64)
+    # process the rows in chunks to bound the size of the temporary buffers
+    for start in range(0, n_rows, rows_per_chunk):
+        codes = finnpy_to_uint_codes(inp_rows[start : start + rows_per_chunk], dtype)
+        n_chunk = codes.shape[0]
+        if 8 % bw == 0:
+            codes = codes.astype(np.uint8)
+            if n_pad_bits > 0:
+                codes = np.pad(codes, ((0, 0), (n_pad_bits // bw, 0)))
+            codes = codes.reshape(n_chunk, n_bytes, per_byte) << shifts
+            ret[start : start + n_chunk] = np.bitwise_or.reduce(codes, axis=-1)
+        elif bw in [16, 32, 64]:
+            n_pad_bytes = n_pad_bits // 8
+            ret[start : start + n_chunk, :n_pad_bytes] = 0
+            ret[start : start + n_chunk, n_pad_bytes:] = (
+                codes.astype(be_dtype).view(np.uint8).reshape(n_chunk, -1)
+            )
+        else:
+            bits = ((codes[..., np.newaxis] >> shifts) & np.uint64(1)).astype(np.uint8)
+            bits = bits.reshape(n_chunk, n_elems * bw)
+            if n_pad_bits > 0:
+                bits = np.pad(bits, ((0, 0), (n_pad_bits, 0)))
+            ret[start : start + n_chunk] = np.packbits(bits, axis=-1)
+    if out is not None:
+        return out
+    return ret.reshape(outer_shape + (n_bytes,))
+
+
+def packed_bytes_to_hex_chars(packed, n_digits):
+    """Convert a 2D big-endian uint8 ndarray of packed lines (as returned by
+    pack_innermost_dim_as_bytes) into a 2D uint8 ndarray of ASCII hex digits
+    with n_digits characters per line, dropping any leading digits beyond
+    n_digits."""
+    n_rows, n_bytes = packed.shape
+    hex_str = packed.tobytes().hex().encode("ascii")
+    hex_chars = np.frombuffer(hex_str, dtype=np.uint8).reshape(n_rows, 2 * n_bytes)
+    return hex_chars[:, 2 * n_bytes - n_digits :]
+
+
+def pack_innermost_dim_to_hex_file(
+    ndarray,
+    dtype,
+    pad_to_nbits,
+    filename,
+    reverse_inner=False,
+    split_words_nbits=None,
+):
+    """Pack the innermost dimension of the given numpy ndarray with FINN
+    DataType dtype into hex strings of pad_to_nbits bits (without prefix) and
+    write them into filename, one packed line per text line. This produces the
+    same file contents as writing out the result of
+    pack_innermost_dim_as_hex_string line by line, but streams the packed words
+    to disk in chunks without creating Python strings per element.
+
+    If split_words_nbits is specified, each packed line is further split into
+    words of split_words_nbits bits which are written out least significant
+    word first, one per text line (as expected for runtime-writable weights).
+    pad_to_nbits must be a multiple of split_words_nbits in this case.
+    """
+    if type(ndarray) != np.ndarray or ndarray.dtype != np.float32:
+        ndarray = np.asarray(ndarray, dtype=np.float32)
+    if ndarray.ndim == 1:
+        ndarray = ndarray.reshape(1, -1)
+    pad_to_nbits = max(pad_to_nbits, 4)
+    if split_words_nbits is not None:
+        assert split_words_nbits % 4 == 0, "split_words_nbits must be a multiple of 4"
+        assert (
+            pad_to_nbits % split_words_nbits == 0
+        ), "pad_to_nbits must be a multiple of split_words_nbits"
+    n_digits = roundup_to_integer_multiple(pad_to_nbits, 4) // 4
+    lines = ndarray.reshape(-1, ndarray.shape[-1])
+    rows_per_chunk = max(1, PACKING_CHUNK_BITS // (n_digits * 4))
+    with open(filename, "wb") as f:
+        for start in range(0, lines.shape[0], rows_per_chunk):
+            chunk = lines[start : start + rows_per_chunk]
+            packed = pack_innermost_dim_as_bytes(chunk, dtype, pad_to_nbits, reverse_inner)
+            hex_chars = packed_bytes_to_hex_chars(packed, n_digits)
+            if split_words_nbits is not None:
+                # (rows, words, digits_per_word), least significant word first
+                digits_per_word = split_words_nbits // 4
+                hex_chars = hex_chars.reshape(-1, n_digits // digits_per_word, digits_per_word)
+                hex_chars = np.flip(hex_chars, axis=1).reshape(-1, digits_per_word)
+            newlines = np.full((hex_chars.shape[0], 1), ord("\n"), dtype=np.uint8)
+            f.write(np.concatenate([hex_chars, newlines], axis=1).tobytes())
+
+
+def pack_innermost_dim_as_words(ndarray, dtype, pad_to_nbits, reverse_inner=False):
+    """Pack the innermost dimension of the given numpy ndarray with FINN
+    DataType dtype into lines of pad_to_nbits bits (a multiple of 32), split
+    into 32-bit words with the least significant word first. Returns a flat
+    uint32 ndarray with the same words in the same order as written by
+    pack_innermost_dim_to_hex_file with split_words_nbits=32, e.g. to write
+    runtime-writable weights in binary form."""
+    assert pad_to_nbits % 32 == 0, "pad_to_nbits must be a multiple of 32"
+    if type(ndarray) != np.ndarray or ndarray.dtype != np.float32:
+        ndarray = np.asarray(ndarray, dtype=np.float32)
+    lines = ndarray.reshape(-1, ndarray.shape[-1])
+    packed = pack_innermost_dim_as_bytes(lines, dtype, pad_to_nbits, reverse_inner)
+    # (rows, words) of big-endian words, least significant word first
+    words = np.flip(packed.view(">u4"), axis=1)
+    return words.astype(np.uint32).reshape(-1)
+
+
 def unpack_innermost_dim_from_hex_string(
     ndarray, dtype, out_shape, packedBits, reverse_inner=False
 ):
@@ -255,25 +480,25 @@ def numpy_to_hls_code(ndarray, dtype, hls_var_name, pack_innermost_dim=True, no_
     # add dimensions
     for d in range(ndims):
         ret += "[%d]" % ndarray.shape[d]
-    orig_printops = np.get_printoptions()
-    np.set_printoptions(threshold=sys.maxsize)
-
-    # define a function to convert a single element into a C++ init string
-    # a single element can be a hex string if we are using packing
-    def elem2str(x):
-        if type(x) == str or type(x) == np.str_:
-            return '%s("%s", 16)' % (hls_dtype, x)
-        elif type(x) == np.float32:
-            if dtype.is_integer():
-                return str(int(x))
-            else:
-                return str(x)
-        else:
-            raise Exception("Unsupported type for numpy_to_hls_code")
 
-    strarr = np.array2string(ndarray, separator=", ", formatter={"all": elem2str})
-    np.set_printoptions(**orig_printops)
-    strarr = strarr.replace("[", "{").replace("]", "}")
+    # convert all elements into C++ init strings at once
+    # an element can be a hex string if we are using packing
+    if ndarray.dtype.kind in {"U", "S"}:
+        elems = np.char.add(np.char.add(hls_dtype + '("', ndarray), '", 16)')
+        elems = elems.flatten().tolist()
+    elif ndarray.dtype == np.float32:
+        if dtype.is_integer():
+            elems = ndarray.astype(np.int64).flatten().astype(str).tolist()
+        else:
+            elems = [str(x) for x in ndarray.flatten()]
+    else:
+        raise Exception("Unsupported type for numpy_to_hls_code")
+    # build up the nested initializer list, starting from the innermost dim
+    sep = ", "
+    for d in reversed(ndarray.shape):
+        elems = ["{" + sep.join(elems[i : i + d]) + "}" for i in range(0, len(elems), d)]
+        sep = ",\n"
+    strarr = elems[0]
     if no_decl:
         ret = strarr + ";"
     else:
@@ -300,15 +525,14 @@ def npy_to_rtlsim_input(input_file, input_dtype, pad_to_nbits, reverse_inner=Tru
         and input_dtype.is_integer()
         and input_dtype.get_canonical_name() != "BIPOLAR"
     ):
-        mask = (1 << input_dtype.bitwidth()) - 1
-        packed_data = inp.flatten().astype(input_dtype.to_numpy_dt())
-        packed_data = [int(x) & mask for x in packed_data]
+        mask = np.uint64((1 << input_dtype.bitwidth()) - 1)
+        packed_data = inp.flatten().astype(input_dtype.to_numpy_dt()).astype(np.int64)
+        packed_data = (packed_data.astype(np.uint64) & mask).tolist()
     else:
-        packed_data = pack_innermost_dim_as_hex_string(
+        packed_data = pack_innermost_dim_as_bytes(
             inp, input_dtype, pad_to_nbits, reverse_inner=reverse_inner
         )
-        packed_data = packed_data.flatten()
-        packed_data = [int(x[2:], 16) for x in packed_data]
+        packed_data = packed_bytes_to_int_list(packed_data.reshape(-1, packed_data.shape[-1]))
     return packed_data
 
 
@@ -320,9 +544,11 @@ def rtlsim_output_to_npy(output, path, dtype, shape, packedBits, targetBits, rev
     not None it will also be saved as a npy file."""
 
     # TODO should have its own testbench?
-    output = np.asarray([hex(int(x)) for x in output])
-    out_array = unpack_innermost_dim_from_hex_string(
-        output, dtype, shape, packedBits=packedBits, reverse_inner=reverse_inner
+    n_lines = int(np.prod(shape[:-1]))
+    n_bytes = roundup_to_integer_multiple(packedBits, 8) // 8
+    packed_output = int_list_to_packed_bytes(output[:n_lines], n_bytes)
+    out_array = unpack_innermost_dim_from_bytes(
+        packed_output, dtype, shape, reverse_inner=reverse_inner
     )
     # make copy before saving the array
     out_array = out_array.copy()
@@ -331,8 +557,126 @@ def rtlsim_output_to_npy(output, path, dtype, shape, packedBits, targetBits, rev
     return out_array
 
 
+def packed_bytes_to_int_list(packed):
+    """Convert a 2D big-endian uint8 ndarray of packed lines (as returned by
+    pack_innermost_dim_as_bytes) into a list of Python arbitrary-precision
+    integers, one per line, e.g. for use as rtlsim stream input."""
+    n_rows, n_bytes = packed.shape
+    if n_bytes <= 8:
+        # let NumPy produce the integers by viewing the lines as uint64
+        packed_u64 = np.zeros((n_rows, 8), dtype=np.uint8)
+        packed_u64[:, 8 - n_bytes :] = packed
+        return packed_u64.view(">u8").flatten().tolist()
+    packed = packed.tobytes()
+    return [int.from_bytes(packed[i : i + n_bytes], "big") for i in range(0, len(packed), n_bytes)]
+
+
+def int_list_to_packed_bytes(values, n_bytes):
+    """Convert a sequence of non-negative Python arbitrary-precision integers
+    (e.g. rtlsim stream outputs) into a 2D big-endian uint8 ndarray with
+    n_bytes bytes per line. Inverse of packed_bytes_to_int_list."""
+    if n_bytes <= 8:
+        values = np.asarray([int(x) for x in values], dtype=np.uint64)
+        return values.astype(">u8").view(np.uint8).reshape(-1, 8)[:, 8 - n_bytes :]
+    values = b"".join([int(x).to_bytes(n_bytes, "big") for x in values])
+    return np.frombuffer(values, dtype=np.uint8).reshape(-1, n_bytes)
+
+
+def uint_codes_to_finnpy(codes, dtype):
+    """Interpret an ndarray of raw bit patterns (e.g. as produced by
+    finnpy_to_uint_codes) as values of FINN DataType dtype and return them as
+    a float32 ndarray of the same shape. Inverse of finnpy_to_uint_codes."""
+    codes = np.asarray(codes, dtype=np.uint64)
+    if dtype == DataType["FLOAT32"]:
+        return codes.astype(np.uint32).view(np.float32)
+    if dtype == DataType["BIPOLAR"]:
+        return (2 * codes.astype(np.int64) - 1).astype(np.float32)
+    bw = dtype.bitwidth()
+    ret = codes.astype(np.int64)
+    if dtype.signed() and bw < 64:
+        # sign-extend two's complement values
+        ret = ret - (((ret >> (bw - 1)) & 1) << bw)
+    ret = ret.astype(np.float32)
+    if dtype.is_fixed_point():
+        # convert signed integer to fixed point by applying scale
+        ret = ret * dtype.scale_factor()
+    return ret
+
+
+def unpack_innermost_dim_from_bytes(packed, dtype, out_shape, reverse_inner=False, out=None):
+    """Unpack a big-endian uint8 ndarray of packed lines (as returned by
+    pack_innermost_dim_as_bytes) into a FINN NumPy array of given DataType and
+    out_shape, without converting through hex strings. The innermost dimension
+    of out_shape determines how many elements are unpacked from each line, any
+    remaining bits are treated as padding. If reverse_inner is set, the first
+    element is taken from the least significant bits of each line.
+
+    If out is given, the unpacked values are written into it instead (which
+    must have out_shape or a compatible size, and may be of any numeric
+    dtype) and out is returned.
+    """
+    packed = np.asarray(packed, dtype=np.uint8)
+    n_bytes = packed.shape[-1]
+    packed = packed.reshape(-1, n_bytes)
+    n_elems = out_shape[-1]
+    if not is_vectorized_packing_supported(dtype):
+        # fall back to unpacking via hex strings
+        packed_hex = np.asarray([npbytearray2hexstring(x) for x in packed])
+        ret = unpack_innermost_dim_from_hex_string(
+            packed_hex, dtype, out_shape, n_bytes * 8, reverse_inner
+        )
+        if out is None:
+            return ret
+        np.copyto(out, ret.reshape(out.shape), casting="unsafe")
+        return out
+    bw = 32 if dtype == DataType["FLOAT32"] else dtype.bitwidth()
+    if bw * n_elems > n_bytes * 8:
+        raise Exception("Number of packed bits is smaller than required by out_shape")
+    n_rows = packed.shape[0]
+    if out is None:
+        ret = np.empty((n_rows, n_elems), dtype=np.float32)
+    else:
+        ret = rows_view(out, n_rows, n_elems)
+    n_pad_bits = n_bytes * 8 - n_elems * bw
+    rows_per_chunk = max(1, PACKING_CHUNK_BITS // (n_bytes * 8))
+    if 8 % bw == 0:
+        # several whole elements per byte: split them with shifts, skipping
+        # the leading padding elements
+        shifts = np.arange(8 - bw, -1, -bw, dtype=np.uint8)
+        mask = np.uint8((1 << bw) - 1)
+    elif bw in [16, 32, 64]:
+        # each element occupies whole bytes: reinterpret as big-endian
+        be_dtype = np.dtype(">u%d" % (bw // 8))
+    else:
+        # least significant bit first, so that element i occupies bits
+        # [i * bw, (i + 1) * bw) counting from the LSB
+        weights = np.uint64(1) << np.arange(bw, dtype=np.uint64)
+    for start in range(0, n_rows, rows_per_chunk):
+        chunk = packed[start : start + rows_per_chunk]
+        if 8 % bw == 0:
+            # elements in MSB-first order
+            codes = (chunk[..., np.newaxis] >> shifts) & mask
+            codes = codes.reshape(chunk.shape[0], -1)[:, n_pad_bits // bw :]
+            if reverse_inner:
+                codes = codes[:, ::-1]
+        elif bw in [16, 32, 64]:
+            codes = np.ascontiguousarray(chunk[:, n_pad_bits // 8 :]).view(be_dtype)
+            if reverse_inner:
+                codes = codes[:, ::-1]
+        else:
+            bits = np.unpackbits(chunk, axis=-1, bitorder="big")[:, ::-1]
+            bits = bits[:, : n_elems * bw].reshape(-1, n_elems, bw).astype(np.uint64)
+            codes = bits @ weights
+            if not reverse_inner:
+                codes = codes[:, ::-1]
+        ret[start : start + rows_per_chunk] = uint_codes_to_finnpy(codes, dtype)
+    if out is not None:
+        return out
+    return ret.reshape(out_shape)
+
+
 def finnpy_to_packed_bytearray(
-    ndarray, dtype, reverse_inner=False, reverse_endian=False, fast_mode=False
+    ndarray, dtype, reverse_inner=False, reverse_endian=False, fast_mode=False, out=None
 ):
     """Given a numpy ndarray with FINN DataType dtype, pack the innermost
     dimension and return the packed representation as an ndarray of uint8.
@@ -340,21 +684,33 @@ def finnpy_to_packed_bytearray(
     of 8 bits. The returned ndarray has the same number of dimensions as the
     input.
 
-    If fast_mode is enabled, will attempt to use shortcuts  to save
-    on runtime for certain cases:
-    * 8-bit ndarray -> 8-bit
+    Packing is vectorized for all DataTypes supported by
+    pack_innermost_dim_as_bytes, any bitwidth, padding and combination of
+    reverse_inner and reverse_endian.
+
+    If fast_mode is enabled, will additionally avoid any computation for
+    certain cases where the input can be reinterpreted or packed directly,
+    skipping the check that the values are permitted by dtype:
+    * int8/uint8 ndarray -> 8-bit integer DataType
     * ndarray -> 1-bit and total bits % 8 == 0
-    This mode is currently not well-tested, use at your own risk!
+    Both require reverse_inner and reverse_endian, as used by the driver.
+
+    If out is given (e.g. a pre-allocated device buffer), the packed data is
+    written directly into it and out is returned, without allocating the
+    packed array.
     """
 
     # handle fast_mode cases (currently only called from driver):
     if issubclass(type(ndarray), np.ndarray) and fast_mode:
         inp_is_byte = ndarray.dtype in [np.uint8, np.int8]
-        out_is_byte = dtype.bitwidth() == 8
+        out_is_byte = dtype.bitwidth() == 8 and dtype.is_integer()
         double_reverse = reverse_inner and reverse_endian
         # fast mode case: byte -> byte: cast
         if inp_is_byte and out_is_byte and double_reverse:
-            return ndarray.view(np.uint8)
+            if out is None:
+                return ndarray.view(np.uint8)
+            np.copyto(out, ndarray.view(np.uint8).reshape(out.shape))
+            return out
         # fast mode case: xxx -> bit with nbits % 8 == 0: np.packbits
         out_is_bit = dtype.bitwidth() == 1
         bits = dtype.bitwidth() * ndarray.shape[-1]
@@ -370,27 +726,25 @@ def finnpy_to_packed_bytearray(
             # pack with numpy
             packed_data = np.packbits(in_as_int8, axis=-1)
             # reverse endianness and return
-            return np.flip(packed_data, axis=-1)
+            if out is None:
+                return np.flip(packed_data, axis=-1)
+            np.copyto(out, np.flip(packed_data, axis=-1).reshape(out.shape))
+            return out
 
-    if (not issubclass(type(ndarray), np.ndarray)) or ndarray.dtype != np.float32:
+    if not issubclass(type(ndarray), np.ndarray):
         # try to convert to a float numpy array (container dtype is float)
         ndarray = np.asarray(ndarray, dtype=np.float32)
-    # pack innermost dim to hex strings padded to 8 bits
+    # pack innermost dim to bytes, padded to a multiple of 8 bits
     bits = dtype.bitwidth() * ndarray.shape[-1]
     bits_padded = roundup_to_integer_multiple(bits, 8)
-    packed_hexstring = pack_innermost_dim_as_hex_string(
-        ndarray, dtype, bits_padded, reverse_inner=reverse_inner
-    )
-
-    def fn(x):
-        return np.asarray(list(map(hexstring2npbytearray, x)))
-
-    if packed_hexstring.ndim == 0:
-        # scalar, call hexstring2npbytearray directly
-        ret = hexstring2npbytearray(np.asscalar(packed_hexstring))
-    else:
-        # convert ndarray of hex strings to byte array
-        ret = np.apply_along_axis(fn, packed_hexstring.ndim - 1, packed_hexstring)
+    if out is not None:
+        # write through a byte-reversed view to reverse the endianness
+        out_view = np.flip(out, axis=-1) if reverse_endian else out
+        pack_innermost_dim_as_bytes(
+            ndarray, dtype, bits_padded, reverse_inner=reverse_inner, out=out_view
+        )
+        return out
+    ret = pack_innermost_dim_as_bytes(ndarray, dtype, bits_padded, reverse_inner=reverse_inner)
     if reverse_endian:
         # reverse the endianness of packing dimension
         ret = np.flip(ret, axis=-1)
@@ -404,6 +758,7 @@ def packed_bytearray_to_finnpy(
     reverse_inner=False,
     reverse_endian=False,
     fast_mode=False,
+    out=None,
 ):
     """Given a packed numpy uint8 ndarray, unpack it into a FINN array of
     given DataType.
@@ -411,10 +766,16 @@ def packed_bytearray_to_finnpy(
     output_shape can be specified to remove padding from the
     packed dimension, or set to None to be inferred from the input.
 
-    If fast_mode is enabled, will attempt to use shortcuts (casting) to save
-    on runtime for certain cases.
-    This mode is currently not well-tested, use at your own risk.
+    Unpacking is vectorized for all DataTypes supported by
+    unpack_innermost_dim_from_bytes, any bitwidth, padding and combination
+    of reverse_inner and reverse_endian.
 
+    If fast_mode is enabled, will additionally avoid any computation by
+    casting for 8- and 16-bit integer DataTypes without padding, if both
+    reverse_inner and reverse_endian are set (as used by the driver).
+
+    If out is given, the unpacked values are written directly into it (it
+    must have output_shape or a compatible size) and out is returned.
     """
 
     if (not issubclass(type(packed_bytearray), np.ndarray)) or packed_bytearray.dtype != np.uint8:
@@ -433,19 +794,18 @@ def packed_bytearray_to_finnpy(
         n_target_elems = packed_bits // target_bits
         output_shape = packed_bytearray.shape[:-1] + (n_target_elems,)
     # handle no-packing cases (if fast_mode) via casting to save on compute
-    out_is_byte = target_bits in [8, 16]
+    out_is_byte = target_bits in [8, 16] and dtype.is_integer()
     double_reverse = reverse_inner and reverse_endian
     if out_is_byte and double_reverse and fast_mode:
-        no_unpad = np.prod(packed_bytearray.shape) == np.prod(output_shape)
+        no_unpad = np.prod(packed_bytearray.shape) * 8 == np.prod(output_shape) * target_bits
         if no_unpad:
-            as_np_type = packed_bytearray.view(dtype.to_numpy_dt())
-            return as_np_type.reshape(output_shape).astype(np.float32)
+            as_np_type = np.ascontiguousarray(packed_bytearray).view(dtype.to_numpy_dt())
+            if out is None:
+                return as_np_type.reshape(output_shape).astype(np.float32)
+            np.copyto(out, as_np_type.reshape(out.shape), casting="unsafe")
+            return out
     if reverse_endian:
         packed_bytearray = np.flip(packed_bytearray, axis=-1)
-    # convert innermost dim of byte array to hex strings
-    packed_hexstring = np.apply_along_axis(npbytearray2hexstring, packed_dim, packed_bytearray)
-    ret = unpack_innermost_dim_from_hex_string(
-        packed_hexstring, dtype, output_shape, packed_bits, reverse_inner
+    return unpack_innermost_dim_from_bytes(
+        packed_bytearray, dtype, output_shape, reverse_inner=reverse_inner, out=out
     )
-
-    return ret
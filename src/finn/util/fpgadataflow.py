@@ -26,8 +26,11 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
 from qonnx.util.basic import get_by_name, is_finn_op
 
+from finn.util.cache import hash_items
+
 
 def is_fpgadataflow_node(node):
     """Returns True if given node is fpgadataflow node. Otherwise False."""
@@ -69,3 +72,24 @@ def is_rtl_node(node):
                     is_node = True
 
     return is_node
+
+
+def hash_generated_code(code_gen_dir, node_name=None, exclude_exts=()):
+    """Return a digest of the files directly inside the given code generation
+    directory, skipping files ending in one of exclude_exts. The directory
+    path itself is masked out of the file contents since it differs between
+    builds. If node_name is given, it is masked out of the file names and
+    contents as well, so that code generated for identically configured
+    nodes yields the same digest."""
+    items = []
+    for fname in sorted(os.listdir(code_gen_dir)):
+        fpath = os.path.join(code_gen_dir, fname)
+        if not os.path.isfile(fpath) or fname.endswith(tuple(exclude_exts)):
+            continue
+        with open(fpath, "rb") as f:
+            contents = f.read().replace(code_gen_dir.encode(), b"$CODEGENDIR$")
+        if node_name is not None:
+            fname = fname.replace(node_name, "$NODENAME$")
+            contents = contents.replace(node_name.encode(), b"$NODENAME$")
+        items += [fname, contents]
+    return hash_items(items)
@@ -29,8 +29,10 @@
 
 import os
 import subprocess
+from functools import lru_cache
 
-from finn.util.basic import which
+from finn.util.basic import get_ip_cache_dir, get_ip_cache_max_size_mb, which
+from finn.util.cache import BuildCache, hash_file, hash_items
 
 
 class CallHLS:
@@ -67,3 +69,30 @@ class CallHLS:
         bash_command = ["bash", self.ipgen_script]
         process_compile = subprocess.Popen(bash_command, stdout=subprocess.PIPE)
         process_compile.communicate()
+
+
+def get_ip_cache():
+    """Return the BuildCache instance used for synthesized HLS IP, or None if
+    caching has been disabled. See get_ip_cache_dir()."""
+    cache_dir = get_ip_cache_dir()
+    if cache_dir is None:
+        return None
+    return BuildCache(cache_dir, max_size_mb=get_ip_cache_max_size_mb(), name="HLS IP cache")
+
+
+@lru_cache(maxsize=None)
+def get_hls_env_digest():
+    """Return a digest of everything outside the generated code that affects
+    the result of HLS synthesis: the vitis_hls installation as well as the
+    finn-hlslib and custom HLS headers."""
+    vitis_hls = which("vitis_hls")
+    items = [os.path.realpath(vitis_hls) if vitis_hls is not None else ""]
+    finn_root = os.environ.get("FINN_ROOT", "")
+    for lib_dir in [finn_root + "/deps/finn-hlslib", finn_root + "/custom_hls"]:
+        for dname, dirs, files in os.walk(lib_dir):
+            dirs[:] = sorted([x for x in dirs if not x.startswith(".")])
+            for fname in sorted(files):
+                if fname.endswith((".h", ".hpp")):
+                    fpath = os.path.join(dname, fname)
+                    items.append(os.path.relpath(fpath, lib_dir) + ":" + hash_file(fpath))
+    return hash_items(items)
@@ -0,0 +1,125 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+from collections import OrderedDict
+from numpy.lib.stride_tricks import sliding_window_view
+
+# arrays derived from node parameters (weights, thresholds) by the python execution
+# of HW layers, keyed by the id of the parameter array and the kind of derivation.
+# the parameter array itself is stored alongside the derived value, so that the
+# id of an array that has been freed in the meantime can not produce a false hit.
+_derived_cache = OrderedDict()
+_derived_cache_size = 64
+
+
+def get_derived(arr, kind, fxn):
+    """Returns fxn(arr), reusing the result of a previous call with the same
+    array object and kind (which must capture any other inputs of fxn). Arrays
+    in the execution context are not modified in-place during execution, so this
+    avoids re-deriving e.g. the sparse VVAU weights for every sample or chunk of
+    a batched/pipelined execution."""
+    key = (id(arr), kind)
+    entry = _derived_cache.get(key)
+    if entry is not None and entry[0] is arr:
+        _derived_cache.move_to_end(key)
+        return entry[1]
+    ret = fxn(arr)
+    _derived_cache[key] = (arr, ret)
+    if len(_derived_cache) > _derived_cache_size:
+        _derived_cache.popitem(last=False)
+    return ret
+
+
+def clear_derived_cache():
+    """Drops all cached derived arrays."""
+    _derived_cache.clear()
+
+
+def thresholds_sorted(thresholds):
+    """Returns True if the thresholds of each channel (row) are in ascending
+    order. NaN thresholds are never considered sorted."""
+    return bool(np.all(np.diff(thresholds, axis=1) >= 0))
+
+
+def multithreshold(v, thresholds, out_scale=None, out_bias=None):
+    """Vectorized drop-in replacement for the multithreshold function of QONNX,
+    which produces bit-exact results. The inputs are expected in the shape
+    (N, C, ...) and the thresholds in the shape (C, B) or (1, B), the output is
+    the number of thresholds each input is greater than or equal to, scaled by
+    out_scale and biased by out_bias.
+
+    Thresholds in ascending order (as generated by FINN) are looked up with a
+    binary search (np.searchsorted) per channel, otherwise each threshold is
+    compared against all inputs of its channel at once."""
+    is_global_threshold = thresholds.shape[0] == 1
+    assert (v.shape[1] == thresholds.shape[0]) or is_global_threshold, "Threshold shape incorrect"
+    num_channel = v.shape[1]
+    num_act = thresholds.shape[1]
+    vr = v.reshape((v.shape[0], v.shape[1], -1))
+    # same output dtype as QONNX, which accumulates into np.zeros_like(v)
+    ret = np.zeros_like(vr)
+    # for few thresholds, a comparison pass per threshold is cheaper than a
+    # binary search per channel
+    if num_act > 4 and get_derived(thresholds, "sorted", thresholds_sorted):
+        if is_global_threshold:
+            ret[...] = np.searchsorted(thresholds[0], vr, side="right")
+        else:
+            for t in range(num_channel):
+                ret[:, t] = np.searchsorted(thresholds[t], vr[:, t], side="right")
+        if np.issubdtype(vr.dtype, np.floating):
+            # NaN compares false against all thresholds
+            ret[np.isnan(vr)] = 0
+    else:
+        for a in range(num_act):
+            ret += vr >= thresholds[:, a].reshape((1, -1, 1))
+
+    if out_scale is None:
+        out_scale = 1.0
+    if out_bias is None:
+        out_bias = 0.0
+    return out_scale * ret.reshape(v.shape) + out_bias
+
+
+def im2col_nhwc(x, kernel, stride, dilation):
+    """Sliding window generation equivalent to the QONNX Im2Col op without
+    padding. Takes an input of shape (N, H, W, C) and returns an output of shape
+    (N, OH, OW, KH * KW * C), where the innermost dimension of each window is
+    ordered (KH, KW, C). The windows are read from a strided view of the input,
+    so the only copy made is the output itself."""
+    k_h, k_w = kernel
+    s_h, s_w = stride
+    d_h, d_w = dilation
+    n, h, w, c = x.shape
+    # view of shape (N, H', W', C, dilated KH, dilated KW)
+    windows = sliding_window_view(x, ((k_h - 1) * d_h + 1, (k_w - 1) * d_w + 1), axis=(1, 2))
+    windows = windows[:, ::s_h, ::s_w, :, ::d_h, ::d_w]
+    (_, out_dim_h, out_dim_w) = windows.shape[:3]
+    # (N, OH, OW, C, KH, KW) -> (N, OH, OW, KH, KW, C)
+    windows = windows.transpose(0, 1, 2, 4, 5, 3)
+    return windows.reshape(n, out_dim_h, out_dim_w, k_h * k_w * c)
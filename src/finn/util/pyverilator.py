@@ -26,17 +26,25 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import ctypes
 import numpy as np
 import os
 import shutil
+import subprocess
+from functools import lru_cache
 from pyverilator import PyVerilator
 from qonnx.custom_op.registry import getCustomOp
 
 from finn.util.basic import (
     get_rtlsim_trace_depth,
+    get_verilator_cache_dir,
+    get_verilator_cache_max_size_mb,
     launch_process_helper,
     make_build_dir,
 )
+from finn.util.cache import BuildCache, hash_file, hash_items
+
+single_source_file_marker = "//Added from "
 
 
 def make_single_source_file(filtered_verilog_files, target_file):
@@ -48,7 +56,7 @@ def make_single_source_file(filtered_verilog_files, target_file):
     with open(target_file, "w") as wf:
         for vfile in filtered_verilog_files:
             with open(vfile) as rf:
-                wf.write("//Added from " + vfile + "\n\n")
+                wf.write(single_source_file_marker + vfile + "\n\n")
                 lines = rf.read()
                 for line in lines.split("\n"):
                     # break down too-long lines, Verilator complains otherwise
@@ -121,6 +129,50 @@ def prepare_stitched_ip_for_verilator(model):
     return vivado_stitch_proj_dir
 
 
+@lru_cache(maxsize=None)
+def get_verilator_version():
+    "Return the version string reported by the verilator executable."
+    which_verilator = shutil.which("verilator")
+    if which_verilator is None:
+        raise Exception("'verilator' executable not found")
+    return subprocess.check_output(["perl", which_verilator, "--version"]).decode().strip()
+
+
+def get_verilator_cache():
+    """Return the BuildCache instance used for compiled Verilator models, or
+    None if caching has been disabled. See get_verilator_cache_dir()."""
+    cache_dir = get_verilator_cache_dir()
+    if cache_dir is None:
+        return None
+    return BuildCache(
+        cache_dir, max_size_mb=get_verilator_cache_max_size_mb(), name="Verilator cache"
+    )
+
+
+def verilator_cache_key(vivado_stitch_proj_dir, top_module_file_name, extra_sources, args):
+    """Compute a content-addressed key for a Verilator model built from the
+    prepared stitched IP in vivado_stitch_proj_dir. The key covers the
+    contents of the single source file produced by make_single_source_file
+    (independent of the order and paths of the original files), the Verilog
+    headers, any extra source files, the Verilator version and the given list
+    of arguments (compiler flags, trace depth, generated C++ driver etc.)"""
+    digests = []
+    # hash each of the concatenated source files separately, so that the
+    # key does not depend on the (unordered) file listing or where the files
+    # happened to be generated
+    with open(vivado_stitch_proj_dir + "/" + top_module_file_name, "r") as f:
+        segments = f.read().split(single_source_file_marker)
+    for segment in segments[1:]:
+        # drop the path line, keep only the file contents
+        digests.append(hash_items([segment.split("\n", 1)[-1]]))
+    verilog_header_dir = vivado_stitch_proj_dir + "/pyverilator_vh"
+    for vh_file in sorted(os.listdir(verilog_header_dir)):
+        digests.append(vh_file + ":" + hash_file(verilog_header_dir + "/" + vh_file))
+    for src_file in extra_sources:
+        digests.append(os.path.basename(src_file) + ":" + hash_file(src_file))
+    return hash_items(sorted(digests) + [get_verilator_version()] + [str(x) for x in args])
+
+
 def verilator_fifosim(model, n_inputs, max_iters=100000000):
     """Create a Verilator model of stitched IP and use a simple C++
     driver to drive the input stream. Useful for FIFO sizing, latency
@@ -237,8 +289,30 @@ def verilator_fifosim(model, n_inputs, max_iters=100000000):
         f.write(" ".join(verilator_args) + "\n")
         f.write(" ".join(make_args) + "\n")
 
-    launch_process_helper(verilator_args, cwd=build_dir)
-    launch_process_helper(make_args, proc_env=proc_env, cwd=build_dir)
+    # reuse a previously compiled simulation executable if possible
+    cache = get_verilator_cache()
+    if cache is not None:
+        cache_key = verilator_cache_key(
+            vivado_stitch_proj_dir,
+            "finn_design_wrapper.v",
+            [swg_pkg, xpm_memory, xpm_cdc, xpm_fifo],
+            ["verilator_fifosim", fifosim_cpp_template, gcc_args]
+            # leave out absolute paths that differ between builds
+            + [
+                x
+                for x in verilator_args
+                if x not in [which_verilator, build_dir, vivado_stitch_proj_dir, verilog_header_dir]
+            ],
+        )
+    if cache is None or not cache.lookup(cache_key, build_dir):
+        launch_process_helper(verilator_args, cwd=build_dir)
+        launch_process_helper(make_args, proc_env=proc_env, cwd=build_dir)
+        if cache is not None:
+            cache.insert(
+                cache_key,
+                [build_dir + "/Vfinn_design_wrapper"],
+                description="verilator_fifosim " + vivado_stitch_proj_dir,
+            )
 
     sim_launch_args = ["./Vfinn_design_wrapper"]
     launch_process_helper(sim_launch_args, cwd=build_dir)
@@ -252,6 +326,248 @@ def verilator_fifosim(model, n_inputs, max_iters=100000000):
     return ret_dict
 
 
+@lru_cache(maxsize=None)
+def get_rtlsim_characterize_lib():
+    """Compile the C++ driver used by rtlsim_characterize and return it as a
+    ctypes library. Compilation happens only once per process, so this should
+    be called before forking worker processes."""
+    src_fname = os.environ["FINN_ROOT"] + "/src/finn/qnn-data/cpp/rtlsim_characterize.cpp"
+    build_dir = make_build_dir("rtlsim_characterize_")
+    so_fname = build_dir + "/rtlsim_characterize.so"
+    compile_args = ["g++", "-O3", "-std=c++11", "-shared", "-fPIC", src_fname, "-o", so_fname]
+    launch_process_helper(compile_args, cwd=build_dir)
+    if not os.path.isfile(so_fname):
+        raise Exception("Failed to compile %s" % src_fname)
+    lib = ctypes.CDLL(so_fname)
+    ptr = ctypes.c_void_p
+    lib.characterize.restype = ctypes.c_int64
+    lib.characterize.argtypes = [
+        # top, eval, set_clk, set_rst_n
+        ptr,
+        ptr,
+        ptr,
+        ptr,
+        # n_in, in_set_valid, in_get_ready, in_txns
+        ctypes.c_uint32,
+        ptr,
+        ptr,
+        ptr,
+        # n_out, out_set_ready, out_get_valid
+        ctypes.c_uint32,
+        ptr,
+        ptr,
+        # n_out_txns, max_cycles, reset_cycles, counts_in, counts_out
+        ctypes.c_uint64,
+        ctypes.c_uint64,
+        ctypes.c_uint32,
+        ptr,
+        ptr,
+    ]
+    return lib
+
+
+def rtlsim_characterize(
+    rtlsim_so, in_txns, out_streams, n_out_txns, max_cycles, sname="_V_", reset_cycles=16
+):
+    """Simulate the node emulation library rtlsim_so with the C++ driver from
+    get_rtlsim_characterize_lib and record the cumulative number of transactions
+    on each stream in every cycle. The input streams are kept valid while the
+    number of transactions given in in_txns (a dict of stream name to
+    transaction count) has not been reached, the output streams (a list of
+    stream names) are always ready. The simulation ends once n_out_txns output
+    transactions were observed over all output streams.
+
+    The library is copied to a private location before loading, so that each
+    call works on an isolated instance of the Verilator model (e.g. when
+    several nodes sharing the same library are characterized in parallel).
+
+    Returns (n_cycles, counts_in, counts_out) where counts_in/counts_out are
+    arrays of shape (n_streams, max_cycles) in the order of in_txns/out_streams,
+    holding their final values past n_cycles. Raises an Exception if the
+    simulation did not finish within max_cycles."""
+    driver = get_rtlsim_characterize_lib()
+    in_streams = list(in_txns.keys())
+    counts_in = np.zeros((len(in_streams), max_cycles), dtype=np.uint32)
+    counts_out = np.zeros((len(out_streams), max_cycles), dtype=np.uint32)
+    sim_dir = make_build_dir("rtlsim_characterize_")
+    sim_so = sim_dir + "/" + os.path.basename(rtlsim_so)
+    shutil.copy(rtlsim_so, sim_so)
+    try:
+        sim = PyVerilator(sim_so, auto_eval=False)
+
+        def fxn(name):
+            return ctypes.cast(getattr(sim.lib, name), ctypes.c_void_p)
+
+        def fxn_array(names):
+            return (ctypes.c_void_p * len(names))(*[fxn(x).value for x in names])
+
+        in_txns_arr = np.asarray([in_txns[x] for x in in_streams], dtype=np.uint64)
+        n_cycles = driver.characterize(
+            ctypes.c_void_p(sim.model),
+            fxn("eval"),
+            fxn("set_ap_clk"),
+            fxn("set_ap_rst_n"),
+            len(in_streams),
+            fxn_array(["set_" + x + sname + "TVALID" for x in in_streams]),
+            fxn_array(["get_" + x + sname + "TREADY" for x in in_streams]),
+            in_txns_arr.ctypes.data_as(ctypes.c_void_p),
+            len(out_streams),
+            fxn_array(["set_" + x + sname + "TREADY" for x in out_streams]),
+            fxn_array(["get_" + x + sname + "TVALID" for x in out_streams]),
+            int(n_out_txns),
+            int(max_cycles),
+            reset_cycles,
+            counts_in.ctypes.data_as(ctypes.c_void_p),
+            counts_out.ctypes.data_as(ctypes.c_void_p),
+        )
+    finally:
+        shutil.rmtree(sim_dir, ignore_errors=True)
+    if n_cycles < 0:
+        raise Exception(
+            "rtlsim of %s did not produce %d outputs within %d cycles"
+            % (rtlsim_so, n_out_txns, max_cycles)
+        )
+    return (n_cycles, counts_in, counts_out)
+
+
+class RtlsimStream(ctypes.Structure):
+    "stream_t of the C++ driver used by rtlsim_stream."
+    _fields_ = [
+        ("handshake_set", ctypes.c_void_p),
+        ("handshake_get", ctypes.c_void_p),
+        ("data", ctypes.c_void_p),
+        ("width", ctypes.c_uint32),
+        ("n_words", ctypes.c_uint32),
+        ("n_txns", ctypes.c_uint64),
+        ("buf", ctypes.c_void_p),
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_rtlsim_stream_lib():
+    """Compile the C++ driver used by rtlsim_stream and return it as a ctypes
+    library. Compilation happens only once per process."""
+    src_fname = os.environ["FINN_ROOT"] + "/src/finn/qnn-data/cpp/rtlsim_stream.cpp"
+    build_dir = make_build_dir("rtlsim_stream_")
+    so_fname = build_dir + "/rtlsim_stream.so"
+    compile_args = ["g++", "-O3", "-std=c++11", "-shared", "-fPIC", src_fname, "-o", so_fname]
+    launch_process_helper(compile_args, cwd=build_dir)
+    if not os.path.isfile(so_fname):
+        raise Exception("Failed to compile %s" % src_fname)
+    lib = ctypes.CDLL(so_fname)
+    ptr = ctypes.c_void_p
+    stream_ptr = ctypes.POINTER(RtlsimStream)
+    lib.rtlsim_stream.restype = ctypes.c_int64
+    lib.rtlsim_stream.argtypes = [
+        # top, eval, set_clk
+        ptr,
+        ptr,
+        ptr,
+        # n_in, in, n_out, out
+        ctypes.c_uint32,
+        stream_ptr,
+        ctypes.c_uint32,
+        stream_ptr,
+        # n_out_txns, liveness_threshold, out_counts
+        ctypes.c_uint64,
+        ctypes.c_uint64,
+        ptr,
+    ]
+    return lib
+
+
+def ints_to_words(values, width):
+    """Convert a list of non-negative integers of up to width bits (e.g. from
+    npy_to_rtlsim_input) into a uint32 ndarray of shape (len(values), n_words),
+    least significant word first."""
+    n_words = (width + 31) // 32
+    if n_words <= 2:
+        words = np.asarray(values, dtype=np.uint64).reshape(-1, 1).view(np.uint32)
+        return np.ascontiguousarray(words[:, :n_words])
+    mask = (1 << 32) - 1
+    words = [(x >> (32 * k)) & mask for x in values for k in range(n_words)]
+    return np.asarray(words, dtype=np.uint32).reshape(-1, n_words)
+
+
+def words_to_ints(words):
+    "Inverse of ints_to_words, returns a list of integers."
+    if words.shape[1] == 1:
+        return words[:, 0].tolist()
+    if words.shape[1] == 2:
+        return np.ascontiguousarray(words).view(np.uint64)[:, 0].tolist()
+    return [sum([int(x) << (32 * k) for k, x in enumerate(row)]) for row in words.tolist()]
+
+
+def rtlsim_stream(sim, in_streams, out_streams, n_out_txns, liveness_threshold, sname="_V_"):
+    """Drive the AXI stream handshakes of the given PyVerilator sim object (of a
+    single node, after reset) with the C++ driver from get_rtlsim_stream_lib
+    until n_out_txns output transactions were observed over all output
+    streams, with the same cycle behavior as pyverilator's rtlsim_multi_io.
+
+    in_streams is a dict of stream name to (width, words), where words is a
+    uint32 ndarray of shape (n_txns, n_words) as from ints_to_words, and
+    out_streams a dict of stream name to width, with TDATA widths in bits.
+
+    Returns (n_cycles, outputs) with outputs a dict of stream name to a uint32
+    ndarray of shape (n_txns, n_words). Raises an Exception if no output was
+    produced for liveness_threshold consecutive cycles."""
+    driver = get_rtlsim_stream_lib()
+
+    def fxn(name):
+        return ctypes.cast(getattr(sim.lib, name), ctypes.c_void_p).value
+
+    # keep the buffers referenced by the stream descriptors alive
+    in_bufs = [np.ascontiguousarray(x[1], dtype=np.uint32) for x in in_streams.values()]
+    out_bufs = [
+        np.zeros((n_out_txns, (x + 31) // 32), dtype=np.uint32) for x in out_streams.values()
+    ]
+    in_desc = (RtlsimStream * max(1, len(in_streams)))()
+    for i, (name, (width, words)) in enumerate(in_streams.items()):
+        in_desc[i] = RtlsimStream(
+            fxn("set_" + name + sname + "TVALID"),
+            fxn("get_" + name + sname + "TREADY"),
+            fxn("set_" + name + sname + "TDATA"),
+            width,
+            (width + 31) // 32,
+            in_bufs[i].shape[0],
+            in_bufs[i].ctypes.data,
+        )
+    out_desc = (RtlsimStream * max(1, len(out_streams)))()
+    for o, (name, width) in enumerate(out_streams.items()):
+        out_desc[o] = RtlsimStream(
+            fxn("set_" + name + sname + "TREADY"),
+            fxn("get_" + name + sname + "TVALID"),
+            fxn("get_" + name + sname + "TDATA"),
+            width,
+            (width + 31) // 32,
+            n_out_txns,
+            out_bufs[o].ctypes.data,
+        )
+    out_counts = np.zeros(max(1, len(out_streams)), dtype=np.uint64)
+    n_cycles = driver.rtlsim_stream(
+        ctypes.c_void_p(sim.model),
+        fxn("eval"),
+        fxn("set_ap_clk"),
+        len(in_streams),
+        in_desc,
+        len(out_streams),
+        out_desc,
+        int(n_out_txns),
+        int(liveness_threshold),
+        out_counts.ctypes.data_as(ctypes.c_void_p),
+    )
+    if n_cycles < 0:
+        raise Exception(
+            "Error in simulation! Takes too long to produce output. "
+            "Consider setting the LIVENESS_THRESHOLD env.var. to a "
+            "larger value."
+        )
+    outputs = {}
+    for o, name in enumerate(out_streams.keys()):
+        outputs[name] = out_bufs[o][: min(int(out_counts[o]), n_out_txns)]
+    return (n_cycles, outputs)
+
+
 def pyverilate_stitched_ip(
     model,
     read_internal_signals=True,
@@ -308,14 +624,37 @@ def pyverilate_stitched_ip(
 
     swg_pkg = os.environ["FINN_ROOT"] + "/finn-rtllib/swg/swg_pkg.sv"
 
+    trace_depth = get_rtlsim_trace_depth()
+    verilator_args += extra_verilator_args
+
+    # reuse a previously compiled model if possible
+    cache = get_verilator_cache()
+    if cache is not None:
+        cache_key = verilator_cache_key(
+            vivado_stitch_proj_dir,
+            top_module_file_name,
+            [swg_pkg, xpm_memory, xpm_cdc, xpm_fifo],
+            ["pyverilate_stitched_ip", top_module_name, trace_depth, read_internal_signals]
+            + verilator_args,
+        )
+        if cache.lookup(cache_key, build_dir):
+            so_file = build_dir + "/" + os.listdir(build_dir)[0]
+            return PyVerilator(so_file, auto_eval=False)
+
     sim = PyVerilator.build(
         [swg_pkg, top_module_file_name, xpm_fifo, xpm_memory, xpm_cdc],
         verilog_path=[vivado_stitch_proj_dir, verilog_header_dir],
         build_dir=build_dir,
-        trace_depth=get_rtlsim_trace_depth(),
+        trace_depth=trace_depth,
         top_module_name=top_module_name,
         auto_eval=False,
         read_internal_signals=read_internal_signals,
-        extra_args=verilator_args + extra_verilator_args,
+        extra_args=verilator_args,
     )
+    if cache is not None:
+        cache.insert(
+            cache_key,
+            [sim.lib._name],
+            description="pyverilate_stitched_ip " + vivado_stitch_proj_dir,
+        )
     return sim
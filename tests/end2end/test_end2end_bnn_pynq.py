@@ -64,6 +64,7 @@ from shutil import copy
 import finn.transformation.fpgadataflow.convert_to_hw_layers as to_hw
 import finn.transformation.streamline.absorb as absorb
 from finn.analysis.fpgadataflow.dataflow_performance import dataflow_performance
+from finn.analysis.fpgadataflow.dataflow_simulation import dataflow_simulation
 from finn.core.onnx_exec import execute_onnx
 from finn.core.throughput_test import throughput_test_rtlsim
 from finn.transformation.fpgadataflow.annotate_cycles import AnnotateCycles
@@ -759,7 +760,7 @@ class TestEnd2End:
 
     @pytest.mark.slow
     @pytest.mark.vivado
-    def test_throughput_rtlsim(self, topology, wbits, abits, board):
+    def test_throughput_rtlsim(self, topology, wbits, abits, board, record_property):
         prev_chkpt_name = get_checkpoint_name(topology, wbits, abits, "ipstitch_rtlsim_" + board)
         model = load_test_checkpoint_or_skip(prev_chkpt_name)
         n_nodes = len(model.graph.node)
@@ -772,6 +773,18 @@ class TestEnd2End:
         res_cycles = ret["cycles"]
         est_cycles = latency + cycles_per_sample_est * batchsize
         assert (abs(res_cycles - est_cycles) / res_cycles) < 0.15
+        # compare the dataflow simulation against the rtlsim measurements, taken
+        # as in step_measure_rtlsim_performance, and record both in the test
+        # report until tolerances are established on these networks
+        sim_b1 = dataflow_simulation(model, n_frames=1)
+        sim = dataflow_simulation(model, n_frames=batchsize)
+        assert sim["converged"]
+        record_property("rtlsim_cycles", res_cycles)
+        record_property("dataflow_simulation_cycles", sim["cycles"])
+        record_property("cycles_rel_error", abs(res_cycles - sim["cycles"]) / res_cycles)
+        record_property("rtlsim_latency_cycles", latency)
+        record_property("dataflow_simulation_latency_cycles", sim_b1["latency_cycles"])
+        record_property("latency_rel_error", abs(latency - sim_b1["latency_cycles"]) / latency)
 
     @pytest.mark.slow
     @pytest.mark.vivado
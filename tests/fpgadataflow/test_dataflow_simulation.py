@@ -0,0 +1,120 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+from functools import partial
+from qonnx.core.datatype import DataType
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.general import GiveUniqueNodeNames
+
+from finn.analysis.fpgadataflow.dataflow_performance import dataflow_performance
+from finn.analysis.fpgadataflow.dataflow_simulation import dataflow_simulation
+from finn.transformation.fpgadataflow.annotate_cycles import AnnotateCycles
+from finn.transformation.fpgadataflow.insert_dwc import InsertDWC
+from finn.transformation.fpgadataflow.insert_fifo import InsertFIFO
+from finn.transformation.fpgadataflow.specialize_layers import SpecializeLayers
+from finn.util.create import hls_random_mlp_maker
+
+test_fpga_part = "xczu3eg-sbva484-1-e"
+
+
+def make_mlp(foldings):
+    layer_spec = []
+    for simd, pe in foldings:
+        layer_spec.append(
+            {
+                "mw": 64,
+                "mh": 64,
+                "simd": simd,
+                "pe": pe,
+                "idt": DataType["INT4"],
+                "wdt": DataType["INT4"],
+                "act": DataType["INT4"],
+            }
+        )
+    model = hls_random_mlp_maker(layer_spec)
+    model = model.transform(SpecializeLayers(test_fpga_part))
+    model = model.transform(InsertDWC())
+    model = model.transform(SpecializeLayers(test_fpga_part))
+    model = model.transform(GiveUniqueNodeNames())
+    model = model.transform(AnnotateCycles())
+    return model
+
+
+@pytest.mark.fpgadataflow
+@pytest.mark.parametrize("n_frames", [1, 8])
+def test_dataflow_simulation_mlp(n_frames):
+    # second layer is the bottleneck
+    model = make_mlp([(8, 8), (2, 2), (16, 16), (4, 4)])
+    perf = model.analysis(dataflow_performance)
+    ret = model.analysis(partial(dataflow_simulation, n_frames=n_frames, clk_ns=5))
+    assert ret["converged"]
+    assert ret["N"] == n_frames
+    # each layer needs a complete input vector, so the latency is bounded by
+    # the pessimistic critical path but not much lower
+    assert ret["latency_cycles"] <= perf["critical_path_cycles"]
+    assert ret["latency_cycles"] >= perf["max_cycles"]
+    assert ret["latency[s]"] == pytest.approx(ret["latency_cycles"] * 5e-9)
+    bottleneck = perf["max_cycles_node_name"]
+    assert ret["bottleneck_node"] == bottleneck
+    if n_frames > 1:
+        # steady state is limited by the slowest node
+        assert ret["stable_cycles_per_frame"] == pytest.approx(perf["max_cycles"])
+        assert ret["cycles"] == pytest.approx(
+            ret["latency_cycles"] + (n_frames - 1) * perf["max_cycles"]
+        )
+        stats = ret["node_stats"]
+        # upstream of the bottleneck is blocked by backpressure,
+        # downstream waits for data
+        assert stats["MVAU_hls_0"]["stall_ratio"] > 0
+        assert stats["MVAU_hls_0"]["starve_ratio"] == 0
+        assert stats["MVAU_hls_3"]["stall_ratio"] == 0
+        assert stats["MVAU_hls_3"]["starve_ratio"] > 0
+        assert stats[bottleneck]["stall_ratio"] == 0
+
+
+@pytest.mark.fpgadataflow
+def test_dataflow_simulation_fifo_depth():
+    model = make_mlp([(8, 8), (2, 2)])
+    model = model.transform(InsertFIFO(create_shallow_fifos=True))
+    model = model.transform(SpecializeLayers(test_fpga_part))
+    model = model.transform(GiveUniqueNodeNames())
+    ret_shallow = model.analysis(partial(dataflow_simulation, n_frames=16, clk_ns=5))
+    # a FIFO deep enough to hold a full frame in front of the slow layer
+    # decouples the first layer from it
+    for node in model.get_nodes_by_op_type("StreamingFIFO_rtl"):
+        getCustomOp(node).set_nodeattr("depth", 256)
+    ret_deep = model.analysis(partial(dataflow_simulation, n_frames=16, clk_ns=5))
+    assert ret_shallow["converged"] and ret_deep["converged"]
+    stall_shallow = ret_shallow["node_stats"]["MVAU_hls_0"]["stall[s]"]
+    stall_deep = ret_deep["node_stats"]["MVAU_hls_0"]["stall[s]"]
+    assert stall_deep < stall_shallow
+    assert ret_deep["stable_cycles_per_frame"] == pytest.approx(
+        ret_shallow["stable_cycles_per_frame"]
+    )
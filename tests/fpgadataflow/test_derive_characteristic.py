@@ -0,0 +1,251 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import ctypes
+import json
+import numpy as np
+import subprocess
+from qonnx.core.datatype import DataType
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.general import GiveUniqueNodeNames
+
+from finn.custom_op.fpgadataflow.hwcustomop import accumulate_char_fxn
+from finn.transformation.fpgadataflow.derive_characteristic import (
+    DeriveFIFOSizes,
+    solve_fifo_depth,
+)
+from finn.transformation.fpgadataflow.specialize_layers import SpecializeLayers
+from finn.util.create import hls_random_mlp_maker
+from finn.util.pyverilator import get_rtlsim_characterize_lib
+
+test_fpga_part = "xczu3eg-sbva484-1-e"
+
+# minimal stand-in for a PyVerilator emulation library: a single register
+# slice, which accepts a new input whenever it is empty
+toy_model_cpp = """
+#include <cstdint>
+struct toy { uint32_t clk, rst_n, in_valid, out_ready, full; };
+extern "C" {
+void* construct() { return new toy{0, 1, 0, 0, 0}; }
+int eval(toy* t) { return 0; }
+int set_ap_clk(toy* t, uint32_t v) {
+    if (v == 1 && t->clk == 0) {
+        if (t->rst_n == 0) {
+            t->full = 0;
+        } else if (t->full) {
+            t->full = t->out_ready ? 0 : 1;
+        } else {
+            t->full = t->in_valid;
+        }
+    }
+    t->clk = v;
+    return 0;
+}
+int set_ap_rst_n(toy* t, uint32_t v) { t->rst_n = v; return 0; }
+int set_in0_V_TVALID(toy* t, uint32_t v) { t->in_valid = v; return 0; }
+uint32_t get_in0_V_TREADY(toy* t) { return t->full ? 0 : 1; }
+int set_out_V_TREADY(toy* t, uint32_t v) { t->out_ready = v; return 0; }
+uint32_t get_out_V_TVALID(toy* t) { return t->full; }
+}
+"""
+
+
+def accumulate_char_fxn_reference(chrc):
+    p = len(chrc)
+    ret = []
+    for t in range(2 * p):
+        if t == 0:
+            ret.append(chrc[0])
+        else:
+            ret.append(ret[-1] + chrc[t % p])
+    return np.asarray(ret, dtype=np.int32)
+
+
+def solve_fifo_depth_reference(prod_chrc, cons_chrc, period):
+    pshift_min = period - 1
+    for pshift_cand in range(period):
+        prod_chrc_part = prod_chrc[pshift_cand:period]
+        cons_chrc_part = cons_chrc[: period - pshift_cand]
+        if (prod_chrc_part >= cons_chrc_part).all():
+            pshift_min = pshift_cand
+            break
+    prod_chrc_part = prod_chrc[pshift_min : (pshift_min + period)]
+    cons_chrc_part = cons_chrc[:period]
+    fifo_depth = int((prod_chrc_part - cons_chrc_part).max())
+    return (fifo_depth, pshift_min)
+
+
+def random_chrc(period, n_txns, burst):
+    # n_txns transactions in bursts of the given length at random times
+    txns = np.zeros(period, dtype=np.int32)
+    n_bursts = n_txns // burst
+    starts = np.sort(np.random.choice(period // burst, n_bursts, replace=False)) * burst
+    for start in starts:
+        txns[start : start + burst] = 1
+    return accumulate_char_fxn(txns)
+
+
+@pytest.mark.fpgadataflow
+def test_accumulate_char_fxn():
+    chrc = np.random.randint(0, 2, size=(3, 50))
+    ret = accumulate_char_fxn(chrc)
+    assert ret.shape == (3, 100)
+    for i in range(3):
+        assert (ret[i] == accumulate_char_fxn_reference(list(chrc[i]))).all()
+
+
+@pytest.mark.fpgadataflow
+def test_rtlsim_characterize_driver(tmp_path):
+    src = tmp_path / "toy_model.cpp"
+    src.write_text(toy_model_cpp)
+    so = str(tmp_path / "toy_model.so")
+    subprocess.check_call(["g++", "-O2", "-shared", "-fPIC", str(src), "-o", so])
+    toy = ctypes.CDLL(so)
+    toy.construct.restype = ctypes.c_void_p
+    model = toy.construct()
+    driver = get_rtlsim_characterize_lib()
+
+    def fxn(name):
+        return ctypes.cast(getattr(toy, name), ctypes.c_void_p)
+
+    def fxn_array(name):
+        return (ctypes.c_void_p * 1)(fxn(name).value)
+
+    n_txns = 5
+    period = 16
+    in_txns = np.asarray([n_txns], dtype=np.uint64)
+    counts_in = np.zeros((1, period), dtype=np.uint32)
+    counts_out = np.zeros((1, period), dtype=np.uint32)
+    n_cycles = driver.characterize(
+        model,
+        fxn("eval"),
+        fxn("set_ap_clk"),
+        fxn("set_ap_rst_n"),
+        1,
+        fxn_array("set_in0_V_TVALID"),
+        fxn_array("get_in0_V_TREADY"),
+        in_txns.ctypes.data_as(ctypes.c_void_p),
+        1,
+        fxn_array("set_out_V_TREADY"),
+        fxn_array("get_out_V_TVALID"),
+        n_txns,
+        period,
+        4,
+        counts_in.ctypes.data_as(ctypes.c_void_p),
+        counts_out.ctypes.data_as(ctypes.c_void_p),
+    )
+    # the register slice alternates between accepting and emitting
+    assert n_cycles == 2 * n_txns
+    exp_in = np.minimum((np.arange(period) + 2) // 2, n_txns)
+    exp_out = np.minimum((np.arange(period) + 1) // 2, n_txns)
+    assert (counts_in[0] == exp_in).all()
+    assert (counts_out[0] == exp_out).all()
+    # not enough cycles to produce all outputs
+    counts_in[:] = 0
+    counts_out[:] = 0
+    n_cycles = driver.characterize(
+        model,
+        fxn("eval"),
+        fxn("set_ap_clk"),
+        fxn("set_ap_rst_n"),
+        1,
+        fxn_array("set_in0_V_TVALID"),
+        fxn_array("get_in0_V_TREADY"),
+        in_txns.ctypes.data_as(ctypes.c_void_p),
+        1,
+        fxn_array("set_out_V_TREADY"),
+        fxn_array("get_out_V_TVALID"),
+        n_txns,
+        2 * n_txns - 1,
+        4,
+        counts_in.ctypes.data_as(ctypes.c_void_p),
+        counts_out.ctypes.data_as(ctypes.c_void_p),
+    )
+    assert n_cycles == -1
+
+
+@pytest.mark.fpgadataflow
+@pytest.mark.parametrize("burst", [1, 4, 16])
+def test_solve_fifo_depth(burst):
+    period = 256
+    for i in range(20):
+        prod_chrc = random_chrc(period, 64, burst)
+        cons_chrc = random_chrc(period, 64, np.random.choice([1, 4, 16]))
+        ret = solve_fifo_depth(prod_chrc, cons_chrc, period)
+        assert ret == solve_fifo_depth_reference(prod_chrc, cons_chrc, period)
+    # producer that never catches up within the period
+    prod_chrc = accumulate_char_fxn(np.asarray([0] * (period - 1) + [1]))
+    cons_chrc = accumulate_char_fxn(np.asarray([1] + [0] * (period - 1)))
+    ret = solve_fifo_depth(prod_chrc, cons_chrc, period)
+    assert ret == solve_fifo_depth_reference(prod_chrc, cons_chrc, period)
+
+
+@pytest.mark.fpgadataflow
+def test_derive_fifo_sizes(tmp_path):
+    layer_spec = [
+        {
+            "mw": 16,
+            "mh": 16,
+            "simd": 1,
+            "pe": 1,
+            "idt": DataType["INT4"],
+            "wdt": DataType["INT4"],
+            "act": DataType["INT4"],
+        }
+    ] * 3
+    model = hls_random_mlp_maker(layer_spec)
+    model = model.transform(SpecializeLayers(test_fpga_part))
+    model = model.transform(GiveUniqueNodeNames())
+    # attach synthetic characteristics instead of running rtlsim:
+    # every node reads in bursts of 16 and writes bursts of 4
+    period = 128
+    for node in model.graph.node:
+        inst = getCustomOp(node)
+        inst.set_nodeattr("io_chrc_period", period)
+        inst.set_nodeattr("io_chrc_in", random_chrc(period, 32, 16)[np.newaxis])
+        inst.set_nodeattr("io_chrc_out", random_chrc(period, 32, 4)[np.newaxis])
+    report_file = str(tmp_path / "fifo_sizing.json")
+    model = model.transform(DeriveFIFOSizes(io_fifo_depth=8, report_file=report_file))
+    with open(report_file, "r") as f:
+        report = json.load(f)
+    assert [x["producer"] for x in report] == [x.name for x in model.graph.node[:-1]]
+    for x in report:
+        prod = getCustomOp(model.get_node_from_name(x["producer"]))
+        cons = getCustomOp(model.get_node_from_name(x["consumer"]))
+        exp = solve_fifo_depth_reference(
+            prod.get_nodeattr("io_chrc_out")[0], cons.get_nodeattr("io_chrc_in")[0], period
+        )
+        assert (x["depth"], x["phase_shift"]) == exp
+        assert prod.get_nodeattr("outFIFODepths") == [x["depth"]]
+        assert x["solve_time[s]"] >= 0
+    first = getCustomOp(model.graph.node[0])
+    last = getCustomOp(model.graph.node[-1])
+    assert first.get_nodeattr("inFIFODepths") == [8]
+    assert last.get_nodeattr("outFIFODepths") == [8]
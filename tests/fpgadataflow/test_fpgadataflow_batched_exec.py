@@ -0,0 +1,207 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import numpy as np
+from onnx import TensorProto, helper
+from qonnx.core.datatype import DataType
+from qonnx.core.modelwrapper import ModelWrapper
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.infer_datatypes import InferDataTypes
+from qonnx.transformation.infer_shapes import InferShapes
+from qonnx.util.basic import gen_finn_dt_tensor, qonnx_make_model
+from types import SimpleNamespace
+
+import finn.core.onnx_exec as oxe
+import finn.custom_op.fpgadataflow.hwcustomop as hwcustomop
+from finn.transformation.fpgadataflow.set_exec_mode import SetExecMode
+from finn.transformation.fpgadataflow.specialize_layers import SpecializeLayers
+from finn.util.basic import make_build_dir
+
+
+def make_batched_exec_model(ch, pe, idim, idt):
+    # DuplicateStreams followed by a standard ONNX node with an initializer
+    shape = [1, idim, idim, ch]
+    inp = helper.make_tensor_value_info("inp", TensorProto.FLOAT, shape)
+    outp0 = helper.make_tensor_value_info("outp0", TensorProto.FLOAT, shape)
+    outp1 = helper.make_tensor_value_info("outp1", TensorProto.FLOAT, shape)
+    dupl1 = helper.make_tensor_value_info("dupl1", TensorProto.FLOAT, shape)
+    dupstrm_node = helper.make_node(
+        "DuplicateStreams",
+        ["inp"],
+        ["outp0", "dupl1"],
+        domain="finn.custom_op.fpgadataflow",
+        backend="fpgadataflow",
+        NumChannels=ch,
+        NumOutputStreams=2,
+        PE=pe,
+        inputDataType=idt.name,
+        numInputVectors=[1, idim, idim],
+    )
+    add_node = helper.make_node("Add", ["dupl1", "bias"], ["outp1"])
+    graph = helper.make_graph(
+        nodes=[dupstrm_node, add_node],
+        name="graph",
+        inputs=[inp],
+        outputs=[outp0, outp1],
+        value_info=[dupl1],
+    )
+    model = ModelWrapper(qonnx_make_model(graph, producer_name="batched-exec-model"))
+    model.set_tensor_datatype("inp", idt)
+    model.set_initializer("bias", np.arange(ch, dtype=np.float32))
+    model = model.transform(InferShapes())
+    model = model.transform(InferDataTypes())
+    return model
+
+
+@pytest.mark.fpgadataflow
+def test_fpgadataflow_batched_exec():
+    ch, idim, idt, batch_size = 8, 3, DataType["INT4"], 5
+    model = make_batched_exec_model(ch, 2, idim, idt)
+    x = gen_finn_dt_tensor(idt, (batch_size, idim, idim, ch))
+    assert oxe.get_input_batch_size(model, {"inp": x}) == batch_size
+    assert oxe.get_input_batch_size(model, {"inp": x[:1]}) is None
+    with pytest.raises(Exception, match="Shape mismatch"):
+        oxe.get_input_batch_size(model, {"inp": x[:, :2]})
+    y = oxe.execute_onnx(model, {"inp": x})
+    assert (y["outp0"] == x).all()
+    assert (y["outp1"] == x + np.arange(ch)).all()
+
+
+@pytest.mark.fpgadataflow
+def test_fpgadataflow_batched_rtlsim(monkeypatch):
+    ch, idim, idt, batch_size = 8, 3, DataType["INT4"], 4
+    model = make_batched_exec_model(ch, 2, idim, idt)
+    model = model.transform(SpecializeLayers("xc7z020clg400-1"))
+    model = model.transform(SetExecMode("rtlsim"))
+    getCustomOp(model.graph.node[0]).set_nodeattr("code_gen_dir_ipgen", make_build_dir("batched_"))
+    n_in_txns = idim * idim * ch // 2
+    sim_calls = []
+
+    # stands in for the simulation of DuplicateStreams: copies the input to
+    # both outputs with a latency of 10 cycles
+    def fake_rtlsim_stream(sim, in_streams, out_streams, n_out_txns, liveness, sname):
+        words = in_streams["in0"][1]
+        sim_calls.append(words.shape[0])
+        assert n_out_txns == 2 * words.shape[0]
+        return (words.shape[0] + 10, {x: words for x in out_streams.keys()})
+
+    monkeypatch.setattr(hwcustomop, "rtlsim_stream", fake_rtlsim_stream)
+    monkeypatch.setattr(
+        hwcustomop.HWCustomOp, "get_rtlsim", lambda self: SimpleNamespace(io=SimpleNamespace())
+    )
+    x = gen_finn_dt_tensor(idt, (batch_size, idim, idim, ch))
+    y = oxe.execute_onnx(model, {"inp": x})
+    assert (y["outp0"] == x).all()
+    assert (y["outp1"] == x + np.arange(ch)).all()
+    # all samples are streamed through a single simulation
+    assert sim_calls == [batch_size * n_in_txns]
+    cycles = getCustomOp(model.graph.node[0]).get_nodeattr("cycles_rtlsim")
+    assert cycles == batch_size * n_in_txns + 10
+
+
+@pytest.mark.fpgadataflow
+@pytest.mark.parametrize("chunk_size", [1, 2, 8])
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_fpgadataflow_pipelined_exec(chunk_size, num_workers):
+    ch, idim, idt, batch_size = 8, 3, DataType["INT4"], 5
+    model = make_batched_exec_model(ch, 2, idim, idt)
+    x = gen_finn_dt_tensor(idt, (batch_size, idim, idim, ch))
+    y = oxe.execute_onnx_pipelined(model, {"inp": x}, chunk_size, num_workers)
+    assert set(y.keys()) == set(["outp0", "outp1"])
+    assert (y["outp0"] == x).all()
+    assert (y["outp1"] == x + np.arange(ch)).all()
+    ctx = oxe.execute_onnx_pipelined(model, {"inp": x}, chunk_size, num_workers, True)
+    assert (ctx["dupl1"] == x).all()
+    assert (ctx["bias"] == np.arange(ch)).all()
+
+
+def make_side_input_model(ch, pe, idim, idt):
+    # DuplicateStreams followed by an Add with a side input broadcast over the
+    # batch and a Reshape with a computed shape tensor
+    shape = [1, idim, idim, ch]
+    inp = helper.make_tensor_value_info("inp", TensorProto.FLOAT, shape)
+    side = helper.make_tensor_value_info("side", TensorProto.FLOAT, [1, ch])
+    outp0 = helper.make_tensor_value_info("outp0", TensorProto.FLOAT, shape)
+    outp1 = helper.make_tensor_value_info("outp1", TensorProto.FLOAT, [1, idim * idim * ch])
+    dupl0 = helper.make_tensor_value_info("dupl0", TensorProto.FLOAT, shape)
+    dupl1 = helper.make_tensor_value_info("dupl1", TensorProto.FLOAT, shape)
+    dupstrm_node = helper.make_node(
+        "DuplicateStreams",
+        ["inp"],
+        ["dupl0", "dupl1"],
+        domain="finn.custom_op.fpgadataflow",
+        backend="fpgadataflow",
+        NumChannels=ch,
+        NumOutputStreams=2,
+        PE=pe,
+        inputDataType=idt.name,
+        numInputVectors=[1, idim, idim],
+    )
+    shape_node = helper.make_node(
+        "Constant",
+        [],
+        ["shape"],
+        value=helper.make_tensor("shape_value", TensorProto.INT64, [2], [1, -1]),
+    )
+    add_node = helper.make_node("Add", ["dupl0", "side"], ["outp0"])
+    reshape_node = helper.make_node("Reshape", ["dupl1", "shape"], ["outp1"])
+    graph = helper.make_graph(
+        nodes=[dupstrm_node, shape_node, add_node, reshape_node],
+        name="graph",
+        inputs=[inp, side],
+        outputs=[outp0, outp1],
+        value_info=[dupl0, dupl1],
+    )
+    model = ModelWrapper(qonnx_make_model(graph, producer_name="side-input-model"))
+    model.set_tensor_datatype("inp", idt)
+    model = model.transform(InferShapes())
+    model = model.transform(InferDataTypes())
+    return model
+
+
+@pytest.mark.fpgadataflow
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_fpgadataflow_batched_exec_side_inputs(pipelined):
+    # the shape tensor has as many elements as there are samples, neither it nor
+    # the side input may be sliced per sample
+    ch, idim, idt, batch_size = 8, 3, DataType["INT4"], 2
+    model = make_side_input_model(ch, 2, idim, idt)
+    x = gen_finn_dt_tensor(idt, (batch_size, idim, idim, ch))
+    side = np.arange(ch, dtype=np.float32).reshape(1, ch)
+    input_dict = {"inp": x, "side": side}
+    assert oxe.get_input_batch_size(model, input_dict) == batch_size
+    if pipelined:
+        ctx = oxe.execute_onnx_pipelined(model, input_dict, 1, 1, True)
+    else:
+        ctx = oxe.execute_onnx(model, input_dict, True)
+    assert (ctx["outp0"] == x + side).all()
+    assert (ctx["outp1"] == x.reshape(batch_size, -1)).all()
+    assert (ctx["shape"] == [1, -1]).all()
+    assert (ctx["side"] == side).all()
@@ -0,0 +1,159 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import numpy as np
+from onnx import TensorProto, helper
+from qonnx.core.datatype import DataType
+from qonnx.core.modelwrapper import ModelWrapper
+from qonnx.custom_op.general.im2col import compute_conv_output_dim
+from qonnx.custom_op.general.multithreshold import multithreshold
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.infer_shapes import InferShapes
+from qonnx.util.basic import gen_finn_dt_tensor, qonnx_make_model
+
+import finn.core.onnx_exec as oxe
+from finn.transformation.fpgadataflow.set_exec_mode import SetExecMode
+from finn.transformation.fpgadataflow.specialize_layers import SpecializeLayers
+
+
+def make_conv_layer_model(idim, ifm_ch, ofm_ch, k, stride, idt, wdt, odt):
+    # ConvolutionInputGenerator followed by MVAU with thresholds
+    odim = compute_conv_output_dim(idim, k, stride, 0)
+    mw = k * k * ifm_ch
+    inp = helper.make_tensor_value_info("inp", TensorProto.FLOAT, [1, idim, idim, ifm_ch])
+    swg_out = helper.make_tensor_value_info("swg_out", TensorProto.FLOAT, [1, odim, odim, mw])
+    outp = helper.make_tensor_value_info("outp", TensorProto.FLOAT, [1, odim, odim, ofm_ch])
+    swg_node = helper.make_node(
+        "ConvolutionInputGenerator",
+        ["inp"],
+        ["swg_out"],
+        domain="finn.custom_op.fpgadataflow",
+        backend="fpgadataflow",
+        ConvKernelDim=[k, k],
+        IFMChannels=ifm_ch,
+        IFMDim=[idim, idim],
+        OFMDim=[odim, odim],
+        SIMD=ifm_ch,
+        Stride=[stride, stride],
+        Dilation=[1, 1],
+        inputDataType=idt.name,
+        outputDataType=idt.name,
+    )
+    mvau_node = helper.make_node(
+        "MVAU",
+        ["swg_out", "weights", "thresh"],
+        ["outp"],
+        domain="finn.custom_op.fpgadataflow",
+        backend="fpgadataflow",
+        MW=mw,
+        MH=ofm_ch,
+        SIMD=ifm_ch,
+        PE=ofm_ch,
+        inputDataType=idt.name,
+        weightDataType=wdt.name,
+        outputDataType=odt.name,
+        ActVal=odt.min(),
+        binaryXnorMode=0,
+        noActivation=0,
+        numInputVectors=[1, odim, odim],
+    )
+    graph = helper.make_graph(
+        nodes=[swg_node, mvau_node],
+        name="conv_layer_graph",
+        inputs=[inp],
+        outputs=[outp],
+        value_info=[swg_out],
+    )
+    model = ModelWrapper(qonnx_make_model(graph, producer_name="conv-layer-model"))
+    model.set_tensor_datatype("inp", idt)
+    model.set_tensor_datatype("swg_out", idt)
+    model.set_tensor_datatype("outp", odt)
+    model.set_tensor_datatype("weights", wdt)
+    model.set_initializer("weights", gen_finn_dt_tensor(wdt, (mw, ofm_ch)))
+    n_steps = odt.get_num_possible_values() - 1
+    thresh = gen_finn_dt_tensor(DataType["INT8"], (ofm_ch, n_steps))
+    model.set_tensor_datatype("thresh", DataType["INT8"])
+    model.set_initializer("thresh", np.sort(thresh, axis=1))
+    model = model.transform(InferShapes())
+    return model
+
+
+def conv_layer_reference(model, x):
+    # Im2Col, MatMul and MultiThreshold from QONNX, executed sample by sample
+    mvau = getCustomOp(model.graph.node[1])
+    W = model.get_initializer("weights")
+    T = model.get_initializer("thresh")
+    ret = []
+    for i in range(x.shape[0]):
+        context = {"inp": x[i : i + 1], "swg_out": None}
+        swg = getCustomOp(model.graph.node[0])
+        k, s = swg.get_nodeattr("ConvKernelDim"), swg.get_nodeattr("Stride")
+        im2col_node = helper.make_node(
+            "Im2Col",
+            ["inp"],
+            ["swg_out"],
+            domain="qonnx.custom_op.general",
+            stride=s,
+            kernel_size=k,
+            input_shape=str(tuple(model.get_tensor_shape("inp"))),
+        )
+        oxe.execute_node(im2col_node, context, model.graph)
+        acc = np.matmul(context["swg_out"], W).transpose(0, 3, 1, 2)
+        y = multithreshold(acc, T, out_bias=mvau.get_nodeattr("ActVal"))
+        ret.append(y.transpose(0, 2, 3, 1))
+    return np.concatenate(ret, axis=0)
+
+
+@pytest.mark.fpgadataflow
+@pytest.mark.parametrize("k_stride", [(3, 1), (2, 2)])
+@pytest.mark.parametrize("impl_style", ["hls", "rtl"])
+def test_fpgadataflow_python_exec(k_stride, impl_style):
+    k, stride = k_stride
+    idt, wdt, odt = DataType["INT4"], DataType["INT4"], DataType["UINT4"]
+    model = make_conv_layer_model(6, 4, 8, k, stride, idt, wdt, odt)
+    x = gen_finn_dt_tensor(idt, (5, 6, 6, 4))
+    y_exp = conv_layer_reference(model, x)
+    # HW abstraction layers
+    y = oxe.execute_onnx(model, {"inp": x})["outp"]
+    assert (y == y_exp).all()
+    # specialized layers in python exec_mode
+    for node in model.graph.node:
+        getCustomOp(node).set_nodeattr("preferred_impl_style", impl_style)
+    model = model.transform(SpecializeLayers("xczu7ev-ffvc1156-2-e"))
+    model = model.transform(SetExecMode("python"))
+    # MVAU with embedded thresholds is always specialized to HLS
+    assert [n.op_type for n in model.graph.node] == [
+        "ConvolutionInputGenerator_" + impl_style,
+        "MVAU_hls",
+    ]
+    y = oxe.execute_onnx(model, {"inp": x})["outp"]
+    assert (y == y_exp).all()
+    y = oxe.execute_onnx(model, {"inp": x[:1]})["outp"]
+    assert (y == y_exp[:1]).all()
@@ -0,0 +1,84 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+from qonnx.core.datatype import DataType
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.general import GiveUniqueNodeNames
+from qonnx.util.basic import gen_finn_dt_tensor
+
+from finn.transformation.fpgadataflow.prepare_ip import PrepareIP
+from finn.transformation.fpgadataflow.specialize_layers import SpecializeLayers
+from finn.util.create import hls_mlp_maker
+
+test_fpga_part = "xc7z020clg400-1"
+
+
+def make_mlp(mem_mode, weights):
+    # three layers with different weights, the last two are otherwise identical
+    wdt = DataType["INT2"]
+    layer_spec = []
+    for idt, W in zip([DataType["INT4"], DataType["INT32"], DataType["INT32"]], weights):
+        layer_spec.append(
+            {
+                "W": W,
+                "T": None,
+                "pe": 4,
+                "simd": 4,
+                "idt": idt,
+                "wdt": wdt,
+                "tdt": None,
+                "odt": DataType["INT32"],
+            }
+        )
+    model = hls_mlp_maker(layer_spec)
+    model = model.transform(SpecializeLayers(test_fpga_part))
+    model = model.transform(GiveUniqueNodeNames())
+    for node in model.graph.node:
+        getCustomOp(node).set_nodeattr("mem_mode", mem_mode)
+    return model.transform(PrepareIP(test_fpga_part, 5))
+
+
+@pytest.mark.fpgadataflow
+@pytest.mark.parametrize("mem_mode", ["internal_embedded", "internal_decoupled"])
+def test_ipgen_dedup_key(mem_mode):
+    weights = [gen_finn_dt_tensor(DataType["INT2"], (16, 16)) for i in range(3)]
+    model = make_mlp(mem_mode, weights)
+    keys = [getCustomOp(node).ipgen_dedup_key() for node in model.graph.node]
+    assert keys[0] != keys[1]
+    if mem_mode == "internal_decoupled":
+        # weights only live in the memstream init file, IP can be shared
+        assert keys[1] == keys[2]
+    else:
+        # weights are part of the HLS code
+        assert keys[1] != keys[2]
+    # regenerating the code in different directories gives the same keys
+    model_regen = make_mlp(mem_mode, weights)
+    keys_regen = [getCustomOp(node).ipgen_dedup_key() for node in model_regen.graph.node]
+    assert keys[0] == keys_regen[0]
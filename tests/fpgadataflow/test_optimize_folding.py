@@ -0,0 +1,158 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import json
+import os
+from functools import partial
+from qonnx.core.datatype import DataType
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.general import ApplyConfig, GiveUniqueNodeNames
+
+from finn.analysis.fpgadataflow.exp_cycles_per_layer import exp_cycles_per_layer
+from finn.analysis.fpgadataflow.op_and_param_counts import aggregate_dict_keys
+from finn.analysis.fpgadataflow.res_estimation import res_estimation
+from finn.transformation.fpgadataflow.optimize_folding import (
+    OptimizeFolding,
+    opt_res_types,
+)
+from finn.transformation.fpgadataflow.set_folding import SetFolding
+from finn.transformation.fpgadataflow.specialize_layers import SpecializeLayers
+from finn.util.basic import make_build_dir
+from finn.util.create import hls_random_mlp_maker
+
+test_fpga_part = "xczu3eg-sbva484-1-e"
+
+
+def make_mlp(nlayers, ch=128):
+    layer_spec = []
+    for i in range(nlayers):
+        layer_spec.append(
+            {
+                "mw": ch,
+                "mh": ch,
+                "simd": 1,
+                "pe": 1,
+                "idt": DataType["INT2"],
+                "wdt": DataType["INT4"],
+                "act": DataType["INT2"],
+            }
+        )
+    model = hls_random_mlp_maker(layer_spec)
+    model = model.transform(SpecializeLayers(test_fpga_part))
+    model = model.transform(GiveUniqueNodeNames())
+    return model
+
+
+def total_resources(model):
+    res = model.analysis(partial(res_estimation, fpgapart=test_fpga_part))
+    return aggregate_dict_keys(res)
+
+
+@pytest.mark.fpgadataflow
+@pytest.mark.parametrize("target_cycles", [100000, 1000, 10])
+def test_optimize_folding_target(target_cycles):
+    model = make_mlp(5)
+    cfg_file = make_build_dir("test_optimize_folding_") + "/folding_config.json"
+    trafo = OptimizeFolding(
+        test_fpga_part, target_cycles_per_frame=target_cycles, folding_config_file=cfg_file
+    )
+    model_opt = model.transform(trafo)
+    cycles = model_opt.analysis(exp_cycles_per_layer)
+    # 128x128 layers cannot go below one cycle per frame
+    assert max(cycles.values()) <= max(target_cycles, 1)
+    # identical layers share a single cost table
+    assert len(trafo.cost_tables) == 1
+    # resource cost is not higher than that of the greedy SetFolding
+    model_greedy = model.transform(SetFolding(target_cycles, two_pass_relaxation=False))
+    res_opt = total_resources(model_opt)
+    if max(model_greedy.analysis(exp_cycles_per_layer).values()) <= target_cycles:
+        assert trafo.cost(res_opt) <= trafo.cost(total_resources(model_greedy))
+    # the emitted folding config reproduces the optimized model
+    assert os.path.isfile(cfg_file)
+    with open(cfg_file, "r") as f:
+        folding_cfg = json.load(f)
+    assert set(folding_cfg.keys()) == {"Defaults"} | set(cycles.keys())
+    model_applied = model.transform(ApplyConfig(cfg_file))
+    assert model_applied.analysis(exp_cycles_per_layer) == cycles
+    assert total_resources(model_applied) == res_opt
+
+
+@pytest.mark.fpgadataflow
+def test_optimize_folding_budget():
+    model = make_mlp(4)
+    # Pynq-Z1 fits a fully unrolled design of this size
+    model_plat = model.transform(OptimizeFolding(test_fpga_part, platform="Pynq-Z1"))
+    cycles_plat = max(model_plat.analysis(exp_cycles_per_layer).values())
+    budget = {"LUT": 4000, "BRAM_18K": 20, "URAM": 0, "DSP": 0}
+    trafo = OptimizeFolding(test_fpga_part, resource_budget=budget)
+    model_small = model.transform(trafo)
+    cycles_small = max(model_small.analysis(exp_cycles_per_layer).values())
+    res_small = total_resources(model_small)
+    for res_type, limit in budget.items():
+        assert res_small[res_type] <= limit
+    assert cycles_small > cycles_plat
+    # a bigger budget never results in a slower design
+    budget_big = {k: 2 * v for k, v in budget.items()}
+    model_big = model.transform(OptimizeFolding(test_fpga_part, resource_budget=budget_big))
+    assert max(model_big.analysis(exp_cycles_per_layer).values()) <= cycles_small
+
+
+@pytest.mark.fpgadataflow
+def test_optimize_folding_budget_not_monotone():
+    budget = {"LUT": 100, "BRAM_18K": 10}
+    trafo = OptimizeFolding(test_fpga_part, resource_budget=budget)
+
+    def make_table(entries):
+        # table entries from (cycles, [LUT, BRAM_18K]) without URAM and DSP
+        return [
+            (c, res + [0, 0], trafo.cost(dict(zip(opt_res_types, res + [0, 0]))), i)
+            for i, (c, res) in enumerate(entries)
+        ]
+
+    # a looser target selects the cheaper BRAM-based entry of the first node,
+    # which exceeds the BRAM budget together with the second node
+    tables = [
+        make_table([(10, [60, 0]), (20, [0, 5]), (30, [1, 4])]),
+        make_table([(10, [0, 6])]),
+    ]
+    assert trafo.fits_budget(trafo.select(tables, 10))
+    assert not trafo.fits_budget(trafo.select(tables, 20))
+    assert trafo.budget_target(tables) == 10
+
+
+@pytest.mark.fpgadataflow
+def test_optimize_folding_evaluate_keeps_model():
+    model = make_mlp(1)
+    node = model.graph.node[0]
+    attrs_before = [x.SerializeToString() for x in node.attribute]
+    trafo = OptimizeFolding(test_fpga_part, target_cycles_per_frame=1000)
+    options = trafo.node_options(node, getCustomOp(node), model)
+    assert len(trafo.cost_table(options)) > 0
+    assert [x.SerializeToString() for x in node.attribute] == attrs_before
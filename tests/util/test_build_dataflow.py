@@ -28,12 +28,36 @@
 
 import pytest
 
+import dataclasses
+import inspect
 import numpy as np
 import os
+import re
+from onnx import TensorProto, helper
+from qonnx.core.modelwrapper import ModelWrapper
+from qonnx.util.basic import qonnx_make_model
 from shutil import copytree
 
-from finn.builder.build_dataflow import build_dataflow_directory
+from finn.builder.build_dataflow import (
+    build_dataflow_cfg,
+    build_dataflow_directory,
+    get_step_fingerprint,
+)
+from finn.builder.build_dataflow_config import (
+    DataflowBuildConfig,
+    DataflowOutputType,
+    ShellFlowType,
+    estimate_only_dataflow_steps,
+)
+from finn.builder.build_dataflow_steps import (
+    build_dataflow_step_cfg_fields,
+    build_dataflow_step_lookup,
+    step_generate_estimate_reports,
+    step_make_pynq_driver,
+    step_synthesize_bitfile,
+)
 from finn.util.basic import make_build_dir
+from finn.util.cache import BuildCache
 
 
 @pytest.mark.slow
@@ -74,3 +98,123 @@ def test_end2end_build_dataflow_directory():
         assert os.path.isfile(verify_out_dir + f"/verify_folded_hls_cppsim_{i}_SUCCESS.npy")
         assert os.path.isfile(verify_out_dir + f"/verify_stitched_ip_rtlsim_{i}_SUCCESS.npy")
         assert os.path.isfile(output_dir + f"/report/verify_rtlsim_{i}.vcd")
+
+
+@pytest.mark.util
+def test_build_dataflow_incremental():
+    test_dir = make_build_dir("test_build_dataflow_incremental_")
+    example_data_dir = os.environ["FINN_ROOT"] + "/src/finn/qnn-data/build_dataflow"
+    output_dir = test_dir + "/output"
+    n_steps = len(estimate_only_dataflow_steps)
+
+    def build(target_fps, **kwargs):
+        cfg = DataflowBuildConfig(
+            output_dir=output_dir,
+            steps=estimate_only_dataflow_steps,
+            target_fps=target_fps,
+            mvau_wwidth_max=10000,
+            synth_clk_period_ns=10.0,
+            board="Pynq-Z1",
+            shell_flow_type=ShellFlowType.VIVADO_ZYNQ,
+            generate_outputs=[DataflowOutputType.ESTIMATE_REPORTS],
+            enable_build_pdb_debug=False,
+            incremental_build=True,
+            **kwargs,
+        )
+        assert build_dataflow_cfg(example_data_dir + "/model.onnx", cfg) == 0
+        return BuildCache(output_dir + "/build_cache").get_stats()
+
+    stats = build(100000)
+    assert stats["hits"] == 0 and stats["misses"] == n_steps
+    report = output_dir + "/report/estimate_network_performance.json"
+    with open(report, "r") as f:
+        report_content = f.read()
+    # identical rebuild reuses all steps and restores their outputs
+    os.remove(report)
+    stats = build(100000)
+    assert stats["hits"] == n_steps
+    with open(report, "r") as f:
+        assert f.read() == report_content
+    # steps before the folding are not affected by changing the target fps
+    stats = build(10000)
+    n_unaffected = estimate_only_dataflow_steps.index("step_target_fps_parallelization")
+    assert stats["hits"] >= n_steps + n_unaffected
+    assert stats["misses"] > n_steps
+    # the cache is bounded, evicting all but the latest result if needed
+    build(1000, build_cache_max_size_mb=0)
+    assert len(BuildCache(output_dir + "/build_cache").entries()) == 1
+    # incremental builds are opt-in
+    assert not DataflowBuildConfig(
+        output_dir=output_dir,
+        synth_clk_period_ns=10.0,
+        generate_outputs=[DataflowOutputType.ESTIMATE_REPORTS],
+    ).incremental_build
+
+
+@pytest.mark.util
+def test_build_dataflow_step_cfg_fields():
+    # every config field a standard step reads must be part of its fingerprint,
+    # except for output_dir, which cached steps are restored into
+    all_fields = set([x.name for x in dataclasses.fields(DataflowBuildConfig)])
+    for step_name, step_fxn in build_dataflow_step_lookup.items():
+        used = set(re.findall(r"cfg\.(\w+)", inspect.getsource(step_fxn))) & all_fields
+        missing = used - set(build_dataflow_step_cfg_fields[step_name]) - set(["output_dir"])
+        assert missing == set(), "%s misses cfg fields %s" % (step_name, str(missing))
+
+
+def make_relu_model(op_type="Relu"):
+    inp = helper.make_tensor_value_info("inp", TensorProto.FLOAT, [1, 4])
+    outp = helper.make_tensor_value_info("outp", TensorProto.FLOAT, [1, 4])
+    node = helper.make_node(op_type, ["inp"], ["outp"])
+    graph = helper.make_graph(nodes=[node], name="graph", inputs=[inp], outputs=[outp])
+    return ModelWrapper(qonnx_make_model(graph))
+
+
+@pytest.mark.util
+def test_build_dataflow_step_fingerprint():
+    model = make_relu_model()
+
+    def fingerprint(**kwargs):
+        cfg = DataflowBuildConfig(
+            output_dir=make_build_dir("test_build_dataflow_fingerprint_"),
+            synth_clk_period_ns=10.0,
+            board="U250",
+            shell_flow_type=ShellFlowType.VITIS_ALVEO,
+            generate_outputs=[DataflowOutputType.BITFILE],
+            **kwargs,
+        )
+        return get_step_fingerprint(step_synthesize_bitfile, model, cfg)
+
+    # the output_dir does not affect the fingerprint, the number of CUs does
+    assert fingerprint() == fingerprint(vitis_num_compute_units=1)
+    assert fingerprint() != fingerprint(vitis_num_compute_units=2)
+
+
+@pytest.mark.util
+def test_build_dataflow_step_fingerprint_parent():
+    model = make_relu_model()
+    cfg = DataflowBuildConfig(
+        output_dir=make_build_dir("test_build_dataflow_fingerprint_parent_"),
+        synth_clk_period_ns=10.0,
+        board="Pynq-Z1",
+        shell_flow_type=ShellFlowType.VIVADO_ZYNQ,
+        generate_outputs=[DataflowOutputType.PYNQ_DRIVER],
+        fuse_host_preproc=True,
+    )
+    os.makedirs(cfg.output_dir + "/intermediate_models")
+    parent_model_fn = cfg.output_dir + "/intermediate_models/dataflow_parent.onnx"
+
+    def fingerprints(parent_op_type):
+        make_relu_model(parent_op_type).save(parent_model_fn)
+        return [
+            get_step_fingerprint(x, model, cfg)
+            for x in [step_make_pynq_driver, step_generate_estimate_reports]
+        ]
+
+    # only the steps using the parent model are affected by changing it
+    # (e.g. the host-side pre-processing in front of the dataflow partition)
+    driver_fp, estimate_fp = fingerprints("Relu")
+    assert fingerprints("Relu") == [driver_fp, estimate_fp]
+    new_driver_fp, new_estimate_fp = fingerprints("Sigmoid")
+    assert new_driver_fp != driver_fp
+    assert new_estimate_fp == estimate_fp
@@ -0,0 +1,132 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import os
+import time
+from qonnx.core.datatype import DataType
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.general import GiveUniqueNodeNames
+
+import finn.util.create as create
+from finn.transformation.fpgadataflow.prepare_ip import PrepareIP
+from finn.transformation.fpgadataflow.specialize_layers import SpecializeLayers
+from finn.util.basic import make_build_dir
+from finn.util.cache import BuildCache, cache_list, cache_prune, cache_stats, hash_items
+
+
+def make_artifact(dirname, fname, size):
+    fpath = dirname + "/" + fname
+    with open(fpath, "wb") as f:
+        f.write(os.urandom(size))
+    return fpath
+
+
+@pytest.mark.util
+def test_build_cache_hit_miss():
+    cache = BuildCache(make_build_dir("test_cache_"), name="test cache")
+    src_dir = make_build_dir("test_cache_src_")
+    artifact = make_artifact(src_dir, "model.so", 1024)
+    key = hash_items(["model", "args"])
+    assert not cache.lookup(key, make_build_dir("test_cache_dst_"))
+    cache.insert(key, [artifact], description="test")
+    dst_dir = make_build_dir("test_cache_dst_")
+    assert cache.lookup(key, dst_dir)
+    assert os.listdir(dst_dir) == ["model.so"]
+    with open(artifact, "rb") as f_src, open(dst_dir + "/model.so", "rb") as f_dst:
+        assert f_src.read() == f_dst.read()
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["inserts"] == 1
+    assert stats["entries"] == 1
+    assert stats["size"] == 1024
+    # key depends on item boundaries, not just the concatenation
+    assert hash_items(["ab", "c"]) != hash_items(["a", "bc"])
+
+
+@pytest.mark.util
+def test_build_cache_lru_eviction():
+    # bound the cache to 2.5 entries of 1 MB each
+    cache = BuildCache(make_build_dir("test_cache_"), max_size_mb=2.5)
+    src_dir = make_build_dir("test_cache_src_")
+    artifact = make_artifact(src_dir, "model.so", 1024 * 1024)
+    cache.insert("a", [artifact])
+    time.sleep(0.01)
+    cache.insert("b", [artifact])
+    time.sleep(0.01)
+    # touch a so that b becomes the least recently used entry
+    assert cache.lookup("a", make_build_dir("test_cache_dst_"))
+    time.sleep(0.01)
+    cache.insert("c", [artifact])
+    assert cache.contains("a")
+    assert not cache.contains("b")
+    assert cache.contains("c")
+    assert cache.get_stats()["evictions"] == 1
+    # prune everything not used in the last second
+    time.sleep(1.1)
+    cache.lookup("c", make_build_dir("test_cache_dst_"))
+    removed = cache.prune(max_age_s=1)
+    assert [x["key"] for x in removed] == ["a"]
+    assert [x["key"] for x in cache.entries()] == ["c"]
+    cache.clear()
+    assert cache.get_stats()["entries"] == 0
+
+
+@pytest.mark.util
+def test_build_cache_cli(capsys):
+    cache_dir = make_build_dir("test_cache_")
+    cache = BuildCache(cache_dir)
+    src_dir = make_build_dir("test_cache_src_")
+    artifact = make_artifact(src_dir, "model.so", 1024 * 1024)
+    cache.insert("a", [artifact], description="first")
+    cache.insert("b", [artifact], description="second")
+    cache_list(cache_dir)
+    assert "first" in capsys.readouterr().out
+    cache_prune(cache_dir, max_size_mb=1.5)
+    assert "Removed 1 entries" in capsys.readouterr().out
+    cache_stats(cache_dir)
+    assert "Entries: 1 (1.0 MB)" in capsys.readouterr().out
+
+
+@pytest.mark.util
+def test_ipgen_cache_key():
+    dt = DataType["INT2"]
+    layer_spec = [{"mw": 16, "mh": 8, "simd": 4, "pe": 2, "idt": dt, "wdt": dt, "act": dt}]
+    model = create.hls_random_mlp_maker(layer_spec)
+    model = model.transform(SpecializeLayers("xc7z020clg400-1"))
+    model = model.transform(GiveUniqueNodeNames())
+
+    def get_key(clk):
+        # each PrepareIP generates code into a fresh directory
+        model_ipgen = model.transform(PrepareIP("xc7z020clg400-1", clk))
+        return getCustomOp(model_ipgen.graph.node[0]).ipgen_cache_key()
+
+    assert get_key(10) == get_key(10)
+    assert get_key(10) != get_key(5)
@@ -0,0 +1,148 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import os
+import threading
+
+import finn.util.cppsim_server as cppsim_server
+from finn.util.basic import get_finn_root, launch_process_helper, make_build_dir
+from finn.util.cppsim_server import get_cppsim_server, shutdown_cppsim_servers
+
+# stands in for a generated node_model: doubles the number in input.txt and
+# counts its executions in a static variable
+node_model_src = r"""
+#include <fstream>
+#include "cppsim_server.hpp"
+
+static int n_executions = 0;
+
+void execute_node(){
+  std::ifstream in("%s/input.txt");
+  int value;
+  in >> value;
+  n_executions++;
+  std::cout << "some output of the node" << std::endl;
+  std::ofstream out("%s/output.txt");
+  out << 2 * value << " " << n_executions << std::endl;
+}
+
+int main(int argc, char **argv){
+  return cppsim_main(argc, argv, execute_node);
+}
+"""
+
+
+def build_node_model(code_gen_dir, src):
+    with open(code_gen_dir + "/node_model.cpp", "w") as f:
+        f.write(src % (code_gen_dir, code_gen_dir))
+    compile_args = ["g++", "-O1", "-I" + get_finn_root() + "/src/finn/qnn-data/cpp"]
+    compile_args += ["node_model.cpp", "-o", "node_model"]
+    launch_process_helper(compile_args, cwd=code_gen_dir)
+    executable_path = code_gen_dir + "/node_model"
+    assert os.path.isfile(executable_path)
+    return executable_path
+
+
+def execute(server, code_gen_dir, value):
+    with open(code_gen_dir + "/input.txt", "w") as f:
+        f.write(str(value))
+    server.run()
+    with open(code_gen_dir + "/output.txt", "r") as f:
+        return [int(x) for x in f.read().split()]
+
+
+@pytest.mark.util
+def test_cppsim_server():
+    code_gen_dir = make_build_dir("test_cppsim_server_")
+    executable_path = build_node_model(code_gen_dir, node_model_src)
+    try:
+        server = get_cppsim_server(executable_path)
+        pid = server.proc.pid
+        for i in range(5):
+            assert execute(server, code_gen_dir, i) == [2 * i, i + 1]
+        # the same process serves all executions
+        assert get_cppsim_server(executable_path).proc.pid == pid
+        # the server is restarted after a rebuild
+        os.utime(executable_path, ns=(0, 0))
+        server = get_cppsim_server(executable_path)
+        assert server.proc.pid != pid
+        assert execute(server, code_gen_dir, 7) == [14, 1]
+    finally:
+        shutdown_cppsim_servers(executable_path)
+    assert server.proc.poll() == 0
+
+
+@pytest.mark.util
+def test_cppsim_server_unsupported():
+    # executables without server mode execute once and exit
+    code_gen_dir = make_build_dir("test_cppsim_server_")
+    src = node_model_src.replace("return cppsim_main(argc, argv, execute_node);", "execute_node();")
+    with open(code_gen_dir + "/input.txt", "w") as f:
+        f.write("3")
+    executable_path = build_node_model(code_gen_dir, src)
+    try:
+        assert get_cppsim_server(executable_path) is None
+        # the executable is not launched again until it is rebuilt
+        with pytest.MonkeyPatch.context() as mp:
+            launches = []
+            mp.setattr(cppsim_server, "CppsimServer", launches.append)
+            assert get_cppsim_server(executable_path) is None
+            assert launches == []
+        os.utime(executable_path, ns=(0, 0))
+        assert get_cppsim_server(executable_path) is None
+    finally:
+        shutdown_cppsim_servers(executable_path)
+
+
+@pytest.mark.util
+def test_cppsim_server_partial_line():
+    # node output without a trailing newline must not hide the control lines
+    code_gen_dir = make_build_dir("test_cppsim_server_")
+    src = node_model_src.replace(
+        'std::cout << "some output of the node" << std::endl;',
+        'std::cout << "some output of the node" << std::flush;',
+    )
+    executable_path = build_node_model(code_gen_dir, src)
+    results = []
+    try:
+        server = get_cppsim_server(executable_path)
+        assert server is not None
+        thread = threading.Thread(
+            target=lambda: results.extend(execute(server, code_gen_dir, 3) for i in range(2))
+        )
+        thread.start()
+        thread.join(timeout=30)
+        if thread.is_alive():
+            # unblock the waiting thread before failing
+            server.proc.kill()
+            thread.join()
+        assert results == [[6, 1], [6, 2]]
+    finally:
+        shutdown_cppsim_servers(executable_path)
@@ -32,11 +32,37 @@ import numpy as np
 import os
 import shutil
 import subprocess
+import textwrap
+import time
 from qonnx.core.datatype import DataType
-from qonnx.util.basic import gen_finn_dt_tensor
+from qonnx.util.basic import gen_finn_dt_tensor, roundup_to_integer_multiple
 
 from finn.util.basic import make_build_dir
-from finn.util.data_packing import npy_to_rtlsim_input, numpy_to_hls_code
+from finn.util.data_packing import (
+    array2hexstring,
+    finnpy_to_packed_bytearray,
+    hexstring2npbytearray,
+    npbytearray2hexstring,
+    npy_to_rtlsim_input,
+    numpy_to_hls_code,
+    pack_innermost_dim_as_bytes,
+    pack_innermost_dim_as_hex_string,
+    pack_innermost_dim_as_words,
+    pack_innermost_dim_to_hex_file,
+    packed_bytearray_to_finnpy,
+    rtlsim_output_to_npy,
+    unpack_innermost_dim_from_hex_string,
+)
+
+
+def reference_pack_innermost_dim_as_hex_string(ndarray, dtype, pad_to_nbits, reverse_inner=False):
+    """Per-element packing with array2hexstring, as the vectorized routines are
+    expected to produce the same results."""
+
+    def fun(x):
+        return array2hexstring(x, dtype, pad_to_nbits, reverse=reverse_inner, prefix="")
+
+    return np.apply_along_axis(fun, ndarray.ndim - 1, ndarray)
 
 
 @pytest.mark.util
@@ -180,3 +206,271 @@ def test_npy_to_rtlsim_input(dtype):
 
     assert all([(x >> dtype.bitwidth()) == 0 for x in output_fast]), "extraneous bits detected"
     assert np.all(output_fast == output_slow_split), "different behavior of packing modes detected"
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "dtype",
+    [
+        DataType["BINARY"],
+        DataType["BIPOLAR"],
+        DataType["TERNARY"],
+        DataType["INT5"],
+        DataType["UINT8"],
+        DataType["INT22"],
+        DataType["UINT32"],
+        DataType["FIXED<9,6>"],
+        DataType["FLOAT32"],
+    ],
+)
+@pytest.mark.parametrize("test_shape", [(2, 3, 1), (1, 4, 4, 7), (3, 40)])
+@pytest.mark.parametrize("reverse_inner", [False, True])
+def test_rtlsim_output_to_npy(dtype, test_shape, reverse_inner):
+    # packing for rtlsim followed by unpacking must reproduce the input,
+    # also when the stream width is padded beyond the packed elements
+    ndarray = gen_finn_dt_tensor(dtype, test_shape)
+    packed_bits = roundup_to_integer_multiple(test_shape[-1] * dtype.bitwidth(), 4) + 12
+    packed = npy_to_rtlsim_input(ndarray, dtype, packed_bits, reverse_inner)
+    assert len(packed) == np.prod(test_shape[:-1])
+    assert all([x < (1 << packed_bits) for x in packed])
+    # values beyond the expected number of outputs are ignored
+    ret = rtlsim_output_to_npy(
+        packed + [0], None, dtype, test_shape, packed_bits, dtype.bitwidth(), reverse_inner
+    )
+    assert ret.dtype == np.float32
+    assert (ret == ndarray).all()
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "dtype",
+    [
+        DataType["BINARY"],
+        DataType["BIPOLAR"],
+        DataType["TERNARY"],
+        DataType["INT3"],
+        DataType["UINT4"],
+        DataType["INT8"],
+        DataType["UINT13"],
+        DataType["INT32"],
+        DataType["FIXED<9,6>"],
+        DataType["FLOAT32"],
+    ],
+)
+@pytest.mark.parametrize("test_shape", [(5,), (1, 7, 3), (2, 4, 12)])
+@pytest.mark.parametrize("extra_pad", [0, 4, 32])
+@pytest.mark.parametrize("reverse_inner", [False, True])
+def test_pack_innermost_dim_vectorized(dtype, test_shape, extra_pad, reverse_inner):
+    ndarray = gen_finn_dt_tensor(dtype, test_shape)
+    bits = roundup_to_integer_multiple(test_shape[-1] * dtype.bitwidth(), 4) + extra_pad
+    expected = reference_pack_innermost_dim_as_hex_string(ndarray, dtype, bits, reverse_inner)
+    # hex strings
+    ret = pack_innermost_dim_as_hex_string(ndarray, dtype, bits, reverse_inner, prefix="")
+    assert ret.shape == expected.shape
+    assert (ret == expected).all()
+    # big-endian bytes
+    ret = pack_innermost_dim_as_bytes(ndarray, dtype, bits, reverse_inner)
+    assert ret.shape == test_shape[:-1] + (roundup_to_integer_multiple(bits, 8) // 8,)
+    ret_hex = np.apply_along_axis(lambda x: x.tobytes().hex()[-(bits // 4) :], -1, ret)
+    assert (ret_hex == expected).all()
+
+
+def reference_finnpy_to_packed_bytearray(ndarray, dtype, reverse_inner, reverse_endian):
+    """Packing via per-element hex strings, as finnpy_to_packed_bytearray used
+    to do it."""
+    bits = roundup_to_integer_multiple(dtype.bitwidth() * ndarray.shape[-1], 8)
+    packed_hex = reference_pack_innermost_dim_as_hex_string(ndarray, dtype, bits, reverse_inner)
+    ret = [hexstring2npbytearray(x, remove_prefix="") for x in packed_hex.flatten()]
+    ret = np.asarray(ret, dtype=np.uint8).reshape(ndarray.shape[:-1] + (bits // 8,))
+    if reverse_endian:
+        ret = np.flip(ret, axis=-1)
+    return ret
+
+
+def reference_packed_bytearray_to_finnpy(packed, dtype, out_shape, reverse_inner, reverse_endian):
+    """Unpacking via per-line hex strings, as packed_bytearray_to_finnpy used
+    to do it."""
+    if reverse_endian:
+        packed = np.flip(packed, axis=-1)
+    packed_hex = np.apply_along_axis(npbytearray2hexstring, packed.ndim - 1, packed)
+    return unpack_innermost_dim_from_hex_string(
+        packed_hex, dtype, out_shape, packed.shape[-1] * 8, reverse_inner
+    )
+
+
+# DataTypes for the randomized packing tests, covering sub-byte, byte-aligned
+# and odd bitwidths as well as fixed and floating point
+packing_test_dtypes = [
+    "BINARY",
+    "BIPOLAR",
+    "TERNARY",
+    "UINT2",
+    "INT3",
+    "INT4",
+    "UINT4",
+    "UINT5",
+    "INT7",
+    "INT8",
+    "UINT8",
+    "INT9",
+    "UINT12",
+    "INT16",
+    "UINT16",
+    "INT24",
+    "INT32",
+    "UINT33",
+    "FIXED<8,4>",
+    "FIXED<12,5>",
+    "FLOAT32",
+]
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("seed", range(100))
+def test_finnpy_packed_bytearray_random(seed):
+    # property-based test: for randomly drawn DataTypes, shapes and packing
+    # options, the vectorized (un)packing must match the per-element reference
+    # implementation and round-trip exactly
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+    dtype = DataType[packing_test_dtypes[rng.integers(len(packing_test_dtypes))]]
+    ndim = rng.integers(1, 5)
+    shape = tuple(rng.integers(1, 4, size=ndim - 1)) + (int(rng.integers(1, 41)),)
+    reverse_inner = bool(rng.integers(2))
+    reverse_endian = bool(rng.integers(2))
+    fast_mode = bool(rng.integers(2))
+    ndarray = gen_finn_dt_tensor(dtype, shape)
+    if dtype.is_integer() and dtype.bitwidth() <= 8 and rng.integers(2) == 1:
+        # byte containers as used in the driver
+        ndarray = ndarray.astype(np.int8 if dtype.signed() else np.uint8)
+    expected = reference_finnpy_to_packed_bytearray(ndarray, dtype, reverse_inner, reverse_endian)
+    packed = finnpy_to_packed_bytearray(
+        ndarray,
+        dtype,
+        reverse_inner=reverse_inner,
+        reverse_endian=reverse_endian,
+        fast_mode=fast_mode,
+    )
+    assert packed.dtype == np.uint8
+    assert packed.shape == expected.shape
+    assert (packed == expected).all()
+    expected = reference_packed_bytearray_to_finnpy(
+        expected, dtype, shape, reverse_inner, reverse_endian
+    )
+    unpacked = packed_bytearray_to_finnpy(
+        packed,
+        dtype,
+        shape,
+        reverse_inner=reverse_inner,
+        reverse_endian=reverse_endian,
+        fast_mode=fast_mode,
+    )
+    assert unpacked.dtype == np.float32
+    assert unpacked.shape == shape
+    assert (unpacked == expected).all()
+    assert (unpacked == ndarray).all()
+    # packing into and unpacking from caller-provided arrays
+    packed_out = np.zeros_like(packed)
+    ret = finnpy_to_packed_bytearray(
+        ndarray,
+        dtype,
+        reverse_inner=reverse_inner,
+        reverse_endian=reverse_endian,
+        fast_mode=fast_mode,
+        out=packed_out,
+    )
+    assert ret is packed_out
+    assert (packed_out == packed).all()
+    unpacked_out = np.zeros(shape, dtype=np.float32)
+    ret = packed_bytearray_to_finnpy(
+        packed_out,
+        dtype,
+        shape,
+        reverse_inner=reverse_inner,
+        reverse_endian=reverse_endian,
+        fast_mode=fast_mode,
+        out=unpacked_out,
+    )
+    assert ret is unpacked_out
+    assert (unpacked_out == ndarray).all()
+    # output shape is inferred if there is no padding
+    if (shape[-1] * dtype.bitwidth()) % 8 == 0:
+        unpacked = packed_bytearray_to_finnpy(
+            packed,
+            dtype,
+            reverse_inner=reverse_inner,
+            reverse_endian=reverse_endian,
+            fast_mode=fast_mode,
+        )
+        assert (unpacked == ndarray).all()
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("dtype", [DataType["BINARY"], DataType["INT4"], DataType["INT13"]])
+@pytest.mark.parametrize("split_words_nbits", [None, 32])
+def test_pack_innermost_dim_to_hex_file(dtype, split_words_nbits):
+    ndarray = gen_finn_dt_tensor(dtype, (1, 37, 24))
+    bits = roundup_to_integer_multiple(24 * dtype.bitwidth(), 32)
+    expected = reference_pack_innermost_dim_as_hex_string(ndarray, dtype, bits).flatten()
+    if split_words_nbits is not None:
+        expected = [w for x in expected for w in reversed(textwrap.wrap(x, 8))]
+    test_dir = make_build_dir(prefix="test_pack_innermost_dim_to_hex_file_")
+    dat_file = test_dir + "/memblock.dat"
+    pack_innermost_dim_to_hex_file(
+        ndarray, dtype, bits, dat_file, split_words_nbits=split_words_nbits
+    )
+    with open(dat_file, "r") as f:
+        produced = f.read()
+    shutil.rmtree(test_dir)
+    assert produced == "".join([x + "\n" for x in expected])
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("dtype", [DataType["BINARY"], DataType["INT4"], DataType["INT13"]])
+@pytest.mark.parametrize("bits", [32, 128])
+def test_pack_innermost_dim_as_words(dtype, bits):
+    ndarray = gen_finn_dt_tensor(dtype, (1, 37, bits // 32))
+    expected = reference_pack_innermost_dim_as_hex_string(ndarray, dtype, bits).flatten()
+    expected = [int(w, 16) for x in expected for w in reversed(textwrap.wrap(x, 8))]
+    words = pack_innermost_dim_as_words(ndarray, dtype, bits)
+    assert words.dtype == np.uint32
+    assert words.tolist() == expected
+
+
+@pytest.mark.util
+@pytest.mark.slow
+@pytest.mark.parametrize(
+    "layer",
+    [
+        # name, (WMEM, PE * SIMD) of the packed weight stream, weight datatype
+        ("cnv_w1a1_conv3x3_256", (4608, 64), DataType["BINARY"]),
+        ("mobilenet_pw_1024x1024", (1024, 1024), DataType["INT4"]),
+        ("resnet50_conv3x3_512", (18432, 128), DataType["INT4"]),
+        ("resnet50_fc_2048x1000", (64000, 32), DataType["INT8"]),
+        ("thresholds_512ch_255steps", (512, 255), DataType["INT24"]),
+    ],
+)
+def test_codegen_benchmark(layer):
+    """Compare vectorized .dat file emission against per-element packing for
+    representative layer sizes. The reference is only run on a subset of the
+    lines and extrapolated to the full layer size to keep runtime reasonable."""
+    name, shape, dtype = layer
+    weights = gen_finn_dt_tensor(dtype, (1,) + shape)
+    bits = roundup_to_integer_multiple(shape[-1] * dtype.bitwidth(), 4)
+    test_dir = make_build_dir(prefix="test_codegen_benchmark_")
+    dat_file = test_dir + "/memblock.dat"
+    start = time.time()
+    pack_innermost_dim_to_hex_file(weights, dtype, bits, dat_file)
+    t_vectorized = time.time() - start
+    n_ref_lines = min(shape[0], 256)
+    start = time.time()
+    expected = reference_pack_innermost_dim_as_hex_string(weights[0, :n_ref_lines], dtype, bits)
+    t_reference = (time.time() - start) * shape[0] / n_ref_lines
+    with open(dat_file, "r") as f:
+        produced = f.read().split("\n")[:n_ref_lines]
+    shutil.rmtree(test_dir)
+    print(
+        "%s: %d elements, vectorized %.3f s, reference (extrapolated) %.3f s, speedup %.1fx"
+        % (name, np.prod(shape), t_vectorized, t_reference, t_reference / t_vectorized)
+    )
+    assert produced == list(expected)
@@ -0,0 +1,584 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import csv
+import gc
+import importlib.util
+import json
+import numpy as np
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from onnx import TensorProto, helper
+from qonnx.core.datatype import DataType
+from qonnx.core.modelwrapper import ModelWrapper
+from qonnx.custom_op.registry import getCustomOp
+from qonnx.transformation.infer_shapes import InferShapes
+from qonnx.util.basic import gen_finn_dt_tensor, qonnx_make_model
+
+import finn.core.onnx_exec as oxe
+from finn.transformation.fpgadataflow.make_pynq_driver import (
+    host_preproc_lut,
+    to_external_tensor,
+)
+from finn.util.basic import get_finn_root
+from finn.util.data_packing import finnpy_to_packed_bytearray
+
+# latency of the mock accelerator per batch
+mock_latency_s = 0.05
+
+
+class MockBuffer(np.ndarray):
+    """Stands in for a PYNQ buffer: a numpy array with cache maintenance
+    functions and a device address."""
+
+    device_address = 0
+
+    def flush(self):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+def mock_allocate(shape, dtype, cacheable=False, target=None):
+    return np.zeros(shape, dtype=dtype).view(MockBuffer)
+
+
+class MockDMAHandle:
+    def __init__(self, thread):
+        self.thread = thread
+
+    def wait(self):
+        self.thread.join()
+
+
+class MockAccelerator:
+    """Alveo-style input and output DMA of an accelerator that adds one to
+    each input byte, taking mock_latency_s per batch."""
+
+    def __init__(self):
+        self.ibuf = None
+        self.busy = threading.Lock()
+        self.n_batches = 0
+
+    def start_input(self, ibuf, batch_size):
+        self.ibuf = ibuf
+
+    def start_output(self, obuf, batch_size):
+        ibuf = self.ibuf
+
+        def run():
+            # batches are processed one after another
+            with self.busy:
+                time.sleep(mock_latency_s)
+                np.add(ibuf[:batch_size], 1, out=obuf[:batch_size])
+                self.n_batches += 1
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return MockDMAHandle(thread)
+
+
+class MockMMIO:
+    """AXI-lite weight memory of a runtime-writable layer."""
+
+    def __init__(self, n_words=1 << 16):
+        self.array = np.zeros(n_words, dtype=np.uint32)
+
+    def write_mm(self, offset, data):
+        words = np.frombuffer(data, dtype=np.uint32)
+        self.array[offset // 4 : offset // 4 + len(words)] = words
+
+
+class MockOverlay:
+    """Overlay with up to max_compute_units replicas of the mock accelerator,
+    named as linked by VitisLink."""
+
+    max_compute_units = 4
+
+    def __init__(self, bitfile_name, download=True, device=None):
+        self.device = device
+        self.ip_dict = {"StreamingDataflowPartition_1": {}, "idma1": {}}
+        self.StreamingDataflowPartition_1 = types.SimpleNamespace(mmio=MockMMIO())
+        self.clock_dict = {"clock0": {"frequency": 200.0}}
+        self.cu_accel = [MockAccelerator() for cu in range(self.max_compute_units)]
+        self.accel = self.cu_accel[0]
+        for cu, accel in enumerate(self.cu_accel):
+            suffix = "" if cu == 0 else "_cu%d" % cu
+            setattr(self, "idma0" + suffix, types.SimpleNamespace(start=accel.start_input))
+            setattr(self, "odma0" + suffix, types.SimpleNamespace(start=accel.start_output))
+            # external weights DMA
+            setattr(self, "idma1" + suffix, types.SimpleNamespace(start=lambda buf, n: None))
+
+
+@pytest.fixture
+def driver_base(monkeypatch):
+    # provide a mock pynq module and load the driver template against it
+    pynq = types.ModuleType("pynq")
+    pynq.Overlay = MockOverlay
+    pynq.allocate = mock_allocate
+    pynq_ps = types.ModuleType("pynq.ps")
+    pynq_ps.Clocks = types.SimpleNamespace(fclk0_mhz=100.0)
+    pynq.ps = pynq_ps
+    monkeypatch.setitem(sys.modules, "pynq", pynq)
+    monkeypatch.setitem(sys.modules, "pynq.ps", pynq_ps)
+    template = get_finn_root() + "/src/finn/qnn-data/templates/driver/driver_base.py"
+    spec = importlib.util.spec_from_file_location("driver_base", template)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # make the driver base importable by the other driver templates
+    monkeypatch.setitem(sys.modules, "driver_base", module)
+    return module
+
+
+def make_overlay(
+    driver_base,
+    batch_size,
+    n_features=64,
+    num_compute_units=1,
+    runtime_weight_dir="none/",
+    native_runtime=False,
+):
+    io_shape_dict = {
+        "idt": [DataType["UINT8"]],
+        "odt": [DataType["UINT8"]],
+        "ishape_normal": [(1, n_features)],
+        "oshape_normal": [(1, n_features)],
+        "ishape_folded": [(1, n_features // 16, 16)],
+        "oshape_folded": [(1, n_features // 16, 16)],
+        "ishape_packed": [(1, n_features // 16, 16)],
+        "oshape_packed": [(1, n_features // 16, 16)],
+        "num_inputs": 1,
+        "num_outputs": 1,
+        "num_compute_units": num_compute_units,
+    }
+    return driver_base.FINNExampleOverlay(
+        "mock.xclbin",
+        "alveo",
+        io_shape_dict,
+        batch_size=batch_size,
+        download=False,
+        runtime_weight_dir=runtime_weight_dir,
+        native_runtime=native_runtime,
+    )
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("num_buffers", [1, 2, 3])
+def test_driver_execute_stream(driver_base, num_buffers):
+    batch_size = 4
+    n_batches = 8
+    accel = make_overlay(driver_base, batch_size)
+    inputs = [
+        np.random.randint(0, 255, size=(batch_size, 64)).astype(np.uint8) for i in range(n_batches)
+    ]
+    outputs = list(accel.execute_stream(iter(inputs), num_buffers=num_buffers))
+    assert len(outputs) == n_batches
+    for inp, out in zip(inputs, outputs):
+        assert (out == inp + 1).all()
+        # same result as the serial execute
+        assert (out == accel.execute(inp)).all()
+    # stopping early shuts down the pipeline
+    for out in accel.execute_stream(iter(inputs), num_buffers=num_buffers):
+        break
+    # exceptions while packing are raised in the caller
+    with pytest.raises(AssertionError):
+        list(accel.execute_stream([inputs[0], inputs[0][:1]], num_buffers=num_buffers))
+
+
+@pytest.mark.util
+def test_driver_execute_stream_overlap(driver_base):
+    batch_size = 4
+    n_batches = 8
+    accel = make_overlay(driver_base, batch_size)
+    pack_input = accel.pack_input
+
+    def slow_pack_input(ibuf_folded, ind=0):
+        # host-side packing takes as long as the accelerator
+        time.sleep(mock_latency_s)
+        return pack_input(ibuf_folded, ind=ind)
+
+    accel.pack_input = slow_pack_input
+    inputs = [
+        np.random.randint(0, 255, size=(batch_size, 64)).astype(np.uint8) for i in range(n_batches)
+    ]
+    start = time.time()
+    serial_outputs = [accel.execute(x) for x in inputs]
+    serial_time = time.time() - start
+    start = time.time()
+    stream_outputs = list(accel.execute_stream(inputs, num_buffers=2))
+    stream_time = time.time() - start
+    for serial_out, stream_out in zip(serial_outputs, stream_outputs):
+        assert (serial_out == stream_out).all()
+    # packing the next batch overlaps with the accelerator, so the stream
+    # takes about half as long as serial execution
+    assert stream_time < 0.75 * serial_time
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("out_dtype", [np.float32, np.uint8])
+def test_driver_execute_zero_copy(driver_base, out_dtype):
+    batch_size = 16
+    n_features = 4096
+    accel = make_overlay(driver_base, batch_size, n_features)
+    inputs = [
+        np.random.randint(0, 255, size=(batch_size, n_features)).astype(np.uint8) for i in range(4)
+    ]
+    out = np.zeros((batch_size, n_features), dtype=out_dtype)
+    for inp in inputs:
+        ret = accel.execute(inp, out=out)
+        assert ret is out
+        assert (out == accel.execute(inp)).all()
+    # steady-state inference does not allocate anything of the buffer size
+    buffer_size = batch_size * n_features
+    tracemalloc.start()
+    for inp in inputs:
+        accel.execute(inp, out=out)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < buffer_size // 4
+
+
+def use_native_runtime(runtime_dir, monkeypatch):
+    # the native runtime is compiled next to the driver, as generated by
+    # MakePYNQDriver
+    for runtime_file in ["finn_runtime.h", "finn_runtime.cpp", "finn_runtime.py"]:
+        shutil.copy(
+            get_finn_root() + "/src/finn/qnn-data/templates/driver/" + runtime_file, runtime_dir
+        )
+    monkeypatch.syspath_prepend(str(runtime_dir))
+    monkeypatch.delitem(sys.modules, "finn_runtime", raising=False)
+
+
+@pytest.mark.util
+def test_driver_native_runtime(driver_base, tmp_path, monkeypatch):
+    use_native_runtime(tmp_path, monkeypatch)
+    batch_size = 4
+    accel = make_overlay(driver_base, batch_size)
+    native_accel = make_overlay(driver_base, batch_size, native_runtime=True)
+    assert accel.native_runtime is None and accel.native_accel is None
+    assert native_accel.use_native_packing(DataType["UINT8"])
+    inputs = [np.random.randint(0, 255, size=(batch_size, 64)).astype(np.uint8) for i in range(4)]
+    # execute packs, runs the device backend and unpacks in the native handle
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(native_accel, "pack_input", None)
+        mp.setattr(native_accel, "unpack_output", None)
+        for inp in inputs:
+            assert (native_accel.execute(inp) == accel.execute(inp)).all()
+    # the handle is recreated for a new batch size
+    native_accel.batch_size = 2
+    assert (native_accel.execute(inputs[0][:2]) == inputs[0][:2] + 1).all()
+    native_accel.batch_size = batch_size
+    out = np.zeros((batch_size, 64), dtype=np.uint8)
+    for inp, stream_out in zip(inputs, list(native_accel.execute_stream(inputs))):
+        assert (native_accel.execute(inp, out=out) == inp + 1).all()
+        assert (stream_out == inp + 1).all()
+
+
+def make_host_preproc_model():
+    # uint8 NCHW images, normalized per channel, quantized to UINT4 and
+    # transposed to NHWC, as in front of the dataflow partition
+    inp = helper.make_tensor_value_info("inp", TensorProto.FLOAT, [1, 3, 4, 4])
+    outp = helper.make_tensor_value_info("outp", TensorProto.FLOAT, [1, 4, 4, 3])
+    nodes = [
+        helper.make_node("Mul", ["inp", "scale"], ["scaled"]),
+        helper.make_node("Sub", ["scaled", "mean"], ["centered"]),
+        helper.make_node("Div", ["centered", "std"], ["normalized"]),
+        helper.make_node(
+            "MultiThreshold",
+            ["normalized", "thresholds"],
+            ["quantized"],
+            domain="qonnx.custom_op.general",
+            out_dtype="UINT4",
+        ),
+        helper.make_node("Transpose", ["quantized"], ["outp"], perm=[0, 2, 3, 1]),
+    ]
+    graph = helper.make_graph(nodes, "host_preproc", [inp], [outp])
+    model = ModelWrapper(qonnx_make_model(graph))
+    model.set_tensor_datatype("inp", DataType["UINT8"])
+    model.set_initializer("scale", np.asarray(1 / 255, dtype=np.float32))
+    model.set_initializer("mean", np.asarray([0.485, 0.456, 0.406], np.float32).reshape(1, 3, 1, 1))
+    model.set_initializer("std", np.asarray([0.229, 0.224, 0.225], np.float32).reshape(3, 1, 1))
+    thresholds = np.linspace(-2, 2, 15, dtype=np.float32)
+    model.set_initializer("thresholds", np.stack([thresholds, thresholds + 0.1, thresholds * 0.5]))
+    return model.transform(InferShapes())
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("native_runtime", [False, True])
+def test_driver_host_preproc(driver_base, tmp_path, monkeypatch, native_runtime):
+    if native_runtime:
+        use_native_runtime(tmp_path, monkeypatch)
+    model = make_host_preproc_model()
+    lut, raw_min, perm = host_preproc_lut(model, "outp")
+    assert lut.shape == (1, 1, 3, 256) and raw_min == 0 and perm == (0, 2, 3, 1)
+    np.savez(str(tmp_path / "input0.npz"), lut=lut, raw_min=raw_min, perm=perm)
+    batch_size = 5
+    io_shape_dict = {
+        "idt": [DataType["UINT4"]],
+        "odt": [DataType["UINT8"]],
+        "ishape_normal": [(1, 4, 4, 3)],
+        "oshape_normal": [(1, 32)],
+        "ishape_folded": [(1, 16, 3)],
+        "oshape_folded": [(1, 16, 2)],
+        "ishape_packed": [(1, 16, 2)],
+        "oshape_packed": [(1, 16, 2)],
+        "num_inputs": 1,
+        "num_outputs": 1,
+        "host_preproc": ["input0.npz"],
+    }
+    accel = driver_base.FINNExampleOverlay(
+        "mock.xclbin",
+        "alveo",
+        io_shape_dict,
+        batch_size=batch_size,
+        download=False,
+        runtime_weight_dir="none/",
+        native_runtime=native_runtime,
+        host_preproc_dir=str(tmp_path),
+    )
+    assert accel.ishape_raw() == (batch_size, 3, 4, 4)
+    inputs = [accel.random_input() for i in range(3)]
+    assert inputs[0].dtype == np.uint8
+    expected = []
+    for inp in inputs:
+        # same result as executing the pre-processing model
+        ref = [oxe.execute_onnx(model, {"inp": x[None].astype(np.float32)})["outp"] for x in inp]
+        ref = np.concatenate(ref)
+        assert (accel.host_preproc[0](inp) == ref).all()
+        expected.append(
+            finnpy_to_packed_bytearray(
+                ref.reshape(batch_size, 16, 3), DataType["UINT4"], True, True, True
+            )
+        )
+    # raw inputs are pre-processed and packed into the device buffers
+    for inp, exp in zip(inputs, expected):
+        accel.execute(inp)
+        assert (accel.ibuf_packed_device[0] == exp).all()
+        accel.execute(inp, out=np.zeros((batch_size, 32), dtype=np.uint8))
+        assert (accel.ibuf_packed_device[0] == exp).all()
+    outputs = list(accel.execute_stream(inputs))
+    for out, exp in zip(outputs, expected):
+        assert (out.reshape(exp.shape) == exp + 1).all()
+    with pytest.raises(Exception):
+        accel.execute(np.full(accel.ishape_raw(), 256, dtype=np.int16))
+    assert accel.benchmark(num_iterations=2)[0]["batch_size"] == batch_size
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("num_compute_units", [1, 2, 3])
+def test_driver_compute_units(driver_base, num_compute_units):
+    batch_size = 10
+    accel = make_overlay(driver_base, batch_size, num_compute_units=num_compute_units)
+    shards = accel.compute_unit_shards()
+    assert len(shards) == num_compute_units
+    assert shards[0][0] == 0 and shards[-1][1] == batch_size
+    assert all([x[1] == y[0] for x, y in zip(shards[:-1], shards[1:])])
+    assert max([x[1] - x[0] for x in shards]) - min([x[1] - x[0] for x in shards]) <= 1
+    inp = np.random.randint(0, 255, size=(batch_size, 64)).astype(np.uint8)
+    start = time.time()
+    out = accel.execute(inp)
+    runtime = time.time() - start
+    assert (out == inp + 1).all()
+    # each compute unit processed its shard, concurrently with the others
+    for cu in range(num_compute_units):
+        assert accel.cu_accel[cu].n_batches == 1
+        assert accel.cu_finish_time[cu] is not None
+    assert runtime < 2 * mock_latency_s
+    # batches smaller than the number of compute units leave some idle
+    accel.batch_size = 1
+    out = accel.execute(inp[:1])
+    assert (out == inp[:1] + 1).all()
+    assert accel.cu_accel[0].n_batches == 2
+    for cu in range(1, num_compute_units):
+        assert accel.cu_accel[cu].n_batches == 1
+    # aggregate and per-compute unit throughput
+    accel.batch_size = batch_size
+    res = accel.throughput_test()
+    assert res["throughput[images/s]"] > 0
+    if num_compute_units > 1:
+        assert res["num_compute_units"] == num_compute_units
+        for cu, (shard_start, shard_end) in enumerate(shards):
+            cu_throughput = res["throughput_cu%d[images/s]" % cu]
+            assert cu_throughput == pytest.approx(
+                (shard_end - shard_start) / (res["runtime_cu%d[ms]" % cu] / 1000)
+            )
+            assert cu_throughput <= res["throughput[images/s]"]
+
+
+@pytest.mark.util
+def test_driver_benchmark(driver_base, tmp_path):
+    accel = make_overlay(driver_base, 2)
+    batch_sizes = [1, 4, 16]
+    res = accel.benchmark(batch_sizes=batch_sizes, num_iterations=5, num_warmup=1)
+    # batch size is restored
+    assert accel.batch_size == 2
+    assert [x["batch_size"] for x in res] == batch_sizes
+    for bs_res in res:
+        for stage in driver_base.benchmark_stages:
+            p50, p90, p99, pmax = [
+                bs_res["%s_%s[ms]" % (stage, p)] for p in ["p50", "p90", "p99", "max"]
+            ]
+            assert 0 <= p50 <= p90 <= p99 <= pmax
+        assert bs_res["execute_p50[ms]"] >= mock_latency_s * 1000
+        assert bs_res["total_mean[ms]"] >= bs_res["execute_mean[ms]"]
+    # the mock accelerator takes the same time for any batch size
+    execute_throughput = [x["execute_throughput[images/s]"] for x in res]
+    assert execute_throughput == sorted(execute_throughput)
+    json_file = str(tmp_path / "benchmark.json")
+    csv_file = str(tmp_path / "benchmark.csv")
+    driver_base.write_benchmark_results(res, json_file, csv_file)
+    with open(json_file, "r") as f:
+        assert json.load(f) == res
+    with open(csv_file, "r") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(batch_sizes)
+    for row, bs_res in zip(rows, res):
+        assert row.keys() == bs_res.keys()
+        assert float(row["execute_p99[ms]"]) == pytest.approx(bs_res["execute_p99[ms]"])
+
+
+def make_runtime_weights(weight_dir, weight_file_mode):
+    # weights of a runtime-writable MVAU in the second dataflow partition
+    node = helper.make_node(
+        "MVAU_hls",
+        ["inp", "weights"],
+        ["outp"],
+        domain="finn.custom_op.fpgadataflow.hls",
+        MW=256,
+        MH=128,
+        SIMD=16,
+        PE=8,
+        inputDataType="INT4",
+        weightDataType="INT4",
+        outputDataType="INT32",
+        mem_mode="internal_decoupled",
+        runtime_writeable_weights=1,
+    )
+    weights = gen_finn_dt_tensor(DataType["INT4"], (256, 128))
+    ext = {"decoupled_runtime": "dat", "decoupled_runtime_npy": "npy"}[weight_file_mode]
+    w_filename = "%s/1_0_MVAU_hls_0.%s" % (weight_dir, ext)
+    getCustomOp(node).make_weight_file(weights, weight_file_mode, w_filename)
+
+
+@pytest.mark.util
+def test_driver_runtime_weights(driver_base, tmp_path):
+    weight_sets = {}
+    for name in ["a", "b"]:
+        weight_dir = tmp_path / name
+        weight_dir.mkdir()
+        make_runtime_weights(str(weight_dir), "decoupled_runtime_npy")
+        weight_sets[name] = np.load(str(weight_dir / "1_0_MVAU_hls_0.npy"))
+    accel = make_overlay(driver_base, 1, runtime_weight_dir=str(tmp_path / "a"))
+    layer_mmio = accel.StreamingDataflowPartition_1.mmio
+    n_words = len(weight_sets["a"])
+    assert (layer_mmio.array[:n_words] == weight_sets["a"]).all()
+    # switch weight sets without verification
+    accel.load_runtime_weights(verify=False, weight_dir=str(tmp_path / "b"))
+    assert (layer_mmio.array[:n_words] == weight_sets["b"]).all()
+    accel.load_runtime_weights(weight_dir=str(tmp_path / "a"))
+    assert (layer_mmio.array[:n_words] == weight_sets["a"]).all()
+    # text and binary weight files hold the same words
+    dat_dir = tmp_path / "dat"
+    dat_dir.mkdir()
+    np.random.seed(42)
+    make_runtime_weights(str(dat_dir), "decoupled_runtime")
+    np.random.seed(42)
+    make_runtime_weights(str(dat_dir), "decoupled_runtime_npy")
+    npy_words = driver_base.read_runtime_weights(str(dat_dir))[(1, 0)]
+    (dat_dir / "1_0_MVAU_hls_0.npy").unlink()
+    dat_words = driver_base.read_runtime_weights(str(dat_dir))[(1, 0)]
+    assert (npy_words == dat_words).all()
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("dataset", ["npy", "custom"])
+def test_driver_validate(driver_base, tmp_path, monkeypatch, dataset):
+    template = get_finn_root() + "/src/finn/qnn-data/templates/driver/validate.py"
+    spec = importlib.util.spec_from_file_location("validate", template)
+    validate = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(validate)
+    # 50 images, the last batch is padded
+    n_images = 50
+    images = np.random.randint(0, 254, size=(n_images, 8, 8)).astype(np.uint8)
+    # the mock accelerator adds one to each input, the top-1 prediction is the
+    # index of the largest input
+    labels = np.argmax(images.reshape(n_images, -1), axis=1)
+    labels[::5] = (labels[::5] + 1) % 64
+    n_ok = n_images - len(labels[::5])
+    np.save(str(tmp_path / "images.npy"), images)
+    np.save(str(tmp_path / "labels.npy"), labels)
+    if dataset == "custom":
+        with open(str(tmp_path / "custom_loader.py"), "w") as f:
+            f.write("import numpy as np\n\n")
+            f.write("def load(root):\n")
+            f.write("    return np.load(root + '/images.npy'), np.load(root + '/labels.npy')\n")
+        monkeypatch.syspath_prepend(str(tmp_path))
+        images, labels = validate.load_dataset("custom_loader:load", str(tmp_path))
+    else:
+        images, labels = validate.load_dataset(
+            "npy", None, str(tmp_path / "images.npy"), str(tmp_path / "labels.npy")
+        )
+        assert isinstance(images, np.memmap)
+    accel = make_overlay(driver_base, 8)
+    res = validate.validate(accel, images, labels, verbose=False)
+    assert res["ok"] == n_ok
+    assert res["nok"] == n_images - n_ok
+    assert res["accuracy[%]"] == pytest.approx(100.0 * n_ok / n_images)
+    assert res["throughput[images/s]"] > 0
+
+
+@pytest.mark.util
+def test_driver_external_weights(driver_base, tmp_path):
+    # 8 MiB of packed INT4 weights
+    weights = gen_finn_dt_tensor(DataType["INT4"], (1 << 16, 256))
+    ext_weights = to_external_tensor(weights, DataType["INT4"])
+    np.save(str(tmp_path / "idma1.npy"), ext_weights)
+    tracemalloc.start()
+    accel_a = make_overlay(driver_base, 1, runtime_weight_dir=str(tmp_path))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the weights are streamed into the (mock) device buffer, rather than fully
+    # loaded into host memory first
+    assert peak < 1.25 * ext_weights.nbytes
+    iwdma, weight_buf, iwdma_name = accel_a.external_weights[0]
+    assert iwdma_name == "idma1"
+    assert (weight_buf == ext_weights).all()
+    # overlays on the same device share the buffer for the same weights
+    accel_b = make_overlay(driver_base, 1, runtime_weight_dir=str(tmp_path))
+    assert accel_b.external_weights[0][1] is weight_buf
+    # the shared buffer is freed when no overlay uses it anymore
+    del accel_a, accel_b, iwdma, weight_buf
+    gc.collect()
+    assert len(driver_base._external_weight_buffers) == 0
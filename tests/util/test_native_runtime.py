@@ -0,0 +1,216 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import importlib.util
+import numpy as np
+import os
+import shutil
+import sys
+from qonnx.core.datatype import DataType
+from qonnx.util.basic import gen_finn_dt_tensor
+
+from finn.util.basic import get_finn_root, make_build_dir
+from finn.util.data_packing import (
+    finnpy_to_packed_bytearray,
+    packed_bytearray_to_finnpy,
+)
+
+native_test_dtypes = [
+    "BINARY",
+    "BIPOLAR",
+    "INT2",
+    "UINT3",
+    "INT4",
+    "UINT7",
+    "INT8",
+    "UINT8",
+    "INT13",
+    "UINT16",
+    "INT24",
+    "FIXED<8,4>",
+    "FIXED<12,3>",
+    "FLOAT32",
+    "INT32",
+    "UINT40",
+    "INT57",
+    "INT64",
+]
+
+
+@pytest.fixture(scope="module")
+def finn_runtime():
+    # copy the runtime to a build dir as MakePYNQDriver does, so that it is
+    # compiled there
+    runtime_dir = make_build_dir("test_native_runtime_")
+    for runtime_file in ["finn_runtime.h", "finn_runtime.cpp", "finn_runtime.py"]:
+        shutil.copy(
+            get_finn_root() + "/src/finn/qnn-data/templates/driver/" + runtime_file, runtime_dir
+        )
+    spec = importlib.util.spec_from_file_location("finn_runtime", runtime_dir + "/finn_runtime.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setitem(sys.modules, "finn_runtime", module)
+        yield module
+    shutil.rmtree(runtime_dir)
+
+
+def reference_pack(codes, bitwidth, n_bytes):
+    # pack each row of uint codes into a little-endian integer
+    rows = []
+    for row in codes.reshape(-1, codes.shape[-1]):
+        val = sum([int(x) << (i * bitwidth) for i, x in enumerate(row)])
+        rows.append(list(val.to_bytes(n_bytes, "little")))
+    return np.asarray(rows, dtype=np.uint8).reshape(codes.shape[:-1] + (n_bytes,))
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("dtype", native_test_dtypes)
+@pytest.mark.parametrize("n_elems", [1, 3, 16, 17])
+def test_native_pack_unpack(finn_runtime, dtype, n_elems):
+    dtype = DataType[dtype]
+    shape = (4, 5, n_elems)
+    bw = dtype.bitwidth()
+    if bw <= 24 or dtype == DataType["FLOAT32"]:
+        # compare against the Python driver, exact for these types
+        data = gen_finn_dt_tensor(dtype, shape).astype(np.float32)
+        expected = finnpy_to_packed_bytearray(data, dtype, reverse_endian=True, reverse_inner=True)
+    else:
+        # values which are not exactly representable as float32
+        data = np.random.randint(dtype.min(), dtype.max(), size=shape, dtype=np.int64)
+        codes = data.astype(np.uint64) & np.uint64((1 << bw) - 1)
+        expected = reference_pack(codes, bw, (n_elems * bw + 7) // 8)
+    packed = finn_runtime.pack(data, dtype, expected.shape)
+    assert (packed == expected).all()
+    unpacked = finn_runtime.unpack(packed, dtype, shape, out=np.empty(shape, dtype=data.dtype))
+    assert (unpacked == data).all()
+    if data.dtype == np.float32:
+        expected_unpacked = packed_bytearray_to_finnpy(
+            expected, dtype, shape, reverse_endian=True, reverse_inner=True
+        )
+        assert (finn_runtime.unpack(packed, dtype, shape) == expected_unpacked).all()
+
+
+@pytest.mark.util
+def test_native_pack_input_types(finn_runtime):
+    dtype = DataType["INT4"]
+    data = gen_finn_dt_tensor(dtype, (8, 3, 16))
+    expected = finnpy_to_packed_bytearray(data, dtype, reverse_endian=True, reverse_inner=True)
+    for np_dtype in [np.int8, np.int16, np.int32, np.int64, np.float32, np.float64]:
+        out = np.zeros_like(expected)
+        finn_runtime.pack(data.astype(np_dtype), dtype, expected.shape, out=out)
+        assert (out == expected).all()
+        unpacked = finn_runtime.unpack(
+            expected, dtype, data.shape, out=np.empty_like(data, np_dtype)
+        )
+        assert (unpacked == data).all()
+
+
+def make_io_shape_dict(idt, odt, n_features):
+    return {
+        "idt": [idt],
+        "odt": [odt],
+        "ishape_normal": [(1, n_features)],
+        "oshape_normal": [(1, n_features)],
+        "ishape_folded": [(1, n_features // 16, 16)],
+        "oshape_folded": [(1, n_features // 16, 16)],
+        "ishape_packed": [(1, n_features // 16, 16 * idt.bitwidth() // 8)],
+        "oshape_packed": [(1, n_features // 16, 16 * odt.bitwidth() // 8)],
+        "num_inputs": 1,
+        "num_outputs": 1,
+    }
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("dtype", ["INT4", "UINT8", "BIPOLAR"])
+def test_native_accelerator_sim(finn_runtime, dtype):
+    dtype = DataType[dtype]
+    batch_size = 8
+    io_shape_dict = make_io_shape_dict(dtype, dtype, 64)
+    accel = finn_runtime.NativeAccelerator(io_shape_dict, batch_size)
+    data = gen_finn_dt_tensor(dtype, (batch_size, 64))
+    # the simulated device loops the packed input back to the output
+    (out,) = accel.execute([data])
+    assert out.shape == (batch_size, 64)
+    assert (out == data).all()
+    expected = finnpy_to_packed_bytearray(
+        data.reshape(batch_size, 4, 16), dtype, reverse_endian=True, reverse_inner=True
+    )
+    assert (accel.input_buffer(0) == expected).all()
+    assert (accel.output_buffer(0) == expected).all()
+    # smaller batches and integer outputs
+    out = [np.zeros((2, 64), dtype=np.int16)]
+    accel.execute([data[:2].astype(np.int8)], out, batch_size=2)
+    assert (out[0] == data[:2]).all()
+    with pytest.raises(Exception):
+        accel.execute([data[:2]], batch_size=batch_size + 1)
+
+
+@pytest.mark.util
+def test_native_accelerator_backend(finn_runtime):
+    batch_size = 4
+    dtype = DataType["UINT8"]
+    io_shape_dict = make_io_shape_dict(dtype, dtype, 64)
+    # packed buffers provided by the caller, as for device buffers
+    ibuf = np.zeros((batch_size, 4, 16), dtype=np.uint8)
+    obuf = np.zeros((batch_size, 4, 16), dtype=np.uint8)
+    batch_sizes = []
+
+    def execute(n):
+        # device backend that adds one to each byte
+        batch_sizes.append(n)
+        np.add(ibuf[:n], 1, out=obuf[:n])
+
+    accel = finn_runtime.NativeAccelerator(io_shape_dict, batch_size, execute=execute)
+    accel.set_buffer(False, 0, ibuf)
+    accel.set_buffer(True, 0, obuf)
+    assert accel.input_buffer(0) is ibuf
+    data = gen_finn_dt_tensor(DataType["UINT7"], (batch_size, 64))
+    (out,) = accel.execute([data])
+    assert batch_sizes == [batch_size]
+    assert (out == data + 1).all()
+    # errors in the backend are raised as exceptions
+    accel = finn_runtime.NativeAccelerator(io_shape_dict, batch_size, execute=lambda n: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        accel.execute([data])
+
+
+@pytest.mark.util
+def test_native_runtime_rebuild(finn_runtime):
+    runtime_dir = os.path.dirname(finn_runtime.__file__)
+    so_fname = runtime_dir + "/libfinn_runtime.so"
+    finn_runtime.get_library()
+    so_mtime = os.path.getmtime(so_fname)
+    # a header newer than the library triggers a rebuild
+    os.utime(runtime_dir + "/finn_runtime.h", (so_mtime + 10, so_mtime + 10))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(finn_runtime, "_library", None)
+        finn_runtime.get_library()
+    assert os.path.getmtime(so_fname) > so_mtime
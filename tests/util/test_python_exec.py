@@ -0,0 +1,137 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import numpy as np
+from onnx import TensorProto, helper
+from qonnx.core.datatype import DataType
+from qonnx.core.modelwrapper import ModelWrapper
+from qonnx.custom_op.general.multithreshold import (
+    multithreshold as qonnx_multithreshold,
+)
+from qonnx.util.basic import gen_finn_dt_tensor, qonnx_make_model
+
+import finn.core.onnx_exec as oxe
+from finn.util.python_exec import (
+    clear_derived_cache,
+    get_derived,
+    im2col_nhwc,
+    multithreshold,
+)
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("num_thres", [1, 3, 15])
+@pytest.mark.parametrize("global_thres", [False, True])
+@pytest.mark.parametrize("ndim", [2, 4])
+@pytest.mark.parametrize("out_scale_bias", [(None, None), (2, -1), (1, -8)])
+def test_multithreshold(num_thres, global_thres, ndim, out_scale_bias):
+    ch = 6
+    shape = (3, ch) if ndim == 2 else (3, ch, 4, 5)
+    x = gen_finn_dt_tensor(DataType["INT8"], shape)
+    # include inputs equal to the thresholds and NaN
+    x.flat[0] = np.nan
+    thres = gen_finn_dt_tensor(DataType["INT8"], (1 if global_thres else ch, num_thres))
+    thres = np.sort(thres, axis=1)
+    x.flat[1] = thres[0, 0]
+    out_scale, out_bias = out_scale_bias
+    exp = qonnx_multithreshold(x, thres, out_scale, out_bias)
+    ret = multithreshold(x, thres, out_scale, out_bias)
+    assert ret.dtype == exp.dtype
+    assert ret.shape == exp.shape
+    assert np.array_equal(ret, exp, equal_nan=True)
+    # unsorted thresholds fall back to the comparison of all thresholds
+    thres_unsorted = thres[:, ::-1].copy()
+    exp = qonnx_multithreshold(x, thres_unsorted, out_scale, out_bias)
+    ret = multithreshold(x, thres_unsorted, out_scale, out_bias)
+    assert np.array_equal(ret, exp, equal_nan=True)
+
+
+def make_im2col_model(ishape, k, s, d):
+    oshape = [1, 1, 1, 1]
+    inp = helper.make_tensor_value_info("inp", TensorProto.FLOAT, ishape)
+    outp = helper.make_tensor_value_info("outp", TensorProto.FLOAT, oshape)
+    im2col_node = helper.make_node(
+        "Im2Col",
+        ["inp"],
+        ["outp"],
+        domain="qonnx.custom_op.general",
+        stride=s,
+        kernel_size=k,
+        dilations=d,
+        input_shape=str(tuple([1] + ishape[1:])),
+    )
+    graph = helper.make_graph(nodes=[im2col_node], name="im2col", inputs=[inp], outputs=[outp])
+    model = ModelWrapper(qonnx_make_model(graph, producer_name="im2col-model"))
+    model.set_tensor_datatype("inp", DataType["INT4"])
+    return model
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("ishape", [[2, 7, 9, 3], [3, 1, 10, 2], [1, 6, 6, 4]])
+@pytest.mark.parametrize("k", [[1, 1], [1, 3], [3, 3]])
+@pytest.mark.parametrize("s", [[1, 1], [1, 2], [2, 2]])
+@pytest.mark.parametrize("d", [[1, 1], [1, 2]])
+def test_im2col_nhwc(ishape, k, s, d):
+    if ishape[1] == 1 and (k[0] != 1 or s[0] != 1):
+        pytest.skip("Kernel and stride must be 1 along a dummy dimension")
+    x = gen_finn_dt_tensor(DataType["INT4"], ishape)
+    model = make_im2col_model([1] + ishape[1:], k, s, d)
+    # Im2Col only handles a single sample correctly
+    exp = []
+    for i in range(ishape[0]):
+        context = {"inp": x[i : i + 1], "outp": None}
+        oxe.execute_node(model.graph.node[0], context, model.graph)
+        exp.append(context["outp"])
+    exp = np.concatenate(exp, axis=0)
+    ret = im2col_nhwc(x, k, s, d)
+    assert ret.dtype == exp.dtype
+    assert np.array_equal(ret, exp)
+
+
+@pytest.mark.util
+def test_get_derived():
+    clear_derived_cache()
+    calls = []
+
+    def derive(x):
+        calls.append(x)
+        return x * 2
+
+    w = np.arange(4)
+    assert (get_derived(w, "double", derive) == w * 2).all()
+    assert (get_derived(w, "double", derive) == w * 2).all()
+    assert len(calls) == 1
+    # other kind or array object, even with the same contents, derives again
+    get_derived(w, "triple", derive)
+    get_derived(w.copy(), "double", derive)
+    assert len(calls) == 3
+    clear_derived_cache()
+    get_derived(w, "double", derive)
+    assert len(calls) == 4
@@ -0,0 +1,216 @@
+# Copyright (C) 2024, Advanced Micro Devices, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of FINN nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import ctypes
+import numpy as np
+import os
+from onnx import helper
+from qonnx.custom_op.registry import getCustomOp
+from types import SimpleNamespace
+
+import finn.custom_op.fpgadataflow.hwcustomop as hwcustomop
+from finn.util.basic import launch_process_helper, make_build_dir
+from finn.util.pyverilator import ints_to_words, rtlsim_stream, words_to_ints
+
+# a single-stage register slice in0 -> out with PyVerilator-style accessors,
+# whose input is not ready in every third cycle (or which never produces any
+# output if STUCK is defined)
+fake_rtlsim_src = r"""
+#include <cstdint>
+
+#define N_WORDS ((WIDTH + 31) / 32)
+
+struct model_t {
+    uint32_t clk, prev_clk, cycle, full, in_valid, out_ready;
+    uint32_t in_data[N_WORDS], reg[N_WORDS];
+};
+
+static model_t the_model;
+
+static uint32_t in_ready(model_t *m) {
+    return ((!m->full || m->out_ready) && (m->cycle % 3 != 2)) ? 1 : 0;
+}
+
+static uint32_t out_valid(model_t *m) {
+#ifdef STUCK
+    return 0;
+#else
+    return m->full;
+#endif
+}
+
+extern "C" {
+void *get_model() { the_model = model_t(); return &the_model; }
+int eval(model_t *m) {
+    if (m->clk && !m->prev_clk) {
+        const bool in_txn = m->in_valid && in_ready(m);
+        if (out_valid(m) && m->out_ready) {
+            m->full = 0;
+        }
+        if (in_txn) {
+            for (int k = 0; k < N_WORDS; k++) m->reg[k] = m->in_data[k];
+            m->full = 1;
+        }
+        m->cycle++;
+    }
+    m->prev_clk = m->clk;
+    return 0;
+}
+int set_ap_clk(model_t *m, uint32_t v) { m->clk = v; return 0; }
+int set_in0_V_TVALID(model_t *m, uint32_t v) { m->in_valid = v; return 0; }
+uint32_t get_in0_V_TREADY(model_t *m) { return in_ready(m); }
+int set_out_V_TREADY(model_t *m, uint32_t v) { m->out_ready = v; return 0; }
+uint32_t get_out_V_TVALID(model_t *m) { return out_valid(m); }
+#if WIDTH > 64
+int set_in0_V_TDATA(model_t *m, int k, uint32_t v) { m->in_data[k] = v; return 0; }
+uint32_t get_out_V_TDATA(model_t *m, int k) { return m->reg[k]; }
+#elif WIDTH > 32
+int set_in0_V_TDATA(model_t *m, uint64_t v) {
+    m->in_data[0] = uint32_t(v);
+    m->in_data[1] = uint32_t(v >> 32);
+    return 0;
+}
+uint64_t get_out_V_TDATA(model_t *m) {
+    return uint64_t(m->reg[0]) | (uint64_t(m->reg[1]) << 32);
+}
+#else
+int set_in0_V_TDATA(model_t *m, uint32_t v) { m->in_data[0] = v; return 0; }
+uint32_t get_out_V_TDATA(model_t *m) { return m->reg[0]; }
+#endif
+}
+"""
+
+
+def make_fake_rtlsim(width, stuck=False):
+    build_dir = make_build_dir("test_rtlsim_stream_")
+    with open(build_dir + "/fake_rtlsim.cpp", "w") as f:
+        f.write(fake_rtlsim_src)
+    so_fname = build_dir + "/fake_rtlsim.so"
+    compile_args = ["g++", "-O1", "-shared", "-fPIC", "-DWIDTH=%d" % width]
+    if stuck:
+        compile_args.append("-DSTUCK")
+    compile_args += ["fake_rtlsim.cpp", "-o", so_fname]
+    launch_process_helper(compile_args, cwd=build_dir)
+    assert os.path.isfile(so_fname)
+    lib = ctypes.CDLL(so_fname)
+    lib.get_model.restype = ctypes.c_void_p
+    return SimpleNamespace(lib=lib, model=lib.get_model())
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("width", [1, 17, 32, 33, 64, 65, 100, 200])
+def test_ints_to_words(width):
+    rng = np.random.default_rng(width)
+    bits = rng.integers(0, 2, size=(20, width)).tolist()
+    values = [sum([b << k for k, b in enumerate(row)]) for row in bits]
+    values += [0, (1 << width) - 1]
+    words = ints_to_words(values, width)
+    assert words.dtype == np.uint32
+    assert words.shape == (len(values), (width + 31) // 32)
+    assert words_to_ints(words) == values
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("width", [8, 40, 72])
+@pytest.mark.parametrize("n_txns", [1, 50])
+def test_rtlsim_stream(width, n_txns):
+    sim = make_fake_rtlsim(width)
+    rng = np.random.default_rng(n_txns)
+    words = rng.integers(0, 1 << 32, size=(n_txns, 3)).tolist()
+    values = [(a | (b << 32) | (c << 64)) & ((1 << width) - 1) for a, b, c in words]
+    in_streams = {"in0": (width, ints_to_words(values, width))}
+    n_cycles, outputs = rtlsim_stream(sim, in_streams, {"out": width}, n_txns, 100)
+    assert words_to_ints(outputs["out"]) == values
+    # the input stalls in every third cycle, the output arrives one cycle
+    # after the last input transaction
+    n_in_cycles = n_txns + (n_txns - 1) // 2
+    assert n_cycles == n_in_cycles + 1
+
+
+@pytest.mark.util
+def test_rtlsim_stream_liveness():
+    sim = make_fake_rtlsim(8, stuck=True)
+    in_streams = {"in0": (8, ints_to_words(list(range(10)), 8))}
+    with pytest.raises(Exception, match="Takes too long to produce output"):
+        rtlsim_stream(sim, in_streams, {"out": 8}, 10, 20)
+
+
+# specialized layers with a weight stream in (default) internal_decoupled mode
+decoupled_nodes = {
+    "MVAU_hls": dict(MW=8, MH=4, SIMD=2, PE=2, weightDataType="INT4", outputDataType="INT32"),
+    "MVAU_rtl": dict(MW=8, MH=4, SIMD=2, PE=2, weightDataType="INT4", outputDataType="INT32"),
+    "VVAU_rtl": dict(
+        Channels=4,
+        Kernel=[3, 3],
+        PE=2,
+        SIMD=3,
+        Dim=[2, 2],
+        weightDataType="INT4",
+        outputDataType="INT32",
+    ),
+    "Thresholding_hls": dict(
+        NumChannels=4, PE=2, numSteps=3, weightDataType="INT4", outputDataType="UINT2"
+    ),
+}
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("op_type", decoupled_nodes.keys())
+def test_rtlsim_multi_io_decoupled(op_type, monkeypatch):
+    node = helper.make_node(
+        op_type,
+        ["inp", "weights"],
+        ["outp"],
+        domain="finn.custom_op.fpgadataflow." + op_type.split("_")[-1],
+        backend="fpgadataflow",
+        inputDataType="INT4",
+        **decoupled_nodes[op_type],
+    )
+    inst = getCustomOp(node)
+    assert inst.get_nodeattr("mem_mode") == "internal_decoupled"
+    in_width = inst.get_instream_width_padded()
+    w_width = inst.get_weightstream_width_padded()
+    out_width = inst.get_outstream_width_padded()
+    calls = []
+
+    # checks the stream widths and echoes the input stream to the output
+    def fake_rtlsim_stream(sim, in_streams, out_streams, n_out_txns, liveness, sname):
+        calls.append(n_out_txns)
+        assert in_streams["in0"][0] == in_width
+        assert in_streams["weights"][0] == w_width
+        assert out_streams == {"out": out_width}
+        return (10, {"out": in_streams["in0"][1]})
+
+    monkeypatch.setattr(hwcustomop, "rtlsim_stream", fake_rtlsim_stream)
+    io_dict = {"inputs": {"in0": [1, 2, 3], "weights": [4, 5]}, "outputs": {"out": []}}
+    inst.rtlsim_multi_io(SimpleNamespace(), io_dict, num_out_values=3)
+    assert calls == [3]
+    assert io_dict["outputs"]["out"] == [1, 2, 3]
+    assert inst.get_nodeattr("cycles_rtlsim") == 10